@@ -0,0 +1,392 @@
+"""
+Passage-level full-text index over the scraped API docs corpus (connectors_api_docs.db).
+
+Each api_docs page is split into `api_doc_passages` along its h1/h2/h3 sections, with the clean
+title, a preview and a token estimate computed once at ingest. `api_doc_passages_fts` indexes the
+passages (rowid = api_doc_passages.id) with connector, url and section_type stored UNINDEXED, so
+ranking, connector filtering/boosting and snippet extraction run inside the index and a query reads a
+passage-sized row instead of a whole page.
+
+The scraper calls `store_doc_passages()` + `index_api_docs()` per saved page; readers call
+`ensure_api_docs_index_once()`, which only creates the tables and reconciles the index. Pages stored
+before passages existed are split offline by `split_pending_pages()`, which the deploy step
+`python3 migrations.py` runs after the schema migrations (`python3 api_docs_index.py [db]` does the
+full reconcile by hand); until then the reader logs how many pages are waiting.
+"""
+
+import math
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+from knowledge_index import build_match_query
+from retrieval_cache import bump_corpus_version
+
+API_DOCS_DB = Path(__file__).parent / "connectors_api_docs.db"
+
+# bm25 column weights: heading, content (connector/url/section_type are UNINDEXED).
+API_DOCS_FTS_WEIGHTS = (4.0, 1.0)
+# bm25 is negative (lower is better); prioritized connectors get their score multiplied by this.
+API_DOCS_CONNECTOR_BOOST = 4.0
+API_DOCS_SNIPPET_TOKENS = 48
+
+# Sections shorter than this are folded into the next one; longer than MAX are split on sentences.
+PASSAGE_MIN_CHARS = 200
+PASSAGE_MAX_CHARS = 1600
+PASSAGE_PREVIEW_CHARS = 400
+
+# The page title is indexed with the first passage only, so it doesn't lift every passage of the page.
+_FTS_HEADING_SQL = "CASE WHEN heading != '' THEN heading WHEN position = 0 THEN COALESCE(title, '') ELSE '' END"
+
+_SPACE_RE = re.compile(r"\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_LOCK = threading.Lock()
+_READY_PATHS = set()
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ? LIMIT 1", (name,)
+    ).fetchone() is not None
+
+
+def clean_text(text):
+    return _SPACE_RE.sub(" ", str(text or "").replace("\xa0", " ")).strip()
+
+
+def estimate_tokens(text):
+    """Same ~4 chars/token estimate the chat ledger uses."""
+    text = str(text or "").strip()
+    return max(1, int(math.ceil(len(text) / 4.0))) if text else 0
+
+
+def make_preview(text, max_chars=PASSAGE_PREVIEW_CHARS):
+    text = clean_text(text)
+    if len(text) <= max_chars:
+        return text
+    return (text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]) + "..."
+
+
+def _split_long(text, max_chars=PASSAGE_MAX_CHARS):
+    if len(text) <= max_chars:
+        return [text]
+    out, current = [], ""
+    for sentence in _SENTENCE_RE.split(text):
+        while len(sentence) > max_chars:  # no sentence boundary: cut on the last space
+            cut = sentence[:max_chars].rsplit(" ", 1)[0] or sentence[:max_chars]
+            if current:
+                out.append(current)
+                current = ""
+            out.append(cut)
+            sentence = sentence[len(cut):].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            out.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        out.append(current)
+    return out
+
+
+def split_into_passages(sections):
+    """[(heading or None, text)] in page order -> [(heading, text)] passages.
+
+    Tiny sections are merged forward (their headings joined with ' › '), oversized ones are split at
+    sentence boundaries. Passages before the first heading get an empty heading.
+    """
+    merged = []
+    heads, buf = [], ""
+    for heading, text in sections:
+        heading, text = clean_text(heading), clean_text(text)
+        if heading:
+            heads.append(heading)
+        if text:
+            buf = f"{buf} {text}".strip()
+        if len(buf) >= PASSAGE_MIN_CHARS:
+            merged.append((" › ".join(heads[-2:]), buf))
+            heads, buf = [], ""
+    if buf:
+        if merged and len(buf) < PASSAGE_MIN_CHARS:
+            heading, text = merged[-1]
+            merged[-1] = (heading, f"{text} {buf}")
+        else:
+            merged.append((" › ".join(heads[-2:]), buf))
+
+    return [(heading, piece) for heading, text in merged for piece in _split_long(text)]
+
+
+def ensure_passages_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS api_doc_passages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doc_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            connector TEXT,
+            url TEXT,
+            section_type TEXT,
+            title TEXT,
+            heading TEXT,
+            preview TEXT,
+            content TEXT NOT NULL,
+            token_count INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(doc_id, position)
+        )
+    """)
+
+
+def store_doc_passages(conn, doc_id, sections=None):
+    """(Re)build the passages of one api_docs row and return their ids; caller indexes + commits.
+
+    sections: the scraper's [(heading, text)] walk. Without it (rows stored before passages existed)
+    the flattened content is split by size only, since the heading boundaries are gone.
+    """
+    row = conn.execute(
+        "SELECT connector, url, title, content, section_type FROM api_docs WHERE id = ?", (int(doc_id),)
+    ).fetchone()
+    if not row:
+        return []
+    connector, url, title, content, section_type = row
+    clean_title = clean_text(title)[:120] or connector
+    old_ids = [r[0] for r in conn.execute("SELECT id FROM api_doc_passages WHERE doc_id = ?", (int(doc_id),))]
+    if old_ids and _table_exists(conn, "api_doc_passages_fts"):
+        conn.execute(
+            f"DELETE FROM api_doc_passages_fts WHERE rowid IN ({','.join('?' for _ in old_ids)})", old_ids
+        )
+    conn.execute("DELETE FROM api_doc_passages WHERE doc_id = ?", (int(doc_id),))
+    ids = []
+    for position, (heading, text) in enumerate(split_into_passages(sections or [(None, content)])):
+        cur = conn.execute(
+            """
+            INSERT INTO api_doc_passages
+                (doc_id, position, connector, url, section_type, title, heading, preview, content, token_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (int(doc_id), position, connector, url, section_type, clean_title, heading[:160],
+             make_preview(text), text, estimate_tokens(text)),
+        )
+        ids.append(cur.lastrowid)
+    return ids
+
+
+def index_api_docs(conn, doc_ids=None, split_pending=True):
+    """(Re)index the passages of the given api_docs ids, or reconcile everything when doc_ids is None.
+
+    split_pending=False leaves pages without passages alone (the read path). Returns (added, removed)
+    passage counts; caller commits.
+    """
+    if doc_ids is not None:
+        ids = [int(v) for v in doc_ids if v]
+        if not ids:
+            return (0, 0)
+        marks = ",".join("?" for _ in ids)
+        removed = conn.execute(
+            f"DELETE FROM api_doc_passages_fts WHERE rowid IN "
+            f"(SELECT id FROM api_doc_passages WHERE doc_id IN ({marks}))",
+            ids,
+        ).rowcount
+        added = conn.execute(
+            f"""
+            INSERT INTO api_doc_passages_fts(rowid, heading, content, connector, url, section_type)
+            SELECT id, {_FTS_HEADING_SQL}, content, connector, url, section_type
+            FROM api_doc_passages WHERE doc_id IN ({marks})
+            """,
+            ids,
+        ).rowcount
+        return (max(0, added or 0), max(0, removed or 0))
+
+    # Pages stored before passages existed (or by a scraper without the hook) are split here.
+    if split_pending:
+        for (doc_id,) in _pending_docs(conn).fetchall():
+            store_doc_passages(conn, doc_id)
+    conn.execute("DELETE FROM api_doc_passages WHERE doc_id NOT IN (SELECT id FROM api_docs)")
+    removed = conn.execute(
+        "DELETE FROM api_doc_passages_fts WHERE rowid NOT IN (SELECT id FROM api_doc_passages)"
+    ).rowcount
+    added = conn.execute(
+        f"""
+        INSERT INTO api_doc_passages_fts(rowid, heading, content, connector, url, section_type)
+        SELECT id, {_FTS_HEADING_SQL}, content, connector, url, section_type
+        FROM api_doc_passages
+        WHERE id NOT IN (SELECT rowid FROM api_doc_passages_fts)
+        """
+    ).rowcount
+    return (max(0, added or 0), max(0, removed or 0))
+
+
+def _pending_docs(conn):
+    return conn.execute("SELECT id FROM api_docs WHERE id NOT IN (SELECT doc_id FROM api_doc_passages)")
+
+
+def ensure_api_docs_index(conn, split_pending=True):
+    """Create passages + their FTS if missing and reconcile. No-op when `api_docs` does not exist."""
+    if not _table_exists(conn, "api_docs"):
+        return False
+    ensure_passages_table(conn)
+    conn.execute("DROP TABLE IF EXISTS api_docs_fts")  # page-level index, superseded by passages
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS api_doc_passages_fts USING fts5(
+            heading, content,
+            connector UNINDEXED, url UNINDEXED, section_type UNINDEXED,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    index_api_docs(conn, split_pending=split_pending)
+    return True
+
+
+def ensure_api_docs_index_once(conn, path):
+    """Per-process guard around ensure_api_docs_index() for read paths; never splits pages itself."""
+    key = str(path)
+    if key in _READY_PATHS:
+        return True
+    with _LOCK:
+        if key in _READY_PATHS:
+            return True
+        try:
+            ok = ensure_api_docs_index(conn, split_pending=False)
+            conn.commit()
+            waiting = len(_pending_docs(conn).fetchall()) if ok else 0
+        except Exception as e:
+            print(f"api_docs_index_error: {e}")
+            return False
+        if waiting:
+            print(f"api_docs_index: {waiting} pages without passages in {key}; "
+                  "run python3 migrations.py")
+        if ok:
+            _READY_PATHS.add(key)
+        return ok
+
+
+def search_api_docs(conn, query, boost_connectors=None, connector=None, limit=3):
+    """One ranked pass over the passages, keeping the best passage per page.
+
+    boost_connectors: connectors whose hits are boosted (the agent's AGENT_CONNECTOR_MAP entry).
+    connector: hard filter to a single connector.
+    Returns dicts with id (passage)/connector/title/heading/url/section_type/snippet/preview/token_count/score.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    w_heading, w_content = API_DOCS_FTS_WEIGHTS
+    params = [API_DOCS_SNIPPET_TOKENS, w_heading, w_content]
+    boost = [str(c) for c in (boost_connectors or []) if c]
+    boost_sql = "1.0"
+    if boost:
+        boost_sql = f"CASE WHEN connector IN ({','.join('?' for _ in boost)}) THEN ? ELSE 1.0 END"
+        params.extend(boost)
+        params.append(API_DOCS_CONNECTOR_BOOST)
+    params.append(match)
+    filter_sql = ""
+    if connector:
+        filter_sql = " AND connector = ?"
+        params.append(str(connector))
+    params.append(max(1, int(limit)))
+    rows = conn.execute(
+        f"""
+        WITH hits AS (
+            SELECT rowid AS passage_id,
+                   snippet(api_doc_passages_fts, 1, '', '', '…', ?) AS snip,
+                   bm25(api_doc_passages_fts, ?, ?) * {boost_sql} AS score,
+                   url
+            FROM api_doc_passages_fts
+            WHERE api_doc_passages_fts MATCH ?{filter_sql}
+        ),
+        ranked AS (
+            SELECT passage_id, snip, score, ROW_NUMBER() OVER (PARTITION BY url ORDER BY score) AS rn
+            FROM hits
+        )
+        SELECT p.connector, p.title, COALESCE(NULLIF(p.heading, ''), p.title), p.url, p.section_type, r.snip,
+               p.preview, p.token_count, r.score, p.id
+        FROM ranked r
+        JOIN api_doc_passages p ON p.id = r.passage_id
+        WHERE r.rn = 1
+        ORDER BY r.score
+        LIMIT ?
+        """,
+        tuple(params),
+    ).fetchall()
+    return [_passage_dict(r[9], r[:5], r[5] or r[6], r[6], r[7], round(float(r[8] or 0.0), 4)) for r in rows]
+
+
+def _passage_dict(passage_id, head, snippet, preview, token_count, score):
+    connector, title, heading, url, section_type = head
+    return {
+        "id": passage_id,
+        "connector": connector,
+        "title": title,
+        "heading": heading,
+        "url": url,
+        "section_type": section_type,
+        "snippet": snippet or "",
+        "preview": preview or "",
+        "token_count": int(token_count or 0),
+        "score": score,
+    }
+
+
+def fetch_passages(conn, ids):
+    """Passages by id (vector-only hits), same dict shape as search_api_docs with the preview as snippet."""
+    ids = [int(v) for v in ids]
+    if not ids:
+        return []
+    rows = conn.execute(
+        f"""
+        SELECT id, connector, title, COALESCE(NULLIF(heading, ''), title), url, section_type, preview, token_count
+        FROM api_doc_passages WHERE id IN ({','.join('?' for _ in ids)})
+        """,
+        ids,
+    ).fetchall()
+    return [_passage_dict(r[0], r[1:6], r[6], r[6], r[7], None) for r in rows]
+
+
+def split_pending_pages(path):
+    """Split + index pages stored before passages existed; returns how many were split (0 without a corpus).
+
+    Bumps the corpus version when it did work, so cached context blocks built without them miss.
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        if not _table_exists(conn, "api_docs"):
+            return 0
+        ensure_passages_table(conn)
+        pending = len(_pending_docs(conn).fetchall())
+        if not pending:
+            return 0
+        ensure_api_docs_index(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    bump_corpus_version(path)
+    return pending
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    path = Path(args[0]) if args else API_DOCS_DB
+    if not path.exists():
+        print(f"{path} not found")
+        return 1
+    conn = sqlite3.connect(path)
+    try:
+        if not ensure_api_docs_index(conn):
+            print(f"{path}: no api_docs table")
+            return 1
+        conn.commit()
+        bump_corpus_version(path)
+        docs, passages, tokens = conn.execute(
+            "SELECT COUNT(DISTINCT doc_id), COUNT(*), COALESCE(SUM(token_count), 0) FROM api_doc_passages"
+        ).fetchone()
+        print(f"{path}: {docs} docs -> {passages} passages (~{tokens} tokens)")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
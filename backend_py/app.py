@@ -1,14 +1,30 @@
-from flask import Flask, render_template, request, jsonify, g, redirect, url_for, make_response, has_request_context
+from flask import Flask, Response, render_template, request, jsonify, g, redirect, url_for, make_response, has_request_context, stream_with_context, copy_current_request_context
 from config import Config
-from database import init_db, get_db, save_message, get_messages, get_daily_message_count, is_user_premium, get_recent_conversations, get_conversation_context, create_new_conversation, get_or_create_conversation, update_conversation_title, search_conversations
-from models import workspaces, get_agent_name, simulate_response, detect_handover, enhance_context, get_llm_response, get_api_docs_context
+from database import init_db, init_app as init_db_app, pool_stats as db_pool_stats, get_db, save_chat_turn, get_messages, get_daily_message_count, is_user_premium, get_recent_conversations, get_conversation_context, create_new_conversation, get_or_create_conversation, search_conversations, refresh_conversation_activity
+from migrations import ensure_schema
+from knowledge_index import search_chunks
+from retrieval_cache import retrieval_cache_stats
+from gateway_client import SingleFlight, fan_out, gateway_client, gateway_stats
+import gateway_cache
+from circuit_breaker import CircuitOpenError, breaker_for, breaker_state, breaker_stats, path_family
+from request_deadline import HEADER as DEADLINE_HEADER, Deadline, parse_budget_ms
+from gateway_hedge import hedge_stats, hedged_call
+from gateway_token import TokenManager, ValidationCache
+from telemetry_writer import TelemetryWriter
+from chat_jobs import JobPool, JobRejected
+import conversation_context
+import reply_cache
+from models import workspaces, get_agent_name, simulate_response, detect_handover, enhance_context, get_llm_response, get_api_docs_context, search_api_docs_corpus
 import markdown
+import atexit
 import json
 import copy
 import math
 from markupsafe import Markup
 import os
+import random
 import time
+import threading
 import requests
 import re
 import uuid
@@ -42,6 +58,11 @@ AGENT_CONNECTOR_MAP = {
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config.from_object(Config)
+init_db_app(app)
+try:
+    init_db()  # apply pending schema migrations once, before serving requests
+except Exception as e:
+    print(f"schema_migration_error: {e}")
 
 # ── Coolbits Gateway (Google stack) ────────────────────────────────
 # We can reuse Coolbits' mature OAuth + MCC logic by proxying Camarad connector calls to
@@ -54,6 +75,9 @@ COOLBITS_WORKSPACE_ID = str(os.getenv("COOLBITS_WORKSPACE_ID", "business")).stri
 AUTH_REQUIRED = str(os.getenv("AUTH_REQUIRED", "1")).strip().lower() in ("1", "true", "yes", "on")
 AUTH_COOKIE_SECURE = str(os.getenv("AUTH_COOKIE_SECURE", "0")).strip().lower() in ("1", "true", "yes", "on")
 _coolbits_auth_cache = {"token": None, "fetched_at": 0.0}
+_coolbits_tokens = TokenManager(lambda: _coolbits_mock_login(), state=_coolbits_auth_cache)
+_coolbits_auth_me_cache = ValidationCache()  # camarad_cb_token -> /api/auth/me user, short TTL
+_coolbits_single_flight = SingleFlight()  # coalesces identical concurrent gateway GETs
 FORCE_VERTEX_ALL_AGENTS = str(os.getenv("FORCE_VERTEX_ALL_AGENTS", "1")).strip().lower() in ("1", "true", "yes", "on")
 _ALL_WORKSPACE_AGENT_SLUGS = {
     str(agent_slug).strip().lower()
@@ -262,11 +286,11 @@ def _coolbits_browser_base_url():
     return COOLBITS_URL
 
 
-def _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_history):
+def _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_history, summary=None):
     base = _REAL_AGENT_OBJECTIVES.get(agent_slug) or "You are a helpful specialist assistant."
     ws_name = str((workspaces.get(ws_slug) or {}).get("name") or ws_slug or "Workspace")
     history_lines = []
-    for msg in (recent_history or [])[-6:]:
+    for msg in (recent_history or [])[-max(1, Config.CHAT_CONTEXT_RECENT_K):]:
         if not isinstance(msg, dict):
             continue
         role = str(msg.get("role") or "").strip().lower()
@@ -275,6 +299,7 @@ def _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_histor
             prefix = "User" if role == "user" else "Assistant"
             history_lines.append(f"{prefix}: {content[:280]}")
     history_txt = "\n".join(history_lines) if history_lines else "No prior context."
+    summary_txt = f"- Earlier in this conversation:\n{summary}\n" if str(summary or "").strip() else ""
 
     uid = get_current_user_id()
     client_id = get_current_client_id()
@@ -294,6 +319,7 @@ def _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_histor
         f"- Connected tools: {connected_txt}\n"
         f"- Role focus tools: {focus_txt}\n"
         f"- User request: {user_message[:900]}\n"
+        f"{summary_txt}"
         f"- Recent chat:\n{history_txt}\n\n"
         f"Output rules:\n"
         f"- You are speaking as a Camarad agent, not as a generic model.\n"
@@ -553,17 +579,23 @@ def _sanitize_real_agent_output(agent_slug, ws_slug, user_message, response_text
     return txt
 
 
-def _generate_real_agent_response(agent_slug, ws_slug, user_message, recent_history):
-    objective = _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_history)
+def _generate_real_agent_response(agent_slug, ws_slug, user_message, recent_history, deadline=None, summary=None):
+    deadline = deadline or _request_deadline()
+    if deadline is not None and not deadline.allows("real_agent"):
+        return None
+    objective = _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_history, summary=summary)
     try:
         status, payload, text = _coolbits_request(
             "POST",
             "/api/runs",
             body={"title": f"camarad-{agent_slug}"},
             timeout=20,
+            deadline=deadline,
         )
         if not (200 <= int(status) < 300) or not isinstance(payload, dict) or not payload.get("runId"):
             return None
+        if deadline is not None and not deadline.allows("real_agent_llm"):
+            return None
 
         run_id = str(payload.get("runId"))
         llm_body = {
@@ -578,6 +610,7 @@ def _generate_real_agent_response(agent_slug, ws_slug, user_message, recent_hist
             body=llm_body,
             timeout=60,
             extra_headers={"X-Real-LLM-Confirm": "true"},
+            deadline=deadline,
         )
         if 200 <= int(status2) < 300 and isinstance(payload2, dict) and str(payload2.get("text") or "").strip():
             return str(payload2.get("text")).strip()
@@ -592,6 +625,86 @@ def _generate_real_agent_response(agent_slug, ws_slug, user_message, recent_hist
     return None
 
 
+def _iter_text_chunks(text, words=4):
+    """Split a finished reply into small word groups for streaming (whitespace preserved)."""
+    parts = re.findall(r"\S+\s*|\s+", str(text or ""))
+    for i in range(0, len(parts), max(1, int(words))):
+        yield "".join(parts[i:i + words])
+
+
+def _stream_real_agent_response(agent_slug, ws_slug, user_message, recent_history, deadline=None, summary=None):
+    """Yield reply deltas from the gateway as they arrive.
+
+    The /llm call asks for `stream: true`; an SSE answer is relayed per `data:` event (delta/token/text),
+    a plain JSON answer is replayed in word chunks. Yields nothing when the real call is unavailable,
+    so callers fall back exactly like _generate_real_agent_response returning None.
+    """
+    deadline = deadline or _request_deadline()
+    if deadline is not None and not deadline.allows("real_agent"):
+        return
+    objective = _build_real_agent_objective(agent_slug, ws_slug, user_message, recent_history, summary=summary)
+    try:
+        status, payload, _text = _coolbits_request(
+            "POST",
+            "/api/runs",
+            body={"title": f"camarad-{agent_slug}"},
+            timeout=20,
+            deadline=deadline,
+        )
+        if not (200 <= int(status) < 300) or not isinstance(payload, dict) or not payload.get("runId"):
+            return
+        if deadline is not None and not deadline.allows("real_agent_llm"):
+            return
+
+        run_id = str(payload.get("runId"))
+        llm_body = {
+            "profileName": COOLBITS_VERTEX_PROFILE,
+            "input": user_message,
+            "promptEnvelope": {"envelopeVersion": "v1", "objective": objective},
+            "real": True,
+            "stream": True,
+        }
+        r = _coolbits_open_stream(
+            "POST",
+            f"/api/runs/{run_id}/llm",
+            body=llm_body,
+            timeout=60,
+            extra_headers={"X-Real-LLM-Confirm": "true"},
+            deadline=deadline,
+        )
+        try:
+            if not (200 <= int(r.status_code) < 300):
+                return
+            ct = (r.headers.get("content-type") or "").lower()
+            if "text/event-stream" in ct:
+                for line in r.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    raw = line[5:].strip()
+                    if raw == "[DONE]":
+                        break
+                    try:
+                        item = json.loads(raw)
+                    except ValueError:
+                        item = raw
+                    if isinstance(item, dict):
+                        if item.get("error"):
+                            break
+                        delta = item.get("delta") or item.get("token") or item.get("text") or ""
+                    else:
+                        delta = str(item)
+                    if delta:
+                        yield str(delta)
+                return
+            payload2 = r.json() if "application/json" in ct else None
+            if isinstance(payload2, dict) and str(payload2.get("text") or "").strip():
+                yield from _iter_text_chunks(str(payload2.get("text")).strip())
+        finally:
+            r.close()
+    except Exception as e:
+        print(f"real_agent_stream_error({agent_slug}): {e}")
+
+
 def _coolbits_get_request_token():
     if not has_request_context():
         return None
@@ -604,35 +717,102 @@ def _coolbits_get_request_token():
     return None
 
 
-def _coolbits_get_token(force=False):
+def _coolbits_mock_login():
+    r = gateway_client().request(
+        "POST",
+        f"{COOLBITS_URL}/api/auth/mock-login",
+        json={"email": COOLBITS_GATEWAY_EMAIL},
+        timeout=10,
+    )
+    r.raise_for_status()
+    data = r.json() if r.content else {}
+    return data.get("token")
+
+
+def _coolbits_get_token(force=False, rejected=None):
+    """The caller's own gateway token, else the service token (see gateway_token.TokenManager).
+
+    force / rejected: a 401 came back; log in again unless another thread already replaced that token.
+    """
     request_token = _coolbits_get_request_token()
     if request_token:
         return request_token
-
-    # Coolbits issues 30d JWTs; refresh occasionally and on 401.
-    now = time.time()
-    if (not force) and _coolbits_auth_cache.get("token") and (now - float(_coolbits_auth_cache.get("fetched_at") or 0.0) < 6 * 3600):
-        return _coolbits_auth_cache["token"]
-
+    if force and rejected is None:
+        rejected = _coolbits_auth_cache.get("token")
     try:
-        r = requests.post(
-            f"{COOLBITS_URL}/api/auth/mock-login",
-            json={"email": COOLBITS_GATEWAY_EMAIL},
-            timeout=10,
-        )
-        r.raise_for_status()
-        data = r.json() if r.content else {}
-        token = data.get("token")
-        if not token:
-            raise RuntimeError("missing_token")
-        _coolbits_auth_cache["token"] = token
-        _coolbits_auth_cache["fetched_at"] = now
-        return token
+        return _coolbits_tokens.get(rejected=rejected)
     except Exception as e:
         raise RuntimeError(f"coolbits_auth_failed: {e}")
 
 
-def _coolbits_request(method, path, params=None, body=None, timeout=25, extra_headers=None):
+REQUEST_DEADLINE_ROUTES = {
+    "chat": Config.CHAT_DEADLINE_MS,
+    "api_chat_stream": Config.CHAT_DEADLINE_MS,
+    "orchestrator_execute": Config.ORCHESTRATOR_DEADLINE_MS,
+}
+
+
+@app.before_request
+def start_request_deadline():
+    """Per-route time budget for this request; X-Request-Deadline-Ms overrides it (see request_deadline)."""
+    budget_ms = parse_budget_ms(request.headers.get(DEADLINE_HEADER), REQUEST_DEADLINE_ROUTES.get(request.endpoint))
+    if budget_ms:
+        g.request_deadline = Deadline(budget_ms)
+    return None
+
+
+def _request_deadline():
+    if not has_request_context():
+        return None
+    return g.get("request_deadline")
+
+
+def _deadline_report(deadline=None):
+    deadline = deadline or _request_deadline()
+    return deadline.snapshot() if deadline is not None else None
+
+
+def _coolbits_deadline(path, timeout, deadline=None):
+    """(timeout, capped, expires_at) for a gateway call under the request deadline (DeadlineExceeded at 0)."""
+    deadline = deadline or _request_deadline()
+    if deadline is None:
+        return timeout, False, None
+    timeout, capped = deadline.cap(timeout, stage=f"gateway:{path_family(path)}")
+    return timeout, capped, deadline.expires_at - deadline.reserve
+
+
+def _coolbits_guarded(path, call, capped=False):
+    """Run call() under the path family's circuit breaker; raises CircuitOpenError (no I/O) while open.
+
+    A timeout caused by the request deadline shortening the call (capped) is not held against the gateway.
+    """
+    breaker = breaker_for(path_family(path))
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.family)
+    outcome = "error"
+    try:
+        result = call()
+        status = result[0] if isinstance(result, tuple) else result.status_code
+        outcome = "ok" if int(status) < 500 else "error"
+        return result
+    except requests.Timeout:
+        outcome = None if capped else "timeout"
+        raise
+    finally:
+        if outcome is None:
+            breaker.cancel()
+        else:
+            breaker.record(outcome)
+
+
+def _coolbits_request(method, path, params=None, body=None, timeout=25, extra_headers=None, deadline=None, hedge=False):
+    """hedge=True opts an idempotent GET into gateway_hedge (second attempt past the path's tail latency)."""
+    timeout, capped, expires_at = _coolbits_deadline(path, timeout, deadline)
+    return _coolbits_request_raw(method, path, params, body, timeout, extra_headers, expires_at, hedge, capped)
+
+
+def _coolbits_request_raw(method, path, params=None, body=None, timeout=25, extra_headers=None, expires_at=None,
+                          hedge=False, capped=False):
     token = _coolbits_get_token(force=False)
     url = f"{COOLBITS_URL}{path if path.startswith('/') else '/' + path}"
     headers = {
@@ -644,45 +824,140 @@ def _coolbits_request(method, path, params=None, body=None, timeout=25, extra_he
         for k, v in extra_headers.items():
             if k and v is not None:
                 headers[str(k)] = str(v)
-    r = requests.request(method, url, params=params, json=body, headers=headers, timeout=timeout)
-    if r.status_code == 401 and not _coolbits_get_request_token():
-        token = _coolbits_get_token(force=True)
-        headers["Authorization"] = f"Bearer {token}"
-        r = requests.request(method, url, params=params, json=body, headers=headers, timeout=timeout)
-    ct = (r.headers.get("content-type") or "").lower()
+
+    def _attempt():
+        r = gateway_client().request(
+            method, url, params=params, json=body, headers=dict(headers), timeout=timeout, deadline=expires_at,
+        )
+        return r.status_code, (r.headers.get("content-type") or "").lower(), r.text
+
+    def _send():
+        if hedge and str(method).upper() == "GET":
+            # histogram per gateway path; a fast 429 / 5xx does not beat the other attempt's real answer
+            result = hedged_call(url[len(COOLBITS_URL):], _attempt, accept=lambda r: 200 <= r[0] < 500 and r[0] != 429)
+        else:
+            result = _attempt()
+        if result[0] == 401 and not _coolbits_get_request_token():
+            fresh = _coolbits_get_token(force=True, rejected=token)
+            headers["Authorization"] = f"Bearer {fresh}"
+            result = _attempt()
+        return result
+
+    def _guarded_send():
+        # Inside the flight: the breaker sees one outcome per upstream call, not one per coalesced waiter.
+        return _coolbits_guarded(path, _send, capped=capped)
+
+    if str(method).upper() == "GET" and Config.GATEWAY_SINGLE_FLIGHT:
+        # Same URL + params + caller identity (token, workspace, extra headers) -> one upstream call.
+        key = (
+            url,
+            tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)),
+            tuple(sorted(headers.items())),
+        )
+        wait = timeout[-1] if isinstance(timeout, (tuple, list)) else timeout
+        (status, ct, text), _shared = _coolbits_single_flight.do(key, _guarded_send, timeout=float(wait or 30))
+    else:
+        status, ct, text = _guarded_send()
     payload = None
     if "application/json" in ct:
         try:
-            payload = r.json()
+            payload = json.loads(text)  # parsed per caller: coalesced waiters never share a dict
         except Exception:
             payload = None
-    return r.status_code, payload, r.text
+    return status, payload, text
 
 
-def _ensure_users_auth_schema(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            is_premium BOOLEAN DEFAULT FALSE
-        )
-    """)
-    for stmt in (
-        "ALTER TABLE users ADD COLUMN email TEXT",
-        "ALTER TABLE users ADD COLUMN auth_provider TEXT DEFAULT 'local'",
-        "ALTER TABLE users ADD COLUMN created_at TEXT",
-        "ALTER TABLE users ADD COLUMN last_login_at TEXT",
-    ):
-        try:
-            conn.execute(stmt)
-            conn.commit()
-        except Exception:
-            pass
+def _coolbits_open_stream(method, path, body=None, timeout=60, extra_headers=None, deadline=None):
+    """Like _coolbits_request, but returns the unread streaming response (caller closes it)."""
+    timeout, capped, expires_at = _coolbits_deadline(path, timeout, deadline)
+    return _coolbits_guarded(
+        path,
+        lambda: _coolbits_open_stream_raw(method, path, body, timeout, extra_headers, expires_at),
+        capped=capped,
+    )
+
+
+def _coolbits_open_stream_raw(method, path, body=None, timeout=60, extra_headers=None, expires_at=None):
+    token = _coolbits_get_token(force=False)
+    url = f"{COOLBITS_URL}{path if path.startswith('/') else '/' + path}"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "X-Workspace-Id": COOLBITS_WORKSPACE_ID,
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream, application/json",
+    }
+    if isinstance(extra_headers, dict):
+        for k, v in extra_headers.items():
+            if k and v is not None:
+                headers[str(k)] = str(v)
+    client = gateway_client()
+    r = client.request(method, url, json=body, headers=headers, timeout=timeout, stream=True, deadline=expires_at)
+    if r.status_code == 401 and not _coolbits_get_request_token():
+        r.close()
+        token = _coolbits_get_token(force=True, rejected=token)
+        headers["Authorization"] = f"Bearer {token}"
+        r = client.request(method, url, json=body, headers=headers, timeout=timeout, stream=True, deadline=expires_at)
+    return r
+
+
+GATEWAY_CACHE_TTLS = {
+    "ga4": Config.GATEWAY_CACHE_TTL_GA4_S,
+    "google_ads": Config.GATEWAY_CACHE_TTL_GOOGLE_ADS_S,
+    "stripe": Config.GATEWAY_CACHE_TTL_STRIPE_S,
+}
+GATEWAY_CACHE_NEGATIVE_ERRORS = {"not_connected", "property_not_set"}
+
+
+def _gateway_cache_identity():
+    if not has_request_context():
+        return None, None
     try:
-        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique ON users(email)")
-        conn.commit()
+        return get_current_user_id(), get_current_client_id()
     except Exception:
-        pass
+        return None, None
+
+
+def _gateway_cache_classify(result):
+    payload, meta = result
+    meta = meta or {}
+    err = str(meta.get("error") or "").strip().lower()
+    if not err and isinstance(payload, dict):
+        err = str(payload.get("error") or "").strip().lower()
+    if err in GATEWAY_CACHE_NEGATIVE_ERRORS:
+        return "negative"
+    if payload is not None and not err and 200 <= int(meta.get("status") or 0) < 300:
+        return "ok"
+    return None
+
+
+def _gateway_cache_spawn(fn):
+    if has_request_context():
+        fn = copy_current_request_context(fn)  # the refresh keeps this user's gateway token
+    threading.Thread(target=fn, daemon=True).start()
+
+
+def _gateway_cached_read(connector, live_fetch, path_candidates, params=None, timeout=25, cache=True):
+    """Serve a connector gateway read from gateway_cache; meta["cache"] is hit / stale / miss / bypass."""
+    ttl = max(0, int(GATEWAY_CACHE_TTLS.get(connector) or 0))
+    family = path_family(path_candidates[0] if path_candidates else "")
+    if not cache or ttl <= 0:
+        payload, meta = live_fetch(path_candidates, params=params, timeout=timeout)
+        return payload, {**(meta or {}), "cache": "bypass", "breaker": breaker_state(family)}
+    user_id, client_id = _gateway_cache_identity()
+    key = gateway_cache.cache_key(connector, user_id, client_id, path_candidates, params)
+    (payload, meta), state = gateway_cache.read_through(
+        key,
+        lambda: live_fetch(path_candidates, params=params, timeout=timeout),
+        ttl,
+        negative_ttl=max(0, int(Config.GATEWAY_CACHE_NEGATIVE_TTL_S)),
+        classify=_gateway_cache_classify,
+        spawn=_gateway_cache_spawn,
+    )
+    return payload, {**(meta or {}), "cache": state, "breaker": breaker_state(family)}
+
+
+def _ensure_users_auth_schema(conn):
+    ensure_schema(conn)
 
 
 def _normalize_email(value):
@@ -750,7 +1025,11 @@ def _coolbits_auth_me(token):
     token = str(token or "").strip()
     if not token:
         raise RuntimeError("missing_token")
-    resp = requests.get(
+    cached = _coolbits_auth_me_cache.get(token)
+    if cached is not None:
+        return cached
+    resp = gateway_client().request(
+        "GET",
         f"{COOLBITS_URL}/api/auth/me",
         headers={"Authorization": f"Bearer {token}", "X-Workspace-Id": COOLBITS_WORKSPACE_ID},
         timeout=15,
@@ -761,6 +1040,7 @@ def _coolbits_auth_me(token):
     user = payload.get("user") if isinstance(payload, dict) else {}
     if not isinstance(user, dict):
         raise RuntimeError("coolbits_invalid_user_payload")
+    _coolbits_auth_me_cache.put(token, user)
     return user
 
 
@@ -1258,15 +1538,7 @@ def _sanitize_user_settings(settings_obj):
 
 
 def _ensure_user_settings_table(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL UNIQUE,
-            settings_json TEXT NOT NULL DEFAULT '{}',
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
+    ensure_schema(conn)
 
 
 def _load_user_settings(conn, user_id):
@@ -1304,258 +1576,8 @@ def _get_user_settings(user_id):
     return settings
 
 
-_PERSONAL_ASSISTANT_NAME_MIGRATED = False
-_CLIENT_SCOPED_CONFIGS_MIGRATED = False
-
-
-def _table_exists(conn, table_name):
-    row = conn.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
-        (str(table_name),),
-    ).fetchone()
-    return bool(row)
-
-
-def _table_columns(conn, table_name):
-    cols = {}
-    try:
-        rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
-        for r in rows:
-            cols[str(r[1])] = {
-                "type": str(r[2] or ""),
-                "notnull": int(r[3] or 0),
-                "dflt": r[4],
-                "pk": int(r[5] or 0),
-            }
-    except Exception:
-        return {}
-    return cols
-
-
-def _has_unique_index_on_columns(conn, table_name, wanted_cols):
-    wanted = [str(x) for x in (wanted_cols or [])]
-    try:
-        idx_rows = conn.execute(f"PRAGMA index_list({table_name})").fetchall()
-    except Exception:
-        return False
-    for idx in idx_rows or []:
-        unique = int(idx[2] or 0)
-        idx_name = str(idx[1] or "")
-        if unique != 1 or not idx_name:
-            continue
-        try:
-            info_rows = conn.execute(f"PRAGMA index_info('{idx_name}')").fetchall()
-        except Exception:
-            continue
-        cols = [str(r[2]) for r in info_rows if r[2] is not None]
-        if cols == wanted:
-            return True
-    return False
-
-
-def _rebuild_agents_config_per_client(conn):
-    if not _table_exists(conn, "agents_config"):
-        return
-    cols = _table_columns(conn, "agents_config")
-    if (
-        cols.get("client_id", {}).get("notnull") == 1
-        and _has_unique_index_on_columns(conn, "agents_config", ["user_id", "agent_slug", "client_id"])
-    ):
-        return
-
-    old_name = "agents_config_old_m3"
-    conn.execute(f"DROP TABLE IF EXISTS {old_name}")
-    conn.execute("ALTER TABLE agents_config RENAME TO agents_config_old_m3")
-    conn.execute(
-        """
-        CREATE TABLE agents_config (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER NOT NULL DEFAULT 0,
-            agent_slug TEXT NOT NULL,
-            custom_name TEXT,
-            avatar_base64 TEXT,
-            avatar_colors TEXT,
-            llm_provider TEXT,
-            llm_model TEXT,
-            api_key TEXT,
-            temperature REAL DEFAULT 0.7,
-            max_tokens INTEGER DEFAULT 2048,
-            rag_enabled INTEGER DEFAULT 1,
-            status TEXT DEFAULT 'Active',
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            UNIQUE(user_id, agent_slug, client_id)
-        )
-        """
-    )
-
-    old_cols = _table_columns(conn, old_name)
-    expr = {
-        "id": "id" if "id" in old_cols else "NULL",
-        "user_id": "user_id" if "user_id" in old_cols else "1",
-        "client_id": "COALESCE(client_id, 0)" if "client_id" in old_cols else "0",
-        "agent_slug": "agent_slug" if "agent_slug" in old_cols else "''",
-        "custom_name": "custom_name" if "custom_name" in old_cols else "NULL",
-        "avatar_base64": "avatar_base64" if "avatar_base64" in old_cols else "NULL",
-        "avatar_colors": "avatar_colors" if "avatar_colors" in old_cols else "NULL",
-        "llm_provider": "llm_provider" if "llm_provider" in old_cols else "NULL",
-        "llm_model": "llm_model" if "llm_model" in old_cols else "NULL",
-        "api_key": "api_key" if "api_key" in old_cols else "NULL",
-        "temperature": "temperature" if "temperature" in old_cols else "0.7",
-        "max_tokens": "max_tokens" if "max_tokens" in old_cols else "2048",
-        "rag_enabled": "rag_enabled" if "rag_enabled" in old_cols else "1",
-        "status": "status" if "status" in old_cols else "'Active'",
-        "created_at": "created_at" if "created_at" in old_cols else "datetime('now')",
-        "updated_at": "updated_at" if "updated_at" in old_cols else "datetime('now')",
-    }
-    conn.execute(
-        f"""
-        INSERT INTO agents_config (
-            id, user_id, client_id, agent_slug, custom_name, avatar_base64, avatar_colors,
-            llm_provider, llm_model, api_key, temperature, max_tokens, rag_enabled, status, created_at, updated_at
-        )
-        SELECT
-            {expr["id"]}, {expr["user_id"]}, {expr["client_id"]}, {expr["agent_slug"]}, {expr["custom_name"]},
-            {expr["avatar_base64"]}, {expr["avatar_colors"]}, {expr["llm_provider"]}, {expr["llm_model"]},
-            {expr["api_key"]}, {expr["temperature"]}, {expr["max_tokens"]}, {expr["rag_enabled"]},
-            {expr["status"]}, {expr["created_at"]}, {expr["updated_at"]}
-        FROM {old_name}
-        """
-    )
-    conn.execute(f"DROP TABLE {old_name}")
-
-
-def _rebuild_connectors_config_per_client(conn):
-    if not _table_exists(conn, "connectors_config"):
-        return
-    cols = _table_columns(conn, "connectors_config")
-    if (
-        cols.get("client_id", {}).get("notnull") == 1
-        and _has_unique_index_on_columns(conn, "connectors_config", ["user_id", "connector_slug", "client_id"])
-    ):
-        return
-
-    old_name = "connectors_config_old_m3"
-    conn.execute(f"DROP TABLE IF EXISTS {old_name}")
-    conn.execute("ALTER TABLE connectors_config RENAME TO connectors_config_old_m3")
-    conn.execute(
-        """
-        CREATE TABLE connectors_config (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER NOT NULL DEFAULT 0,
-            connector_slug TEXT NOT NULL,
-            status TEXT DEFAULT 'Disconnected',
-            config_json TEXT,
-            last_connected TEXT,
-            UNIQUE(user_id, connector_slug, client_id)
-        )
-        """
-    )
-
-    old_cols = _table_columns(conn, old_name)
-    expr = {
-        "id": "id" if "id" in old_cols else "NULL",
-        "user_id": "user_id" if "user_id" in old_cols else "1",
-        "client_id": "COALESCE(client_id, 0)" if "client_id" in old_cols else "0",
-        "connector_slug": "connector_slug" if "connector_slug" in old_cols else "''",
-        "status": "status" if "status" in old_cols else "'Disconnected'",
-        "config_json": "config_json" if "config_json" in old_cols else "NULL",
-        "last_connected": "last_connected" if "last_connected" in old_cols else "NULL",
-    }
-    conn.execute(
-        f"""
-        INSERT INTO connectors_config (
-            id, user_id, client_id, connector_slug, status, config_json, last_connected
-        )
-        SELECT
-            {expr["id"]}, {expr["user_id"]}, {expr["client_id"]}, {expr["connector_slug"]},
-            {expr["status"]}, {expr["config_json"]}, {expr["last_connected"]}
-        FROM {old_name}
-        """
-    )
-    conn.execute(f"DROP TABLE {old_name}")
-
-
 def _ensure_client_tables(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS clients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL DEFAULT 'person',
-            name TEXT,
-            company_name TEXT,
-            email TEXT,
-            website TEXT,
-            phone TEXT,
-            address TEXT,
-            notes TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS client_connectors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_id INTEGER NOT NULL,
-            connector_slug TEXT NOT NULL,
-            account_id TEXT,
-            account_name TEXT,
-            status TEXT DEFAULT 'pending',
-            config_json TEXT,
-            last_synced TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
-    for stmt in (
-        "ALTER TABLE flows ADD COLUMN client_id INTEGER",
-        "ALTER TABLE conversations ADD COLUMN client_id INTEGER",
-        "ALTER TABLE agents_config ADD COLUMN client_id INTEGER",
-        "ALTER TABLE connectors_config ADD COLUMN client_id INTEGER",
-    ):
-        try:
-            conn.execute(stmt)
-        except Exception:
-            pass
-    try:
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_user ON clients(user_id)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_client_connectors_client ON client_connectors(client_id)")
-    except Exception:
-        pass
-    global _CLIENT_SCOPED_CONFIGS_MIGRATED
-    if not _CLIENT_SCOPED_CONFIGS_MIGRATED:
-        try:
-            conn.execute("BEGIN")
-            _rebuild_agents_config_per_client(conn)
-            _rebuild_connectors_config_per_client(conn)
-            conn.execute("COMMIT")
-            _CLIENT_SCOPED_CONFIGS_MIGRATED = True
-        except Exception:
-            try:
-                conn.execute("ROLLBACK")
-            except Exception:
-                pass
-
-    # One-time migration: keep slug `life-coach` but persist branding as "Personal Assistant"
-    # when custom_name is empty. This avoids UI regressions without breaking history.
-    global _PERSONAL_ASSISTANT_NAME_MIGRATED
-    if not _PERSONAL_ASSISTANT_NAME_MIGRATED:
-        try:
-            conn.execute(
-                """
-                UPDATE agents_config
-                SET custom_name = ?
-                WHERE agent_slug = ?
-                  AND (custom_name IS NULL OR TRIM(custom_name) = '')
-                """,
-                ("Personal Assistant", "life-coach"),
-            )
-            conn.commit()
-            _PERSONAL_ASSISTANT_NAME_MIGRATED = True
-        except Exception:
-            pass
+    ensure_schema(conn)
 
 
 CT_MONTHLY_GRANT_FREE = 1000
@@ -1564,167 +1586,25 @@ CT_LOW_BALANCE_WARN_PCT = 20
 SHADOW_DEFAULT_BUFFER_PCT = 0.15
 SHADOW_DEFAULT_MARGIN_PCT = 0.50
 SHADOW_DEFAULT_CT_VALUE_USD = 0.00010
+SHADOW_PRICING_SEED_INTERVAL_SECONDS = _env_int("SHADOW_PRICING_SEED_INTERVAL_SECONDS", 600, min_value=0, max_value=86400)
 
 
 def _ensure_usage_ledger_table(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS usage_ledger (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            client_id INTEGER,
-            event_type TEXT NOT NULL,
-            amount INTEGER NOT NULL,
-            description TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
-    try:
-        conn.execute("ALTER TABLE usage_ledger ADD COLUMN client_id INTEGER")
-    except Exception:
-        pass
-    # Shadow billing telemetry (Phase 1): additive columns only.
-    for stmt in (
-        "ALTER TABLE usage_ledger ADD COLUMN request_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN workspace_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN run_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN step_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN agent_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN trace_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN provider TEXT DEFAULT 'mock'",
-        "ALTER TABLE usage_ledger ADD COLUMN model TEXT DEFAULT 'mock'",
-        "ALTER TABLE usage_ledger ADD COLUMN region TEXT DEFAULT 'unknown'",
-        "ALTER TABLE usage_ledger ADD COLUMN model_class TEXT DEFAULT 'auto'",
-        "ALTER TABLE usage_ledger ADD COLUMN input_tokens INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN output_tokens INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN tool_calls INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN connector_calls INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN latency_ms INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN status TEXT DEFAULT 'ok'",
-        "ALTER TABLE usage_ledger ADD COLUMN error_code TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_estimate_usd REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_final_usd REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_estimate_eur REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_final_eur REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN overhead_eur REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN billable_eur REAL",
-        "ALTER TABLE usage_ledger ADD COLUMN billable_usd REAL",
-        "ALTER TABLE usage_ledger ADD COLUMN overhead_usd REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_shadow_debit INTEGER",
-        "ALTER TABLE usage_ledger ADD COLUMN risk_buffer_pct REAL DEFAULT 0.15",
-        "ALTER TABLE usage_ledger ADD COLUMN target_margin_pct REAL DEFAULT 0.50",
-        "ALTER TABLE usage_ledger ADD COLUMN minimum_ct_debit INTEGER DEFAULT 1",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_actual_debit INTEGER",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_debit_shadow INTEGER",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_ledger_txn_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN pricing_catalog_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_rate_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_debit_applied INTEGER",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_applied INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_applied_at TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_cap_reason TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN meta_json TEXT",
-    ):
-        try:
-            conn.execute(stmt)
-        except Exception:
-            pass
-    try:
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_created ON usage_ledger(user_id, created_at)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_event ON usage_ledger(user_id, event_type)")
-        conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_ledger_request_id_unique "
-            "ON usage_ledger(request_id) WHERE request_id IS NOT NULL AND request_id <> ''"
-        )
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_status_created ON usage_ledger(status, created_at)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_provider_model_created ON usage_ledger(provider, model, created_at)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_phase3_created ON usage_ledger(phase3_applied, created_at)")
-    except Exception:
-        pass
+    ensure_schema(conn)
     _ensure_pricing_engine_tables(conn)
 
 
-def _ensure_pricing_engine_tables(conn):
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS pricing_catalog (
-            id TEXT PRIMARY KEY,
-            provider TEXT NOT NULL,
-            model TEXT NOT NULL,
-            region TEXT NOT NULL DEFAULT 'unknown',
-            input_price_per_1k_usd REAL NOT NULL DEFAULT 0,
-            output_price_per_1k_usd REAL NOT NULL DEFAULT 0,
-            tool_call_price_usd REAL NOT NULL DEFAULT 0,
-            connector_call_price_usd REAL NOT NULL DEFAULT 0,
-            effective_from TEXT NOT NULL,
-            effective_to TEXT,
-            version INTEGER NOT NULL DEFAULT 1,
-            is_active INTEGER NOT NULL DEFAULT 1,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            notes TEXT
-        )
-        """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS ct_rates (
-            id TEXT PRIMARY KEY,
-            ct_value_usd REAL NOT NULL,
-            effective_from TEXT NOT NULL,
-            effective_to TEXT,
-            version INTEGER NOT NULL DEFAULT 1,
-            is_active INTEGER NOT NULL DEFAULT 1,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            notes TEXT
-        )
-        """
-    )
-    try:
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_pricing_lookup ON pricing_catalog(provider, model, region, effective_from)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_ct_rates_effective ON ct_rates(effective_from)")
-        conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_pricing_provider_model_version "
-            "ON pricing_catalog(provider, model, version)"
-        )
-    except Exception:
-        pass
+_SHADOW_PRICING_SEEDED_AT = 0.0
 
-    # Seed default ct rate once.
-    row = conn.execute("SELECT id FROM ct_rates ORDER BY effective_from DESC LIMIT 1").fetchone()
-    if not row:
-        conn.execute(
-            """
-            INSERT INTO ct_rates (id, ct_value_usd, effective_from, effective_to, version, is_active, notes)
-            VALUES (?, ?, datetime('now'), NULL, 1, 1, ?)
-            """,
-            (str(uuid.uuid4()), float(SHADOW_DEFAULT_CT_VALUE_USD), "bootstrap shadow ct rate"),
-        )
 
-    # Seed a minimal pricing catalog for currently used models.
-    seeds = [
-        ("vertex", "gemini-1.5-flash-002", "unknown", 0.000075, 0.000300, 1),
-        ("vertex", "gemini-1.5-pro-002", "unknown", 0.001250, 0.005000, 1),
-        ("anthropic", "claude-3-5-sonnet-20241022", "unknown", 0.003000, 0.015000, 1),
-        ("xai", "grok-beta", "unknown", 0.000200, 0.000800, 1),
-        ("grok", "grok-1", "unknown", 0.000200, 0.000800, 1),
-    ]
-    for provider, model, region, in_p, out_p, version in seeds:
-        exists = conn.execute(
-            "SELECT id FROM pricing_catalog WHERE provider = ? AND model = ? AND version = ? LIMIT 1",
-            (provider, model, int(version)),
-        ).fetchone()
-        if not exists:
-            conn.execute(
-                """
-                INSERT INTO pricing_catalog (
-                    id, provider, model, region,
-                    input_price_per_1k_usd, output_price_per_1k_usd,
-                    tool_call_price_usd, connector_call_price_usd,
-                    effective_from, effective_to, version, is_active, notes
-                ) VALUES (?, ?, ?, ?, ?, ?, 0, 0, datetime('now'), NULL, ?, 1, ?)
-                """,
-                (str(uuid.uuid4()), provider, model, region, float(in_p), float(out_p), int(version), "seed"),
-            )
-    # Keep catalog fresh with models observed in live usage.
+def _ensure_pricing_engine_tables(conn):
+    ensure_schema(conn)
+    # Keep catalog fresh with models observed in live usage (throttled; the scan is not free).
+    global _SHADOW_PRICING_SEEDED_AT
+    now = time.time()
+    if now - _SHADOW_PRICING_SEEDED_AT < SHADOW_PRICING_SEED_INTERVAL_SECONDS:
+        return
+    _SHADOW_PRICING_SEEDED_AT = now
     try:
         _shadow_seed_pricing_from_usage(conn, window_hours=48)
     except Exception:
@@ -1941,8 +1821,41 @@ def _estimate_tokens(text):
     return max(1, int(math.ceil(len(t) / 4.0)))
 
 
-def _shadow_usage_preflight(
-    conn,
+_SHADOW_PREFLIGHT_SQL = """
+    INSERT OR IGNORE INTO usage_ledger (
+        user_id, client_id, workspace_id, event_type, amount, description, created_at,
+        request_id, run_id, step_id, agent_id, trace_id,
+        provider, model, region, model_class,
+        cost_estimate_usd, cost_final_usd, status, meta_json
+    ) VALUES (?, ?, ?, ?, ?, ?, datetime('now'),
+              ?, ?, ?, ?, ?,
+              ?, ?, ?, ?,
+              ?, 0, 'ok', ?)
+"""
+
+_SHADOW_FINALIZE_SQL = """
+    UPDATE usage_ledger
+    SET input_tokens = ?,
+        output_tokens = ?,
+        tool_calls = ?,
+        connector_calls = ?,
+        latency_ms = ?,
+        status = ?,
+        error_code = ?,
+        cost_final_usd = ?,
+        billable_usd = ?,
+        ct_shadow_debit = ?,
+        pricing_catalog_id = ?,
+        ct_rate_id = ?,
+        risk_buffer_pct = ?,
+        target_margin_pct = ?,
+        minimum_ct_debit = ?,
+        meta_json = ?
+    WHERE request_id = ?
+"""
+
+
+def _shadow_usage_preflight_params(
     *,
     request_id,
     user_id,
@@ -1962,47 +1875,39 @@ def _shadow_usage_preflight(
     cost_estimate_usd=0.0,
     meta=None,
 ):
+    meta_json = json.dumps(meta or {}, ensure_ascii=True)
+    return (
+        int(user_id),
+        int(client_id) if client_id is not None else None,
+        str(workspace_id or "unknown"),
+        str(event_type or "unknown").strip().lower() or "unknown",
+        int(amount or 0),
+        str(description or "")[:300],
+        str(request_id or "")[:96],
+        str(run_id or "")[:64] or None,
+        str(step_id or "")[:64] or None,
+        str(agent_id or "")[:64] or None,
+        str(trace_id or "")[:96] or None,
+        str(provider or "mock")[:64],
+        str(model or "mock")[:128],
+        str(region or "unknown")[:32],
+        str(model_class or "auto")[:24],
+        float(cost_estimate_usd or 0.0),
+        meta_json[:8000],
+    )
+
+
+def _shadow_usage_preflight(conn, **kwargs):
     try:
         _ensure_usage_ledger_table(conn)
-        meta_json = json.dumps(meta or {}, ensure_ascii=True)
-        conn.execute(
-            """
-            INSERT OR IGNORE INTO usage_ledger (
-                user_id, client_id, workspace_id, event_type, amount, description, created_at,
-                request_id, run_id, step_id, agent_id, trace_id,
-                provider, model, region, model_class,
-                cost_estimate_usd, cost_final_usd, status, meta_json
-            ) VALUES (?, ?, ?, ?, ?, ?, datetime('now'),
-                      ?, ?, ?, ?, ?,
-                      ?, ?, ?, ?,
-                      ?, 0, 'ok', ?)
-            """,
-            (
-                int(user_id),
-                int(client_id) if client_id is not None else None,
-                str(workspace_id or "unknown"),
-                str(event_type or "unknown").strip().lower() or "unknown",
-                int(amount or 0),
-                str(description or "")[:300],
-                str(request_id or "")[:96],
-                str(run_id or "")[:64] or None,
-                str(step_id or "")[:64] or None,
-                str(agent_id or "")[:64] or None,
-                str(trace_id or "")[:96] or None,
-                str(provider or "mock")[:64],
-                str(model or "mock")[:128],
-                str(region or "unknown")[:32],
-                str(model_class or "auto")[:24],
-                float(cost_estimate_usd or 0.0),
-                meta_json[:8000],
-            ),
-        )
+        conn.execute(_SHADOW_PREFLIGHT_SQL, _shadow_usage_preflight_params(**kwargs))
     except Exception as e:
         print(f"shadow_usage_preflight_error: {e}")
 
 
-def _shadow_usage_finalize(
+def _shadow_usage_finalize_params(
     conn,
+    row,
     *,
     request_id,
     status="ok",
@@ -2014,7 +1919,111 @@ def _shadow_usage_finalize(
     latency_ms=0,
     cost_final_usd=0.0,
     meta=None,
+    lookups=None,
 ):
+    """_SHADOW_FINALIZE_SQL parameters for the ledger `row` (created_at, user_id, provider, model, region).
+
+    lookups: optional dict memoizing user economy settings / pricing / CT rates across a batch.
+    """
+    lookups = lookups if lookups is not None else {}
+    effective_provider = str((row["provider"] if row["provider"] is not None else "mock") or "mock")
+    effective_model = str((row["model"] if row["model"] is not None else "mock") or "mock")
+    effective_region = str((row["region"] if row["region"] is not None else "unknown") or "unknown")
+    occurred_at = str(row["created_at"] or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    # Pull user economy knobs when available (shadow only).
+    risk_buffer = float(SHADOW_DEFAULT_BUFFER_PCT)
+    target_margin = float(SHADOW_DEFAULT_MARGIN_PCT)
+    minimum_ct = 1
+    try:
+        uid = int(row["user_id"] or 0)
+        if uid > 0:
+            if ("settings", uid) not in lookups:
+                lookups[("settings", uid)] = _get_user_settings(uid)
+            settings_obj = lookups[("settings", uid)]
+            econ = settings_obj.get("economy") if isinstance(settings_obj.get("economy"), dict) else {}
+            risk_buffer = float(econ.get("risk_buffer_pct", risk_buffer) or risk_buffer)
+            target_margin = float(econ.get("target_margin_pct", target_margin) or target_margin)
+            minimum_ct = int(econ.get("minimum_ct_debit", 1) or 1)
+    except Exception:
+        pass
+    risk_buffer = max(0.0, min(3.0, float(risk_buffer)))
+    target_margin = max(0.0, min(3.0, float(target_margin)))
+    minimum_ct = max(1, min(1000, int(minimum_ct)))
+
+    pricing_key = ("pricing", effective_provider, effective_model, effective_region, occurred_at)
+    if pricing_key not in lookups:
+        lookups[pricing_key] = _shadow_lookup_pricing(conn, effective_provider, effective_model, effective_region, occurred_at)
+    pricing = lookups[pricing_key]
+    if ("ct_rate", occurred_at) not in lookups:
+        lookups[("ct_rate", occurred_at)] = _shadow_lookup_ct_rate(conn, occurred_at)
+    ct_rate = lookups[("ct_rate", occurred_at)]
+
+    computed_cost_final_usd = float(cost_final_usd or 0.0)
+    pricing_id = None
+    pricing_version = None
+    if pricing:
+        pricing_id = str(pricing["id"] or "")
+        pricing_version = int(pricing["version"] or 0)
+        # In phase 2, compute from tokens/calls whenever pricing is available.
+        computed_cost_final_usd = (
+            (float(int(input_tokens or 0)) / 1000.0) * float(pricing["input_price_per_1k_usd"] or 0.0)
+            + (float(int(output_tokens or 0)) / 1000.0) * float(pricing["output_price_per_1k_usd"] or 0.0)
+            + float(int(tool_calls or 0)) * float(pricing["tool_call_price_usd"] or 0.0)
+            + float(int(connector_calls or 0)) * float(pricing["connector_call_price_usd"] or 0.0)
+        )
+
+    ct_rate_id = None
+    ct_rate_value = None
+    ct_rate_version = None
+    billable_usd = None
+    ct_shadow_debit = None
+    if ct_rate:
+        ct_rate_id = str(ct_rate["id"] or "")
+        ct_rate_value = float(ct_rate["ct_value_usd"] or 0.0)
+        ct_rate_version = int(ct_rate["version"] or 0)
+        if ct_rate_value > 0:
+            overhead = 0.0
+            billable_usd = (float(computed_cost_final_usd) + overhead) * (1.0 + risk_buffer + target_margin)
+            ct_shadow_debit = max(int(minimum_ct), int(math.ceil(float(billable_usd) / float(ct_rate_value))))
+
+    meta_dict = {}
+    if isinstance(meta, dict):
+        meta_dict.update(meta)
+    meta_dict.update({
+        "shadow_mode": True,
+        "pricing_source": "pricing_catalog_v1" if pricing else "missing_pricing",
+        "pricing_missing": not bool(pricing),
+        "ct_rate_missing": not bool(ct_rate),
+        "pricing_version_used": pricing_version,
+        "ct_rate_version_used": ct_rate_version,
+        "risk_buffer_pct": risk_buffer,
+        "target_margin_pct": target_margin,
+        "minimum_ct_debit": minimum_ct,
+    })
+    meta_json = json.dumps(meta_dict, ensure_ascii=True)
+    return (
+        int(input_tokens or 0),
+        int(output_tokens or 0),
+        int(tool_calls or 0),
+        int(connector_calls or 0),
+        int(latency_ms or 0),
+        str(status or "ok")[:16],
+        str(error_code or "")[:64] or None,
+        float(computed_cost_final_usd or 0.0),  # shadow only for now
+        float(billable_usd) if billable_usd is not None else None,
+        int(ct_shadow_debit) if ct_shadow_debit is not None else None,
+        pricing_id if pricing_id else None,
+        ct_rate_id if ct_rate_id else None,
+        float(risk_buffer),
+        float(target_margin),
+        int(minimum_ct),
+        meta_json[:8000],
+        str(request_id or "")[:96],
+    )
+
+
+def _shadow_usage_finalize(conn, *, request_id, **kwargs):
     try:
         _ensure_usage_ledger_table(conn)
         # Resolve row context first for pricing lookup and reproducibility.
@@ -2030,119 +2039,52 @@ def _shadow_usage_finalize(
         ).fetchone()
         if not row:
             return
+        conn.execute(_SHADOW_FINALIZE_SQL, _shadow_usage_finalize_params(conn, row, request_id=request_id, **kwargs))
+    except Exception as e:
+        print(f"shadow_usage_finalize_error: {e}")
 
-        effective_provider = str((row["provider"] if row["provider"] is not None else "mock") or "mock")
-        effective_model = str((row["model"] if row["model"] is not None else "mock") or "mock")
-        effective_region = str((row["region"] if row["region"] is not None else "unknown") or "unknown")
-        occurred_at = str(row["created_at"] or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
-        # Pull user economy knobs when available (shadow only).
-        risk_buffer = float(SHADOW_DEFAULT_BUFFER_PCT)
-        target_margin = float(SHADOW_DEFAULT_MARGIN_PCT)
-        minimum_ct = 1
-        try:
-            uid = int(row["user_id"] or 0)
+def _write_usage_batch(items):
+    """TelemetryWriter batch: each item is {"preflight": kwargs, "finalize": kwargs} for one request_id.
+
+    All preflight INSERTs, one SELECT for the rows' pricing context, then all finalize UPDATEs, in one
+    transaction; settings / pricing / CT-rate lookups are shared across the batch.
+    """
+    conn = get_db()
+    try:
+        _ensure_usage_ledger_table(conn)
+        lookups = {}
+        for uid in {int(item["preflight"]["user_id"] or 0) for item in items}:
             if uid > 0:
-                settings_obj = _get_user_settings(uid)
-                econ = settings_obj.get("economy") if isinstance(settings_obj.get("economy"), dict) else {}
-                risk_buffer = float(econ.get("risk_buffer_pct", risk_buffer) or risk_buffer)
-                target_margin = float(econ.get("target_margin_pct", target_margin) or target_margin)
-                minimum_ct = int(econ.get("minimum_ct_debit", 1) or 1)
-        except Exception:
-            pass
-        risk_buffer = max(0.0, min(3.0, float(risk_buffer)))
-        target_margin = max(0.0, min(3.0, float(target_margin)))
-        minimum_ct = max(1, min(1000, int(minimum_ct)))
-
-        pricing = _shadow_lookup_pricing(conn, effective_provider, effective_model, effective_region, occurred_at)
-        ct_rate = _shadow_lookup_ct_rate(conn, occurred_at)
-
-        computed_cost_final_usd = float(cost_final_usd or 0.0)
-        pricing_id = None
-        pricing_version = None
-        if pricing:
-            pricing_id = str(pricing["id"] or "")
-            pricing_version = int(pricing["version"] or 0)
-            # In phase 2, compute from tokens/calls whenever pricing is available.
-            computed_cost_final_usd = (
-                (float(int(input_tokens or 0)) / 1000.0) * float(pricing["input_price_per_1k_usd"] or 0.0)
-                + (float(int(output_tokens or 0)) / 1000.0) * float(pricing["output_price_per_1k_usd"] or 0.0)
-                + float(int(tool_calls or 0)) * float(pricing["tool_call_price_usd"] or 0.0)
-                + float(int(connector_calls or 0)) * float(pricing["connector_call_price_usd"] or 0.0)
-            )
+                lookups[("settings", uid)] = _get_user_settings(uid)  # read before the write transaction opens
+        conn.executemany(_SHADOW_PREFLIGHT_SQL, [_shadow_usage_preflight_params(**item["preflight"]) for item in items])
+        request_ids = sorted({str(item["finalize"]["request_id"] or "")[:96] for item in items})
+        rows = {}
+        for start in range(0, len(request_ids), 500):
+            chunk = request_ids[start:start + 500]
+            for row in conn.execute(
+                f"""
+                SELECT id, request_id, created_at, user_id, workspace_id, provider, model, region
+                FROM usage_ledger
+                WHERE request_id IN ({','.join('?' for _ in chunk)})
+                ORDER BY id
+                """,
+                tuple(chunk),
+            ).fetchall():
+                rows[str(row["request_id"])] = row
+        updates = []
+        for item in items:
+            row = rows.get(str(item["finalize"]["request_id"] or "")[:96])
+            if row is not None:
+                updates.append(_shadow_usage_finalize_params(conn, row, lookups=lookups, **item["finalize"]))
+        conn.executemany(_SHADOW_FINALIZE_SQL, updates)
+        conn.commit()
+    finally:
+        conn.close()
 
-        ct_rate_id = None
-        ct_rate_value = None
-        ct_rate_version = None
-        billable_usd = None
-        ct_shadow_debit = None
-        if ct_rate:
-            ct_rate_id = str(ct_rate["id"] or "")
-            ct_rate_value = float(ct_rate["ct_value_usd"] or 0.0)
-            ct_rate_version = int(ct_rate["version"] or 0)
-            if ct_rate_value > 0:
-                overhead = 0.0
-                billable_usd = (float(computed_cost_final_usd) + overhead) * (1.0 + risk_buffer + target_margin)
-                ct_shadow_debit = max(int(minimum_ct), int(math.ceil(float(billable_usd) / float(ct_rate_value))))
-
-        meta_dict = {}
-        if isinstance(meta, dict):
-            meta_dict.update(meta)
-        meta_dict.update({
-            "shadow_mode": True,
-            "pricing_source": "pricing_catalog_v1" if pricing else "missing_pricing",
-            "pricing_missing": not bool(pricing),
-            "ct_rate_missing": not bool(ct_rate),
-            "pricing_version_used": pricing_version,
-            "ct_rate_version_used": ct_rate_version,
-            "risk_buffer_pct": risk_buffer,
-            "target_margin_pct": target_margin,
-            "minimum_ct_debit": minimum_ct,
-        })
-        meta_json = json.dumps(meta_dict, ensure_ascii=True)
-        conn.execute(
-            """
-            UPDATE usage_ledger
-            SET input_tokens = ?,
-                output_tokens = ?,
-                tool_calls = ?,
-                connector_calls = ?,
-                latency_ms = ?,
-                status = ?,
-                error_code = ?,
-                cost_final_usd = ?,
-                billable_usd = ?,
-                ct_shadow_debit = ?,
-                pricing_catalog_id = ?,
-                ct_rate_id = ?,
-                risk_buffer_pct = ?,
-                target_margin_pct = ?,
-                minimum_ct_debit = ?,
-                meta_json = ?
-            WHERE request_id = ?
-            """,
-            (
-                int(input_tokens or 0),
-                int(output_tokens or 0),
-                int(tool_calls or 0),
-                int(connector_calls or 0),
-                int(latency_ms or 0),
-                str(status or "ok")[:16],
-                str(error_code or "")[:64] or None,
-                float(computed_cost_final_usd or 0.0),  # shadow only for now
-                float(billable_usd) if billable_usd is not None else None,
-                int(ct_shadow_debit) if ct_shadow_debit is not None else None,
-                pricing_id if pricing_id else None,
-                ct_rate_id if ct_rate_id else None,
-                float(risk_buffer),
-                float(target_margin),
-                int(minimum_ct),
-                meta_json[:8000],
-                str(request_id or "")[:96],
-            ),
-        )
-    except Exception as e:
-        print(f"shadow_usage_finalize_error: {e}")
+
+_usage_writer = TelemetryWriter("usage_ledger", _write_usage_batch)
+atexit.register(_usage_writer.close)
 
 
 def _is_premium_user(conn, user_id):
@@ -2836,7 +2778,19 @@ def readyz():
     payload = {
         "status": status,
         "checks": {
-            "db": {"ok": db_ok, "error": db_error},
+            "db": {"ok": db_ok, "error": db_error, "pool": db_pool_stats()},
+            "retrieval": retrieval_cache_stats(),
+            "gateway": {
+                **gateway_stats(),
+                "in_flight": _coolbits_single_flight.in_flight(),
+                "breakers": breaker_stats(),
+                "hedging": hedge_stats(),
+                "token": {**_coolbits_tokens.snapshot(), "auth_me_cache": _coolbits_auth_me_cache.snapshot()},
+                "cache": gateway_cache.gateway_cache_stats(),
+            },
+            "usage_writer": _usage_writer.snapshot(),
+            "chat_jobs": _chat_jobs.snapshot(),
+            "reply_cache": reply_cache.reply_cache_stats(),
         },
     }
     return jsonify(payload), (200 if db_ok else 503)
@@ -2953,8 +2907,8 @@ def _build_chat_home_payload(user_id, client_id, settings_obj):
 
     convo_sql = """
         SELECT c.id, c.workspace_slug, c.agent_slug, c.title, c.created_at,
-               (SELECT content FROM messages WHERE conv_id = c.id ORDER BY timestamp DESC LIMIT 1) AS last_message,
-               (SELECT MAX(timestamp) FROM messages WHERE conv_id = c.id) AS last_activity
+               c.last_message_preview AS last_message,
+               c.last_activity_at AS last_activity
         FROM conversations c
         WHERE c.user_id = ?
     """
@@ -2962,7 +2916,7 @@ def _build_chat_home_payload(user_id, client_id, settings_obj):
     if client_id is not None:
         convo_sql += " AND COALESCE(c.client_id, 0) = ?"
         convo_params.append(int(client_id))
-    convo_sql += " ORDER BY COALESCE((SELECT MAX(timestamp) FROM messages WHERE conv_id = c.id), c.created_at) DESC"
+    convo_sql += " ORDER BY c.last_activity_at DESC"
     convo_rows = conn.execute(convo_sql, tuple(convo_params)).fetchall()
     conn.close()
 
@@ -3875,6 +3829,9 @@ def workspace(ws_slug):
     ws_data = workspaces[ws_slug]
     return render_template('workspace.html', ws_slug=ws_slug, ws_data=ws_data)
 
+SEARCH_RESULTS_PER_PAGE = 20
+
+
 @app.route('/search/<ws_slug>')
 def search(ws_slug):
     if AUTH_REQUIRED and not is_user_authenticated():
@@ -3887,8 +3844,17 @@ def search(ws_slug):
     query = request.args.get('q', '')
     if not query:
         return redirect(url_for('workspace', ws_slug=ws_slug))
-    results = search_conversations(uid, ws_slug, query)
-    return render_template('search_results.html', ws_slug=ws_slug, query=query, results=results)
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    per_page = SEARCH_RESULTS_PER_PAGE
+    results = search_conversations(
+        uid, ws_slug, query,
+        limit=per_page + 1, offset=(page - 1) * per_page, client_id=get_current_client_id(),
+    )
+    has_more = len(results) > per_page
+    return render_template(
+        'search_results.html', ws_slug=ws_slug, query=query, results=results[:per_page],
+        page=page, has_more=has_more,
+    )
 
 
 @app.route("/chat-demo")
@@ -3934,12 +3900,484 @@ def chat_home():
         ws_filter = "all"
     q = str(request.args.get("q") or "").strip()
 
-    return render_template(
-        "chat_home.html",
-        chat_home=payload,
-        ws_filter=ws_filter,
-        q=q,
-    )
+    return render_template(
+        "chat_home.html",
+        chat_home=payload,
+        ws_filter=ws_filter,
+        q=q,
+    )
+
+
+def _wants_event_stream():
+    accept = str(request.headers.get("Accept") or "").lower()
+    return "text/event-stream" in accept
+
+
+def _chat_start_turn(uid, ws_slug, agent_slug, data):
+    """Resolve the conversation for a chat turn.
+
+    Nothing is written yet: the user message is saved together with the reply by _chat_persist_turn.
+    Returns (turn, None), or (None, (error_payload, status)) when the body has no message.
+    """
+    user_message = data.get('message', '').strip()
+    request_id = _shadow_request_id(data.get("request_id") or request.headers.get("X-Request-ID"))
+    conv_id = data.get('conv_id')
+    if not user_message:
+        user_message = request.form.get('message', '').strip()
+    if not user_message:
+        return None, ({"error": "No message provided"}, 400)
+
+    agent_name = get_agent_name(ws_slug, agent_slug)
+
+    # Get or create conversation
+    if conv_id:
+        conv_id = int(conv_id)
+    else:
+        conv_id = get_or_create_conversation(uid, ws_slug, agent_slug)
+
+    return {
+        "uid": uid,
+        "ws_slug": ws_slug,
+        "agent_slug": agent_slug,
+        "agent_name": agent_name,
+        "conv_id": conv_id,
+        "request_id": request_id,
+        "user_message": user_message,
+        "received_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "t0": time.time(),
+        "no_cache": data.get("cache") is False or _wants_no_cache(),
+    }, None
+
+
+def _wants_no_cache():
+    cache_control = str(request.headers.get("Cache-Control") or "").lower()
+    return "no-cache" in cache_control or "no-store" in cache_control
+
+
+_REPLY_CACHE_PROVIDERS = ("vertex", "mock", "grok")  # fallback replies are not worth pinning for a TTL
+
+
+def _chat_reply_cache_key(turn):
+    """Reply-cache key for this turn, or None when it must not be cached (see reply_cache).
+
+    Only first turns are cached: with history the prompt depends on the conversation.
+    """
+    if "reply_cache_key" in turn:
+        return turn["reply_cache_key"]
+    turn["reply_cache_key"] = None
+    if not Config.REPLY_CACHE or turn.get("no_cache") or not reply_cache.cacheable(turn["user_message"]):
+        return None
+    try:
+        conn = get_db()
+        try:
+            has_history = conn.execute("SELECT 1 FROM messages WHERE conv_id = ? LIMIT 1", (turn["conv_id"],)).fetchone()
+        finally:
+            conn.close()
+        if has_history:
+            return None
+        runtime_ctx = _get_chat_runtime_context(turn["uid"], get_current_client_id())
+        turn["reply_cache_key"] = reply_cache.make_key(turn["agent_slug"], turn["ws_slug"], turn["user_message"], runtime_ctx)
+    except Exception as e:
+        print(f"reply_cache_key_error: {e}")
+    return turn["reply_cache_key"]
+
+
+def _chat_cached_reply(turn):
+    """Cached reply entry for this turn (looked up once per turn), or None."""
+    if turn.get("reply_cache_checked"):
+        return None
+    turn["reply_cache_checked"] = True
+    key = _chat_reply_cache_key(turn)
+    hit = reply_cache.get(key) if key else None
+    if hit:
+        turn["reply_cache"] = {"hit": True, "source_provider": hit["provider"], "age_s": hit["age_s"]}
+    return hit
+
+
+def _chat_store_reply(turn, response_text, llm_provider, llm_model, llm_status):
+    key = _chat_reply_cache_key(turn)
+    if key and llm_status == "ok" and llm_provider in _REPLY_CACHE_PROVIDERS:
+        if reply_cache.put(key, turn["agent_slug"], turn["ws_slug"], response_text, llm_provider, llm_model):
+            turn["reply_cache"] = {"hit": False, "stored": True}
+
+
+def _chat_turn_history(turn):
+    """Bounded recent window ending with this turn's (not yet saved) user message.
+
+    Also sets turn["context_summary"] (rolling summary of older messages) and turn["context_stats"].
+    """
+    pending = None if turn.get("persisted") else turn["user_message"]
+    try:
+        history, summary, stats = conversation_context.build_context(turn["conv_id"], pending)
+    except Exception as e:
+        print(f"chat_context_error: {e}")
+        history, summary, stats = ([{"role": "user", "content": pending}] if pending else []), "", None
+    turn["context_summary"] = summary
+    turn["context_stats"] = stats
+    return history
+
+
+def _chat_persist_turn(turn, response_text=None):
+    """Title, user message, reply and conversation activity in one transaction (reply optional)."""
+    if turn.get("persisted"):
+        return
+    user_message = turn["user_message"]
+    save_chat_turn(
+        turn["conv_id"],
+        user_message,
+        response_text,
+        title=user_message[:50] + ('…' if len(user_message) > 50 else ''),
+        replace_title=turn["agent_slug"],
+        user_timestamp=turn.get("received_at"),
+    )
+    turn["persisted"] = True
+
+
+def _chat_generate_reply(turn, try_real=True):
+    """Real Vertex agent via Coolbits -> agent fallback -> mock -> Grok.
+
+    Returns (response_text, provider, model, status, error).
+    """
+    agent_slug, ws_slug, user_message = turn["agent_slug"], turn["ws_slug"], turn["user_message"]
+    llm_provider = "mock"
+    llm_model = "simulate_response"
+    llm_status = "ok"
+    llm_error = None
+
+    cached = _chat_cached_reply(turn)
+    if cached:
+        return cached["response"], "cache", cached["model"], llm_status, llm_error
+
+    # Try real Vertex via Coolbits for selected agents, fallback to existing mock flow
+    try:
+        response_text = None
+        if try_real and agent_slug in REAL_AGENT_SLUGS:
+            recent_history = _chat_turn_history(turn)
+            response_text = _generate_real_agent_response(
+                agent_slug=agent_slug,
+                ws_slug=ws_slug,
+                user_message=user_message,
+                recent_history=recent_history,
+                summary=turn.get("context_summary"),
+            )
+            if response_text:
+                llm_provider = "vertex"
+                llm_model = COOLBITS_VERTEX_PROFILE
+        if not response_text and agent_slug in REAL_AGENT_SLUGS:
+            response_text = _fallback_real_agent_reply(
+                agent_slug=agent_slug,
+                ws_slug=ws_slug,
+                user_message=user_message,
+                runtime_ctx=_get_chat_runtime_context(turn["uid"], get_current_client_id()),
+            )
+            if response_text:
+                llm_provider = "camarad-fallback"
+                llm_model = f"{agent_slug}-fallback"
+        if not response_text:
+            response_text = simulate_response(agent_slug, user_message)
+            if response_text:
+                llm_provider = "mock"
+                llm_model = "simulate_response"
+        if not response_text:
+            response_text = get_llm_response(user_message)
+            llm_provider = "grok"
+            llm_model = "grok-1"
+        response_text = _sanitize_real_agent_output(agent_slug, ws_slug, user_message, response_text)
+    except Exception as llm_err:
+        print(f"Response generation error: {llm_err}")
+        llm_status = "error"
+        llm_error = str(llm_err)
+        response_text = f"{turn['agent_name']}: Received '{user_message}'. (Mock response - generation failed)"
+    _chat_store_reply(turn, response_text, llm_provider, llm_model, llm_status)
+    return response_text, llm_provider, llm_model, llm_status, llm_error
+
+
+def _chat_docs_context_block(agent_slug, user_message):
+    """Connector-specific API docs context with citations (only when query is tool/API oriented).
+
+    Optional: skipped when the request deadline is nearly spent.
+    """
+    try:
+        relevant_connectors = AGENT_CONNECTOR_MAP.get(agent_slug, [])
+        if relevant_connectors and _should_attach_docs_context(agent_slug, user_message):
+            deadline = _request_deadline()
+            if deadline is not None and not deadline.allows("docs_context"):
+                return ""
+            docs_context = get_api_docs_context(user_message, relevant_connectors, top_k=3, deadline=deadline)
+            if docs_context:
+                return "\n\n---\n\n📚 **Relevant API Documentation:**\n\n" + docs_context
+    except Exception as docs_err:
+        print(f"API docs enrichment error: {docs_err}")
+    return ""
+
+
+def _chat_render_html(response_text):
+    # Convert markdown to HTML safely
+    try:
+        return str(Markup(markdown.markdown(response_text)))
+    except Exception:
+        return response_text
+
+
+def _chat_finish_turn(turn, response_text, llm_provider, llm_model, llm_status, llm_error, render=True):
+    """Persist the turn and queue its shadow usage telemetry; returns the reply rendered as HTML."""
+    uid, ws_slug, agent_slug = turn["uid"], turn["ws_slug"], turn["agent_slug"]
+    request_id, user_message = turn["request_id"], turn["user_message"]
+
+    _chat_persist_turn(turn, response_text)
+
+    # Shadow usage telemetry (no CT debit changes), written by the background usage writer.
+    try:
+        finalize_meta = {"shadow_mode": True, "source": "chat", "agent_slug": agent_slug}
+        if turn.get("streamed"):
+            finalize_meta["streamed"] = True
+            finalize_meta["first_token_ms"] = turn.get("first_token_ms")
+        if turn.get("job_id"):
+            finalize_meta["job_id"] = turn["job_id"]
+        if turn.get("context_stats"):
+            finalize_meta["context"] = turn["context_stats"]
+        if turn.get("reply_cache"):
+            finalize_meta["reply_cache"] = turn["reply_cache"]
+        _usage_writer.submit({
+            "preflight": dict(
+                request_id=request_id,
+                user_id=uid,
+                client_id=get_current_client_id(),
+                workspace_id=ws_slug or _current_workspace_slug(),
+                event_type="chat_message",
+                amount=0,
+                description=f"Chat message ({agent_slug})",
+                provider=llm_provider,
+                model=llm_model,
+                region="unknown",
+                model_class="auto",
+                agent_id=agent_slug,
+                cost_estimate_usd=0.0,
+                meta={"shadow_mode": True, "source": "chat"},
+            ),
+            "finalize": dict(
+                request_id=request_id,
+                status=llm_status,
+                error_code=llm_error,
+                input_tokens=_estimate_tokens(user_message),
+                output_tokens=_estimate_tokens(response_text),
+                tool_calls=0,
+                connector_calls=0,
+                latency_ms=int(max(0, round((time.time() - turn["t0"]) * 1000))),
+                cost_final_usd=0.0,
+                meta=finalize_meta,
+            ),
+        })
+    except Exception as shadow_err:
+        print(f"chat_shadow_usage_error: {shadow_err}")
+
+    return _chat_render_html(response_text) if render else None
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chat_stream_deltas(turn, outcome):
+    """Yield reply deltas, recording text/provider/model/status/error in `outcome` as they settle."""
+    agent_slug = turn["agent_slug"]
+    cached = _chat_cached_reply(turn)
+    if cached:
+        outcome["provider"], outcome["model"] = "cache", cached["model"]
+        for delta in _iter_text_chunks(cached["response"]):
+            outcome["text"] += delta
+            yield delta
+        return
+    if agent_slug in REAL_AGENT_SLUGS:
+        recent_history = _chat_turn_history(turn)
+        for delta in _stream_real_agent_response(
+            agent_slug=agent_slug,
+            ws_slug=turn["ws_slug"],
+            user_message=turn["user_message"],
+            recent_history=recent_history,
+            summary=turn.get("context_summary"),
+        ):
+            outcome["text"] += delta
+            outcome["provider"] = "vertex"
+            outcome["model"] = COOLBITS_VERTEX_PROFILE
+            yield delta
+    if outcome["text"].strip():
+        sanitized = _sanitize_real_agent_output(agent_slug, turn["ws_slug"], turn["user_message"], outcome["text"])
+        if sanitized != outcome["text"].strip():
+            outcome["replaced"] = True
+        outcome["text"] = sanitized
+        _chat_store_reply(turn, sanitized, outcome["provider"], outcome["model"], outcome["status"])
+        return
+    # Fallback / mock / Grok replies are complete strings: replay them in chunks.
+    text, outcome["provider"], outcome["model"], outcome["status"], outcome["error"] = _chat_generate_reply(
+        turn, try_real=False
+    )
+    for delta in _iter_text_chunks(text):
+        outcome["text"] += delta
+        yield delta
+
+
+def _chat_stream_response(turn):
+    """SSE variant of the chat POST: meta -> token* -> [replace] -> [docs] -> done.
+
+    The reply and its usage telemetry are persisted once the stream ends, including when the client
+    disconnects mid-reply (status `client_closed`, partial text).
+    """
+    turn["streamed"] = True
+
+    def generate():
+        outcome = {"text": "", "provider": "mock", "model": "simulate_response", "status": "ok", "error": None}
+        finished = False
+        try:
+            yield _sse_event("meta", {
+                "conv_id": turn["conv_id"],
+                "request_id": turn["request_id"],
+                "agent_name": turn["agent_name"],
+            })
+            for delta in _chat_stream_deltas(turn, outcome):
+                if "first_token_ms" not in turn:
+                    turn["first_token_ms"] = int(max(0, round((time.time() - turn["t0"]) * 1000)))
+                yield _sse_event("token", {"text": delta})
+            if outcome.get("replaced"):
+                yield _sse_event("replace", {"text": outcome["text"]})
+            docs = _chat_docs_context_block(turn["agent_slug"], turn["user_message"])
+            if docs:
+                outcome["text"] += docs
+                yield _sse_event("docs", {"text": docs})
+            finished = True
+            yield _sse_event("done", {
+                "response": outcome["text"],
+                "response_html": _chat_render_html(outcome["text"]),
+                "conv_id": turn["conv_id"],
+                "request_id": turn["request_id"],
+                "deadline": _deadline_report(),
+            })
+        except Exception as e:
+            print(f"chat_stream_error: {e}")
+            outcome["status"] = "error"
+            outcome["error"] = str(e)
+            if not outcome["text"].strip():
+                outcome["text"] = f"{turn['agent_name']}: Received '{turn['user_message']}'. (Mock response - generation failed)"
+            finished = True
+            yield _sse_event("error", {"error": f"Server error: {str(e)}", "response": outcome["text"]})
+        finally:
+            if not finished and outcome["status"] == "ok":
+                outcome["status"] = "client_closed"
+            if outcome["text"].strip():
+                _chat_finish_turn(
+                    turn, outcome["text"], outcome["provider"], outcome["model"],
+                    outcome["status"], outcome["error"], render=False,
+                )
+            else:
+                _chat_persist_turn(turn)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_chat_jobs = JobPool()
+
+
+def _wants_async_job(data):
+    prefer = str(request.headers.get("Prefer") or "").lower()
+    return data.get("async") is True or "respond-async" in prefer
+
+
+def _chat_run_job(turn, job):
+    """Chat job body: reply deltas into the job as partial text, then persist the turn (once)."""
+    g.request_deadline = Deadline(Config.CHAT_JOBS_DEADLINE_MS)
+    turn["job_id"] = job.id
+    outcome = {"text": "", "provider": "mock", "model": "simulate_response", "status": "ok", "error": None}
+    try:
+        for delta in _chat_stream_deltas(turn, outcome):
+            _chat_jobs.append(job, delta)
+        if outcome.get("replaced"):
+            _chat_jobs.set_text(job, outcome["text"])
+        docs = _chat_docs_context_block(turn["agent_slug"], turn["user_message"])
+        if docs:
+            outcome["text"] += docs
+            _chat_jobs.append(job, docs)
+    except Exception as e:
+        print(f"chat_job_reply_error: {e}")
+        outcome["status"] = "error"
+        outcome["error"] = str(e)
+        if not outcome["text"].strip():
+            outcome["text"] = f"{turn['agent_name']}: Received '{turn['user_message']}'. (Mock response - generation failed)"
+        _chat_jobs.set_text(job, outcome["text"])
+    finally:
+        _chat_finish_turn(
+            turn, outcome["text"], outcome["provider"], outcome["model"],
+            outcome["status"], outcome["error"], render=False,
+        )
+    return {
+        "response": outcome["text"],
+        "response_html": _chat_render_html(outcome["text"]),
+        "conv_id": turn["conv_id"],
+        "request_id": turn["request_id"],
+        "deadline": _deadline_report(),
+    }
+
+
+def _chat_submit_job(turn):
+    """Async chat turn: 202 with a job id now, reply produced on the chat job pool (see chat_jobs)."""
+    try:
+        job = _chat_jobs.submit(
+            turn["uid"],
+            copy_current_request_context(lambda job: _chat_run_job(turn, job)),
+            meta={"conv_id": turn["conv_id"], "request_id": turn["request_id"]},
+        )
+    except JobRejected:
+        return jsonify({"error": "too_many_jobs", "max_per_user": _chat_jobs.max_per_user}), 429
+    poll_url = url_for("chat_job_status", job_id=job.id)
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "conv_id": turn["conv_id"],
+        "request_id": turn["request_id"],
+        "poll_url": poll_url,
+    }), 202, {"Location": poll_url}
+
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def chat_job_status(job_id):
+    """Async chat job state and (partial) text; `wait=<s>` long-polls until `since=<version>` is passed."""
+    if AUTH_REQUIRED and not is_user_authenticated():
+        return jsonify({"error": "unauthorized"}), 401
+    wait_s = max(0.0, min(float(Config.CHAT_JOBS_MAX_WAIT_S), request.args.get("wait", 0, type=float) or 0.0))
+    since = request.args.get("since", -1, type=int)
+    snapshot = _chat_jobs.wait(job_id, get_current_user_id(), since=since, timeout=wait_s)
+    if snapshot is None:
+        return jsonify({"error": "job_not_found"}), 404
+    return jsonify(snapshot)
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """Streaming chat turn for API clients: {ws_slug, agent_slug, message, conv_id?} -> text/event-stream."""
+    if AUTH_REQUIRED and not is_user_authenticated():
+        return jsonify({"error": "unauthorized"}), 401
+    uid = get_current_user_id()
+    if uid > 0 and _must_complete_onboarding(uid):
+        return jsonify({"error": "onboarding_required"}), 409
+
+    data = request.get_json(force=True, silent=True)
+    if not data or not isinstance(data, dict):
+        data = {}
+    ws_slug = str(data.get("ws_slug") or "").strip().lower()
+    agent_slug = str(data.get("agent_slug") or "").strip().lower()
+    if ws_slug not in VALID_WORKSPACES or not agent_slug:
+        return jsonify({"error": "ws_slug and agent_slug are required"}), 400
+    try:
+        turn, error = _chat_start_turn(uid, ws_slug, agent_slug, data)
+        if error:
+            return jsonify(error[0]), error[1]
+        return _chat_stream_response(turn)
+    except Exception as e:
+        print(f"CHAT STREAM CRASH: {e}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
 @app.route('/chat/<ws_slug>/<agent_slug>', methods=['GET', 'POST'])
@@ -3951,164 +4389,42 @@ def chat(ws_slug, agent_slug):
         return redirect(url_for("onboarding_page"))
 
     if request.method == 'POST':
+        turn = None
         try:
             # Anti-crash: parse JSON safely
             data = request.get_json(force=True, silent=True)
             if not data or not isinstance(data, dict):
                 data = {}
 
-            user_message = data.get('message', '').strip()
-            request_id = _shadow_request_id(data.get("request_id") or request.headers.get("X-Request-ID"))
-            conv_id = data.get('conv_id')
-            if not user_message:
-                user_message = request.form.get('message', '').strip()
-            if not user_message:
-                return jsonify({"error": "No message provided"}), 400
-
-            agent_name = get_agent_name(ws_slug, agent_slug)
-
-            # Get or create conversation
-            if conv_id:
-                conv_id = int(conv_id)
-            else:
-                conv_id = get_or_create_conversation(uid, ws_slug, agent_slug)
-
-            # Auto-title: use first message if conversation has no title
-            try:
-                conn_t = get_db()
-                row_t = conn_t.execute('SELECT title FROM conversations WHERE id = ?', (conv_id,)).fetchone()
-                if row_t and (not row_t[0] or row_t[0] == agent_slug):
-                    title = user_message[:50] + ('…' if len(user_message) > 50 else '')
-                    conn_t.execute('UPDATE conversations SET title = ? WHERE id = ?', (title, conv_id))
-                    conn_t.commit()
-                conn_t.close()
-            except Exception:
-                pass
-
-            # Save user message to DB
-            save_message(conv_id, 'user', user_message)
-            t0 = time.time()
-            llm_provider = "mock"
-            llm_model = "simulate_response"
-            llm_status = "ok"
-            llm_error = None
-
-            # Try real Vertex via Coolbits for selected agents, fallback to existing mock flow
-            try:
-                response_text = None
-                if agent_slug in REAL_AGENT_SLUGS:
-                    try:
-                        recent_history = get_messages(conv_id) or []
-                    except Exception:
-                        recent_history = []
-                    response_text = _generate_real_agent_response(
-                        agent_slug=agent_slug,
-                        ws_slug=ws_slug,
-                        user_message=user_message,
-                        recent_history=recent_history,
-                    )
-                    if response_text:
-                        llm_provider = "vertex"
-                        llm_model = COOLBITS_VERTEX_PROFILE
-                if not response_text and agent_slug in REAL_AGENT_SLUGS:
-                    response_text = _fallback_real_agent_reply(
-                        agent_slug=agent_slug,
-                        ws_slug=ws_slug,
-                        user_message=user_message,
-                        runtime_ctx=_get_chat_runtime_context(uid, get_current_client_id()),
-                    )
-                    if response_text:
-                        llm_provider = "camarad-fallback"
-                        llm_model = f"{agent_slug}-fallback"
-                if not response_text:
-                    response_text = simulate_response(agent_slug, user_message)
-                    if response_text:
-                        llm_provider = "mock"
-                        llm_model = "simulate_response"
-                if not response_text:
-                    response_text = get_llm_response(user_message)
-                    llm_provider = "grok"
-                    llm_model = "grok-1"
-                response_text = _sanitize_real_agent_output(agent_slug, ws_slug, user_message, response_text)
-            except Exception as llm_err:
-                print(f"Response generation error: {llm_err}")
-                llm_status = "error"
-                llm_error = str(llm_err)
-                response_text = f"{agent_name}: Received '{user_message}'. (Mock response - generation failed)"
-
-            # Append connector-specific API docs context with citations (only when query is tool/API oriented)
-            try:
-                relevant_connectors = AGENT_CONNECTOR_MAP.get(agent_slug, [])
-                if relevant_connectors and _should_attach_docs_context(agent_slug, user_message):
-                    docs_context = get_api_docs_context(user_message, relevant_connectors, top_k=3)
-                    if docs_context:
-                        response_text += "\n\n---\n\n📚 **Relevant API Documentation:**\n\n" + docs_context
-            except Exception as docs_err:
-                print(f"API docs enrichment error: {docs_err}")
-
-            # Save agent response to DB
-            save_message(conv_id, 'agent', response_text)
-
-            # Shadow usage telemetry (no CT debit changes).
-            try:
-                conn_shadow = get_db()
-                _ensure_usage_ledger_table(conn_shadow)
-                client_id = get_current_client_id()
-                in_tok = _estimate_tokens(user_message)
-                out_tok = _estimate_tokens(response_text)
-                latency_ms = int(max(0, round((time.time() - t0) * 1000)))
-                _shadow_usage_preflight(
-                    conn_shadow,
-                    request_id=request_id,
-                    user_id=uid,
-                    client_id=client_id,
-                    workspace_id=ws_slug or _current_workspace_slug(),
-                    event_type="chat_message",
-                    amount=0,
-                    description=f"Chat message ({agent_slug})",
-                    provider=llm_provider,
-                    model=llm_model,
-                    region="unknown",
-                    model_class="auto",
-                    agent_id=agent_slug,
-                    cost_estimate_usd=0.0,
-                    meta={"shadow_mode": True, "source": "chat"},
-                )
-                _shadow_usage_finalize(
-                    conn_shadow,
-                    request_id=request_id,
-                    status=llm_status,
-                    error_code=llm_error,
-                    input_tokens=in_tok,
-                    output_tokens=out_tok,
-                    tool_calls=0,
-                    connector_calls=0,
-                    latency_ms=latency_ms,
-                    cost_final_usd=0.0,
-                    meta={"shadow_mode": True, "source": "chat", "agent_slug": agent_slug},
-                )
-                conn_shadow.commit()
-                conn_shadow.close()
-            except Exception as shadow_err:
-                print(f"chat_shadow_usage_error: {shadow_err}")
+            turn, error = _chat_start_turn(uid, ws_slug, agent_slug, data)
+            if error:
+                return jsonify(error[0]), error[1]
+            if _wants_event_stream():
+                return _chat_stream_response(turn)
+            if _wants_async_job(data):
+                return _chat_submit_job(turn)
 
-            # Convert markdown to HTML safely
-            try:
-                response_html = Markup(markdown.markdown(response_text))
-            except Exception:
-                response_html = response_text
+            response_text, llm_provider, llm_model, llm_status, llm_error = _chat_generate_reply(turn)
+            response_text += _chat_docs_context_block(agent_slug, turn["user_message"])
+            response_html = _chat_finish_turn(turn, response_text, llm_provider, llm_model, llm_status, llm_error)
 
             return jsonify({
                 "response": response_text,
-                "response_html": str(response_html),
-                "conv_id": conv_id,
-                "request_id": request_id,
+                "response_html": response_html,
+                "conv_id": turn["conv_id"],
+                "request_id": turn["request_id"],
+                "deadline": _deadline_report(),
             })
 
         except Exception as e:
             import traceback
             print(f"CHAT POST CRASH: {e}")
             traceback.print_exc()
+            if turn is not None:
+                try:
+                    _chat_persist_turn(turn)  # keep the user message even without a reply
+                except Exception as persist_err:
+                    print(f"chat_persist_error: {persist_err}")
             return jsonify({"error": f"Server error: {str(e)}"}), 500
 
     # GET: render chat page
@@ -4211,39 +4527,7 @@ def testchat():
     })
 def _migrate_flows_table(conn):
     """Ensure flows table has required columns for templates and client scoping."""
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS flows (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL DEFAULT 'Untitled Flow',
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER,
-            flow_json TEXT NOT NULL,
-            thumbnail TEXT,
-            category TEXT DEFAULT 'Uncategorized',
-            description TEXT DEFAULT '',
-            is_template INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            is_active INTEGER DEFAULT 1
-        )
-    """)
-    for stmt in (
-        "ALTER TABLE flows ADD COLUMN thumbnail TEXT",
-        "ALTER TABLE flows ADD COLUMN category TEXT DEFAULT 'Uncategorized'",
-        "ALTER TABLE flows ADD COLUMN description TEXT DEFAULT ''",
-        "ALTER TABLE flows ADD COLUMN is_template INTEGER DEFAULT 0",
-        "ALTER TABLE flows ADD COLUMN client_id INTEGER",
-    ):
-        try:
-            conn.execute(stmt)
-        except Exception:
-            pass
-    try:
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_flows_user_template ON flows(user_id, is_template)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_flows_user_client_template ON flows(user_id, client_id, is_template)")
-    except Exception:
-        pass
-    conn.commit()
+    ensure_schema(conn)
 
 
 def _flow_template_thumbnail(name, category):
@@ -5503,6 +5787,12 @@ def orchestrator_execute():
             return {}
         return _safe_json_parse(row[0], {})
 
+    deadline = _request_deadline()
+
+    def _snapshot_headers():
+        # The in-process connector call gets what is left of this request's budget.
+        return {DEADLINE_HEADER: str(max(1, deadline.remaining_ms()))} if deadline is not None else {}
+
     def _live_connector_snapshot(connector_slug, node_cfg):
         cfg_node = node_cfg if isinstance(node_cfg, dict) else {}
         runtime_cfg = {}
@@ -5540,7 +5830,7 @@ def orchestrator_execute():
                 params["mcc_id"] = mcc_id
 
             with app.test_client() as tc:
-                resp = tc.get("/api/connectors/google-ads/campaigns", query_string=params)
+                resp = tc.get("/api/connectors/google-ads/campaigns", query_string=params, headers=_snapshot_headers())
                 if resp.status_code != 200:
                     raise RuntimeError(f"google_ads_http_{resp.status_code}")
                 payload = resp.get_json(silent=True) or {}
@@ -5579,7 +5869,7 @@ def orchestrator_execute():
                 params["property_id"] = prop
 
             with app.test_client() as tc:
-                resp = tc.get("/api/connectors/ga4/overview", query_string=params)
+                resp = tc.get("/api/connectors/ga4/overview", query_string=params, headers=_snapshot_headers())
                 if resp.status_code != 200:
                     raise RuntimeError(f"ga4_http_{resp.status_code}")
                 payload = resp.get_json(silent=True) or {}
@@ -5643,7 +5933,10 @@ def orchestrator_execute():
         elif ntype == "connector":
             cslug = slug or CONNECTOR_NAME_TO_SLUG.get(label)
             live = None
-            if cslug in ("google-ads", "ga4"):
+            if cslug in ("google-ads", "ga4") and deadline is not None and not deadline.allows(f"connector_snapshot:{cslug}"):
+                status = "warning"
+                fail_reason = "deadline_skipped"
+            elif cslug in ("google-ads", "ga4"):
                 try:
                     live = _live_connector_snapshot(cslug, cfg)
                 except Exception as live_err:
@@ -5764,19 +6057,9 @@ def orchestrator_execute():
     try:
         conn = get_db()
         _ensure_client_tables(conn)
-        conn.execute("""CREATE TABLE IF NOT EXISTS flow_executions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, client_id INTEGER, flow_name TEXT, nodes_count INTEGER, steps_count INTEGER, elapsed_ms REAL, status TEXT, result_json TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
-        try:
-            conn.execute("ALTER TABLE flow_executions ADD COLUMN client_id INTEGER")
-        except Exception:
-            pass
         cur = conn.execute("INSERT INTO flow_executions (user_id, client_id, flow_name, nodes_count, steps_count, elapsed_ms, status, result_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (uid, cid, flow_name, len(nodes), step_no, elapsed_ms, overall, json.dumps(results)))
         exec_id = cur.lastrowid
 
-        conn.execute("""CREATE TABLE IF NOT EXISTS executions (id INTEGER PRIMARY KEY AUTOINCREMENT, flow_id INTEGER, user_id INTEGER NOT NULL, client_id INTEGER, started_at TEXT NOT NULL, finished_at TEXT NOT NULL, status TEXT NOT NULL, steps_json TEXT NOT NULL)""")
-        try:
-            conn.execute("ALTER TABLE executions ADD COLUMN client_id INTEGER")
-        except Exception:
-            pass
         cur2 = conn.execute("INSERT INTO executions (flow_id, user_id, client_id, started_at, finished_at, status, steps_json) VALUES (?, ?, ?, ?, ?, ?, ?)", (flow_id, uid, cid, started_at, finished_at, overall, json.dumps(steps)))
         trace_exec_id = cur2.lastrowid
         conn.commit()
@@ -5813,6 +6096,7 @@ def orchestrator_execute():
         "steps": steps,
         "results": results,
         "summary": summary,
+        "deadline": _deadline_report(deadline),
     })
 
 @app.route("/api/orchestrator/history", methods=["GET"])
@@ -5826,25 +6110,6 @@ def orchestrator_history():
         conn = get_db()
         _ensure_client_tables(conn)
 
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS flow_executions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                client_id INTEGER,
-                flow_name TEXT,
-                nodes_count INTEGER,
-                steps_count INTEGER,
-                elapsed_ms REAL,
-                status TEXT,
-                result_json TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        try:
-            conn.execute("ALTER TABLE flow_executions ADD COLUMN client_id INTEGER")
-        except Exception:
-            pass
-
         if cid is not None and not _client_owned(conn, uid, cid):
             conn.close()
             return jsonify([])
@@ -5889,25 +6154,6 @@ def orchestrator_history_detail(exec_id):
         conn = get_db()
         _ensure_client_tables(conn)
 
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS flow_executions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                client_id INTEGER,
-                flow_name TEXT,
-                nodes_count INTEGER,
-                steps_count INTEGER,
-                elapsed_ms REAL,
-                status TEXT,
-                result_json TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        try:
-            conn.execute("ALTER TABLE flow_executions ADD COLUMN client_id INTEGER")
-        except Exception:
-            pass
-
         if cid is not None and not _client_owned(conn, uid, cid):
             conn.close()
             return jsonify({"error": "Execution not found"}), 404
@@ -5943,36 +6189,17 @@ def orchestrator_history_detail(exec_id):
         return jsonify({"error": str(e)}), 500
 @app.route("/api/rag/search")
 def rag_search():
-    query = request.args.get('q', '').strip().lower()
-    limit = request.args.get('limit', 3, type=int)
-    
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(20, request.args.get('limit', 3, type=int) or 3))
+
     if not query:
         return jsonify([])
-    
-    # Split query into words for better matching
-    words = query.split()
-    like_conditions = " OR ".join(["LOWER(content) LIKE ? OR LOWER(title) LIKE ? OR LOWER(summary) LIKE ?"] * len(words))
-    params = []
-    for word in words:
-        params.extend([f"%{word}%", f"%{word}%", f"%{word}%"])
-    params.append(limit)
-    
+
     conn = get_db()
-    cursor = conn.cursor()
-    sql = f"""
-        SELECT title, summary, content, source
-        FROM chunks
-        WHERE {like_conditions}
-        ORDER BY LENGTH(content) DESC
-        LIMIT ?
-    """
-    rows = cursor.execute(sql, params).fetchall()
-    conn.close()
-    
-    results = [
-        {"title": r[0], "summary": r[1], "content": r[2], "source": r[3]}
-        for r in rows
-    ]
+    try:
+        results = search_chunks(conn, query, top_k=limit)
+    finally:
+        conn.close()
     return jsonify(results)
 
 @app.route("/api/agents/<slug>", methods=["GET", "POST"])
@@ -6415,55 +6642,29 @@ def list_connectors():
 @app.route("/api/rag/api-docs")
 def rag_api_docs():
     query = request.args.get('q', '').strip()
-    limit = request.args.get('limit', 3, type=int)
+    limit = max(1, min(20, request.args.get('limit', 3, type=int) or 3))
     connector_filter = request.args.get('connector', None)  # opțional: doar un conector
+    agent_slug = str(request.args.get('agent') or '').strip().lower()  # opțional: boost conectori agent
 
     if not query:
         return jsonify([])
 
-    # Smart keyword extraction (skip common stop words, split into meaningful terms)
-    stop_words = {'what', 'is', 'the', 'how', 'to', 'for', 'and', 'or', 'but', 'in',
-                  'on', 'at', 'by', 'with', 'a', 'an', 'of', 'are', 'was', 'do', 'does',
-                  'can', 'could', 'should', 'would', 'will', 'my', 'me', 'i', 'show',
-                  'tell', 'about', 'from', 'get', 'give', 'this', 'that', 'these', 'those'}
-    words = [w.lower() for w in query.split() if len(w) > 2 and w.lower() not in stop_words]
-    if not words:
-        words = [query.lower()]
-
-    conn = get_db()
-    cursor = conn.cursor()
-
-    # Build OR conditions for each keyword across title and content
-    word_conditions = " OR ".join(
-        ["(LOWER(title) LIKE ? OR LOWER(content) LIKE ?)" for _ in words]
+    rows = search_api_docs_corpus(
+        query,
+        boost_connectors=AGENT_CONNECTOR_MAP.get(agent_slug, []),
+        connector=connector_filter,
+        limit=limit,
     )
-    params = []
-    for w in words:
-        params.extend([f"%{w}%", f"%{w}%"])
-
-    sql = f"""
-        SELECT connector, title, url, content, section_type
-        FROM api_docs
-        WHERE ({word_conditions})
-    """
-
-    if connector_filter:
-        sql += " AND connector = ?"
-        params.append(connector_filter)
-
-    sql += " ORDER BY LENGTH(content) DESC LIMIT ?"
-    params.append(limit)
-
-    rows = cursor.execute(sql, params).fetchall()
-    conn.close()
 
     results = [
         {
-            "connector": r[0],
-            "title": r[1],
-            "url": r[2],
-            "content_preview": r[3][:500] + "..." if len(r[3]) > 500 else r[3],
-            "section_type": r[4]
+            "connector": r["connector"],
+            "title": r["title"],
+            "heading": r["heading"],
+            "url": r["url"],
+            "content_preview": r["snippet"],
+            "section_type": r["section_type"],
+            "score": r["score"],
         }
         for r in rows
     ]
@@ -6592,14 +6793,18 @@ def _google_ads_build_summary(campaigns):
     }
 
 
-def _google_ads_gateway_fetch(path_candidates, params=None, timeout=25):
+def _google_ads_gateway_fetch(path_candidates, params=None, timeout=25, cache=True):
     if not COOLBITS_GATEWAY_ENABLED:
         return None, {"enabled": False, "reason": "disabled"}
+    return _gateway_cached_read("google_ads", _google_ads_gateway_fetch_live, path_candidates, params=params, timeout=timeout, cache=cache)
+
+
+def _google_ads_gateway_fetch_live(path_candidates, params=None, timeout=25):
 
     last_error = None
     for path in path_candidates:
         try:
-            status, payload, text = _coolbits_request("GET", path, params=params, timeout=timeout)
+            status, payload, text = _coolbits_request("GET", path, params=params, timeout=timeout, hedge=True)
             if 200 <= int(status) < 300:
                 return payload, {"enabled": True, "path": path, "status": int(status)}
             last_error = f"{path} -> HTTP {status}"
@@ -6844,35 +7049,98 @@ def _google_ads_extract_account_name_from_report_payload(payload):
     return ""
 
 
-def _google_ads_enrich_accounts_names(accounts, mcc_id):
-    rows = accounts if isinstance(accounts, list) else []
-    if not rows:
-        return rows
-    range_from, range_to = _google_ads_iso_date_window(30)
-    out = []
-    for a in rows:
-        if not isinstance(a, dict):
-            continue
-        item = dict(a)
+def _gateway_task(fn):
+    """Bind fn to the current request (user's gateway token) so it can run on the fan-out pool."""
+    return copy_current_request_context(fn) if has_request_context() else fn
+
+
+def _google_ads_load_account_names(user_id, account_ids):
+    if user_id is None or not account_ids:
+        return {}
+    conn = get_db()
+    try:
+        marks = ",".join("?" for _ in account_ids)
+        rows = conn.execute(
+            f"SELECT account_id, name FROM google_ads_account_names WHERE user_id = ? AND account_id IN ({marks})",
+            (user_id, *account_ids),
+        ).fetchall()
+        return {str(r[0]): str(r[1]) for r in rows}
+    except Exception as e:
+        print(f"google_ads_account_names_error: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+def _google_ads_save_account_names(user_id, names, mcc_id):
+    if user_id is None or not names:
+        return
+    conn = get_db()
+    try:
+        conn.executemany("""
+            INSERT INTO google_ads_account_names (user_id, account_id, name, mcc_id, updated_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(user_id, account_id) DO UPDATE SET
+                name = excluded.name, mcc_id = excluded.mcc_id, updated_at = excluded.updated_at
+        """, [(user_id, aid, name, _google_ads_normalize_account_id(mcc_id) or None) for aid, name in names.items()])
+        conn.commit()
+    except Exception as e:
+        print(f"google_ads_account_names_error: {e}")
+    finally:
+        conn.close()
+
+
+def _google_ads_enrich_accounts_names(accounts, mcc_id, stats=None):
+    """Replace placeholder account names: stored names first, then report lookups fanned out in parallel.
+
+    Lookups still running at GOOGLE_ADS_FANOUT_DEADLINE_MS keep their placeholder for this response
+    (counted in stats["pending"]); every name found is stored so later loads need no lookups.
+    """
+    out = [dict(a) for a in (accounts if isinstance(accounts, list) else []) if isinstance(a, dict)]
+    todo = {}
+    for item in out:
         account_id = str(item.get("id") or "").strip()
-        if not account_id:
-            out.append(item)
-            continue
-        if not _google_ads_is_placeholder_account_name(item.get("name"), account_id):
-            out.append(item)
-            continue
-        params = _google_ads_attach_mcc_params({
-            "account_id": account_id,
-            "preset": "overview",
-            "from": range_from,
-            "to": range_to,
-            "blocks": "overview",
-        }, mcc_id)
-        payload, _gw = _google_ads_gateway_fetch(["/api/connectors/googleads/report"], params=params, timeout=10)
-        better_name = _google_ads_extract_account_name_from_report_payload(payload)
-        if better_name:
-            item["name"] = better_name
-        out.append(item)
+        if account_id and _google_ads_is_placeholder_account_name(item.get("name"), account_id):
+            todo.setdefault(account_id, []).append(item)
+    counts = {"stored": 0, "fetched": 0, "pending": 0}
+    if todo:
+        user_id = _gateway_cache_identity()[0]
+        stored = _google_ads_load_account_names(user_id, list(todo))
+        for account_id, name in stored.items():
+            for item in todo.pop(account_id, []):
+                item["name"] = name
+        counts["stored"] = len(stored)
+
+    if todo and COOLBITS_GATEWAY_ENABLED:
+        range_from, range_to = _google_ads_iso_date_window(30)
+
+        def lookup(account_id):
+            params = _google_ads_attach_mcc_params({
+                "account_id": account_id,
+                "preset": "overview",
+                "from": range_from,
+                "to": range_to,
+                "blocks": "overview",
+            }, mcc_id)
+            payload, _gw = _google_ads_gateway_fetch(["/api/connectors/googleads/report"], params=params, timeout=10)
+            name = _google_ads_extract_account_name_from_report_payload(payload)
+            if name:
+                # Stored from the worker, so a lookup that outlives the deadline still lands for next time.
+                _google_ads_save_account_names(user_id, {account_id: name}, mcc_id)
+            return name
+
+        results, _errors, pending = fan_out(
+            {aid: _gateway_task(lambda aid=aid: lookup(aid)) for aid in todo},
+            deadline=Config.GOOGLE_ADS_FANOUT_DEADLINE_MS / 1000.0,
+        )
+        found = {aid: name for aid, name in results.items() if name}
+        for account_id, name in found.items():
+            for item in todo[account_id]:
+                item["name"] = name
+        counts["fetched"] = len(found)
+        counts["pending"] = len(pending)
+    if isinstance(stats, dict):
+        stats.update(counts)
     return out
 
 
@@ -6990,9 +7258,10 @@ def google_ads_accounts():
     if payload is not None:
         accounts = _google_ads_list_from_payload(payload, ["accounts", "customers", "clients", "items", "data", "results"])
         mapped_accounts = _google_ads_map_accounts(accounts)
-        mapped_accounts = _google_ads_enrich_accounts_names(mapped_accounts, mcc_id)
+        enrichment = {}
+        mapped_accounts = _google_ads_enrich_accounts_names(mapped_accounts, mcc_id, stats=enrichment)
         if mapped_accounts:
-            return jsonify({"accounts": mapped_accounts, "source": "coolbits", "gateway": gw})
+            return jsonify({"accounts": mapped_accounts, "source": "coolbits", "gateway": gw, "enrichment": enrichment})
     return jsonify(_google_ads_mock_accounts_response())
 
 
@@ -7048,6 +7317,74 @@ def google_ads_campaigns():
     return jsonify(_google_ads_mock_campaigns_response(account_id))
 
 
+GOOGLE_ADS_MULTI_MAX_ACCOUNTS = 50
+
+
+@app.route("/api/connectors/google-ads/campaigns/multi", methods=["GET"])
+def google_ads_campaigns_multi():
+    """Campaigns for several accounts (`account_ids=a,b,c`) pulled in parallel.
+
+    Each account is one report read with its account_id in the params; the gateway's active customer
+    is left alone, since switching it per account would race between the parallel reads. Accounts whose
+    read is still running at GOOGLE_ADS_FANOUT_DEADLINE_MS are listed in `pending` (partial result).
+    """
+    raw_ids = request.args.get("account_ids") or request.args.get("account_id") or ""
+    account_ids = []
+    for raw in raw_ids.split(","):
+        aid = _google_ads_normalize_account_id(raw)
+        if aid and aid not in account_ids:
+            account_ids.append(aid)
+    if not account_ids:
+        return jsonify({"error": "missing_account_ids"}), 400
+    if len(account_ids) > GOOGLE_ADS_MULTI_MAX_ACCOUNTS:
+        return jsonify({"error": "too_many_accounts", "max": GOOGLE_ADS_MULTI_MAX_ACCOUNTS}), 400
+    mcc_id = request.args.get("mcc_id", "").strip()
+    days = request.args.get("days", 30, type=int)
+    range_from, range_to = _google_ads_iso_date_window(days)
+
+    def account_campaigns(account_id):
+        payload, gw = _google_ads_gateway_fetch(["/api/connectors/googleads/report"], params=_google_ads_attach_mcc_params({
+            "account_id": account_id,
+            "preset": "campaigns",
+            "from": range_from,
+            "to": range_to,
+            "blocks": "overview,campaigns",
+        }, mcc_id))
+        rows = []
+        if isinstance(payload, dict):
+            rows = (((payload.get("data") or {}).get("campaigns") or {}).get("rows") or [])
+        campaigns = _google_ads_map_coolbits_campaigns(rows)
+        if campaigns:
+            return {"campaigns": campaigns, "summary": _google_ads_build_summary(campaigns), "source": "coolbits", "gateway": gw}
+        return None
+
+    results, errors, pending = {}, {}, []
+    if COOLBITS_GATEWAY_ENABLED:
+        results, errors, pending = fan_out(
+            {aid: _gateway_task(lambda aid=aid: account_campaigns(aid)) for aid in account_ids},
+            deadline=Config.GOOGLE_ADS_FANOUT_DEADLINE_MS / 1000.0,
+        )
+    accounts = {}
+    for aid in account_ids:
+        if aid in pending:
+            continue
+        if results.get(aid):
+            accounts[aid] = results[aid]
+            continue
+        mock = _google_ads_mock_campaigns_response(aid)
+        accounts[aid] = {"campaigns": mock.get("campaigns") or [], "summary": mock.get("summary"), "source": "mock"}
+    all_campaigns = [c for acct in accounts.values() for c in acct["campaigns"]]
+    return jsonify({
+        "account_ids": account_ids,
+        "accounts": accounts,
+        "summary": _google_ads_build_summary(all_campaigns),
+        "pending": pending,
+        "errors": {aid: str(e) for aid, e in errors.items()},
+        "partial": bool(pending),
+        "source": "coolbits" if any(a["source"] == "coolbits" for a in accounts.values()) else "mock",
+    })
+
+
 @app.route("/api/connectors/google-ads/keywords", methods=["GET"])
 def google_ads_keywords():
     """Return keywords for a campaign (Coolbits gateway when enabled, fallback to mock)."""
@@ -7064,6 +7401,8 @@ def google_ads_keywords():
         "to": range_to,
         "blocks": "overview,keywords",
     }, mcc_id)
+    if account_id:
+        gw_params["account_id"] = account_id
     payload, gw = _google_ads_gateway_fetch([
         "/api/connectors/googleads/report",
         "/api/google-ads/keywords",
@@ -7566,14 +7905,18 @@ GA4_MOCK_FUNNELS = {
 }
 
 
-def _ga4_gateway_fetch(path_candidates, params=None, timeout=30):
+def _ga4_gateway_fetch(path_candidates, params=None, timeout=30, cache=True):
     if not COOLBITS_GATEWAY_ENABLED:
         return None, {"enabled": False, "reason": "disabled"}
+    return _gateway_cached_read("ga4", _ga4_gateway_fetch_live, path_candidates, params=params, timeout=timeout, cache=cache)
+
+
+def _ga4_gateway_fetch_live(path_candidates, params=None, timeout=30):
 
     last_error = None
     for path in path_candidates:
         try:
-            status, payload, text = _coolbits_request("GET", path, params=params, timeout=timeout)
+            status, payload, text = _coolbits_request("GET", path, params=params, timeout=timeout, hedge=True)
             if 200 <= int(status) < 300:
                 return payload, {"enabled": True, "path": path, "status": int(status)}
             if int(status) in (400, 401, 403) and isinstance(payload, dict):
@@ -7610,29 +7953,7 @@ def _ga4_rewrite_auth_url(raw_url):
 
 
 def _ensure_oauth_states_table(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS oauth_states (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            provider TEXT NOT NULL,
-            state TEXT NOT NULL,
-            user_id INTEGER,
-            workspace_id TEXT,
-            redirect_uri TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            expires_at TEXT NOT NULL,
-            used_at TEXT,
-            meta_json TEXT
-        )
-    """)
-    conn.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_oauth_states_provider_state
-        ON oauth_states(provider, state)
-    """)
-    conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_oauth_states_provider_expires
-        ON oauth_states(provider, expires_at)
-    """)
-    conn.commit()
+    ensure_schema(conn)
 
 
 def _ga4_store_oauth_state(state_value, user_id=None, workspace_id=None, redirect_uri=None, meta=None):
@@ -8056,6 +8377,114 @@ def _ga4_map_countries(rows):
     return out
 
 
+def _ga4_map_daily(rows):
+    return [{
+        "date": r.get("date"),
+        "sessions": int(r.get("sessions") or 0),
+        "conversions": int(r.get("conversions") or 0),
+        "users": int(r.get("sessions") or 0),
+        "new_users": int(r.get("sessions") or 0),
+        "bounce_rate": None,
+        "avg_engagement_time": None,
+        "event_count": None,
+        "revenue": None,
+    } for r in rows if isinstance(r, dict)]
+
+
+def _ga4_mock_daily(days):
+    from datetime import datetime, timedelta
+
+    rng = random.Random(77)
+    daily = []
+    for i in range(days):
+        d = (datetime.now() - timedelta(days=days - 1 - i)).strftime('%Y-%m-%d')
+        base_sessions = rng.randint(220, 380)
+        base_users = int(base_sessions * rng.uniform(0.6, 0.8))
+        base_new = int(base_users * rng.uniform(0.5, 0.7))
+        base_conv = int(base_sessions * rng.uniform(0.05, 0.09))
+        base_bounce = round(rng.uniform(35, 52), 1)
+        base_engage = f"{rng.randint(1, 2)}m {rng.randint(10, 55)}s"
+        base_events = int(base_sessions * rng.uniform(4.5, 6.5))
+        base_revenue = round(base_conv * rng.uniform(18, 35), 2)
+        daily.append({
+            "date": d, "sessions": base_sessions, "users": base_users,
+            "new_users": base_new, "conversions": base_conv,
+            "bounce_rate": base_bounce, "avg_engagement_time": base_engage,
+            "event_count": base_events, "revenue": base_revenue
+        })
+    return daily
+
+
+GA4_REPORT_PATH = "/api/connectors/ga4/report"
+# Dashboard section -> (report param, gateway block/preset name); the report answers under data[<name>].
+GA4_DASHBOARD_SECTIONS = {
+    "overview": ("blocks", "overview"),
+    "pages": ("preset", "pages_screens"),
+    "sources": ("preset", "traffic_acquisition"),
+    "events": ("preset", "events"),
+    "devices": ("blocks", "device"),
+    "countries": ("blocks", "geo"),
+    "daily": ("blocks", "series"),
+}
+
+
+def _ga4_section_value(section, payload):
+    """Map one dashboard section out of a GA4 report payload; None when the payload does not carry it."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("data"), dict):
+        return None
+    data = payload["data"]
+    if section == "overview":
+        return _ga4_extract_overview(payload)
+    if section == "pages":
+        rows = _ga4_preset_rows(payload, "pages_screens")
+        return _ga4_map_pages(rows) if rows else None
+    if section == "sources":
+        rows = _ga4_preset_rows(payload, "traffic_acquisition")
+        return _ga4_map_sources(rows) if rows else None
+    if section == "events":
+        rows = _ga4_preset_rows(payload, "events")
+        return _ga4_map_events(rows) if rows else None
+    if section == "devices":
+        rows = (data.get("device") or {}).get("deviceCategory") or []
+        return _ga4_map_devices(rows) if rows else None
+    if section == "countries":
+        rows = (data.get("geo") or {}).get("countries") or []
+        return _ga4_map_countries(rows) if rows else None
+    if section == "daily":
+        rows = (data.get("series") or {}).get("daily") or []
+        return _ga4_map_daily(rows) if rows else None
+    return None
+
+
+def _ga4_batched_params(prop_id, date_from, date_to):
+    blocks = [name for kind, name in GA4_DASHBOARD_SECTIONS.values() if kind == "blocks"]
+    presets = [name for kind, name in GA4_DASHBOARD_SECTIONS.values() if kind == "preset"]
+    return {
+        "propertyId": prop_id,
+        "from": date_from,
+        "to": date_to,
+        "blocks": ",".join(blocks),
+        "preset": ",".join(presets),
+    }
+
+
+def _ga4_report_fetch(section, params, timeout=30):
+    """GA4 report read for one dashboard section.
+
+    Answers from a fresh batched dashboard report for the same property/range when one is cached
+    (gateway meta gets batched=True); otherwise does the section's own gateway request.
+    """
+    if COOLBITS_GATEWAY_ENABLED:
+        user_id, client_id = _gateway_cache_identity()
+        batched = _ga4_batched_params(params.get("propertyId"), params.get("from"), params.get("to"))
+        cached = gateway_cache.peek(gateway_cache.cache_key("ga4", user_id, client_id, [GA4_REPORT_PATH], batched))
+        if cached is not None:
+            payload, meta = cached
+            if _ga4_section_value(section, payload):
+                return payload, {**(meta or {}), "cache": "hit", "batched": True}
+    return _ga4_gateway_fetch([GA4_REPORT_PATH], params=params, timeout=timeout)
+
+
 def _ga4_pick_event_count(events, names):
     keys = {str(x).strip().lower() for x in (names or [])}
     best = 0
@@ -8120,7 +8549,7 @@ def ga4_properties():
 
 @app.route("/api/connectors/ga4/status", methods=["GET"])
 def ga4_status():
-    payload, gw = _ga4_gateway_fetch(["/api/connectors/ga4/status"], timeout=15)
+    payload, gw = _ga4_gateway_fetch(["/api/connectors/ga4/status"], timeout=15, cache=False)
     if payload is not None and isinstance(payload, dict):
         out = dict(payload)
         selected = str(out.get("selectedPropertyId") or out.get("propertyId") or out.get("activePropertyId") or "").strip()
@@ -8220,6 +8649,7 @@ def ga4_oauth_callback_proxy():
 
     if is_ok:
         _ga4_mark_oauth_state_used(state_value)
+        gateway_cache.invalidate("ga4", _gateway_cache_identity()[0])
         return _ga4_popup_html(True, "GA4 connection completed.")
     detail = {"status": status_code}
     if isinstance(payload, dict):
@@ -8238,6 +8668,7 @@ def ga4_select_property():
     try:
         status, payload, text = _coolbits_request("POST", "/api/connectors/ga4/property", body={"propertyId": property_id}, timeout=20)
         if 200 <= int(status) < 300:
+            gateway_cache.invalidate("ga4", _gateway_cache_identity()[0])
             try:
                 cfg_payload = connector_config("ga4").get_json(silent=True) if request.method == "POST" else {}
                 existing = cfg_payload.get("config") if isinstance(cfg_payload, dict) and isinstance(cfg_payload.get("config"), dict) else {}
@@ -8268,6 +8699,82 @@ def ga4_select_property():
         return jsonify({"error": "select_property_failed", "detail": str(e)}), 502
 
 
+@app.route("/api/connectors/ga4/dashboard", methods=["GET"])
+def ga4_dashboard():
+    """Every GA4 dashboard section from one batched gateway report.
+
+    Sections the gateway leaves out of the batched answer are fetched on their own, in parallel on the
+    gateway fan-out pool; whatever is still missing at GA4_DASHBOARD_FALLBACK_DEADLINE_MS falls back
+    to the mock data. `sections` says where each one came from.
+    """
+    prop_id = _ga4_pick_property_id()
+    _range = _ga4_resolve_range_args(request.args)
+    days = int(_range["days"])
+    payload, gw = _ga4_gateway_fetch(
+        [GA4_REPORT_PATH],
+        params=_ga4_batched_params(prop_id, _range["from"], _range["to"]),
+        timeout=30,
+    )
+    out = {"property_id": prop_id, "days": days, "from": _range["from"], "to": _range["to"]}
+    if isinstance(payload, dict) and payload.get("error") == "not_connected":
+        out.update({
+            "overview": {"property_id": prop_id, "error": "not_connected", "source": "coolbits"},
+            "pages": [], "sources": [], "events": [], "devices": [], "countries": [], "daily": [],
+            "error": "not_connected", "source": "coolbits", "gateway": gw,
+        })
+        return jsonify(out)
+
+    sections = {}
+    for name in GA4_DASHBOARD_SECTIONS:
+        value = _ga4_section_value(name, payload)
+        if value:
+            out[name] = value
+            sections[name] = "batched"
+    missing = {name: spec for name, spec in GA4_DASHBOARD_SECTIONS.items() if name not in sections}
+    if payload is not None and missing:
+        budget_s = Config.GA4_DASHBOARD_FALLBACK_DEADLINE_MS / 1000.0
+
+        def section_report(kind, block):
+            part, _gw = _ga4_gateway_fetch(
+                [GA4_REPORT_PATH],
+                params={"propertyId": prop_id, "from": _range["from"], "to": _range["to"], kind: block},
+                timeout=max(1.0, budget_s),
+            )
+            return part
+
+        results, _errors, _pending = fan_out(
+            {name: _gateway_task(lambda kind=kind, block=block: section_report(kind, block))
+             for name, (kind, block) in missing.items()},
+            deadline=budget_s,
+        )
+        for name in missing:
+            value = _ga4_section_value(name, results.get(name))
+            if value:
+                out[name] = value
+                sections[name] = "fallback"
+
+    mocks = {
+        "overview": lambda: dict(GA4_MOCK_OVERVIEW.get(prop_id, GA4_MOCK_OVERVIEW['G-ABC123DEF4'])),
+        "pages": lambda: GA4_MOCK_TOP_PAGES.get(prop_id, []),
+        "sources": lambda: GA4_MOCK_SOURCES.get(prop_id, GA4_MOCK_SOURCES['G-ABC123DEF4']),
+        "events": lambda: GA4_MOCK_EVENTS.get(prop_id, GA4_MOCK_EVENTS['G-ABC123DEF4']),
+        "devices": lambda: GA4_MOCK_DEVICES.get(prop_id, GA4_MOCK_DEVICES['G-ABC123DEF4']),
+        "countries": lambda: GA4_MOCK_COUNTRIES.get(prop_id, GA4_MOCK_COUNTRIES['G-ABC123DEF4']),
+        "daily": lambda: _ga4_mock_daily(days),
+    }
+    for name, build in mocks.items():
+        if name not in sections:
+            out[name] = build()
+            sections[name] = "mock"
+    live = any(v != "mock" for v in sections.values())
+    out["overview"] = {"property_id": prop_id, **out["overview"], "source": "coolbits" if sections["overview"] != "mock" else "mock"}
+    out["sections"] = sections
+    out["source"] = "coolbits" if live else "mock"
+    if gw.get("enabled"):
+        out["gateway"] = gw
+    return jsonify(out)
+
+
 @app.route("/api/connectors/ga4/overview", methods=["GET"])
 def ga4_overview():
     prop_id = _ga4_pick_property_id()
@@ -8278,7 +8785,7 @@ def ga4_overview():
         "to": _range["to"],
         "blocks": "overview",
     }
-    payload, gw = _ga4_gateway_fetch(["/api/connectors/ga4/report"], params=report_params, timeout=30)
+    payload, gw = _ga4_report_fetch("overview", report_params, timeout=30)
     if payload is not None:
         overview = _ga4_extract_overview(payload)
         if overview:
@@ -8295,9 +8802,9 @@ def ga4_overview():
 def ga4_pages():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "pages",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8319,9 +8826,9 @@ def ga4_pages():
 def ga4_sources():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "sources",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8343,9 +8850,9 @@ def ga4_sources():
 def ga4_events():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "events",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8367,9 +8874,9 @@ def ga4_events():
 def ga4_devices():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "devices",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8393,9 +8900,9 @@ def ga4_devices():
 def ga4_countries():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "countries",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8420,9 +8927,9 @@ def ga4_funnel():
     funnel_type = request.args.get('type', 'ecommerce')
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "events",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8447,9 +8954,9 @@ def ga4_funnel():
 def ga4_timeseries():
     prop_id = _ga4_pick_property_id()
     _range = _ga4_resolve_range_args(request.args)
-    payload, gw = _ga4_gateway_fetch(
-        ["/api/connectors/ga4/report"],
-        params={
+    payload, gw = _ga4_report_fetch(
+        "daily",
+        {
             "propertyId": prop_id,
             "from": _range["from"],
             "to": _range["to"],
@@ -8458,44 +8965,11 @@ def ga4_timeseries():
         timeout=30,
     )
     if payload is not None:
-        rows = []
-        if isinstance(payload, dict):
-            rows = (((payload.get("data") or {}).get("series") or {}).get("daily") or [])
-        if rows:
-            daily = [{
-                "date": r.get("date"),
-                "sessions": int(r.get("sessions") or 0),
-                "conversions": int(r.get("conversions") or 0),
-                "users": int(r.get("sessions") or 0),
-                "new_users": int(r.get("sessions") or 0),
-                "bounce_rate": None,
-                "avg_engagement_time": None,
-                "event_count": None,
-                "revenue": None,
-            } for r in rows if isinstance(r, dict)]
+        daily = _ga4_section_value("daily", payload)
+        if daily:
             return jsonify({"property_id": prop_id, "days": _range["days"], "daily": daily, "source": "coolbits", "gateway": gw})
     days = int(_range["days"])
-    import random
-    random.seed(77)
-    daily = []
-    for i in range(days):
-        from datetime import datetime, timedelta
-        d = (datetime.now() - timedelta(days=days - 1 - i)).strftime('%Y-%m-%d')
-        base_sessions = random.randint(220, 380)
-        base_users = int(base_sessions * random.uniform(0.6, 0.8))
-        base_new = int(base_users * random.uniform(0.5, 0.7))
-        base_conv = int(base_sessions * random.uniform(0.05, 0.09))
-        base_bounce = round(random.uniform(35, 52), 1)
-        base_engage = f"{random.randint(1, 2)}m {random.randint(10, 55)}s"
-        base_events = int(base_sessions * random.uniform(4.5, 6.5))
-        base_revenue = round(base_conv * random.uniform(18, 35), 2)
-        daily.append({
-            "date": d, "sessions": base_sessions, "users": base_users,
-            "new_users": base_new, "conversions": base_conv,
-            "bounce_rate": base_bounce, "avg_engagement_time": base_engage,
-            "event_count": base_events, "revenue": base_revenue
-        })
-    return jsonify({"property_id": prop_id, "days": days, "daily": daily, "source": "mock"})
+    return jsonify({"property_id": prop_id, "days": days, "daily": _ga4_mock_daily(days), "source": "mock"})
 
 
 @app.route("/api/connectors/ga4/test-call", methods=["POST"])
@@ -9894,9 +10368,13 @@ STRIPE_MOCK_BUDGET_PACING = {
 }
 
 
-def _stripe_gateway_fetch(path_candidates, params=None, timeout=20):
+def _stripe_gateway_fetch(path_candidates, params=None, timeout=20, cache=True):
     if not COOLBITS_GATEWAY_ENABLED:
         return None, {"enabled": False, "reason": "disabled"}
+    return _gateway_cached_read("stripe", _stripe_gateway_fetch_live, path_candidates, params=params, timeout=timeout, cache=cache)
+
+
+def _stripe_gateway_fetch_live(path_candidates, params=None, timeout=20):
 
     last_error = None
     for path in path_candidates:
@@ -9912,12 +10390,12 @@ def _stripe_gateway_fetch(path_candidates, params=None, timeout=20):
     return None, {"enabled": True, "error": last_error or "gateway_unavailable"}
 
 
-def _stripe_billing_summary():
+def _stripe_billing_summary(cache=True):
     payload, gw = _stripe_gateway_fetch([
         "/api/billing/summary",
         "/api/connectors/stripe/overview",
         "/api/connectors/stripe/summary",
-    ], timeout=15)
+    ], timeout=15, cache=cache)
     if isinstance(payload, dict) and isinstance(payload.get("stripe"), dict):
         return payload, gw
     return None, gw
@@ -13164,9 +13642,9 @@ def api_conversations():
 
     sql = """
         SELECT c.id, c.workspace_slug, c.agent_slug, c.title, c.created_at, c.client_id,
-               (SELECT content FROM messages WHERE conv_id = c.id ORDER BY timestamp DESC LIMIT 1) as last_message,
-               (SELECT MAX(timestamp) FROM messages WHERE conv_id = c.id) as last_activity,
-               (SELECT COUNT(*) FROM messages WHERE conv_id = c.id) as msg_count,
+               c.last_message_preview as last_message,
+               c.last_activity_at as last_activity,
+               c.message_count as msg_count,
                ac.custom_name,
                ac.avatar_base64
         FROM conversations c
@@ -13183,7 +13661,7 @@ def api_conversations():
             params.append(cid)
 
     sql += """
-        ORDER BY COALESCE((SELECT MAX(timestamp) FROM messages WHERE conv_id = c.id), c.created_at) DESC
+        ORDER BY c.last_activity_at DESC
         LIMIT 30
     """
 
@@ -13233,6 +13711,40 @@ def api_conversations():
     return jsonify(convs)
 
 
+@app.route("/api/conversations/search", methods=["GET"])
+def api_conversations_search():
+    """Ranked full-text search over the current user's chats (bm25, highlighted, paginated)."""
+    uid = get_current_user_id()
+    cid = get_current_client_id()
+    query = str(request.args.get("q") or "").strip()[:200]
+    ws_slug = str(request.args.get("workspace") or "").strip().lower() or None
+    page = max(1, request.args.get("page", 1, type=int) or 1)
+    per_page = max(1, min(50, request.args.get("per_page", SEARCH_RESULTS_PER_PAGE, type=int) or SEARCH_RESULTS_PER_PAGE))
+    if not query:
+        return jsonify({"query": query, "page": page, "per_page": per_page, "has_more": False, "results": []})
+
+    if cid is not None:
+        conn = get_db()
+        try:
+            owned = _client_owned(conn, uid, cid)
+        finally:
+            conn.close()
+        if not owned:
+            return jsonify({"error": "Client not found or not owned"}), 404
+
+    rows = search_conversations(uid, ws_slug, query, limit=per_page + 1, offset=(page - 1) * per_page, client_id=cid)
+    return jsonify({
+        "query": query,
+        "page": page,
+        "per_page": per_page,
+        "has_more": len(rows) > per_page,
+        "results": [
+            dict(r, url=f"/chat/{r['workspace_slug']}/{r['agent_slug']}?conv_id={r['conv_id']}")
+            for r in rows[:per_page]
+        ],
+    })
+
+
 @app.route("/api/conversations/new", methods=["POST"])
 @app.route("/api/chats", methods=["POST"])
 def api_new_conversation():
@@ -13329,6 +13841,7 @@ def api_delete_conversation(conv_id):
         return jsonify({"error": "Not found"}), 404
 
     conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+    conn.execute("DELETE FROM conversation_summaries WHERE conv_id = ?", (conv_id,))
     conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
     conn.commit()
     conn.close()
@@ -13775,7 +14288,7 @@ def api_user_settings():
         economy_patch["preset"] = "free"
     if incoming_preset in VALID_ECONOMY_PRESETS:
         if incoming_preset in ("pro", "enterprise"):
-            summary, _gw = _stripe_billing_summary()
+            summary, _gw = _stripe_billing_summary(cache=False)
             if not _stripe_subscription_active(summary):
                 conn.close()
                 return jsonify({
@@ -13811,7 +14324,7 @@ def api_settings_billing_plan():
         return jsonify({"success": False, "error": "invalid_plan"}), 400
 
     if target_plan in ("pro", "enterprise"):
-        summary, gw = _stripe_billing_summary()
+        summary, gw = _stripe_billing_summary(cache=False)
         if not _stripe_subscription_active(summary):
             checkout_url = None
             if COOLBITS_GATEWAY_ENABLED:
@@ -13981,7 +14494,7 @@ def api_settings_billing():
     conn.commit()
     conn.close()
 
-    payload, gw = _stripe_billing_summary()
+    payload, gw = _stripe_billing_summary(cache=False)
     if isinstance(payload, dict):
         eur_payload = _billing_payload_to_eur(payload)
         plan = eur_payload.get("plan") if isinstance(eur_payload.get("plan"), dict) else {}
@@ -15531,6 +16044,7 @@ def import_all():
                     (new_conv_id, role, content),
                 )
             counts["messages"] += 1
+        refresh_conversation_activity(conn, [new_conv_id])
 
     # Import client connector links
     for cc in data.get("client_connectors", []):
@@ -15866,11 +16380,6 @@ def boardroom_meetings_list():
     try:
         conn = get_db()
         _ensure_client_tables(conn)
-        try:
-            conn.execute("ALTER TABLE meetings ADD COLUMN client_id INTEGER")
-            conn.commit()
-        except Exception:
-            pass
         if cid is not None and not _client_owned(conn, uid, cid):
             conn.close()
             return jsonify({"error": "Client not found or not owned"}), 404
@@ -15921,11 +16430,6 @@ def boardroom_meeting_detail(meeting_id):
         real_id = meeting_id.replace("db-", "")
         conn = get_db()
         _ensure_client_tables(conn)
-        try:
-            conn.execute("ALTER TABLE meetings ADD COLUMN client_id INTEGER")
-            conn.commit()
-        except Exception:
-            pass
 
         if cid is not None and not _client_owned(conn, uid, cid):
             conn.close()
@@ -16024,29 +16528,6 @@ def boardroom_create_meeting():
         if cid is not None and not _client_owned(conn, uid, cid):
             conn.close()
             return jsonify({"error": "Client not found or not owned"}), 404
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS meetings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER DEFAULT 1,
-                client_id INTEGER,
-                template_id TEXT,
-                title TEXT,
-                status TEXT DEFAULT 'completed',
-                created_at TEXT DEFAULT (datetime('now')),
-                duration_min INTEGER,
-                agents_json TEXT,
-                rounds INTEGER,
-                topic TEXT,
-                transcript_json TEXT,
-                summary TEXT,
-                action_items_json TEXT,
-                config_json TEXT
-            )
-        """)
-        try:
-            conn.execute("ALTER TABLE meetings ADD COLUMN client_id INTEGER")
-        except Exception:
-            pass
         cursor = conn.execute("""
             INSERT INTO meetings (user_id, client_id, template_id, title, status, duration_min, agents_json, rounds, topic, transcript_json, summary, action_items_json, config_json)
             VALUES (?, ?, ?, ?, 'completed', ?, ?, ?, ?, ?, ?, ?, ?)
@@ -16464,16 +16945,15 @@ def active_context():
         active_agents = conn.execute(agents_sql, tuple(agents_params)).fetchall()
 
         conv_sql = """
-            SELECT c.agent_slug, c.title, MAX(m.timestamp) as last_msg
+            SELECT c.agent_slug, c.title, c.last_activity_at as last_msg
             FROM conversations c
-            JOIN messages m ON c.id = m.conv_id
-            WHERE c.user_id = ?
+            WHERE c.user_id = ? AND c.message_count > 0
         """
         conv_params = [uid]
         if cid is not None:
             conv_sql += " AND COALESCE(c.client_id, 0) = ?"
             conv_params.append(cid)
-        conv_sql += " GROUP BY c.id ORDER BY last_msg DESC LIMIT 5"
+        conv_sql += " ORDER BY c.last_activity_at DESC LIMIT 5"
         recent_convs = conn.execute(conv_sql, tuple(conv_params)).fetchall()
 
         conn.close()
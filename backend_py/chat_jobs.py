@@ -0,0 +1,202 @@
+"""
+Async chat jobs: agent replies generated off the request thread, polled by the client.
+
+A real-agent reply can hold a Flask worker for over a minute of gateway time, and production runs a
+single process. With `{"async": true}` (or `Prefer: respond-async`) the chat POST answers 202 with a
+job id and the reply is produced by a `JobPool`:
+  - CHAT_JOBS_WORKERS daemon threads (started lazily, restarted after fork);
+  - per-user fairness: each user has their own FIFO and a free worker serves the user with the fewest
+    running jobs, then the one served longest ago, so one user with several slow replies does not
+    starve the others; a user may have at most
+    CHAT_JOBS_MAX_PER_USER unfinished jobs (`JobRejected` beyond that);
+  - the job function streams partial text into the job (`append` / `set_text`); every change bumps
+    `version`, and `wait(job_id, owner, since, timeout)` long-polls until the version moves past
+    `since` or the job finishes;
+  - finished jobs stay readable for CHAT_JOBS_TTL_S, then are swept (on submit / read / job end).
+Persisting the reply is the job function's business, so it happens once whether or not anyone polls.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import count
+
+from config import Config
+
+FINISHED = ("done", "error")
+
+
+class JobRejected(Exception):
+    pass
+
+
+class ChatJob:
+    def __init__(self, owner, fn, meta=None):
+        self.id = uuid.uuid4().hex
+        self.seq = 0
+        self.owner = str(owner)
+        self.fn = fn
+        self.meta = dict(meta or {})
+        self.status = "queued"
+        self.text = ""
+        self.result = None
+        self.error = None
+        self.version = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "done": self.status in FINISHED,
+            "version": self.version,
+            "text": self.text,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.meta,
+        }
+
+
+class JobPool:
+    def __init__(self, workers=None, max_per_user=None, ttl_s=None):
+        self.workers = max(1, int(Config.CHAT_JOBS_WORKERS if workers is None else workers))
+        self.max_per_user = max(1, int(Config.CHAT_JOBS_MAX_PER_USER if max_per_user is None else max_per_user))
+        self.ttl_s = max(0, int(Config.CHAT_JOBS_TTL_S if ttl_s is None else ttl_s))
+        self._cond = threading.Condition()
+        self._jobs = {}  # job id -> ChatJob
+        self._queues = {}  # owner -> deque of queued jobs
+        self._running = {}  # owner -> running jobs
+        self._unfinished = {}  # owner -> queued + running
+        self._served = {}  # owner -> tick of their last job start (while they have unfinished jobs)
+        self._seq = count(1)
+        self._threads = []
+        self._pid = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+    def _ensure_workers(self):
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        self._pid = os.getpid()
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"chat-job-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, owner, fn, meta=None):
+        """Queue fn(job) for owner; returns the ChatJob. fn's return value becomes job.result."""
+        job = ChatJob(owner, fn, meta)
+        with self._cond:
+            self._sweep()
+            if self._unfinished.get(job.owner, 0) >= self.max_per_user:
+                self.stats["rejected"] += 1
+                raise JobRejected("too_many_jobs")
+            self._ensure_workers()
+            job.seq = next(self._seq)
+            self._jobs[job.id] = job
+            self._queues.setdefault(job.owner, deque()).append(job)
+            self._unfinished[job.owner] = self._unfinished.get(job.owner, 0) + 1
+            self.stats["submitted"] += 1
+            self._cond.notify_all()
+        return job
+
+    def _take(self):
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            owner = min(self._queues, key=lambda o: (self._running.get(o, 0), self._served.get(o, 0), self._queues[o][0].seq))
+            queue = self._queues[owner]
+            job = queue.popleft()
+            if not queue:
+                del self._queues[owner]
+            self._running[owner] = self._running.get(owner, 0) + 1
+            self._served[owner] = next(self._seq)
+            job.status = "running"
+            job.started_at = time.time()
+            job.version += 1
+            self._cond.notify_all()
+            return job
+
+    def _run(self):
+        while True:
+            job = self._take()
+            result, error = None, None
+            try:
+                result = job.fn(job)
+            except Exception as e:
+                print(f"chat_job_error({job.id}): {e}")
+                error = str(e) or e.__class__.__name__
+            with self._cond:
+                job.result, job.error = result, error
+                job.status = "error" if error else "done"
+                job.finished_at = time.time()
+                job.version += 1
+                job.fn = None
+                for counts in (self._running, self._unfinished):
+                    counts[job.owner] = counts.get(job.owner, 1) - 1
+                    if counts[job.owner] <= 0:
+                        del counts[job.owner]
+                if job.owner not in self._unfinished:
+                    self._served.pop(job.owner, None)
+                self.stats["failed" if error else "completed"] += 1
+                self._sweep()
+                self._cond.notify_all()
+
+    def append(self, job, delta):
+        with self._cond:
+            job.text += str(delta)
+            job.version += 1
+            self._cond.notify_all()
+
+    def set_text(self, job, text):
+        with self._cond:
+            job.text = str(text)
+            job.version += 1
+            self._cond.notify_all()
+
+    def _sweep(self):
+        cutoff = time.time() - self.ttl_s
+        stale = [jid for jid, job in self._jobs.items() if job.finished_at is not None and job.finished_at <= cutoff]
+        for jid in stale:
+            del self._jobs[jid]
+        self.stats["expired"] += len(stale)
+
+    def get(self, job_id, owner):
+        """Snapshot of owner's job; None when unknown, expired or someone else's."""
+        with self._cond:
+            self._sweep()
+            job = self._jobs.get(str(job_id))
+            if job is None or job.owner != str(owner):
+                return None
+            return job.snapshot()
+
+    def wait(self, job_id, owner, since=-1, timeout=0.0):
+        """Like get(), but blocks up to timeout until the job's version passes `since` or it finishes."""
+        until = time.monotonic() + max(0.0, float(timeout))
+        with self._cond:
+            self._sweep()
+            while True:
+                job = self._jobs.get(str(job_id))
+                if job is None or job.owner != str(owner):
+                    return None
+                remaining = until - time.monotonic()
+                if job.version > since or job.status in FINISHED or remaining <= 0:
+                    return job.snapshot()
+                self._cond.wait(remaining)
+
+    def snapshot(self):
+        with self._cond:
+            out = dict(self.stats)
+            out["queued"] = sum(len(q) for q in self._queues.values())
+            out["running"] = sum(1 for job in self._jobs.values() if job.status == "running")
+            out["retained"] = len(self._jobs)
+            out["users_waiting"] = len(self._queues)
+            out["workers"] = sum(1 for t in self._threads if t.is_alive())
+        return out
@@ -0,0 +1,162 @@
+"""
+Circuit breakers for the Coolbits gateway, one per path family (runs/llm, ga4, googleads, billing).
+
+While Coolbits is down every caller used to wait out its full 25-60 s timeout before falling back
+to mock data / `_fallback_real_agent_reply`, which tied up every worker during an incident.
+Each family keeps the outcomes of the last GATEWAY_BREAKER_WINDOW_S seconds:
+  - closed: calls go through; once at least GATEWAY_BREAKER_MIN_CALLS were seen and
+    GATEWAY_BREAKER_FAILURE_PCT of them failed (transport error, timeout or 5xx) it opens;
+  - open: `allow()` says no, so callers raise CircuitOpenError and take their fallback at once;
+  - half_open: after GATEWAY_BREAKER_OPEN_S one probe call is let through; success closes the
+    breaker, failure opens it for another period.
+"""
+
+import threading
+import time
+from collections import deque
+
+from config import Config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+PATH_FAMILIES = (
+    ("/api/runs", "runs"),
+    ("/api/connectors/ga4", "ga4"),
+    ("/api/connectors/googleads", "googleads"),
+    ("/api/connectors/google-ads", "googleads"),
+    ("/api/google-ads", "googleads"),
+    ("/googleads", "googleads"),
+    ("/api/billing", "billing"),
+    ("/api/connectors/stripe", "billing"),
+)
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, family):
+        super().__init__(f"circuit_open:{family}")
+        self.family = family
+
+
+def path_family(path):
+    p = "/" + str(path or "").lstrip("/")
+    for prefix, family in PATH_FAMILIES:
+        if p.startswith(prefix):
+            return family
+    return "other"
+
+
+class CircuitBreaker:
+    def __init__(self, family, window_s=None, min_calls=None, failure_pct=None, open_s=None):
+        self.family = family
+        self.window_s = float(Config.GATEWAY_BREAKER_WINDOW_S if window_s is None else window_s)
+        self.min_calls = max(1, int(Config.GATEWAY_BREAKER_MIN_CALLS if min_calls is None else min_calls))
+        self.failure_pct = float(Config.GATEWAY_BREAKER_FAILURE_PCT if failure_pct is None else failure_pct)
+        self.open_s = float(Config.GATEWAY_BREAKER_OPEN_S if open_s is None else open_s)
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=1024)  # (monotonic ts, "ok" | "error" | "timeout")
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "short_circuited": 0, "probes": 0}
+
+    def _prune(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_s:
+            self._outcomes.popleft()
+
+    def allow(self):
+        if not Config.GATEWAY_BREAKER:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.open_s:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self.stats["probes"] += 1
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record(self, outcome):
+        """outcome: "ok" (any answer below 500), "error" or "timeout"."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if outcome == "ok":
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip(now)
+                return
+            self._outcomes.append((now, outcome))
+            if self.state != CLOSED:
+                return
+            self._prune(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _ts, o in self._outcomes if o != "ok")
+            if total >= self.min_calls and failures * 100.0 >= self.failure_pct * total:
+                self._trip(now)
+
+    def cancel(self):
+        """Forget an admitted call that ended on our side (request deadline), not the gateway's."""
+        with self._lock:
+            self._probing = False
+
+    def _trip(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.stats["opened"] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            total = len(self._outcomes)
+            errors = sum(1 for _ts, o in self._outcomes if o == "error")
+            timeouts = sum(1 for _ts, o in self._outcomes if o == "timeout")
+            out = {
+                "state": self.state,
+                "calls": total,
+                "errors": errors,
+                "timeouts": timeouts,
+                **self.stats,
+            }
+            if self.state == OPEN:
+                out["retry_in_s"] = round(max(0.0, self.open_s - (now - self.opened_at)), 1)
+        return out
+
+
+_LOCK = threading.Lock()
+_BREAKERS = {}
+
+
+def breaker_for(family):
+    breaker = _BREAKERS.get(family)
+    if breaker is None:
+        with _LOCK:
+            breaker = _BREAKERS.get(family)
+            if breaker is None:
+                breaker = _BREAKERS[family] = CircuitBreaker(family)
+    return breaker
+
+
+def breaker_state(family):
+    breaker = _BREAKERS.get(family)
+    return breaker.state if breaker is not None else CLOSED
+
+
+def breaker_stats():
+    with _LOCK:
+        breakers = list(_BREAKERS.values())
+    return {b.family: b.snapshot() for b in breakers}
+
+
+def reset_breakers():
+    with _LOCK:
+        _BREAKERS.clear()
@@ -25,3 +25,88 @@ class Config:
     PORT = _env_int('PORT', 5051)
     MAX_FREE_MESSAGES_PER_DAY = _env_int('MAX_FREE_MESSAGES_PER_DAY', 30)
     GROK_API_KEY = os.getenv('GROK_API_KEY', '')
+    # SQLite connection tuning (see database.get_db)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 8)
+    DB_BUSY_TIMEOUT_MS = _env_int('DB_BUSY_TIMEOUT_MS', 5000)
+    DB_MMAP_SIZE = _env_int('DB_MMAP_SIZE', 256 * 1024 * 1024)
+    DB_CACHED_STATEMENTS = _env_int('DB_CACHED_STATEMENTS', 256)
+    DB_WAL = _env_bool('DB_WAL', True)
+    # Read-only RAG corpora (see retrieval_cache): mmap size per connection, idle connections kept per
+    # corpus file, context LRU entries
+    RETRIEVAL_MMAP_SIZE = _env_int('RETRIEVAL_MMAP_SIZE', 1024 * 1024 * 1024)
+    RETRIEVAL_POOL_SIZE = _env_int('RETRIEVAL_POOL_SIZE', 8)
+    RETRIEVAL_CACHE_SIZE = _env_int('RETRIEVAL_CACHE_SIZE', 512)
+    # Coolbits gateway HTTP client (see gateway_client): keep-alive pool, timeouts, retry budget
+    GATEWAY_POOL_MAXSIZE = _env_int('GATEWAY_POOL_MAXSIZE', 16)
+    GATEWAY_CONNECT_TIMEOUT_MS = _env_int('GATEWAY_CONNECT_TIMEOUT_MS', 3050)
+    GATEWAY_RETRY_MAX = _env_int('GATEWAY_RETRY_MAX', 2)
+    GATEWAY_RETRY_BUDGET_MS = _env_int('GATEWAY_RETRY_BUDGET_MS', 8000)
+    GATEWAY_BACKOFF_BASE_MS = _env_int('GATEWAY_BACKOFF_BASE_MS', 200)
+    GATEWAY_BACKOFF_MAX_MS = _env_int('GATEWAY_BACKOFF_MAX_MS', 2000)
+    GATEWAY_SINGLE_FLIGHT = _env_bool('GATEWAY_SINGLE_FLIGHT', True)
+    GATEWAY_FANOUT_WORKERS = _env_int('GATEWAY_FANOUT_WORKERS', 16)
+    GATEWAY_FANOUT_LIMIT = _env_int('GATEWAY_FANOUT_LIMIT', 6)
+    GOOGLE_ADS_FANOUT_DEADLINE_MS = _env_int('GOOGLE_ADS_FANOUT_DEADLINE_MS', 8000)
+    GA4_DASHBOARD_FALLBACK_DEADLINE_MS = _env_int('GA4_DASHBOARD_FALLBACK_DEADLINE_MS', 5000)
+    # Per path-family circuit breaker (see circuit_breaker)
+    GATEWAY_BREAKER = _env_bool('GATEWAY_BREAKER', True)
+    GATEWAY_BREAKER_WINDOW_S = _env_int('GATEWAY_BREAKER_WINDOW_S', 30)
+    GATEWAY_BREAKER_MIN_CALLS = _env_int('GATEWAY_BREAKER_MIN_CALLS', 5)
+    GATEWAY_BREAKER_FAILURE_PCT = _env_int('GATEWAY_BREAKER_FAILURE_PCT', 50)
+    GATEWAY_BREAKER_OPEN_S = _env_int('GATEWAY_BREAKER_OPEN_S', 15)
+    # Gateway read cache (see gateway_cache): per-connector TTLs, stale window, negative TTL, LRU entries
+    GATEWAY_CACHE_TTL_GA4_S = _env_int('GATEWAY_CACHE_TTL_GA4_S', 900)
+    GATEWAY_CACHE_TTL_GOOGLE_ADS_S = _env_int('GATEWAY_CACHE_TTL_GOOGLE_ADS_S', 900)
+    GATEWAY_CACHE_TTL_STRIPE_S = _env_int('GATEWAY_CACHE_TTL_STRIPE_S', 300)
+    GATEWAY_CACHE_STALE_S = _env_int('GATEWAY_CACHE_STALE_S', 3600)
+    GATEWAY_CACHE_NEGATIVE_TTL_S = _env_int('GATEWAY_CACHE_NEGATIVE_TTL_S', 60)
+    GATEWAY_CACHE_SIZE = _env_int('GATEWAY_CACHE_SIZE', 2048)
+    # Request deadlines (see request_deadline): per-route budgets (X-Request-Deadline-Ms overrides, up to
+    # the max), time kept back for fallbacks + DB writes, minimum left to start an optional stage
+    CHAT_DEADLINE_MS = _env_int('CHAT_DEADLINE_MS', 30000)
+    ORCHESTRATOR_DEADLINE_MS = _env_int('ORCHESTRATOR_DEADLINE_MS', 20000)
+    REQUEST_DEADLINE_MAX_MS = _env_int('REQUEST_DEADLINE_MAX_MS', 120000)
+    REQUEST_DEADLINE_RESERVE_MS = _env_int('REQUEST_DEADLINE_RESERVE_MS', 500)
+    DEADLINE_MIN_STAGE_MS = _env_int('DEADLINE_MIN_STAGE_MS', 1500)
+    # Hedged gateway GETs (see gateway_hedge): opt-in; second request after the path's observed quantile,
+    # at most GATEWAY_HEDGE_MAX_PCT extra requests, on a pool of GATEWAY_HEDGE_WORKERS threads
+    GATEWAY_HEDGE = _env_bool('GATEWAY_HEDGE', False)
+    GATEWAY_HEDGE_QUANTILE = _env_int('GATEWAY_HEDGE_QUANTILE', 95)
+    GATEWAY_HEDGE_MIN_SAMPLES = _env_int('GATEWAY_HEDGE_MIN_SAMPLES', 20)
+    GATEWAY_HEDGE_MIN_DELAY_MS = _env_int('GATEWAY_HEDGE_MIN_DELAY_MS', 50)
+    GATEWAY_HEDGE_MAX_PCT = _env_int('GATEWAY_HEDGE_MAX_PCT', 5)
+    GATEWAY_HEDGE_WORKERS = _env_int('GATEWAY_HEDGE_WORKERS', 8)
+    # Gateway service token (see gateway_token): background refresh this long before the JWT `exp`,
+    # lifetime assumed for tokens without one, TTL of cached /api/auth/me validations
+    GATEWAY_TOKEN_REFRESH_MARGIN_S = _env_int('GATEWAY_TOKEN_REFRESH_MARGIN_S', 3600)
+    GATEWAY_TOKEN_FALLBACK_TTL_S = _env_int('GATEWAY_TOKEN_FALLBACK_TTL_S', 21600)
+    GATEWAY_AUTH_ME_TTL_S = _env_int('GATEWAY_AUTH_ME_TTL_S', 60)
+    # Background usage-ledger writer (see telemetry_writer): bounded queue, rows per batch transaction,
+    # how long a batch may wait to fill; USAGE_WRITER_ASYNC=0 writes on the request thread instead
+    USAGE_WRITER_ASYNC = _env_bool('USAGE_WRITER_ASYNC', True)
+    USAGE_WRITER_QUEUE_MAX = _env_int('USAGE_WRITER_QUEUE_MAX', 10000)
+    USAGE_WRITER_BATCH_MAX = _env_int('USAGE_WRITER_BATCH_MAX', 200)
+    USAGE_WRITER_FLUSH_MS = _env_int('USAGE_WRITER_FLUSH_MS', 200)
+    # Async chat jobs (see chat_jobs): worker threads, unfinished jobs per user, reply budget per job,
+    # how long finished jobs stay pollable, longest long-poll on GET /api/chat/jobs/<id>
+    CHAT_JOBS_WORKERS = _env_int('CHAT_JOBS_WORKERS', 4)
+    CHAT_JOBS_MAX_PER_USER = _env_int('CHAT_JOBS_MAX_PER_USER', 3)
+    CHAT_JOBS_DEADLINE_MS = _env_int('CHAT_JOBS_DEADLINE_MS', 90000)
+    CHAT_JOBS_TTL_S = _env_int('CHAT_JOBS_TTL_S', 600)
+    CHAT_JOBS_MAX_WAIT_S = _env_int('CHAT_JOBS_MAX_WAIT_S', 25)
+    # Real-agent conversation context (see conversation_context): messages kept verbatim, turns folded
+    # into the rolling summary at a time, summary length cap
+    CHAT_CONTEXT_RECENT_K = _env_int('CHAT_CONTEXT_RECENT_K', 6)
+    CHAT_CONTEXT_SUMMARY_EVERY = _env_int('CHAT_CONTEXT_SUMMARY_EVERY', 4)
+    CHAT_CONTEXT_SUMMARY_MAX_CHARS = _env_int('CHAT_CONTEXT_SUMMARY_MAX_CHARS', 1500)
+    # Chat reply cache (see reply_cache): opt-in; default TTL, per-agent overrides ("slug=seconds,...",
+    # 0 disables an agent), longest cacheable message, in-memory entries, rows kept in SQLite
+    REPLY_CACHE = _env_bool('REPLY_CACHE', False)
+    REPLY_CACHE_TTL_S = _env_int('REPLY_CACHE_TTL_S', 3600)
+    REPLY_CACHE_AGENT_TTLS = os.getenv('REPLY_CACHE_AGENT_TTLS', '')
+    REPLY_CACHE_MAX_CHARS = _env_int('REPLY_CACHE_MAX_CHARS', 280)
+    REPLY_CACHE_SIZE = _env_int('REPLY_CACHE_SIZE', 512)
+    REPLY_CACHE_DB_MAX_ROWS = _env_int('REPLY_CACHE_DB_MAX_ROWS', 5000)
+    # Few-shot example store (see example_store): SQLite file the synthetic JSONL datasets are loaded into
+    # (default synthetic_datasets/examples.db)
+    EXAMPLE_STORE_DB = os.getenv('EXAMPLE_STORE_DB', '')
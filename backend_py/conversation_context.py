@@ -0,0 +1,181 @@
+"""
+Bounded conversation context for real-agent prompts.
+
+The chat route used to load the whole conversation (`get_messages`) on every real-agent turn, so the
+read grew with the conversation and everything past the last few messages was simply lost to the
+prompt. `build_context(conv_id, pending_user_message)` instead:
+  - reads only the messages not yet covered by the conversation's rolling summary, newest first, with
+    an indexed `LIMIT` query on messages(conv_id, id) (at most CHAT_CONTEXT_RECENT_K +
+    2 * CHAT_CONTEXT_SUMMARY_EVERY rows); the prompt gets the last CHAT_CONTEXT_RECENT_K of them;
+  - once CHAT_CONTEXT_SUMMARY_EVERY turns have left that window, folds them into the summary in
+    `conversation_summaries` (one extractive line per message, oldest lines dropped past
+    CHAT_CONTEXT_SUMMARY_MAX_CHARS) and moves `covered_message_id` forward; until then their lines are
+    added to the prompt's summary on the fly, so nothing between the summary and the window is lost;
+  - a conversation older than its summary row is folded from the start, _BACKLOG_CHUNK rows at a
+    time, the first time it is used; earlier messages are never read again;
+  - keeps running token estimates (`covered_tokens`) so the prompt's history size can be compared with
+    what replaying the full conversation would have cost.
+The prompt therefore carries a bounded summary plus a bounded window however long the conversation
+gets; `stats` (window size, summary size, tokens used vs. full history) go into the usage-ledger meta.
+"""
+
+import math
+import re
+
+from config import Config
+from database import get_db
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+_BACKLOG_CHUNK = 200
+
+
+def estimate_tokens(text):
+    t = str(text or "").strip()
+    if not t:
+        return 0
+    return max(1, int(math.ceil(len(t) / 4.0)))
+
+
+def window_limit():
+    """Most uncovered messages build_context() reads on an ordinary turn."""
+    return max(1, Config.CHAT_CONTEXT_RECENT_K) + 2 * max(1, Config.CHAT_CONTEXT_SUMMARY_EVERY)
+
+
+def load_summary(db, conv_id):
+    row = db.execute(
+        "SELECT summary, covered_message_id, covered_count, covered_tokens "
+        "FROM conversation_summaries WHERE conv_id = ?",
+        (conv_id,),
+    ).fetchone()
+    if not row:
+        return {"summary": "", "covered_message_id": 0, "covered_count": 0, "covered_tokens": 0}
+    return {
+        "summary": row["summary"] or "",
+        "covered_message_id": int(row["covered_message_id"] or 0),
+        "covered_count": int(row["covered_count"] or 0),
+        "covered_tokens": int(row["covered_tokens"] or 0),
+    }
+
+
+def uncovered_messages(db, conv_id, after_id, limit):
+    """Newest `limit` messages with id > after_id, returned oldest first."""
+    rows = db.execute(
+        "SELECT id, role, content FROM messages WHERE conv_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+        (conv_id, int(after_id), int(limit)),
+    ).fetchall()
+    return [{"id": r["id"], "role": r["role"], "content": r["content"] or ""} for r in reversed(rows)]
+
+
+def summary_line(msg):
+    """One extractive line per message: first sentence, whitespace collapsed, capped."""
+    text = " ".join(str(msg.get("content") or "").split())
+    if not text:
+        return ""
+    text = _SENTENCE_END.split(text, 1)[0]
+    if len(text) > 160:
+        text = text[:159].rstrip() + "…"
+    prefix = "User" if msg.get("role") == "user" else "Assistant"
+    return f"{prefix}: {text}"
+
+
+def fold_summary(summary, messages, max_chars=None):
+    """Append one line per message to summary; drop the oldest lines beyond max_chars."""
+    max_chars = max(200, int(Config.CHAT_CONTEXT_SUMMARY_MAX_CHARS if max_chars is None else max_chars))
+    lines = [ln for ln in str(summary or "").split("\n") if ln and ln != "…"]
+    lines.extend(ln for ln in (summary_line(m) for m in messages) if ln)
+    trimmed = False
+    while lines and sum(len(ln) + 1 for ln in lines) > max_chars:
+        lines.pop(0)
+        trimmed = True
+    return "\n".join((["…"] if trimmed else []) + lines)
+
+
+def _save_summary(db, conv_id, state):
+    # Concurrent turns on the same conversation: the row only ever moves forward.
+    db.execute(
+        """
+        INSERT INTO conversation_summaries (conv_id, summary, covered_message_id, covered_count, covered_tokens, updated_at)
+        VALUES (?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(conv_id) DO UPDATE SET
+            summary = excluded.summary,
+            covered_message_id = excluded.covered_message_id,
+            covered_count = excluded.covered_count,
+            covered_tokens = excluded.covered_tokens,
+            updated_at = excluded.updated_at
+        WHERE excluded.covered_message_id > conversation_summaries.covered_message_id
+        """,
+        (conv_id, state["summary"], state["covered_message_id"], state["covered_count"], state["covered_tokens"]),
+    )
+    db.commit()
+
+
+def _folded(state, messages):
+    return {
+        "summary": fold_summary(state["summary"], messages),
+        "covered_message_id": messages[-1]["id"],
+        "covered_count": state["covered_count"] + len(messages),
+        "covered_tokens": state["covered_tokens"] + sum(estimate_tokens(m["content"]) for m in messages),
+    }
+
+
+def _fold_backlog(db, conv_id, state, before_id):
+    """Fold every uncovered message older than before_id, reading _BACKLOG_CHUNK rows at a time.
+
+    Only conversations that predate the summary (or grew past the window between turns) have a backlog;
+    once folded, covered_message_id moves past it and it is never read again.
+    """
+    while True:
+        rows = db.execute(
+            "SELECT id, role, content FROM messages WHERE conv_id = ? AND id > ? AND id < ? ORDER BY id LIMIT ?",
+            (conv_id, state["covered_message_id"], int(before_id), _BACKLOG_CHUNK),
+        ).fetchall()
+        if not rows:
+            return state
+        state = _folded(state, [{"id": r["id"], "role": r["role"], "content": r["content"] or ""} for r in rows])
+
+
+def build_context(conv_id, pending_user_message=None):
+    """(history, summary, stats) for a real-agent prompt.
+
+    history: the last CHAT_CONTEXT_RECENT_K messages as [{"role", "content"}], ending with
+    pending_user_message when given (the turn's user message is saved together with the reply, so it
+    is not in the table yet). summary covers everything older: the stored summary plus, between folds,
+    lines for the few uncovered messages that have already left the window.
+    """
+    recent_k = max(1, Config.CHAT_CONTEXT_RECENT_K)
+    fold_at = 2 * max(1, Config.CHAT_CONTEXT_SUMMARY_EVERY)
+    keep = recent_k - 1 if pending_user_message else recent_k
+    db = get_db()
+    try:
+        stored = load_summary(db, conv_id)
+        state = stored
+        window = uncovered_messages(db, conv_id, state["covered_message_id"], window_limit())
+        if len(window) >= window_limit():
+            state = _fold_backlog(db, conv_id, state, window[0]["id"])
+        split = max(0, len(window) - keep)
+        gap, window = window[:split], window[split:]
+        if len(gap) >= fold_at:
+            state, gap = _folded(state, gap), []
+        if state is not stored:
+            _save_summary(db, conv_id, state)
+    finally:
+        db.close()
+
+    summary = fold_summary(state["summary"], gap) if gap else state["summary"]
+    history = [{"role": m["role"], "content": m["content"]} for m in window]
+    if pending_user_message:
+        history.append({"role": "user", "content": pending_user_message})
+    window_tokens = sum(estimate_tokens(m["content"]) for m in history)
+    summary_tokens = estimate_tokens(summary)
+    full_tokens = state["covered_tokens"] + sum(estimate_tokens(m["content"]) for m in gap) + window_tokens
+    used_tokens = summary_tokens + window_tokens
+    stats = {
+        "window_messages": len(history),
+        "summarized_messages": state["covered_count"] + len(gap),
+        "summary_folded": state["covered_count"] - stored["covered_count"],
+        "summary_tokens": summary_tokens,
+        "history_tokens": used_tokens,
+        "full_history_tokens": full_tokens,
+        "saved_tokens": max(0, full_tokens - used_tokens),
+    }
+    return history, summary, stats
@@ -1,11 +1,162 @@
+import html
+import re
 import sqlite3
+import threading
+from flask import g, has_app_context
 from config import Config
 
 
+# ── Connection manager ────────────────────────────────────────────
+# get_db() used to open a fresh sqlite3 connection on every call (6+ per chat POST).
+# Connections are now tuned once (WAL, busy_timeout, mmap) and reused:
+#   - inside a Flask app context, every get_db() returns the same request-scoped handle
+#     stored on `g` and counts a lease; close() drops the lease and, once the last caller has
+#     closed it, rolls back anything left uncommitted (so it cannot ride along with a later
+#     commit in the same request); the teardown hook returns it to the pool;
+#   - outside a request (scripts, tests, background threads) get_db() leases a pooled
+#     connection and close() hands it back.
+# A leased connection is only ever used by one thread at a time.
+_POOL_LOCK = threading.Lock()
+_POOL_IDLE = {}  # database path -> [sqlite3.Connection]
+_POOL_STATS = {"opened": 0, "reused": 0, "released": 0, "discarded": 0}
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=max(0.0, Config.DB_BUSY_TIMEOUT_MS / 1000.0),
+        check_same_thread=False,
+        cached_statements=max(0, int(Config.DB_CACHED_STATEMENTS)),
+    )
+    conn.row_factory = sqlite3.Row
+    try:
+        if Config.DB_WAL:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}")
+        if int(Config.DB_MMAP_SIZE) > 0:
+            conn.execute(f"PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+    except sqlite3.Error:
+        pass
+    return conn
+
+
+def _acquire_connection():
+    path = Config.DATABASE
+    with _POOL_LOCK:
+        idle = _POOL_IDLE.get(path)
+        if idle:
+            _POOL_STATS["reused"] += 1
+            return path, idle.pop()
+        _POOL_STATS["opened"] += 1
+    return path, _open_connection(path)
+
+
+def _release_connection(path, conn):
+    try:
+        if conn.in_transaction:
+            # Same contract as sqlite3.Connection.close(): uncommitted work is discarded.
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+    except sqlite3.Error:
+        _discard_connection(conn)
+        return
+    with _POOL_LOCK:
+        idle = _POOL_IDLE.setdefault(path, [])
+        if len(idle) < max(0, int(Config.DB_POOL_SIZE)):
+            idle.append(conn)
+            _POOL_STATS["released"] += 1
+            return
+    _discard_connection(conn)
+
+
+def _discard_connection(conn):
+    with _POOL_LOCK:
+        _POOL_STATS["discarded"] += 1
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+class PooledConnection:
+    """sqlite3.Connection proxy whose close() returns the connection to the pool."""
+
+    __slots__ = ("_conn", "_path", "_request_scoped", "_leases")
+
+    def __init__(self, path, conn, request_scoped=False):
+        object.__setattr__(self, "_path", path)
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_request_scoped", request_scoped)
+        object.__setattr__(self, "_leases", 0)
+
+    def _raw(self):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw(), name, value)
+
+    def __enter__(self):
+        self._raw().__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw().__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._request_scoped:
+            leases = max(0, self._leases - 1)
+            object.__setattr__(self, "_leases", leases)
+            conn = self._conn
+            if leases == 0 and conn is not None and conn.in_transaction:
+                # Same contract as sqlite3.Connection.close(): uncommitted work is discarded.
+                conn.rollback()
+            return
+        self._release()
+
+    def _release(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, "_conn", None)
+        _release_connection(self._path, conn)
+
+
 def get_db():
-    db = sqlite3.connect(Config.DATABASE)
-    db.row_factory = sqlite3.Row
-    return db
+    if has_app_context():
+        db = g.get("_camarad_db")
+        if db is None or db._conn is None:
+            path, conn = _acquire_connection()
+            db = PooledConnection(path, conn, request_scoped=True)
+            g._camarad_db = db
+        object.__setattr__(db, "_leases", db._leases + 1)
+        return db
+    path, conn = _acquire_connection()
+    return PooledConnection(path, conn)
+
+
+def close_request_db(exc=None):
+    db = g.pop("_camarad_db", None)
+    if db is not None:
+        db._release()
+
+
+def pool_stats():
+    with _POOL_LOCK:
+        stats = dict(_POOL_STATS)
+        stats["idle"] = sum(len(v) for v in _POOL_IDLE.values())
+    return stats
+
+
+def init_app(app):
+    app.teardown_appcontext(close_request_db)
 
 
 def _table_exists(db, table_name):
@@ -168,298 +319,32 @@ def _rebuild_connectors_config_per_client(db):
 
 
 def init_db():
+    """Bring camarad.db up to the latest schema version (see migrations.py)."""
+    from migrations import ensure_schema
+
     db = get_db()
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            is_premium BOOLEAN DEFAULT FALSE
-        )
-    ''')
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            client_id INTEGER,
-            workspace_slug TEXT NOT NULL,
-            agent_slug TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            title TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY,
-            conv_id INTEGER NOT NULL,
-            role TEXT NOT NULL,  -- 'user' or 'agent'
-            content TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conv_id) REFERENCES conversations (id)
-        )
-    ''')
-
-    # Clients
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS clients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL DEFAULT 'person',
-            name TEXT,
-            company_name TEXT,
-            email TEXT,
-            website TEXT,
-            phone TEXT,
-            address TEXT,
-            notes TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        )
-    ''')
-
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS client_connectors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_id INTEGER NOT NULL,
-            connector_slug TEXT NOT NULL,
-            account_id TEXT,
-            account_name TEXT,
-            status TEXT DEFAULT 'pending',
-            config_json TEXT,
-            last_synced TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            FOREIGN KEY (client_id) REFERENCES clients(id)
-        )
-    ''')
-
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS user_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL UNIQUE,
-            settings_json TEXT NOT NULL DEFAULT '{}',
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS usage_ledger (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            client_id INTEGER,
-            event_type TEXT NOT NULL,
-            amount INTEGER NOT NULL,
-            description TEXT,
-            request_id TEXT,
-            workspace_id TEXT,
-            run_id TEXT,
-            step_id TEXT,
-            agent_id TEXT,
-            trace_id TEXT,
-            provider TEXT DEFAULT 'mock',
-            model TEXT DEFAULT 'mock',
-            region TEXT DEFAULT 'unknown',
-            model_class TEXT DEFAULT 'auto',
-            input_tokens INTEGER DEFAULT 0,
-            output_tokens INTEGER DEFAULT 0,
-            tool_calls INTEGER DEFAULT 0,
-            connector_calls INTEGER DEFAULT 0,
-            latency_ms INTEGER DEFAULT 0,
-            status TEXT DEFAULT 'ok',
-            error_code TEXT,
-            cost_estimate_usd REAL DEFAULT 0,
-            cost_final_usd REAL DEFAULT 0,
-            meta_json TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    for stmt in (
-        "ALTER TABLE usage_ledger ADD COLUMN request_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN workspace_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN run_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN step_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN agent_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN trace_id TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN provider TEXT DEFAULT 'mock'",
-        "ALTER TABLE usage_ledger ADD COLUMN model TEXT DEFAULT 'mock'",
-        "ALTER TABLE usage_ledger ADD COLUMN region TEXT DEFAULT 'unknown'",
-        "ALTER TABLE usage_ledger ADD COLUMN model_class TEXT DEFAULT 'auto'",
-        "ALTER TABLE usage_ledger ADD COLUMN input_tokens INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN output_tokens INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN tool_calls INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN connector_calls INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN latency_ms INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN status TEXT DEFAULT 'ok'",
-        "ALTER TABLE usage_ledger ADD COLUMN error_code TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_estimate_usd REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN cost_final_usd REAL DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN ct_debit_applied INTEGER",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_applied INTEGER DEFAULT 0",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_applied_at TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN phase3_cap_reason TEXT",
-        "ALTER TABLE usage_ledger ADD COLUMN meta_json TEXT",
-    ):
-        try:
-            db.execute(stmt)
-            db.commit()
-        except Exception:
-            pass
-
-    # Insert mock users
-    db.execute('INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (1, "dev", FALSE)')
-    db.execute('INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (2, "Alice", FALSE)')
-    db.execute('INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (3, "Bob", TRUE)')
-
-    # Flows table for orchestrator
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS flows (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL DEFAULT 'Untitled Flow',
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER,
-            flow_json TEXT NOT NULL,
-            thumbnail TEXT,
-            category TEXT DEFAULT 'Uncategorized',
-            description TEXT DEFAULT '',
-            is_template INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            is_active INTEGER DEFAULT 1
-        )
-    ''')
-
-    # Migrations: add flows columns if missing (existing DBs)
-    for stmt in (
-        "ALTER TABLE flows ADD COLUMN thumbnail TEXT",
-        "ALTER TABLE flows ADD COLUMN category TEXT DEFAULT 'Uncategorized'",
-        "ALTER TABLE flows ADD COLUMN description TEXT DEFAULT ''",
-        "ALTER TABLE flows ADD COLUMN is_template INTEGER DEFAULT 0",
-        "ALTER TABLE flows ADD COLUMN client_id INTEGER",
-        "ALTER TABLE conversations ADD COLUMN client_id INTEGER",
-        "ALTER TABLE agents_config ADD COLUMN client_id INTEGER",
-        "ALTER TABLE connectors_config ADD COLUMN client_id INTEGER",
-    ):
-        try:
-            db.execute(stmt)
-            db.commit()
-        except Exception:
-            pass  # column already exists or table not yet present
-
-    # Chunks table for RAG
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS chunks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chunk_id TEXT UNIQUE,
-            title TEXT,
-            summary TEXT,
-            content TEXT,
-            source TEXT,
-            timestamp TEXT DEFAULT (datetime('now'))
-        )
-    ''')
-
-    # Agents config table
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS agents_config (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER NOT NULL DEFAULT 0,
-            agent_slug TEXT NOT NULL,
-            custom_name TEXT,
-            avatar_base64 TEXT,
-            avatar_colors TEXT,
-            llm_provider TEXT,
-            llm_model TEXT,
-            api_key TEXT,
-            temperature REAL DEFAULT 0.7,
-            max_tokens INTEGER DEFAULT 2048,
-            rag_enabled INTEGER DEFAULT 1,
-            status TEXT DEFAULT 'Active',
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now')),
-            UNIQUE(user_id, agent_slug, client_id)
-        )
-    ''')
-
-    # Migration: add avatar_colors/client_id column if missing (existing DBs)
     try:
-        db.execute('ALTER TABLE agents_config ADD COLUMN avatar_colors TEXT')
-        db.commit()
-    except Exception:
-        pass
-    try:
-        db.execute('ALTER TABLE agents_config ADD COLUMN client_id INTEGER')
-        db.commit()
-    except Exception:
-        pass
-
-    # Connectors config table
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS connectors_config (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER DEFAULT 1,
-            client_id INTEGER NOT NULL DEFAULT 0,
-            connector_slug TEXT NOT NULL,
-            status TEXT DEFAULT 'Disconnected',
-            config_json TEXT,
-            last_connected TEXT,
-            UNIQUE(user_id, connector_slug, client_id)
-        )
-    ''')
+        ensure_schema(db)
+    finally:
+        db.close()
 
-    try:
-        db.execute('ALTER TABLE connectors_config ADD COLUMN client_id INTEGER')
-        db.commit()
-    except Exception:
-        pass
-    try:
-        _rebuild_agents_config_per_client(db)
-    except Exception:
-        pass
-    try:
-        _rebuild_connectors_config_per_client(db)
-    except Exception:
-        pass
-
-    # Helpful indexes
-    try:
-        db.execute('CREATE INDEX IF NOT EXISTS idx_clients_user ON clients(user_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_client_connectors_client ON client_connectors(client_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_flows_user_client ON flows(user_id, client_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_conversations_user_client ON conversations(user_id, client_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_agents_user_client ON agents_config(user_id, client_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_connectors_user_client ON connectors_config(user_id, client_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_user_settings_user ON user_settings(user_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_created ON usage_ledger(user_id, created_at)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_event ON usage_ledger(user_id, event_type)')
-        db.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_ledger_request_id_unique "
-            "ON usage_ledger(request_id) WHERE request_id IS NOT NULL AND request_id <> ''"
-        )
-        db.execute('CREATE INDEX IF NOT EXISTS idx_usage_ledger_phase3_created ON usage_ledger(phase3_applied, created_at)')
-    except Exception:
-        pass
 
-    db.commit()
-    db.close()
+# conversations.last_message_preview keeps this many characters (lists truncate further).
+CONVERSATION_PREVIEW_CHARS = 280
 
 
 def get_recent_conversations(user_id, workspace_slug, limit=5, client_id=None):
     db = get_db()
     sql = '''
-        SELECT c.agent_slug, MAX(m.timestamp) as last_msg, c.title
+        SELECT c.agent_slug, c.last_activity_at as last_msg, c.title
         FROM conversations c
-        JOIN messages m ON c.id = m.conv_id
-        WHERE c.user_id = ? AND c.workspace_slug = ?
+        WHERE c.user_id = ? AND c.workspace_slug = ? AND c.message_count > 0
     '''
     params = [user_id, workspace_slug]
     if client_id is not None:
         sql += ' AND COALESCE(c.client_id, 0) = ?'
         params.append(int(client_id))
-    sql += ' GROUP BY c.id ORDER BY last_msg DESC LIMIT ?'
+    sql += ' ORDER BY c.last_activity_at DESC LIMIT ?'
     params.append(limit)
     rows = db.execute(sql, tuple(params)).fetchall()
     db.close()
@@ -480,7 +365,8 @@ def create_new_conversation(user_id, workspace_slug, agent_slug, title="", clien
     db = get_db()
     try:
         cursor = db.execute(
-            'INSERT INTO conversations (user_id, client_id, workspace_slug, agent_slug, title) VALUES (?, ?, ?, ?, ?)',
+            'INSERT INTO conversations (user_id, client_id, workspace_slug, agent_slug, title, last_activity_at) '
+            'VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
             (user_id, client_id, workspace_slug, agent_slug, title)
         )
     except Exception:
@@ -523,11 +409,93 @@ def get_or_create_conversation(user_id, workspace_slug, agent_slug, client_id=No
 
 def save_message(conv_id, role, content):
     db = get_db()
-    db.execute('INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)', (conv_id, role, content))
+    cursor = db.execute('INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)', (conv_id, role, content))
+    # Keep the denormalized activity columns in the same transaction as the message.
+    db.execute(
+        '''
+        UPDATE conversations
+        SET last_message_preview = ?,
+            last_activity_at = (SELECT timestamp FROM messages WHERE id = ?),
+            message_count = COALESCE(message_count, 0) + 1
+        WHERE id = ?
+        ''',
+        (str(content or '')[:CONVERSATION_PREVIEW_CHARS], cursor.lastrowid, conv_id)
+    )
     db.commit()
     db.close()
 
 
+def save_chat_turn(conv_id, user_message, agent_message=None, title=None, replace_title=None, user_timestamp=None):
+    """Persist one chat turn in a single transaction: auto-title, user + agent message, activity columns.
+
+    title is applied only while the conversation has no title (or still has `replace_title`, the agent
+    slug placeholder). user_timestamp ('YYYY-MM-DD HH:MM:SS', UTC) keeps the user message at the time it
+    was received rather than the time the reply was written. agent_message=None saves the user message alone.
+    """
+    db = get_db()
+    try:
+        if title:
+            db.execute(
+                "UPDATE conversations SET title = ? WHERE id = ? AND (title IS NULL OR title = '' OR title = ?)",
+                (title, conv_id, replace_title or ''),
+            )
+        if user_timestamp:
+            cursor = db.execute(
+                'INSERT INTO messages (conv_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                (conv_id, 'user', user_message, user_timestamp),
+            )
+        else:
+            cursor = db.execute('INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)', (conv_id, 'user', user_message))
+        last_id, last_content, count = cursor.lastrowid, user_message, 1
+        if agent_message is not None:
+            cursor = db.execute('INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)', (conv_id, 'agent', agent_message))
+            last_id, last_content, count = cursor.lastrowid, agent_message, 2
+        db.execute(
+            '''
+            UPDATE conversations
+            SET last_message_preview = ?,
+                last_activity_at = (SELECT timestamp FROM messages WHERE id = ?),
+                message_count = COALESCE(message_count, 0) + ?
+            WHERE id = ?
+            ''',
+            (str(last_content or '')[:CONVERSATION_PREVIEW_CHARS], last_id, count, conv_id)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def refresh_conversation_activity(db, conv_ids=None):
+    """Recompute last_message_preview / last_activity_at / message_count from messages.
+
+    Used by the schema backfill and by bulk paths that insert messages directly.
+    Returns the number of conversations updated.
+    """
+    sql = '''
+        UPDATE conversations
+        SET message_count = (SELECT COUNT(*) FROM messages m WHERE m.conv_id = conversations.id),
+            last_activity_at = COALESCE(
+                (SELECT MAX(m.timestamp) FROM messages m WHERE m.conv_id = conversations.id),
+                conversations.created_at
+            ),
+            last_message_preview = (
+                SELECT SUBSTR(m.content, 1, ?)
+                FROM messages m
+                WHERE m.conv_id = conversations.id
+                ORDER BY m.timestamp DESC, m.id DESC
+                LIMIT 1
+            )
+    '''
+    params = [CONVERSATION_PREVIEW_CHARS]
+    if conv_ids is not None:
+        ids = [int(v) for v in conv_ids]
+        if not ids:
+            return 0
+        sql += f" WHERE id IN ({','.join('?' for _ in ids)})"
+        params.extend(ids)
+    return db.execute(sql, tuple(params)).rowcount
+
+
 def get_messages(conv_id):
     db = get_db()
     rows = db.execute('SELECT role, content FROM messages WHERE conv_id = ? ORDER BY timestamp', (conv_id,)).fetchall()
@@ -564,23 +532,109 @@ def update_conversation_title(conv_id, title):
     db.close()
 
 
-def search_conversations(user_id, workspace_slug, query, limit=10, client_id=None):
-    db = get_db()
-    sql = '''
-        SELECT c.agent_slug, MAX(m.timestamp) as last_msg, c.title
-        FROM conversations c
-        JOIN messages m ON c.id = m.conv_id
-        WHERE c.user_id = ? AND c.workspace_slug = ? AND (c.title LIKE ? OR m.content LIKE ?)
-    '''
-    params = [user_id, workspace_slug, f'%{query}%', f'%{query}%']
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"
+SEARCH_TITLE_BOOST = 2.0  # bm25 is negative; a title hit counts double
+
+
+def build_fts_query(raw_query, prefix_last=True):
+    """Turn free text into a safe FTS5 MATCH expression ("a" "b"*), or '' if nothing is searchable."""
+    tokens = _FTS_TOKEN_RE.findall(str(raw_query or ""))[:12]
+    if not tokens:
+        return ""
+    parts = [f'"{t}"' for t in tokens]
+    if prefix_last:
+        parts[-1] += "*"
+    return " ".join(parts)
+
+
+def _highlight_html(marked):
+    return html.escape(str(marked or "")).replace(_HL_OPEN, "<mark>").replace(_HL_CLOSE, "</mark>")
+
+
+def search_conversations(user_id, workspace_slug, query, limit=10, client_id=None, offset=0):
+    """Ranked full-text search over message content and conversation titles.
+
+    Returns one row per conversation (its best hit), ordered by bm25, with an HTML-safe
+    `snippet` (matches wrapped in <mark>). workspace_slug=None searches every workspace.
+    """
+    match = build_fts_query(query)
+    if not match:
+        return []
+    scope_sql = 'c.user_id = ?'
+    scope_params = [user_id]
+    if workspace_slug is not None:
+        scope_sql += ' AND c.workspace_slug = ?'
+        scope_params.append(workspace_slug)
     if client_id is not None:
-        sql += ' AND COALESCE(c.client_id, 0) = ?'
-        params.append(int(client_id))
-    sql += ' GROUP BY c.id ORDER BY last_msg DESC LIMIT ?'
-    params.append(limit)
-    rows = db.execute(sql, tuple(params)).fetchall()
-    db.close()
-    return [{'agent_slug': row[0], 'last_msg': row[1], 'title': row[2] or row[0]} for row in rows]
+        scope_sql += ' AND COALESCE(c.client_id, 0) = ?'
+        scope_params.append(int(client_id))
+    # Scope first: bm25 is only computed for hits in the caller's own conversations, and
+    # snippet()/highlight() only for the best hit of each conversation on the requested page.
+    sql = f'''
+        WITH hits AS (
+            SELECT c.id AS conv_id, bm25(messages_fts) AS score, 'message' AS matched,
+                   messages_fts.rowid AS hit_id
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            JOIN conversations c ON c.id = m.conv_id
+            WHERE messages_fts MATCH ? AND {scope_sql}
+            UNION ALL
+            SELECT c.id, bm25(conversations_fts) * ?, 'title', conversations_fts.rowid
+            FROM conversations_fts
+            JOIN conversations c ON c.id = conversations_fts.rowid
+            WHERE conversations_fts MATCH ? AND {scope_sql}
+        ),
+        ranked AS (
+            SELECT conv_id, score, matched, hit_id,
+                   ROW_NUMBER() OVER (PARTITION BY conv_id ORDER BY score) AS rn
+            FROM hits
+        ),
+        page AS (
+            SELECT r.conv_id, c.workspace_slug, c.agent_slug, c.title, c.last_activity_at,
+                   r.score, r.matched, r.hit_id
+            FROM ranked r
+            JOIN conversations c ON c.id = r.conv_id
+            WHERE r.rn = 1
+            ORDER BY r.score, c.last_activity_at DESC
+            LIMIT ? OFFSET ?
+        )
+        SELECT conv_id, workspace_slug, agent_slug, title, last_activity_at, score, matched,
+               CASE matched
+                   WHEN 'message' THEN (
+                       SELECT snippet(messages_fts, 0, ?, ?, '…', 16) FROM messages_fts
+                       WHERE messages_fts MATCH ? AND messages_fts.rowid = page.hit_id)
+                   ELSE (
+                       SELECT highlight(conversations_fts, 0, ?, ?) FROM conversations_fts
+                       WHERE conversations_fts MATCH ? AND conversations_fts.rowid = page.hit_id)
+               END AS marked
+        FROM page
+        ORDER BY score, last_activity_at DESC
+    '''
+    params = [match, *scope_params, SEARCH_TITLE_BOOST, match, *scope_params]
+    params.extend([int(limit), max(0, int(offset))])
+    params.extend([_HL_OPEN, _HL_CLOSE, match, _HL_OPEN, _HL_CLOSE, match])
+    db = get_db()
+    try:
+        rows = db.execute(sql, tuple(params)).fetchall()
+    finally:
+        db.close()
+    return [{
+        'conv_id': row['conv_id'],
+        'workspace_slug': row['workspace_slug'],
+        'agent_slug': row['agent_slug'],
+        'last_msg': row['last_activity_at'],
+        'title': row['title'] or row['agent_slug'],
+        'matched': row['matched'],
+        'snippet': _highlight_html(row['marked']),
+        'score': round(float(row['score'] or 0.0), 4),
+    } for row in rows]
+
+
+def rebuild_search_index(db):
+    """Repopulate the FTS indexes from messages / conversations (existing databases, repairs)."""
+    db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
 
 
 def is_user_premium(user_id):
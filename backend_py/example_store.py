@@ -0,0 +1,197 @@
+"""
+Few-shot example store over synthetic_datasets/<agent>_synthetic.jsonl.
+
+`models.load_agent_examples` used to parse an agent's whole JSONL file (thousands of lines) on first
+use and keep one fixed random sample for the life of the process, so every prompt got the same
+examples and every worker paid the parse. The examples now live in one SQLite file (EXAMPLE_STORE_DB):
+  - `sync_examples()` loads each JSONL file into `examples` once, streaming line by line; a file is
+    reloaded only when its size / mtime change (`example_sources`), so a restart costs a few stats.
+    An agent's rows are inserted in one transaction, which keeps their ids contiguous
+    (`first_id` .. `first_id + count - 1`);
+  - `examples_fts` (FTS5 over the user turn) is the keyword index for relevance mode, filtered to the
+    agent by that rowid range;
+  - `sample_examples()` draws a fresh random sample per call and reads only the chosen rows by id, or,
+    with a query, takes the best bm25 matches and tops up with random rows.
+Reads go through retrieval_cache.read_connection (pooled, read-only, mmap), so process memory does
+not grow with the datasets.
+"""
+
+import json
+import random
+import sqlite3
+from pathlib import Path
+
+from config import Config
+from knowledge_index import build_match_query
+from retrieval_cache import read_connection
+
+DATA_DIR = Path(__file__).parent / "synthetic_datasets"
+_SUFFIX = "_synthetic.jsonl"
+_INSERT_BATCH = 500
+
+
+def example_store_path():
+    return Path(Config.EXAMPLE_STORE_DB or (DATA_DIR / "examples.db"))
+
+
+def _ensure_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS examples (
+            id INTEGER PRIMARY KEY,
+            agent TEXT NOT NULL,
+            system TEXT NOT NULL DEFAULT '',
+            user TEXT NOT NULL,
+            assistant TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS example_sources (
+            agent TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            count INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS examples_fts USING fts5(
+            user, tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+
+
+def _parse(line):
+    """(system, user, assistant) from one JSONL line, or None when it is not a usable example."""
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return None
+    by_role = {}
+    for msg in (item.get("messages") or []) if isinstance(item, dict) else []:
+        if isinstance(msg, dict):
+            by_role.setdefault(str(msg.get("role") or ""), str(msg.get("content") or "").strip())
+    if not by_role.get("user") or not by_role.get("assistant"):
+        return None
+    return by_role.get("system", ""), by_role["user"], by_role["assistant"]
+
+
+def _load_agent(conn, agent, path, st):
+    conn.execute("DELETE FROM examples_fts WHERE rowid IN (SELECT id FROM examples WHERE agent = ?)", (agent,))
+    conn.execute("DELETE FROM examples WHERE agent = ?", (agent,))
+    first_id = int(conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM examples").fetchone()[0])
+    count = 0
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parsed = _parse(line) if line.strip() else None
+            if parsed is None:
+                continue
+            batch.append((first_id + count, agent) + parsed)
+            count += 1
+            if len(batch) >= _INSERT_BATCH:
+                conn.executemany("INSERT INTO examples (id, agent, system, user, assistant) VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+    if batch:
+        conn.executemany("INSERT INTO examples (id, agent, system, user, assistant) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.execute(
+        "INSERT INTO examples_fts (rowid, user) SELECT id, user FROM examples WHERE id BETWEEN ? AND ?",
+        (first_id, first_id + count - 1),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO example_sources (agent, size, mtime_ns, first_id, count) VALUES (?, ?, ?, ?, ?)",
+        (agent, st.st_size, st.st_mtime_ns, first_id, count),
+    )
+    return count
+
+
+def sync_examples(conn, data_dir=None):
+    """Load new or changed JSONL files into the store; returns {agent: rows loaded}."""
+    data_dir = Path(data_dir or DATA_DIR)
+    conn.isolation_level = None
+    conn.execute("PRAGMA busy_timeout=30000")
+    _ensure_tables(conn)
+    loaded = {}
+    for path in sorted(data_dir.glob(f"*{_SUFFIX}")):
+        agent = path.name[:-len(_SUFFIX)]
+        st = path.stat()
+        # IMMEDIATE: workers starting together load each file once, the others see the new stamp.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT size, mtime_ns FROM example_sources WHERE agent = ?", (agent,)).fetchone()
+            if row is None or tuple(row) != (st.st_size, st.st_mtime_ns):
+                loaded[agent] = _load_agent(conn, agent, path, st)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return loaded
+
+
+def _connection(db_path=None, data_dir=None):
+    path = Path(db_path or example_store_path())
+    if not path.exists():
+        sqlite3.connect(str(path)).close()
+
+    def prepare(conn, _path):
+        try:
+            sync_examples(conn, data_dir)
+        except Exception as e:
+            print(f"example_store_sync_error: {e}")
+            return False
+        return True
+
+    return read_connection(path, prepare=prepare)
+
+
+def _as_example(row):
+    return {
+        "messages": [
+            {"role": "system", "content": row["system"]},
+            {"role": "user", "content": row["user"]},
+            {"role": "assistant", "content": row["assistant"]},
+        ],
+        "agent": row["agent"],
+    }
+
+
+def _fetch(conn, ids):
+    if not ids:
+        return []
+    marks = ",".join("?" for _ in ids)
+    rows = conn.execute(f"SELECT id, agent, system, user, assistant FROM examples WHERE id IN ({marks})", tuple(ids)).fetchall()
+    by_id = {r["id"]: r for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def sample_examples(agent_slug, k=3, query=None, db_path=None, data_dir=None, rng=None):
+    """k examples for agent_slug: the best keyword matches for query (when given), then random ones."""
+    rng = rng or random
+    conn = _connection(db_path, data_dir) if k > 0 else None
+    if conn is None:
+        return []
+    try:
+        conn.row_factory = sqlite3.Row
+        source = conn.execute("SELECT first_id, count FROM example_sources WHERE agent = ?", (agent_slug,)).fetchone()
+        if source is None or not source["count"]:
+            return []
+        first_id, count = int(source["first_id"]), int(source["count"])
+        k = min(int(k), count)
+        ids = []
+        match = build_match_query(query) if query else ""
+        if match:
+            ids = [r[0] for r in conn.execute(
+                "SELECT rowid FROM examples_fts WHERE examples_fts MATCH ? AND rowid BETWEEN ? AND ? "
+                "ORDER BY bm25(examples_fts) LIMIT ?",
+                (match, first_id, first_id + count - 1, k),
+            )]
+        if len(ids) < k:
+            taken = set(ids)
+            picks = rng.sample(range(count), min(count, k + len(ids)))
+            ids += [first_id + i for i in picks if first_id + i not in taken][:k - len(ids)]
+        return [_as_example(r) for r in _fetch(conn, ids)]
+    except sqlite3.Error as e:
+        print(f"example_store_error: {e}")
+        return []
+    finally:
+        conn.close()
+
@@ -0,0 +1,152 @@
+"""
+Response cache for Coolbits gateway reads (GA4 / Google Ads / Stripe dashboards).
+
+Connector reports change at most hourly, but every page load and orchestrator run used to pay a
+25-30 s-timeout gateway hop. `read_through()` keeps the (payload, meta) result per key in a bounded
+LRU:
+  - fresh entries (younger than the connector TTL) are served as "hit";
+  - expired entries stay servable as "stale" for GATEWAY_CACHE_STALE_S more seconds while one
+    background refresh per key re-fetches them (stale-while-revalidate);
+  - negative answers (GA4 `not_connected` / `property_not_set`) are kept for the shorter
+    GATEWAY_CACHE_NEGATIVE_TTL_S and never served stale;
+  - transport failures are not cached; a failed refresh keeps the stale copy.
+Values are deep-copied in and out, so callers may mutate what they get back.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+_LOCK = threading.Lock()
+_ENTRIES = OrderedDict()  # key -> (value, expires_at, stale_until)
+_REFRESHING = set()
+_STATS = {"hits": 0, "stale": 0, "misses": 0, "negative": 0, "evictions": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+def cache_key(connector, user_id, client_id, paths, params=None):
+    """(connector, user, client, gateway path(s), params with None dropped, sorted, stringified)."""
+    norm = tuple(sorted(
+        (str(k), str(v)) for k, v in (params or {}).items() if v is not None and str(v) != ""
+    ))
+    if isinstance(paths, str):
+        paths = (paths,)
+    return (str(connector), user_id, client_id, tuple(paths), norm)
+
+
+def _store(key, value, ttl, stale_for):
+    now = time.monotonic()
+    limit = max(0, int(Config.GATEWAY_CACHE_SIZE))
+    with _LOCK:
+        _ENTRIES[key] = (copy.deepcopy(value), now + ttl, now + ttl + max(0.0, stale_for))
+        _ENTRIES.move_to_end(key)
+        while len(_ENTRIES) > limit:
+            _ENTRIES.popitem(last=False)
+            _STATS["evictions"] += 1
+
+
+def _fetch_and_store(key, fetch, ttl, negative_ttl, classify):
+    value = fetch()
+    kind = classify(value) if classify else "ok"
+    if kind == "ok" and ttl > 0:
+        _store(key, value, ttl, float(Config.GATEWAY_CACHE_STALE_S))
+    elif kind == "negative" and negative_ttl > 0:
+        _store(key, value, negative_ttl, 0.0)
+        with _LOCK:
+            _STATS["negative"] += 1
+    return value
+
+
+def _refresh(key, fetch, ttl, negative_ttl, classify):
+    try:
+        _fetch_and_store(key, fetch, ttl, negative_ttl, classify)
+    except Exception as e:
+        with _LOCK:
+            _STATS["refresh_errors"] += 1
+        print(f"gateway_cache_refresh_error: {e}")
+    finally:
+        with _LOCK:
+            _REFRESHING.discard(key)
+
+
+def _spawn_thread(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+def read_through(key, fetch, ttl, negative_ttl=0, classify=None, spawn=None):
+    """Return (value, state) with state "hit" | "stale" | "miss".
+
+    fetch() -> value; classify(value) -> "ok" | "negative" | None (None = do not cache).
+    spawn(fn) starts the background refresh for a stale entry (default: a daemon thread).
+    """
+    now = time.monotonic()
+    refresh = False
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            if now < expires_at:
+                _ENTRIES.move_to_end(key)
+                _STATS["hits"] += 1
+                return copy.deepcopy(value), "hit"
+            if now < stale_until:
+                _ENTRIES.move_to_end(key)
+                _STATS["stale"] += 1
+                if key not in _REFRESHING:
+                    _REFRESHING.add(key)
+                    _STATS["refreshes"] += 1
+                    refresh = True
+                value = copy.deepcopy(value)
+            else:
+                del _ENTRIES[key]
+                entry = None
+        if entry is None:
+            _STATS["misses"] += 1
+    if entry is not None:
+        if refresh:
+            try:
+                (spawn or _spawn_thread)(lambda: _refresh(key, fetch, ttl, negative_ttl, classify))
+            except Exception as e:
+                with _LOCK:
+                    _REFRESHING.discard(key)
+                print(f"gateway_cache_refresh_error: {e}")
+        return value, "stale"
+    return copy.deepcopy(_fetch_and_store(key, fetch, ttl, negative_ttl, classify)), "miss"
+
+
+def peek(key):
+    """Fresh value for key without fetching or refreshing; None when absent or past its TTL."""
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return None
+        _ENTRIES.move_to_end(key)
+        _STATS["hits"] += 1
+        return copy.deepcopy(entry[0])
+
+
+def invalidate(connector=None, user_id=None):
+    """Drop entries for a connector and/or user (e.g. after a property switch or OAuth connect)."""
+    with _LOCK:
+        doomed = [
+            k for k in _ENTRIES
+            if (connector is None or k[0] == connector) and (user_id is None or k[1] == user_id)
+        ]
+        for k in doomed:
+            del _ENTRIES[k]
+    return len(doomed)
+
+
+def clear():
+    with _LOCK:
+        _ENTRIES.clear()
+
+
+def gateway_cache_stats():
+    with _LOCK:
+        stats = dict(_STATS)
+        stats["entries"] = len(_ENTRIES)
+        stats["refreshing"] = len(_REFRESHING)
+    return stats
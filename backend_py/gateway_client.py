@@ -0,0 +1,287 @@
+"""
+HTTP client for the Coolbits gateway (GA4, Google Ads, Stripe reports, runs/LLM).
+
+Every gateway hop used to go through module-level `requests.request`, i.e. a new TCP (+TLS)
+handshake per call and no retry policy beyond the single 401 replay. `gateway_client()` returns
+one client per worker process:
+  - a `requests.Session` with a keep-alive connection pool (GATEWAY_POOL_MAXSIZE per host),
+    shared by the request threads; the cookie jar never stores anything, so one user's gateway
+    cookies cannot leak into another user's calls;
+  - per-call (connect, read) timeouts: a bare number is the read timeout, the connect part is
+    capped at GATEWAY_CONNECT_TIMEOUT_MS;
+  - jittered exponential backoff for idempotent methods only, on connection errors and
+    429/502/503/504, bounded by GATEWAY_RETRY_MAX, a total GATEWAY_RETRY_BUDGET_MS and the
+    caller's request deadline when it passes one;
+  - counters (`gateway_stats()`): attempts, new connections vs pool hits, retries, give-ups.
+
+`SingleFlight` coalesces identical concurrent reads: the first caller for a key runs the upstream
+call, callers arriving while it is in flight wait for it (up to their own timeout) and share its
+result or exception instead of sending the same request again.
+
+`fan_out()` runs independent gateway calls (per-account reports, name lookups) on a shared,
+bounded worker pool with a per-request cap on calls in flight and a deadline: whatever has not
+finished by then is reported as pending instead of holding the HTTP request open.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config import Config
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_STATS_LOCK = threading.Lock()
+_STATS = {
+    "calls": 0,
+    "attempts": 0,
+    "connections_opened": 0,
+    "retries": 0,
+    "retry_gave_up": 0,
+    "errors": 0,
+    "flights": 0,
+    "coalesced": 0,
+    "coalesce_timeouts": 0,
+    "fanout_calls": 0,
+    "fanout_pending": 0,
+}
+_CLIENT_LOCK = threading.Lock()
+_CLIENT = None
+_FANOUT_POOL = None
+
+
+def _count(key, n=1):
+    with _STATS_LOCK:
+        _STATS[key] += n
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+class GatewayClient:
+    def __init__(self, pool_maxsize=None, connect_timeout_ms=None, retry_max=None,
+                 retry_budget_ms=None, backoff_base_ms=None, backoff_max_ms=None):
+        self.pool_maxsize = max(1, int(Config.GATEWAY_POOL_MAXSIZE if pool_maxsize is None else pool_maxsize))
+        self.connect_timeout = max(0.1, (Config.GATEWAY_CONNECT_TIMEOUT_MS if connect_timeout_ms is None else connect_timeout_ms) / 1000.0)
+        self.retry_max = max(0, int(Config.GATEWAY_RETRY_MAX if retry_max is None else retry_max))
+        self.retry_budget = max(0.0, (Config.GATEWAY_RETRY_BUDGET_MS if retry_budget_ms is None else retry_budget_ms) / 1000.0)
+        self.backoff_base = max(0.0, (Config.GATEWAY_BACKOFF_BASE_MS if backoff_base_ms is None else backoff_base_ms) / 1000.0)
+        self.backoff_max = max(self.backoff_base, (Config.GATEWAY_BACKOFF_MAX_MS if backoff_max_ms is None else backoff_max_ms) / 1000.0)
+
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = _PooledAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.session = session
+        self.pid = os.getpid()
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, (tuple, list)):
+            return tuple(timeout)
+        read = float(timeout or 30)
+        return (min(self.connect_timeout, read), read)
+
+    def _backoff(self, attempt, response=None):
+        delay = random.uniform(0.0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None and response.status_code == 429:
+            try:
+                delay = max(delay, float(response.headers.get("Retry-After") or 0))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    def request(self, method, url, params=None, json=None, headers=None, timeout=30, stream=False, retry=True,
+                deadline=None):
+        """One logical call: returns the final requests.Response or raises the last transport error.
+
+        deadline (time.monotonic() value) bounds the retries: no backoff sleep runs past it.
+        """
+        method = str(method or "GET").upper()
+        retryable = bool(retry) and method in IDEMPOTENT_METHODS
+        started = time.monotonic()
+        timeout = self._timeout(timeout)
+        _count("calls")
+        attempt = 0
+        while True:
+            _count("attempts")
+            response, error = None, None
+            try:
+                response = self.session.request(
+                    method, url, params=params, json=json, headers=headers,
+                    timeout=timeout, stream=stream,
+                )
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+            except Exception:
+                _count("errors")
+                raise
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+            if not retryable:
+                break
+            delay = self._backoff(attempt, response)
+            now = time.monotonic()
+            if (attempt >= self.retry_max or (now - started) + delay > self.retry_budget
+                    or (deadline is not None and now + delay >= deadline)):
+                _count("retry_gave_up")
+                break
+            if response is not None:
+                response.close()
+            _count("retries")
+            attempt += 1
+            time.sleep(delay)
+        if error is not None:
+            _count("errors")
+            raise error
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per concurrent key; returns (result, shared) where shared=True for waiters."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if leader:
+            _count("flights")
+            try:
+                flight.result = fn()
+                return flight.result, False
+            except BaseException as exc:
+                flight.error = exc
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        _count("coalesced")
+        if not flight.done.wait(timeout):
+            # The leader is stuck past this caller's budget: go upstream on our own.
+            _count("coalesce_timeouts")
+            return fn(), False
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+def gateway_client():
+    """The worker's shared client; a forked worker builds its own pool instead of reusing the parent's sockets."""
+    global _CLIENT
+    client = _CLIENT
+    if client is not None and client.pid == os.getpid():
+        return client
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.pid != os.getpid():
+            _CLIENT = GatewayClient()
+        return _CLIENT
+
+
+def _fanout_pool():
+    global _FANOUT_POOL
+    with _CLIENT_LOCK:
+        if _FANOUT_POOL is None or _FANOUT_POOL[1] != os.getpid():
+            pool = ThreadPoolExecutor(
+                max_workers=max(1, int(Config.GATEWAY_FANOUT_WORKERS)),
+                thread_name_prefix="gateway-fanout",
+            )
+            _FANOUT_POOL = (pool, os.getpid())
+        return _FANOUT_POOL[0]
+
+
+def fan_out(calls, limit=None, deadline=None):
+    """Run {key: fn} on the shared pool, at most `limit` in flight, waiting up to `deadline` seconds.
+
+    Returns (results, errors, pending): results/errors keyed like `calls`; pending lists keys that
+    were still running or never started at the deadline. Running calls finish in the background.
+    """
+    limit = max(1, int(Config.GATEWAY_FANOUT_LIMIT if limit is None else limit))
+    ends_at = None if deadline is None else time.monotonic() + max(0.0, float(deadline))
+    queue = list(calls.items())
+    pool = _fanout_pool()
+    running = {}
+    results, errors = {}, {}
+    _count("fanout_calls", len(queue))
+    while queue or running:
+        while queue and len(running) < limit:
+            key, fn = queue.pop(0)
+            running[pool.submit(fn)] = key
+        remaining = None if ends_at is None else ends_at - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            break
+        done, _ = wait(list(running), timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for fut in done:
+            key = running.pop(fut)
+            try:
+                results[key] = fut.result()
+            except Exception as exc:
+                errors[key] = exc
+    pending = list(running.values()) + [key for key, _fn in queue]
+    if pending:
+        _count("fanout_pending", len(pending))
+    return results, errors, pending
+
+
+def reset_gateway_client():
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None and _CLIENT.pid == os.getpid():
+            _CLIENT.close()
+        _CLIENT = None
+
+
+def gateway_stats():
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    stats["pool_hits"] = max(0, stats["attempts"] - stats["connections_opened"])
+    return stats
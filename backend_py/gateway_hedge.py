@@ -0,0 +1,192 @@
+"""
+Hedged requests for latency-critical gateway GETs (GA4 / Google Ads reports).
+
+Coolbits report latency is heavy-tailed: most calls answer in ~300 ms, a few percent take 10 s+.
+`hedged_call(path, fn)` runs an idempotent read and, when it has not answered after the path's
+observed GATEWAY_HEDGE_QUANTILE latency, starts an identical second attempt and returns whichever
+succeeds first (the loser finishes in the background and is discarded); an answer `accept(result)`
+rejects (the app's 429 / 5xx) does not end the race, the other attempt is awaited instead:
+  - per-path latency histograms (log-spaced buckets, halved every _DECAY_AT samples so they follow
+    the recent past) drive the delay; no hedging until GATEWAY_HEDGE_MIN_SAMPLES were seen;
+  - a global token bucket caps hedges at GATEWAY_HEDGE_MAX_PCT of hedgeable calls, so a slow
+    upstream never sees its load doubled;
+  - attempts run on a dedicated pool with one slot per worker; with no free slot the call runs
+    inline, unhedged, instead of queueing.
+p50 is untouched: nothing is duplicated before the tail quantile.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import Config
+
+BUCKETS_MS = (25, 50, 75, 100, 150, 200, 300, 400, 600, 800, 1000, 1500, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000)
+_DECAY_AT = 1000
+_BURST = 3.0
+
+_LOCK = threading.Lock()
+_HISTOGRAMS = {}
+_TOKENS = [1.0]
+_POOL = None  # (executor, slots, pid)
+_STATS = {"calls": 0, "inline": 0, "hedged": 0, "hedge_wins": 0, "rate_limited": 0, "no_slot": 0}
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+
+    def record(self, seconds):
+        idx = bisect_left(BUCKETS_MS, seconds * 1000.0)
+        with self._lock:
+            self.counts[idx] += 1
+            self.total += 1
+            if self.total >= _DECAY_AT:
+                self.counts = [c // 2 for c in self.counts]
+                self.total = sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-th percentile; None without samples."""
+        with self._lock:
+            total, counts = self.total, list(self.counts)
+        if total <= 0:
+            return None
+        need = total * min(100.0, max(0.0, float(q))) / 100.0
+        seen = 0
+        for idx, count in enumerate(counts):
+            seen += count
+            if seen >= need and count:
+                return (BUCKETS_MS[idx] if idx < len(BUCKETS_MS) else BUCKETS_MS[-1] * 2) / 1000.0
+        return BUCKETS_MS[-1] * 2 / 1000.0
+
+    def hedge_delay(self):
+        if self.total < max(1, int(Config.GATEWAY_HEDGE_MIN_SAMPLES)):
+            return None
+        delay = self.quantile(Config.GATEWAY_HEDGE_QUANTILE)
+        return None if delay is None else max(delay, Config.GATEWAY_HEDGE_MIN_DELAY_MS / 1000.0)
+
+    def snapshot(self):
+        out = {"samples": self.total}
+        for q in (50, 95, 99):
+            value = self.quantile(q)
+            out[f"p{q}_ms"] = None if value is None else int(value * 1000)
+        return out
+
+
+def latency_histogram(path):
+    hist = _HISTOGRAMS.get(path)
+    if hist is None:
+        with _LOCK:
+            hist = _HISTOGRAMS.setdefault(path, LatencyHistogram())
+    return hist
+
+
+def _count(key, n=1):
+    with _LOCK:
+        _STATS[key] += n
+
+
+def _earn_token():
+    with _LOCK:
+        _TOKENS[0] = min(_BURST, _TOKENS[0] + max(0, Config.GATEWAY_HEDGE_MAX_PCT) / 100.0)
+
+
+def _spend_token():
+    with _LOCK:
+        if _TOKENS[0] < 1.0:
+            _STATS["rate_limited"] += 1
+            return False
+        _TOKENS[0] -= 1.0
+        return True
+
+
+def _pool():
+    global _POOL
+    with _LOCK:
+        if _POOL is None or _POOL[2] != os.getpid():
+            workers = max(2, int(Config.GATEWAY_HEDGE_WORKERS))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gateway-hedge")
+            _POOL = (executor, threading.BoundedSemaphore(workers), os.getpid())
+        return _POOL[0], _POOL[1]
+
+
+def _timed(hist, fn):
+    started = time.monotonic()
+    result = fn()
+    hist.record(time.monotonic() - started)
+    return result
+
+
+def _submit(executor, slots, hist, fn):
+    """Start fn on the hedge pool if a slot is free; None otherwise."""
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        future = executor.submit(_timed, hist, fn)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _f: slots.release())
+    return future
+
+
+def hedged_call(path, fn, accept=None):
+    """fn() (an idempotent read) with one hedge after the path's tail latency; see module docstring.
+
+    accept(result) -> bool decides whether a finished attempt ends the race; when neither attempt is
+    accepted, the last rejected result is returned (or the error, if both raised).
+    """
+    hist = latency_histogram(path)
+    _count("calls")
+    _earn_token()
+    delay = hist.hedge_delay() if Config.GATEWAY_HEDGE else None
+    executor, slots = _pool() if delay is not None else (None, None)
+    primary = _submit(executor, slots, hist, fn) if delay is not None else None
+    if primary is None:
+        _count("inline")
+        return _timed(hist, fn)
+    done, _ = wait([primary], timeout=delay)
+    if done or not _spend_token():
+        return primary.result()
+    backup = _submit(executor, slots, hist, fn)
+    if backup is None:
+        _count("no_slot")
+        return primary.result()
+    _count("hedged")
+    pending, error, rejected = {primary, backup}, None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            if accept is not None and not accept(future.result()):
+                rejected = future
+                continue
+            if future is backup:
+                _count("hedge_wins")
+            return future.result()
+    if rejected is not None:
+        return rejected.result()
+    raise error
+
+
+def hedge_stats():
+    with _LOCK:
+        stats = dict(_STATS)
+        stats["tokens"] = round(_TOKENS[0], 2)
+        histograms = dict(_HISTOGRAMS)
+    stats["latency"] = {path: hist.snapshot() for path, hist in histograms.items()}
+    return stats
+
+
+def reset_hedging():
+    with _LOCK:
+        _HISTOGRAMS.clear()
+        _TOKENS[0] = 1.0
+        for key in _STATS:
+            _STATS[key] = 0
@@ -0,0 +1,557 @@
+"""
+Local stand-in for the Coolbits gateway, for load tests and latency/fault experiments.
+
+    python3 gateway_sim.py --port 8788 --latency lognormal:300:0.6 --error-rate 0.02
+    COOLBITS_URL=http://127.0.0.1:8788 COOLBITS_GATEWAY_ENABLED=1 python3 app.py
+
+Serves the routes the app calls (mock-login, auth/me, runs + /llm, GA4 and Google Ads reports,
+status/properties/accounts, billing summary and checkout) with answers built from the app's own
+mock datasets (GA4_MOCK_*, GOOGLE_ADS_MOCK_*) and the synthetic agent conversations.
+
+Faults, set on the command line or at runtime with POST /__sim/config (JSON, merged):
+  - latency: "fixed:MS", "uniform:LO:HI", "lognormal:MEDIAN_MS:SIGMA" or "tail:BASE_MS:SLOW_MS:PCT"
+    (PCT percent of calls take SLOW_MS); `route_latency` overrides it per path family
+    (runs / ga4 / googleads / billing / auth, as in circuit_breaker.PATH_FAMILIES);
+  - error_rate / error_status: that fraction of calls answers error_status (503 by default,
+    429 gets a Retry-After); hang_rate: that fraction never answers within hang_s;
+  - token_ttl_s: `exp` of the JWTs mock-login hands out; auth_storm "EVERY_S:FOR_S": for FOR_S
+    seconds of every EVERY_S all service tokens are rejected with 401 (POST /__sim/revoke does
+    it once, for tokens issued so far);
+  - drip_ms / drip_words: streamed /llm answers send drip_words words per SSE event every drip_ms.
+GET /__sim/stats returns per-route counters; POST /__sim/reset clears them and the issued tokens.
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from circuit_breaker import path_family
+
+DEFAULTS = {
+    "latency": "fixed:0",
+    "route_latency": {},
+    "error_rate": 0.0,
+    "error_status": 503,
+    "hang_rate": 0.0,
+    "hang_s": 30.0,
+    "token_ttl_s": 86400,
+    "auth_storm": "",
+    "drip_ms": 0,
+    "drip_words": 3,
+    "seed": None,
+}
+ADMIN_PREFIX = "/__sim/"
+
+
+def parse_latency(spec):
+    """Latency spec -> sampler(rng) returning seconds. Raises ValueError on a bad spec."""
+    kind, _, rest = str(spec or "fixed:0").partition(":")
+    args = [float(x) for x in rest.split(":") if x != ""]
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(args) == 1:
+        return lambda rng: args[0] / 1000.0
+    if kind == "uniform" and len(args) == 2:
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000.0
+    if kind == "lognormal" and len(args) == 2:
+        return lambda rng: rng.lognormvariate(math.log(max(args[0], 0.001)), args[1]) / 1000.0
+    if kind == "tail" and len(args) == 3:
+        return lambda rng: (args[1] if rng.random() * 100.0 < args[2] else args[0]) / 1000.0
+    raise ValueError(f"bad latency spec: {spec!r}")
+
+
+def _jwt(claims):
+    def _b64(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+
+    return f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64(claims)}.sim"
+
+
+_DATASETS = {}
+_DATASETS_LOCK = threading.Lock()
+
+
+def _datasets():
+    """The app's mock constants, imported on first use (importing app is slow)."""
+    with _DATASETS_LOCK:
+        if not _DATASETS:
+            import app as camarad
+
+            for name in ("GA4_MOCK_PROPERTIES", "GA4_MOCK_OVERVIEW", "GA4_MOCK_TOP_PAGES", "GA4_MOCK_SOURCES",
+                         "GA4_MOCK_EVENTS", "GA4_MOCK_DEVICES", "GA4_MOCK_COUNTRIES", "GOOGLE_ADS_MOCK_ACCOUNTS",
+                         "GOOGLE_ADS_MOCK_CAMPAIGNS", "GOOGLE_ADS_MOCK_KEYWORDS"):
+                _DATASETS[name] = getattr(camarad, name)
+            _DATASETS["ga4_daily"] = camarad._ga4_mock_daily
+            _DATASETS["ads_daily"] = camarad._google_ads_mock_metrics_response
+        return _DATASETS
+
+
+def _agent_replies(agent_slug):
+    from models import SYNTHETIC_DATA_DIR
+
+    replies = []
+    try:
+        with open(SYNTHETIC_DATA_DIR / f"{agent_slug}_synthetic.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for msg in json.loads(line).get("messages") or []:
+                    if msg.get("role") == "assistant" and str(msg.get("content") or "").strip():
+                        replies.append(str(msg["content"]).strip())
+    except (OSError, ValueError):
+        pass
+    return replies
+
+
+class Simulator:
+    def __init__(self, **overrides):
+        self._lock = threading.Lock()
+        self.config = dict(DEFAULTS)
+        self.started = time.monotonic()
+        self.tokens = {}  # token -> exp
+        self.revoked_before = 0.0
+        self.runs = {}  # run id -> agent slug
+        self.stats = {}
+        self.configure(overrides)
+
+    def configure(self, updates):
+        updates = {k: v for k, v in dict(updates or {}).items() if k in DEFAULTS}
+        samplers = {"": parse_latency(updates.get("latency", self.config["latency"]))}
+        route_latency = dict(updates.get("route_latency", self.config["route_latency"]) or {})
+        for family, spec in route_latency.items():
+            samplers[family] = parse_latency(spec)
+        storm = str(updates.get("auth_storm", self.config["auth_storm"]) or "")
+        if storm:
+            every, _, length = storm.partition(":")
+            storm = (float(every), float(length or 0))
+        with self._lock:
+            self.config.update(updates)
+            self.config["route_latency"] = route_latency
+            self._samplers = samplers
+            self._storm = storm or None
+            if "seed" in updates or not hasattr(self, "rng"):
+                self.rng = random.Random(self.config["seed"])
+        return self.snapshot()["config"]
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.tokens.clear()
+            self.runs.clear()
+            self.revoked_before = 0.0
+            self.started = time.monotonic()
+
+    def count(self, route, key):
+        with self._lock:
+            bucket = self.stats.setdefault(route, {})
+            bucket[key] = bucket.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "config": dict(self.config),
+                "routes": {route: dict(counts) for route, counts in self.stats.items()},
+                "tokens_issued": len(self.tokens),
+                "runs": len(self.runs),
+            }
+
+    def plan(self, path):
+        """(delay_s, fault) for one call; fault is None, "error" or "hang"."""
+        family = path_family(path)
+        with self._lock:
+            sampler = self._samplers.get(family) or self._samplers[""]
+            delay = max(0.0, sampler(self.rng))
+            roll = self.rng.random()
+            error_rate, hang_rate = float(self.config["error_rate"]), float(self.config["hang_rate"])
+        if roll < error_rate:
+            return delay, "error"
+        if roll < error_rate + hang_rate:
+            return delay, "hang"
+        return delay, None
+
+    def issue_token(self):
+        now = time.time()
+        exp = int(now + float(self.config["token_ttl_s"]))
+        token = _jwt({"sub": "camarad-svc", "iat": now, "exp": exp, "jti": uuid.uuid4().hex})
+        with self._lock:
+            self.tokens[token] = (now, exp)
+        return token
+
+    def revoke(self):
+        with self._lock:
+            self.revoked_before = time.time()
+
+    def in_storm(self):
+        storm = self._storm
+        if not storm or storm[0] <= 0:
+            return False
+        return (time.monotonic() - self.started) % storm[0] < storm[1]
+
+    def token_ok(self, token):
+        with self._lock:
+            issued = self.tokens.get(token)
+            revoked_before = self.revoked_before
+        if issued is None or time.time() >= issued[1] or issued[0] <= revoked_before:
+            return False
+        return not self.in_storm()
+
+    def new_run(self, title):
+        run_id = f"run-{uuid.uuid4().hex[:12]}"
+        agent = str(title or "").removeprefix("camarad-") or "ceo-strategy"
+        with self._lock:
+            self.runs[run_id] = agent
+        return run_id
+
+    def reply_for(self, run_id, user_input):
+        with self._lock:
+            agent = self.runs.get(run_id)
+            rng = self.rng
+            pick = rng.random()
+        if agent is None:
+            return None
+        replies = _agent_replies(agent)
+        if not replies:
+            return f"[{agent}] {str(user_input or '').strip()[:200]}"
+        return replies[int(pick * len(replies))]
+
+
+def _rows_ga4_report(params):
+    d = _datasets()
+    prop = str(params.get("propertyId") or "").split("/")[-1] or d["GA4_MOCK_PROPERTIES"][0]["id"]
+    base = "G-ABC123DEF4"
+    blocks = {b.strip() for b in str(params.get("blocks") or "").split(",") if b.strip()}
+    presets = {p.strip() for p in str(params.get("preset") or "").split(",") if p.strip()}
+    if not blocks and not presets:
+        blocks = {"overview", "device", "geo", "series"}
+        presets = {"pages_screens", "traffic_acquisition", "events"}
+    data = {}
+    if "overview" in blocks:
+        ov = d["GA4_MOCK_OVERVIEW"].get(prop, d["GA4_MOCK_OVERVIEW"][base])
+        deltas = {k: float(str(v).rstrip("%") or 0) / 100.0 for k, v in (ov.get("comparison") or {}).items()}
+        data["overview"] = {"sessions": ov["sessions"], "users": ov["users"], "conversions": ov["conversions"],
+                            "revenue": ov["revenue"], "deltas": deltas}
+    if "pages_screens" in presets:
+        data["pages_screens"] = {"rows": [{
+            "pagePath": r["path"], "pageTitle": r["title"], "screenPageViews": r["views"], "sessions": r["sessions"],
+            "totalUsers": r["users"], "conversions": r["conversions"], "engagementRate": 0.6,
+        } for r in d["GA4_MOCK_TOP_PAGES"].get(prop, d["GA4_MOCK_TOP_PAGES"][base])]}
+    if "traffic_acquisition" in presets:
+        data["traffic_acquisition"] = {"rows": [{
+            "sessionSource": r["source"], "sessionMedium": r["medium"], "sessions": r["sessions"],
+            "totalUsers": r["users"], "conversions": r["conversions"], "totalRevenue": r["revenue"],
+        } for r in d["GA4_MOCK_SOURCES"].get(prop, d["GA4_MOCK_SOURCES"][base])]}
+    if "events" in presets:
+        data["events"] = {"rows": [{
+            "eventName": r["name"], "eventCount": r["count"], "sessions": r["count"], "totalUsers": r["users"],
+            "totalRevenue": 0,
+        } for r in d["GA4_MOCK_EVENTS"].get(prop, d["GA4_MOCK_EVENTS"][base])]}
+    if "device" in blocks:
+        data["device"] = {"deviceCategory": [
+            {"deviceCategory": r["category"], "sessions": r["sessions"], "conversions": r["conversions"]}
+            for r in d["GA4_MOCK_DEVICES"].get(prop, d["GA4_MOCK_DEVICES"][base])]}
+    if "geo" in blocks:
+        data["geo"] = {"countries": [
+            {"country": r["country"], "sessions": r["sessions"], "conversions": r["conversions"]}
+            for r in d["GA4_MOCK_COUNTRIES"].get(prop, d["GA4_MOCK_COUNTRIES"][base])]}
+    if "series" in blocks:
+        data["series"] = {"daily": [
+            {"date": r["date"], "sessions": r["sessions"], "conversions": r["conversions"]}
+            for r in d["ga4_daily"](30)]}
+    return {"data": data, "propertyId": prop}
+
+
+def _rows_googleads_report(params):
+    d = _datasets()
+    account_id = str(params.get("account_id") or params.get("customerId") or "123-456-7890")
+    account = next((a for a in d["GOOGLE_ADS_MOCK_ACCOUNTS"] if a["id"] == account_id), None)
+    campaigns = d["GOOGLE_ADS_MOCK_CAMPAIGNS"].get(account_id, [])
+    presets = {p.strip() for p in str(params.get("preset") or "campaigns").split(",") if p.strip()}
+    blocks = {b.strip() for b in str(params.get("blocks") or "").split(",") if b.strip()} | presets
+    data = {}
+    if "overview" in blocks:
+        data["overview"] = {
+            "accountName": (account or {}).get("name") or account_id,
+            "clicks": sum(c["clicks"] for c in campaigns),
+            "impressions": sum(c["impressions"] for c in campaigns),
+            "cost": round(sum(c["spent"] for c in campaigns), 2),
+            "conversions": sum(c["conversions"] for c in campaigns),
+        }
+    if "campaigns" in blocks:
+        data["campaigns"] = {"rows": [{
+            "id": c["id"], "name": c["name"], "status": c["status"], "type": c["type"], "clicks": c["clicks"],
+            "impressions": c["impressions"], "cost": c["spent"], "conversions": c["conversions"],
+            "convValue": round(c["spent"] * c["roas"], 2),
+        } for c in campaigns]}
+    if "keywords" in blocks:
+        rows = []
+        for c in campaigns:
+            for k in d["GOOGLE_ADS_MOCK_KEYWORDS"].get(c["id"], []):
+                rows.append({"keyword": k["keyword"], "matchType": k["match_type"], "status": k["status"],
+                             "impressions": k["impressions"], "clicks": k["clicks"],
+                             "cost": round(k["clicks"] * k["avg_cpc"], 2), "qualityScore": k["quality_score"],
+                             "campaignId": c["id"]})
+        data["keywords"] = {"rows": rows}
+    if "series" in blocks:
+        daily = d["ads_daily"](account_id, 30)["daily_metrics"]
+        data["series"] = {"daily": [{**r, "convValue": round(r["cost"] * r["roas"], 2)} for r in daily]}
+    return {"data": data, "account_id": account_id}
+
+
+def _ads_accounts():
+    return {"accounts": [{"id": a["id"], "name": a["name"], "currency": a.get("currency"),
+                          "manager": a.get("type") == "MCC"} for a in _datasets()["GOOGLE_ADS_MOCK_ACCOUNTS"]]}
+
+
+def _ga4_properties():
+    return {"properties": [{"propertyId": p["id"], "displayName": p["name"], "stream": p["stream"], "url": p["url"],
+                            "timeZone": p["timezone"], "currencyCode": p["currency"]}
+                           for p in _datasets()["GA4_MOCK_PROPERTIES"]]}
+
+
+def _checkout(_body):
+    return {"url": f"https://checkout.stripe.test/c/{uuid.uuid4().hex[:16]}"}
+
+
+# (method, path) -> handler(params, body) for routes that need the service token.
+GET_ROUTES = {
+    "/api/connectors/ga4/report": _rows_ga4_report,
+    "/api/connectors/ga4/status": lambda p: {"connected": True, "status": "connected",
+                                             "selectedPropertyId": _datasets()["GA4_MOCK_PROPERTIES"][0]["id"]},
+    "/api/connectors/ga4/properties": lambda p: _ga4_properties(),
+    "/api/connectors/ga4/auth/url": lambda p: {"url": "https://accounts.google.test/o/oauth2/auth?sim=1"},
+    "/api/connectors/googleads/report": _rows_googleads_report,
+    "/api/connectors/googleads/customers": lambda p: _ads_accounts(),
+    "/api/connectors/googleads/customers/clients": lambda p: _ads_accounts(),
+    "/api/connectors/googleads/clients": lambda p: _ads_accounts(),
+    "/api/billing/summary": lambda p: {"stripe": {"status": "active", "plan": "pro", "currency": "usd",
+                                                  "current_period_end": int(time.time()) + 30 * 86400}},
+}
+POST_ROUTES = {
+    "/api/connectors/ga4/property": lambda b: {"ok": True, "selectedPropertyId": b.get("propertyId")},
+    "/api/connectors/googleads/customer": lambda b: {"ok": True, "customerId": b.get("customerId") or b.get("account_id")},
+    "/api/billing/upgrade": _checkout,
+    "/api/billing/checkout-session": _checkout,
+    "/api/billing/checkout": _checkout,
+    "/api/billing/subscribe": _checkout,
+}
+LLM_PATH = re.compile(r"^/api/runs/([^/]+)/llm$")
+
+
+class SimHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sim = None  # set per server by make_server
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        raw = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(raw)
+        except OSError:
+            pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    def _bearer(self):
+        value = str(self.headers.get("Authorization") or "")
+        return value[7:].strip() if value.lower().startswith("bearer ") else ""
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/") or "/"
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body() if method == "POST" else {}
+        if path.startswith(ADMIN_PREFIX):
+            self._admin(method, path[len(ADMIN_PREFIX):], body)
+            return
+
+        sim = self.sim
+        route = f"{method} {LLM_PATH.sub('/api/runs/{id}/llm', path)}"
+        sim.count(route, "calls")
+        delay, fault = sim.plan(path)
+        if fault == "hang":
+            sim.count(route, "hangs")
+            time.sleep(float(sim.config["hang_s"]))
+            return
+        if delay:
+            time.sleep(delay)
+        if fault == "error":
+            status = int(sim.config["error_status"])
+            sim.count(route, str(status))
+            self._json(status, {"error": "simulated_fault"}, {"Retry-After": "1"} if status == 429 else None)
+            return
+
+        if method == "POST" and path == "/api/auth/mock-login":
+            sim.count(route, "200")
+            self._json(200, {"token": sim.issue_token()})
+            return
+        if method == "GET" and path == "/api/auth/me":
+            token = self._bearer()
+            if not token or sim.in_storm():
+                sim.count(route, "401")
+                self._json(401, {"error": "unauthorized"})
+                return
+            sim.count(route, "200")
+            self._json(200, {"user": {"email": "sim@camarad.ai", "name": "Sim User"}})
+            return
+
+        if not sim.token_ok(self._bearer()):
+            sim.count(route, "401")
+            self._json(401, {"error": "invalid_token"})
+            return
+
+        if method == "POST" and path == "/api/runs":
+            sim.count(route, "200")
+            self._json(200, {"runId": sim.new_run(body.get("title"))})
+            return
+        match = LLM_PATH.match(path) if method == "POST" else None
+        if match:
+            text = sim.reply_for(match.group(1), body.get("input"))
+            if text is None:
+                sim.count(route, "404")
+                self._json(404, {"error": "run_not_found"})
+                return
+            sim.count(route, "200")
+            if body.get("stream") and "text/event-stream" in str(self.headers.get("Accept") or ""):
+                self._drip(text)
+            else:
+                self._json(200, {"text": text, "runId": match.group(1)})
+            return
+
+        handler = (GET_ROUTES if method == "GET" else POST_ROUTES).get(path)
+        if handler is None:
+            sim.count(route, "404")
+            self._json(404, {"error": "not_found"})
+            return
+        sim.count(route, "200")
+        self._json(200, handler(params if method == "GET" else body))
+
+    def _drip(self, text):
+        """SSE answer, `drip_words` words per event every `drip_ms`, closed with [DONE]."""
+        words = max(1, int(self.sim.config["drip_words"]))
+        pause = max(0, int(self.sim.config["drip_ms"])) / 1000.0
+        parts = re.findall(r"\S+\s*|\s+", text)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i in range(0, len(parts), words):
+                if pause:
+                    time.sleep(pause)
+                self.wfile.write(f"data: {json.dumps({'delta': ''.join(parts[i:i + words])})}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except OSError:
+            pass
+        self.close_connection = True
+
+    def _admin(self, method, action, body):
+        sim = self.sim
+        if method == "GET" and action == "stats":
+            self._json(200, sim.snapshot())
+        elif method == "POST" and action == "config":
+            try:
+                self._json(200, {"config": sim.configure(body)})
+            except (TypeError, ValueError) as e:
+                self._json(400, {"error": str(e)})
+        elif method == "POST" and action == "revoke":
+            sim.revoke()
+            self._json(200, {"ok": True})
+        elif method == "POST" and action == "reset":
+            sim.reset()
+            self._json(200, {"ok": True})
+        else:
+            self._json(404, {"error": "not_found"})
+
+
+def make_server(host="127.0.0.1", port=0, **config):
+    """A (not yet serving) simulator server; its Simulator is `server.sim`."""
+    sim = Simulator(**config)
+    handler = type("BoundSimHandler", (SimHandler,), {"sim": sim})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.sim = sim
+    return server
+
+
+def start_simulator(host="127.0.0.1", port=0, **config):
+    """Serve on a daemon thread; returns (server, base_url). Stop with server.shutdown()."""
+    server = make_server(host, port, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Coolbits gateway simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--latency", default=DEFAULTS["latency"], help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA | tail:BASE:SLOW:PCT")
+    parser.add_argument("--route-latency", action="append", default=[], metavar="FAMILY=SPEC")
+    parser.add_argument("--error-rate", type=float, default=DEFAULTS["error_rate"])
+    parser.add_argument("--error-status", type=int, default=DEFAULTS["error_status"])
+    parser.add_argument("--hang-rate", type=float, default=DEFAULTS["hang_rate"])
+    parser.add_argument("--hang-s", type=float, default=DEFAULTS["hang_s"])
+    parser.add_argument("--token-ttl-s", type=int, default=DEFAULTS["token_ttl_s"])
+    parser.add_argument("--auth-storm", default="", metavar="EVERY_S:FOR_S")
+    parser.add_argument("--drip-ms", type=int, default=DEFAULTS["drip_ms"])
+    parser.add_argument("--drip-words", type=int, default=DEFAULTS["drip_words"])
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    server = make_server(
+        args.host,
+        args.port,
+        latency=args.latency,
+        route_latency=dict(item.split("=", 1) for item in args.route_latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_s=args.hang_s,
+        token_ttl_s=args.token_ttl_s,
+        auth_storm=args.auth_storm,
+        drip_ms=args.drip_ms,
+        drip_words=args.drip_words,
+        seed=args.seed,
+    )
+    _datasets()
+    print(f"gateway_sim listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
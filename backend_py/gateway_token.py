@@ -0,0 +1,163 @@
+"""
+Coolbits gateway service token (mock-login JWT) and cached validations of user tokens.
+
+`_coolbits_get_token` used to keep the token in an unlocked module dict, refresh it every 6 hours
+or after a 401, and run the blocking mock-login inside whichever user request noticed; under load
+several threads logged in at once. `TokenManager`:
+  - reads the expiry from the JWT `exp` claim (GATEWAY_TOKEN_FALLBACK_TTL_S when there is none);
+  - inside the last GATEWAY_TOKEN_REFRESH_MARGIN_S it hands out the still-valid token and starts
+    one background refresh; requests only wait when there is no valid token at all;
+  - coalesces concurrent logins (lock + SingleFlight), and after a 401 re-logs in only if the
+    rejected token is still the current one.
+`ValidationCache` keeps successful /api/auth/me answers per user token for GATEWAY_AUTH_ME_TTL_S
+(never past the token's own `exp`), keyed by a hash so raw tokens are not held as dict keys.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from gateway_client import SingleFlight
+
+
+def jwt_expiry(token):
+    """`exp` (epoch seconds) from an unverified JWT payload; None for anything else."""
+    parts = str(token or "").split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        raw = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(raw.encode("ascii")))
+        return float(claims["exp"]) if isinstance(claims, dict) and claims.get("exp") is not None else None
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class TokenManager:
+    def __init__(self, login, state=None):
+        """login() -> token string (raises on failure); state: dict holding "token" / "fetched_at"."""
+        self._login = login
+        self.state = state if state is not None else {"token": None, "fetched_at": 0.0}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._refreshing = False
+        self.stats = {"logins": 0, "background_refreshes": 0, "refresh_errors": 0, "waits": 0}
+
+    def _current(self):
+        with self._lock:
+            return self.state.get("token"), float(self.state.get("fetched_at") or 0.0)
+
+    def expires_at(self, token=None, fetched_at=None):
+        if token is None:
+            token, fetched_at = self._current()
+        if not token:
+            return 0.0
+        exp = jwt_expiry(token)
+        return exp if exp is not None else float(fetched_at or 0.0) + float(Config.GATEWAY_TOKEN_FALLBACK_TTL_S)
+
+    def get(self, rejected=None):
+        """A usable token. rejected: the token a 401 came back for; forces a login unless already replaced."""
+        token, fetched_at = self._current()
+        now = time.time()
+        if token and token != rejected:
+            expires = self.expires_at(token, fetched_at)
+            if now < expires:
+                if now >= expires - float(Config.GATEWAY_TOKEN_REFRESH_MARGIN_S):
+                    self._refresh_in_background()
+                return token
+        with self._lock:
+            self.stats["waits"] += 1
+        return self._refresh()
+
+    def _refresh(self):
+        token, _shared = self._flight.do("login", self._login_and_store)
+        return token
+
+    def _login_and_store(self):
+        token = self._login()
+        if not token:
+            raise RuntimeError("missing_token")
+        with self._lock:
+            self.state["token"] = token
+            self.state["fetched_at"] = time.time()
+            self.stats["logins"] += 1
+        return token
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self.stats["background_refreshes"] += 1
+
+        def _run():
+            try:
+                self._refresh()
+            except Exception as e:
+                with self._lock:
+                    self.stats["refresh_errors"] += 1
+                print(f"gateway_token_refresh_error: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def snapshot(self):
+        token, fetched_at = self._current()
+        expires = self.expires_at(token, fetched_at)
+        with self._lock:
+            out = dict(self.stats)
+            out["refreshing"] = self._refreshing
+        out["has_token"] = bool(token)
+        out["expires_in_s"] = int(expires - time.time()) if token else None
+        return out
+
+
+class ValidationCache:
+    def __init__(self, max_entries=1024):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # sha256(token) -> (user, expires_at)
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(str(token).encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[1]:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, token, user):
+        expires = time.time() + max(0, int(Config.GATEWAY_AUTH_ME_TTL_S))
+        exp = jwt_expiry(token)
+        if exp is not None:
+            expires = min(expires, exp)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(user), expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
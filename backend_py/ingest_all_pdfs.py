@@ -12,6 +12,10 @@ import sqlite3
 from pathlib import Path
 from typing import List
 
+from knowledge_index import sync_chunk_index
+from retrieval_cache import bump_corpus_version
+from vector_index import build_vector_index
+
 try:
     import pdfplumber
 except ImportError:
@@ -138,8 +142,16 @@ def process_pdf(pdf_path: Path):
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (chunk_id, title, summary, chunk, pdf_path.name, now))
     
+    # Index FTS (BM25) pentru get_rag_context / /api/rag/search
+    added, removed = sync_chunk_index(conn)
     conn.commit()
+    # Index vectorial (hashed TF-IDF/SVD) pentru retrieval hibrid; incremental, sărit fără numpy
+    vectors = build_vector_index(conn, DB_PATH, "chunks")
+    if vectors:
+        print(f"  Index vectorial: +{vectors['added']} / -{vectors['removed']} ({vectors['rows']} vectori)")
+    bump_corpus_version(DB_PATH)  # invalidează contextele RAG din cache-ul proceselor web
     conn.close()
+    print(f"  Index FTS actualizat: +{added} / -{removed} chunks")
     
     print(f"  Salvat: {jsonl_path}")
     print(f"  Adăugat {chunk_count} chunks în DB")
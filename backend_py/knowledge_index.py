@@ -0,0 +1,169 @@
+"""
+BM25 retrieval over knowledge-base `chunks` (FTS5).
+
+`chunks_fts` mirrors chunks(title, summary, content) with rowid = chunks.id. Triggers keep it current
+for ordinary INSERT/UPDATE/DELETE; `sync_chunk_index()` reconciles anything the triggers cannot see
+(rows written before the index existed, INSERT OR REPLACE deletes, which skip delete triggers) and is
+the hook the ingest scripts call after writing chunks.
+"""
+
+import re
+import threading
+
+# bm25 column weights: title, summary, content.
+CHUNK_FTS_WEIGHTS = (5.0, 2.0, 1.0)
+
+STOP_WORDS = {
+    'what', 'is', 'the', 'how', 'to', 'for', 'and', 'or', 'but', 'in', 'on', 'at', 'by', 'with', 'a', 'an',
+    'of', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will',
+    'would', 'could', 'should', 'can', 'may', 'might', 'must', 'my', 'me', 'i', 'this', 'that', 'these',
+    'those', 'about', 'from', 'show', 'tell', 'give', 'get',
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_LOCK = threading.Lock()
+_READY_PATHS = set()  # database files whose index was created + reconciled in this process
+
+
+def query_terms(query, stop_words=STOP_WORDS, min_len=3, max_terms=16):
+    """Meaningful lower-cased query terms, de-duplicated in order of appearance."""
+    tokens = [t.lower() for t in _TOKEN_RE.findall(str(query or ""))]
+    terms = [t for t in tokens if len(t) >= min_len and t not in stop_words]
+    if not terms:
+        terms = [t for t in tokens if t]
+    seen = []
+    for t in terms:
+        if t not in seen:
+            seen.append(t)
+    return seen[:max_terms]
+
+
+def build_match_query(query, stop_words=STOP_WORDS, min_len=3, max_terms=16):
+    """OR together the meaningful query terms; bm25 then favours chunks that match more of them."""
+    return " OR ".join(f'"{t}"' for t in query_terms(query, stop_words, min_len, max_terms))
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ? LIMIT 1", (name,)
+    ).fetchone() is not None
+
+
+def sync_chunk_index(conn):
+    """Bring chunks_fts in line with chunks. Returns (added, removed); caller commits."""
+    if not _table_exists(conn, "chunks_fts"):
+        if not ensure_chunk_index(conn):
+            return (0, 0)
+        return (conn.execute("SELECT COUNT(*) FROM chunks_fts").fetchone()[0], 0)
+    removed = conn.execute("DELETE FROM chunks_fts WHERE rowid NOT IN (SELECT id FROM chunks)").rowcount
+    added = conn.execute(
+        """
+        INSERT INTO chunks_fts(rowid, title, summary, content)
+        SELECT id, COALESCE(title, ''), COALESCE(summary, ''), COALESCE(content, '')
+        FROM chunks
+        WHERE id NOT IN (SELECT rowid FROM chunks_fts)
+        """
+    ).rowcount
+    return (max(0, added or 0), max(0, removed or 0))
+
+
+def ensure_chunk_index(conn):
+    """Create chunks_fts + triggers if missing and reconcile. No-op when `chunks` does not exist."""
+    if not _table_exists(conn, "chunks"):
+        return False
+    created = not _table_exists(conn, "chunks_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            title, summary, content,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    for stmt in (
+        """CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+            DELETE FROM chunks_fts WHERE rowid = new.id;
+            INSERT INTO chunks_fts(rowid, title, summary, content)
+            VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.summary, ''), COALESCE(new.content, ''));
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+            DELETE FROM chunks_fts WHERE rowid = old.id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE ON chunks BEGIN
+            DELETE FROM chunks_fts WHERE rowid = old.id;
+            INSERT INTO chunks_fts(rowid, title, summary, content)
+            VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.summary, ''), COALESCE(new.content, ''));
+        END""",
+    ):
+        conn.execute(stmt)
+    if created:
+        conn.execute(
+            """
+            INSERT INTO chunks_fts(rowid, title, summary, content)
+            SELECT id, COALESCE(title, ''), COALESCE(summary, ''), COALESCE(content, '') FROM chunks
+            """
+        )
+    else:
+        sync_chunk_index(conn)
+    return True
+
+
+def ensure_chunk_index_once(conn, path):
+    """Per-process guard around ensure_chunk_index() for read paths (commits only when it did work)."""
+    key = str(path)
+    if key in _READY_PATHS:
+        return True
+    with _LOCK:
+        if key in _READY_PATHS:
+            return True
+        try:
+            ok = ensure_chunk_index(conn)
+            conn.commit()
+        except Exception as e:
+            print(f"chunk_index_error: {e}")
+            return False
+        if ok:
+            _READY_PATHS.add(key)
+        return ok
+
+
+def search_chunks(conn, query, top_k=3):
+    """Top-k chunks by weighted bm25. Returns dicts with id/title/summary/content/source/score."""
+    match = build_match_query(query)
+    if not match:
+        return []
+    w_title, w_summary, w_content = CHUNK_FTS_WEIGHTS
+    rows = conn.execute(
+        """
+        SELECT c.id, c.title, c.summary, c.content, c.source, bm25(chunks_fts, ?, ?, ?) AS score
+        FROM chunks_fts
+        JOIN chunks c ON c.id = chunks_fts.rowid
+        WHERE chunks_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        """,
+        (w_title, w_summary, w_content, match, max(1, int(top_k))),
+    ).fetchall()
+    return [
+        {
+            "id": r[0],
+            "title": r[1],
+            "summary": r[2],
+            "content": r[3],
+            "source": r[4],
+            "score": round(float(r[5] or 0.0), 4),
+        }
+        for r in rows
+    ]
+
+
+def fetch_chunks(conn, ids):
+    """Chunks by id (vector-only hits), same dict shape as search_chunks with score=None."""
+    ids = [int(v) for v in ids]
+    if not ids:
+        return []
+    rows = conn.execute(
+        f"SELECT id, title, summary, content, source FROM chunks WHERE id IN ({','.join('?' for _ in ids)})", ids
+    ).fetchall()
+    return [
+        {"id": r[0], "title": r[1], "summary": r[2], "content": r[3], "source": r[4], "score": None}
+        for r in rows
+    ]
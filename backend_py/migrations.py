@@ -0,0 +1,699 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for camarad.db.
+
+Every schema change lives here as a numbered step. Steps run once, in order, inside their own
+transaction and are recorded in `schema_migrations`; `PRAGMA user_version` mirrors the latest
+applied step so `ensure_schema()` can answer "is the schema current?" with a single pragma read
+(and then a set lookup for the rest of the process lifetime).
+
+Run `python3 migrations.py` on deploy. App startup applies pending steps as well, so request
+handlers never issue DDL. `python3 migrations.py --backfill-conversation-activity` recomputes the
+denormalized conversation list columns from `messages`; `--rebuild-search-index` repopulates the
+FTS5 search indexes. A plain run also splits API docs pages stored before passages existed
+(connectors_api_docs.db, see api_docs_index); `--build-api-docs-passages` runs only that step.
+"""
+
+import sys
+import threading
+import uuid
+
+import api_docs_index
+from config import Config
+from knowledge_index import ensure_chunk_index
+from database import (
+    get_db,
+    refresh_conversation_activity,
+    rebuild_search_index,
+    _table_exists,
+    _table_columns,
+    _rebuild_agents_config_per_client,
+    _rebuild_connectors_config_per_client,
+)
+
+
+def _add_columns(conn, table_name, columns):
+    """ALTER TABLE ADD COLUMN for each (name, decl) pair that is not present yet."""
+    if not _table_exists(conn, table_name):
+        return
+    existing = _table_columns(conn, table_name)
+    for name, decl in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {decl}")
+
+
+def _m001_core_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            is_premium BOOLEAN DEFAULT FALSE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            client_id INTEGER,
+            workspace_slug TEXT NOT NULL,
+            agent_slug TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            title TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            conv_id INTEGER NOT NULL,
+            role TEXT NOT NULL,  -- 'user' or 'agent'
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conv_id) REFERENCES conversations (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL DEFAULT 'person',
+            name TEXT,
+            company_name TEXT,
+            email TEXT,
+            website TEXT,
+            phone TEXT,
+            address TEXT,
+            notes TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS client_connectors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            connector_slug TEXT NOT NULL,
+            account_id TEXT,
+            account_name TEXT,
+            status TEXT DEFAULT 'pending',
+            config_json TEXT,
+            last_synced TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (client_id) REFERENCES clients(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            settings_json TEXT NOT NULL DEFAULT '{}',
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS flows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL DEFAULT 'Untitled Flow',
+            user_id INTEGER DEFAULT 1,
+            client_id INTEGER,
+            flow_json TEXT NOT NULL,
+            thumbnail TEXT,
+            category TEXT DEFAULT 'Uncategorized',
+            description TEXT DEFAULT '',
+            is_template INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now')),
+            is_active INTEGER DEFAULT 1
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chunk_id TEXT UNIQUE,
+            title TEXT,
+            summary TEXT,
+            content TEXT,
+            source TEXT,
+            timestamp TEXT DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agents_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER DEFAULT 1,
+            client_id INTEGER NOT NULL DEFAULT 0,
+            agent_slug TEXT NOT NULL,
+            custom_name TEXT,
+            avatar_base64 TEXT,
+            avatar_colors TEXT,
+            llm_provider TEXT,
+            llm_model TEXT,
+            api_key TEXT,
+            temperature REAL DEFAULT 0.7,
+            max_tokens INTEGER DEFAULT 2048,
+            rag_enabled INTEGER DEFAULT 1,
+            status TEXT DEFAULT 'Active',
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now')),
+            UNIQUE(user_id, agent_slug, client_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS connectors_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER DEFAULT 1,
+            client_id INTEGER NOT NULL DEFAULT 0,
+            connector_slug TEXT NOT NULL,
+            status TEXT DEFAULT 'Disconnected',
+            config_json TEXT,
+            last_connected TEXT,
+            UNIQUE(user_id, connector_slug, client_id)
+        )
+    """)
+    # Mock users
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (1, 'dev', FALSE)")
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (2, 'Alice', FALSE)")
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (3, 'Bob', TRUE)")
+
+
+def _m002_users_auth_columns(conn):
+    _add_columns(conn, "users", (
+        ("email", "TEXT"),
+        ("auth_provider", "TEXT DEFAULT 'local'"),
+        ("created_at", "TEXT"),
+        ("last_login_at", "TEXT"),
+    ))
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique ON users(email)")
+
+
+def _m003_client_scope_columns(conn):
+    for table_name in ("flows", "conversations", "agents_config", "connectors_config"):
+        _add_columns(conn, table_name, (("client_id", "INTEGER"),))
+    _add_columns(conn, "agents_config", (("avatar_colors", "TEXT"),))
+    _add_columns(conn, "flows", (
+        ("thumbnail", "TEXT"),
+        ("category", "TEXT DEFAULT 'Uncategorized'"),
+        ("description", "TEXT DEFAULT ''"),
+        ("is_template", "INTEGER DEFAULT 0"),
+    ))
+
+
+def _m004_per_client_config_uniques(conn):
+    _rebuild_agents_config_per_client(conn)
+    _rebuild_connectors_config_per_client(conn)
+
+
+def _m005_usage_ledger(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            client_id INTEGER,
+            event_type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            description TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    # Shadow billing telemetry (Phase 1-3): additive columns only.
+    _add_columns(conn, "usage_ledger", (
+        ("client_id", "INTEGER"),
+        ("request_id", "TEXT"),
+        ("workspace_id", "TEXT"),
+        ("run_id", "TEXT"),
+        ("step_id", "TEXT"),
+        ("agent_id", "TEXT"),
+        ("trace_id", "TEXT"),
+        ("provider", "TEXT DEFAULT 'mock'"),
+        ("model", "TEXT DEFAULT 'mock'"),
+        ("region", "TEXT DEFAULT 'unknown'"),
+        ("model_class", "TEXT DEFAULT 'auto'"),
+        ("input_tokens", "INTEGER DEFAULT 0"),
+        ("output_tokens", "INTEGER DEFAULT 0"),
+        ("tool_calls", "INTEGER DEFAULT 0"),
+        ("connector_calls", "INTEGER DEFAULT 0"),
+        ("latency_ms", "INTEGER DEFAULT 0"),
+        ("status", "TEXT DEFAULT 'ok'"),
+        ("error_code", "TEXT"),
+        ("cost_estimate_usd", "REAL DEFAULT 0"),
+        ("cost_final_usd", "REAL DEFAULT 0"),
+        ("cost_estimate_eur", "REAL DEFAULT 0"),
+        ("cost_final_eur", "REAL DEFAULT 0"),
+        ("overhead_eur", "REAL DEFAULT 0"),
+        ("billable_eur", "REAL"),
+        ("billable_usd", "REAL"),
+        ("overhead_usd", "REAL DEFAULT 0"),
+        ("ct_shadow_debit", "INTEGER"),
+        ("risk_buffer_pct", "REAL DEFAULT 0.15"),
+        ("target_margin_pct", "REAL DEFAULT 0.50"),
+        ("minimum_ct_debit", "INTEGER DEFAULT 1"),
+        ("ct_actual_debit", "INTEGER"),
+        ("ct_debit_shadow", "INTEGER"),
+        ("ct_ledger_txn_id", "TEXT"),
+        ("pricing_catalog_id", "TEXT"),
+        ("ct_rate_id", "TEXT"),
+        ("ct_debit_applied", "INTEGER"),
+        ("phase3_applied", "INTEGER DEFAULT 0"),
+        ("phase3_applied_at", "TEXT"),
+        ("phase3_cap_reason", "TEXT"),
+        ("meta_json", "TEXT"),
+    ))
+
+
+def _m006_pricing_engine(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pricing_catalog (
+            id TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            model TEXT NOT NULL,
+            region TEXT NOT NULL DEFAULT 'unknown',
+            input_price_per_1k_usd REAL NOT NULL DEFAULT 0,
+            output_price_per_1k_usd REAL NOT NULL DEFAULT 0,
+            tool_call_price_usd REAL NOT NULL DEFAULT 0,
+            connector_call_price_usd REAL NOT NULL DEFAULT 0,
+            effective_from TEXT NOT NULL,
+            effective_to TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            notes TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ct_rates (
+            id TEXT PRIMARY KEY,
+            ct_value_usd REAL NOT NULL,
+            effective_from TEXT NOT NULL,
+            effective_to TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            notes TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pricing_lookup ON pricing_catalog(provider, model, region, effective_from)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ct_rates_effective ON ct_rates(effective_from)")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_pricing_provider_model_version "
+        "ON pricing_catalog(provider, model, version)"
+    )
+
+    # Seed default ct rate once.
+    row = conn.execute("SELECT id FROM ct_rates ORDER BY effective_from DESC LIMIT 1").fetchone()
+    if not row:
+        conn.execute(
+            """
+            INSERT INTO ct_rates (id, ct_value_usd, effective_from, effective_to, version, is_active, notes)
+            VALUES (?, ?, datetime('now'), NULL, 1, 1, ?)
+            """,
+            (str(uuid.uuid4()), 0.00010, "bootstrap shadow ct rate"),
+        )
+
+    # Seed a minimal pricing catalog for currently used models.
+    seeds = [
+        ("vertex", "gemini-1.5-flash-002", "unknown", 0.000075, 0.000300, 1),
+        ("vertex", "gemini-1.5-pro-002", "unknown", 0.001250, 0.005000, 1),
+        ("anthropic", "claude-3-5-sonnet-20241022", "unknown", 0.003000, 0.015000, 1),
+        ("xai", "grok-beta", "unknown", 0.000200, 0.000800, 1),
+        ("grok", "grok-1", "unknown", 0.000200, 0.000800, 1),
+    ]
+    for provider, model, region, in_p, out_p, version in seeds:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO pricing_catalog (
+                id, provider, model, region,
+                input_price_per_1k_usd, output_price_per_1k_usd,
+                tool_call_price_usd, connector_call_price_usd,
+                effective_from, effective_to, version, is_active, notes
+            ) VALUES (?, ?, ?, ?, ?, ?, 0, 0, datetime('now'), NULL, ?, 1, ?)
+            """,
+            (str(uuid.uuid4()), provider, model, region, float(in_p), float(out_p), int(version), "seed"),
+        )
+
+
+def _m007_oauth_states(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS oauth_states (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider TEXT NOT NULL,
+            state TEXT NOT NULL,
+            user_id INTEGER,
+            workspace_id TEXT,
+            redirect_uri TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at TEXT NOT NULL,
+            used_at TEXT,
+            meta_json TEXT
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_oauth_states_provider_state ON oauth_states(provider, state)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_oauth_states_provider_expires ON oauth_states(provider, expires_at)")
+
+
+def _m008_orchestrator_history(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS flow_executions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            client_id INTEGER,
+            flow_name TEXT,
+            nodes_count INTEGER,
+            steps_count INTEGER,
+            elapsed_ms REAL,
+            status TEXT,
+            result_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS executions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flow_id INTEGER,
+            user_id INTEGER NOT NULL,
+            client_id INTEGER,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            steps_json TEXT NOT NULL
+        )
+    """)
+    _add_columns(conn, "flow_executions", (("client_id", "INTEGER"),))
+    _add_columns(conn, "executions", (("client_id", "INTEGER"),))
+
+
+def _m009_meetings(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS meetings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER DEFAULT 1,
+            client_id INTEGER,
+            template_id TEXT,
+            title TEXT,
+            status TEXT DEFAULT 'completed',
+            created_at TEXT DEFAULT (datetime('now')),
+            duration_min INTEGER,
+            agents_json TEXT,
+            rounds INTEGER,
+            topic TEXT,
+            transcript_json TEXT,
+            summary TEXT,
+            action_items_json TEXT,
+            config_json TEXT
+        )
+    """)
+    _add_columns(conn, "meetings", (("client_id", "INTEGER"),))
+
+
+def _m010_indexes(conn):
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS idx_clients_user ON clients(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_client_connectors_client ON client_connectors(client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_flows_user_client ON flows(user_id, client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_flows_user_template ON flows(user_id, is_template)",
+        "CREATE INDEX IF NOT EXISTS idx_flows_user_client_template ON flows(user_id, client_id, is_template)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_client ON conversations(user_id, client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_conv ON messages(conv_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_agents_user_client ON agents_config(user_id, client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_connectors_user_client ON connectors_config(user_id, client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_user_settings_user ON user_settings(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_created ON usage_ledger(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_event ON usage_ledger(user_id, event_type)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_ledger_request_id_unique "
+        "ON usage_ledger(request_id) WHERE request_id IS NOT NULL AND request_id <> ''",
+        "CREATE INDEX IF NOT EXISTS idx_usage_ledger_status_created ON usage_ledger(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_ledger_provider_model_created ON usage_ledger(provider, model, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_ledger_phase3_created ON usage_ledger(phase3_applied, created_at)",
+    ):
+        conn.execute(stmt)
+
+
+def _m011_personal_assistant_branding(conn):
+    # Keep slug `life-coach` but persist branding as "Personal Assistant" when custom_name is empty.
+    conn.execute(
+        """
+        UPDATE agents_config
+        SET custom_name = ?
+        WHERE agent_slug = ?
+          AND (custom_name IS NULL OR TRIM(custom_name) = '')
+        """,
+        ("Personal Assistant", "life-coach"),
+    )
+
+
+def _m012_conversation_activity(conn):
+    # Denormalized list columns, maintained by database.save_message() / save_chat_turn().
+    _add_columns(conn, "conversations", (
+        ("last_message_preview", "TEXT"),
+        ("last_activity_at", "TEXT"),
+        ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+    ))
+    refresh_conversation_activity(conn)
+    # List queries filter on COALESCE(client_id, 0), so index that expression.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_client_activity "
+        "ON conversations(user_id, COALESCE(client_id, 0), last_activity_at DESC)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_activity "
+        "ON conversations(user_id, last_activity_at DESC)"
+    )
+
+
+def _m013_search_fts(conn):
+    # External-content FTS5 indexes: the text lives once, in messages / conversations.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            title, content='conversations', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    for stmt in (
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title);
+        END""",
+    ):
+        conn.execute(stmt)
+    rebuild_search_index(conn)
+
+
+def _m014_chunks_fts(conn):
+    ensure_chunk_index(conn)
+
+
+def _m015_google_ads_account_names(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS google_ads_account_names (
+            user_id INTEGER NOT NULL,
+            account_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mcc_id TEXT,
+            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (user_id, account_id)
+        )
+    """)
+
+
+def _m016_conversation_summaries(conn):
+    # Rolling per-conversation summary maintained by conversation_context.build_context().
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conv_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL DEFAULT '',
+            covered_message_id INTEGER NOT NULL DEFAULT 0,
+            covered_count INTEGER NOT NULL DEFAULT 0,
+            covered_tokens INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+
+def _m017_reply_cache(conn):
+    # Shared tier of the opt-in chat reply cache (see reply_cache); epoch-second timestamps.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reply_cache (
+            key TEXT PRIMARY KEY,
+            agent_slug TEXT NOT NULL,
+            ws_slug TEXT,
+            response TEXT NOT NULL,
+            provider TEXT,
+            model TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reply_cache_last_hit ON reply_cache(last_hit_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reply_cache_agent ON reply_cache(agent_slug)")
+
+
+MIGRATIONS = [
+    (1, "core_tables", _m001_core_tables),
+    (2, "users_auth_columns", _m002_users_auth_columns),
+    (3, "client_scope_columns", _m003_client_scope_columns),
+    (4, "per_client_config_uniques", _m004_per_client_config_uniques),
+    (5, "usage_ledger", _m005_usage_ledger),
+    (6, "pricing_engine", _m006_pricing_engine),
+    (7, "oauth_states", _m007_oauth_states),
+    (8, "orchestrator_history", _m008_orchestrator_history),
+    (9, "meetings", _m009_meetings),
+    (10, "indexes", _m010_indexes),
+    (11, "personal_assistant_branding", _m011_personal_assistant_branding),
+    (12, "conversation_activity", _m012_conversation_activity),
+    (13, "search_fts", _m013_search_fts),
+    (14, "chunks_fts", _m014_chunks_fts),
+    (15, "google_ads_account_names", _m015_google_ads_account_names),
+    (16, "conversation_summaries", _m016_conversation_summaries),
+    (17, "reply_cache", _m017_reply_cache),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_LOCK = threading.Lock()
+_CURRENT_PATHS = set()  # database paths verified at LATEST_VERSION in this process
+
+
+def _ensure_migrations_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+
+def schema_version(conn):
+    row = conn.execute("PRAGMA user_version").fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+def schema_is_current(conn):
+    return schema_version(conn) >= LATEST_VERSION
+
+
+def apply_migrations(conn, verbose=False):
+    """Apply every pending step. Returns the list of versions applied by this call."""
+    applied = []
+    if conn.in_transaction:
+        conn.commit()
+    _ensure_migrations_table(conn)
+    conn.commit()
+    for version, name, step in MIGRATIONS:
+        # BEGIN IMMEDIATE serializes concurrent workers/deploy scripts on the write lock.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone()
+            if done:
+                conn.execute("COMMIT")
+                continue
+            step(conn)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"  applied {version:03d}_{name}")
+    return applied
+
+
+def ensure_schema(conn):
+    """Fast path used by request code: one set lookup once the schema has been verified."""
+    path = getattr(conn, "_path", None) or Config.DATABASE
+    if path in _CURRENT_PATHS:
+        return
+    with _LOCK:
+        if path in _CURRENT_PATHS:
+            return
+        if not schema_is_current(conn):
+            apply_migrations(conn)
+        _CURRENT_PATHS.add(path)
+
+
+def backfill_conversation_activity():
+    """Recompute conversation activity columns from messages (safe to re-run)."""
+    conn = get_db()
+    try:
+        ensure_schema(conn)
+        updated = refresh_conversation_activity(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Conversation activity refreshed for {updated} conversations ({Config.DATABASE})")
+
+
+def rebuild_search():
+    """Rebuild the conversation/message FTS indexes from their content tables."""
+    conn = get_db()
+    try:
+        ensure_schema(conn)
+        rebuild_search_index(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Search index rebuilt ({Config.DATABASE})")
+
+
+def build_api_docs_passages(path=None):
+    """Split API docs pages stored before passages existed (the read path never does; see api_docs_index)."""
+    path = path or api_docs_index.API_DOCS_DB
+    split = api_docs_index.split_pending_pages(path)
+    if split:
+        print(f"API docs passages built for {split} pages ({path})")
+
+
+def main():
+    if "--backfill-conversation-activity" in sys.argv[1:]:
+        backfill_conversation_activity()
+        return
+    if "--rebuild-search-index" in sys.argv[1:]:
+        rebuild_search()
+        return
+    if "--build-api-docs-passages" in sys.argv[1:]:
+        build_api_docs_passages()
+        return
+    conn = get_db()
+    try:
+        before = schema_version(conn)
+        applied = apply_migrations(conn, verbose=True)
+        after = schema_version(conn)
+    finally:
+        conn.close()
+    if applied:
+        print(f"Schema migrated {before} -> {after} ({Config.DATABASE})")
+    else:
+        print(f"Schema is current at version {after} ({Config.DATABASE})")
+    build_api_docs_passages()
+
+
+if __name__ == "__main__":
+    main()
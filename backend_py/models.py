@@ -1,165 +1,153 @@
 # Models as dicts/helpers for now
 
-import json
 import os
-import random
-import sqlite3
 from pathlib import Path
 
+from api_docs_index import API_DOCS_CONNECTOR_BOOST, ensure_api_docs_index_once, fetch_passages, search_api_docs
+from example_store import sample_examples
+from knowledge_index import ensure_chunk_index_once, fetch_chunks, search_chunks
+from retrieval_cache import cached_context, read_connection
+from vector_index import open_vector_index, rrf_fuse
+
 SYNTHETIC_DATA_DIR = Path(__file__).parent / "synthetic_datasets"
-AGENT_EXAMPLES = {}  # Cache for loaded examples
 
 DB_PATH = Path(__file__).parent / "knowledge_base" / "knowledge.db"
 API_DOCS_DB = Path(__file__).parent / "connectors_api_docs.db"
 
+# keyword | vector | hybrid. Vector retrieval needs numpy and an index built with vector_index.py;
+# without them every mode falls back to keyword (BM25) ranking.
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower()
+# random | relevant: few-shot examples drawn at random, or the ones closest to the message (keyword index).
+FEW_SHOT_MODE = os.getenv("FEW_SHOT_MODE", "random").strip().lower()
 
-def get_api_docs_context(query: str, connectors: list, top_k: int = 3) -> str:
-    """Search API docs prioritizing specific connectors, return formatted context with citations"""
-    if not API_DOCS_DB.exists():
-        return ""
 
-    # Extract meaningful keywords
-    stop_words = {'what', 'is', 'the', 'how', 'to', 'for', 'and', 'or', 'but', 'in',
-                  'on', 'at', 'by', 'with', 'a', 'an', 'of', 'are', 'was', 'do', 'does',
-                  'can', 'could', 'should', 'would', 'will', 'my', 'me', 'i', 'show',
-                  'tell', 'about', 'from', 'get', 'give', 'this', 'that', 'these', 'those'}
-    words = [w.lower() for w in query.split() if len(w) > 2 and w.lower() not in stop_words]
-    if not words:
-        words = [query.lower()]
+def _fuse_ranked(keyword_rows, vector_hits, fetch):
+    """RRF over keyword rows (dicts with "id") and vector hits [(id, score)]; vector-only rows come from fetch()."""
+    by_id = {r["id"]: r for r in keyword_rows}
+    fused = rrf_fuse([[r["id"] for r in keyword_rows], [i for i, _ in vector_hits]])
+    by_id.update({r["id"]: r for r in fetch([i for i, _ in fused if i not in by_id])})
+    return [dict(by_id[i], score=round(score, 6)) for i, score in fused if i in by_id]
 
-    conn = sqlite3.connect(API_DOCS_DB)
-    cursor = conn.cursor()
 
-    results = []
+def search_api_docs_corpus(query: str, boost_connectors=None, connector=None, limit: int = 3, mode: str = None) -> list:
+    """Ranked API docs passages from connectors_api_docs.db, best one per page ([] when the corpus is missing)."""
+    conn = read_connection(API_DOCS_DB, prepare=ensure_api_docs_index_once)
+    if conn is None:
+        return []
+    try:
+        return _rank_api_docs(conn, query, boost_connectors, connector, limit, mode)
+    finally:
+        conn.close()
+
+
+def _rank_api_docs(conn, query, boost_connectors, connector, limit, mode):
+    mode = (mode or RAG_RETRIEVAL_MODE).lower()
+    vectors = open_vector_index(API_DOCS_DB, "api_docs") if mode in ("vector", "hybrid") else None
+    if vectors is None:
+        return search_api_docs(conn, query, boost_connectors=boost_connectors, connector=connector, limit=limit)
+
+    pool = max(limit * 4, 20)
+    keyword = []
+    if mode == "hybrid":
+        keyword = search_api_docs(conn, query, boost_connectors=boost_connectors, connector=connector, limit=pool)
+    hits = vectors.search(query, top_k=pool * 2)
+    candidates = {r["id"]: r for r in fetch_passages(conn, [i for i, _ in hits])}
+    # Same connector filter / boost as the keyword pass, applied to cosine scores.
+    boost = set(boost_connectors or [])
+    vector_hits = sorted(
+        (
+            (i, score * (API_DOCS_CONNECTOR_BOOST if candidates[i]["connector"] in boost else 1.0))
+            for i, score in hits
+            if i in candidates and (not connector or candidates[i]["connector"] == connector)
+        ),
+        key=lambda hit: hit[1],
+        reverse=True,
+    )
+    results, seen_urls = [], set()
+    for r in _fuse_ranked(keyword, vector_hits, lambda ids: [candidates[i] for i in ids if i in candidates]):
+        if r["url"] in seen_urls:
+            continue
+        seen_urls.add(r["url"])
+        results.append(r)
+        if len(results) >= limit:
+            break
+    return results
 
-    # Phase 1: Search within prioritized connectors first
-    if connectors:
-        word_conditions = " OR ".join(
-            ["(LOWER(title) LIKE ? OR LOWER(content) LIKE ?)" for _ in words]
-        )
-        connector_placeholders = ",".join(["?" for _ in connectors])
-        params = []
-        for w in words:
-            params.extend([f"%{w}%", f"%{w}%"])
-        params.extend(connectors)
-        params.append(top_k)
-
-        sql = f"""
-            SELECT connector, title, url, content, section_type
-            FROM api_docs
-            WHERE ({word_conditions})
-              AND connector IN ({connector_placeholders})
-            ORDER BY LENGTH(content) DESC
-            LIMIT ?
-        """
-        results = cursor.execute(sql, params).fetchall()
-
-    # Phase 2: If not enough results, also search all connectors
-    if len(results) < top_k:
-        remaining = top_k - len(results)
-        word_conditions = " OR ".join(
-            ["(LOWER(title) LIKE ? OR LOWER(content) LIKE ?)" for _ in words]
-        )
-        params = []
-        for w in words:
-            params.extend([f"%{w}%", f"%{w}%"])
-
-        # Exclude already-found URLs
-        exclude = ""
-        found_urls = [r[2] for r in results]
-        if found_urls:
-            exclude = " AND url NOT IN (" + ",".join(["?" for _ in found_urls]) + ")"
-            params.extend(found_urls)
-
-        params.append(remaining)
-        sql = f"""
-            SELECT connector, title, url, content, section_type
-            FROM api_docs
-            WHERE ({word_conditions}) {exclude}
-            ORDER BY LENGTH(content) DESC
-            LIMIT ?
-        """
-        results.extend(cursor.execute(sql, params).fetchall())
-
-    conn.close()
 
+def get_api_docs_context(query: str, connectors: list, top_k: int = 3, deadline=None) -> str:
+    """Search API docs prioritizing specific connectors, return formatted context with citations"""
+    # Optional enrichment: nothing once the caller's request deadline (request_deadline.Deadline) is spent.
+    if deadline is not None and deadline.expired():
+        return ""
+    # Repeated questions are served from the context LRU until the next scrape bumps the corpus version.
+    return cached_context(
+        "api_docs", API_DOCS_DB, query, (tuple(connectors or ()), top_k, RAG_RETRIEVAL_MODE),
+        lambda: _format_api_docs_context(query, connectors, top_k),
+    )
+
+
+def _format_api_docs_context(query, connectors, top_k):
+    # One ranked pass; the agent's connectors are boosted rather than searched separately.
+    results = search_api_docs_corpus(query, boost_connectors=connectors, limit=top_k)
     if not results:
         return ""
 
     context = ""
-    for connector, title, url, content, section_type in results:
-        # Clean title (remove non-breaking spaces)
-        clean_title = title.replace('\xa0', ' ').strip()[:80] if title else connector
-        # Truncate content smartly
-        preview = content[:400].rsplit(' ', 1)[0] + "..." if len(content) > 400 else content
+    for r in results:
+        connector = r["connector"]
+        # Title is cleaned at ingest; the snippet comes from the matching passage, not the page prefix
+        clean_title = (r["title"] or connector)[:80]
         # Format with citation link
-        context += f"📖 **[{clean_title}]({url})** ({connector} – {section_type})\n"
-        context += f"{preview}\n\n"
+        context += f"📖 **[{clean_title}]({r['url']})** ({connector} – {r['section_type']})\n"
+        if r.get("heading") and r["heading"] != r["title"]:
+            context += f"_{r['heading']}_\n"
+        context += f"{r['snippet']}\n\n"
 
     return context.strip()
 
-def get_rag_context(query: str, top_k: int = 3) -> str:
-    """Caută simple keyword în chunks și returnează context relevant"""
-    if not DB_PATH.exists():
+
+def get_rag_context(query: str, top_k: int = 3, mode: str = None) -> str:
+    """Top-k chunk-uri din knowledge base: BM25 peste FTS5, fuzionat (RRF) cu indexul vectorial când există"""
+    mode = (mode or RAG_RETRIEVAL_MODE).lower()
+    # Din LRU până când un ingest nou schimbă versiunea corpusului
+    return cached_context("rag", DB_PATH, query, (top_k, mode), lambda: _format_rag_context(query, top_k, mode))
+
+
+def _format_rag_context(query, top_k, mode):
+    conn = read_connection(DB_PATH, prepare=ensure_chunk_index_once)
+    if conn is None:
         return ""
-    
-    # Extract key terms: words longer than 3 chars, remove common stop words
-    stop_words = {'what', 'is', 'the', 'how', 'to', 'for', 'and', 'or', 'but', 'in', 'on', 'at', 'by', 'with', 'a', 'an', 'of', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'can', 'may', 'might', 'must'}
-    words = [w.lower() for w in query.split() if len(w) > 3 and w.lower() not in stop_words]
-    if not words:
-        words = [query.lower()]  # fallback
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Build LIKE conditions for each key word
-    conditions = " OR ".join(["content LIKE ?" for _ in words])
-    params = [f"%{word}%" for word in words]
-    
-    sql = f"""
-    SELECT title, summary, content, source
-    FROM chunks
-    WHERE {conditions}
-    ORDER BY LENGTH(content) DESC
-    LIMIT ?
-    """
-    params.append(top_k)
-    
-    rows = cursor.execute(sql, params).fetchall()
-    conn.close()
-    
+
+    try:
+        vectors = open_vector_index(DB_PATH, "chunks") if mode in ("vector", "hybrid") else None
+        if vectors is None:
+            rows = search_chunks(conn, query, top_k=top_k)
+        else:
+            pool = max(top_k * 4, 20)
+            keyword = search_chunks(conn, query, top_k=pool) if mode == "hybrid" else []
+            hits = vectors.search(query, top_k=pool)
+            rows = _fuse_ranked(keyword, hits, lambda ids: fetch_chunks(conn, ids))[:top_k]
+    finally:
+        conn.close()
+
     print(f"DEBUG: Found {len(rows)} chunks for query: {query}")
-    
+
     if not rows:
         return ""
-    
+
     context = "Relevant knowledge from reports:\n\n"
-    for title, summary, content, source in rows:
-        context += f"**{title}**\n{summary}\n\n{content[:600]}...\n\n---\n"
-    
+    for r in rows:
+        context += f"**{r['title']}**\n{r['summary']}\n\n{(r['content'] or '')[:600]}...\n\n---\n"
+
     return context.strip()
 
-def load_agent_examples(agent_slug, num_examples=5):
-    if agent_slug in AGENT_EXAMPLES:
-        return AGENT_EXAMPLES[agent_slug]
-    
-    file_path = SYNTHETIC_DATA_DIR / f"{agent_slug}_synthetic.jsonl"
-    if not file_path.exists():
-        return []
-    
-    examples = []
+def load_agent_examples(agent_slug, num_examples=5, query=None):
+    """A fresh sample of the agent's synthetic examples (see example_store); relevance-ranked with a query."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    examples.append(json.loads(line))
+        return sample_examples(agent_slug, num_examples, query=query)
     except Exception as e:
         print(f"Error loading examples for {agent_slug}: {e}")
         return []
-    
-    # Cache and return random sample
-    AGENT_EXAMPLES[agent_slug] = random.sample(examples, min(num_examples, len(examples)))
-    return AGENT_EXAMPLES[agent_slug]
 
 workspaces = {
     'personal': {
@@ -274,7 +262,8 @@ def enhance_context(base_response: str, context: str, agent_slug: str = "") -> s
     
     # Add few-shot examples if available
     if agent_slug:
-        examples = load_agent_examples(agent_slug, 3)  # 3 examples for brevity
+        query = base_response if FEW_SHOT_MODE == "relevant" else None
+        examples = load_agent_examples(agent_slug, 3, query=query)  # 3 examples for brevity
         if examples:
             few_shot = "\n\n".join([
                 f"User: {ex['messages'][1]['content']}\nAssistant: {ex['messages'][2]['content']}"
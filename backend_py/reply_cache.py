@@ -0,0 +1,199 @@
+"""
+Opt-in reply cache for repeated chat questions (REPLY_CACHE).
+
+Landing demos and new users send the same starter prompts to the same agents over and over; each one
+paid a full Vertex round-trip (or a RAG scan in `simulate_response`). Replies are cached per
+`make_key(agent, workspace, message, runtime_ctx)`:
+  - the message is normalized (NFKC, case-folded, whitespace collapsed, trailing punctuation dropped)
+    and the key also carries the runtime-context fingerprint the prompt is built from (client name,
+    connected connectors), so a reply is only reused for an identical prompt;
+  - `cacheable(message)` refuses long or personalized / time-sensitive messages (emails, URLs, ids and
+    amounts, "today", "my name", ...); the app also skips turns with conversation history or an
+    explicit opt-out, and only stores successful replies;
+  - TTL per agent: REPLY_CACHE_AGENT_TTLS ("slug=seconds,..."; 0 disables an agent), otherwise
+    REPLY_CACHE_TTL_S;
+  - two LRU tiers: REPLY_CACHE_SIZE entries in process memory over the `reply_cache` table
+    (REPLY_CACHE_DB_MAX_ROWS rows, least recently hit pruned first), shared by every worker.
+Hits are written to the usage ledger with provider "cache", so billing never counts them as LLM calls.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config import Config
+from database import get_db
+
+_LOCK = threading.Lock()
+_ENTRIES = OrderedDict()  # key -> (entry, expires_at)
+_STATS = {"hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "skipped": 0, "evictions": 0, "db_pruned": 0, "errors": 0}
+
+_TRAILING = re.compile(r"[\s.!?…]+$")
+_PERSONAL = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"  # email
+    r"|https?://|www\."  # links
+    r"|\d{3,}"  # ids, amounts, dates
+    r"|\b(?:today|tonight|yesterday|tomorrow|right now|this (?:week|month|morning)|last (?:week|month)"
+    r"|my name|i am|i'm|azi|ieri|maine|numele meu)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize(message):
+    text = unicodedata.normalize("NFKC", str(message or "")).casefold()
+    return _TRAILING.sub("", " ".join(text.split()))
+
+
+def cacheable(message):
+    text = str(message or "").strip()
+    return bool(text) and len(text) <= int(Config.REPLY_CACHE_MAX_CHARS) and not _PERSONAL.search(text)
+
+
+def context_fingerprint(runtime_ctx):
+    ctx = runtime_ctx or {}
+    return {
+        "client": str(ctx.get("client_name") or "None"),
+        "connectors": sorted(str(c) for c in (ctx.get("connected_connectors") or [])),
+    }
+
+
+def make_key(agent_slug, ws_slug, message, runtime_ctx=None):
+    raw = json.dumps(
+        [str(agent_slug or ""), str(ws_slug or ""), normalize(message), context_fingerprint(runtime_ctx)],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ttl_for(agent_slug):
+    for part in str(Config.REPLY_CACHE_AGENT_TTLS or "").split(","):
+        slug, sep, seconds = part.partition("=")
+        if sep and slug.strip() == agent_slug:
+            try:
+                return max(0, int(seconds))
+            except ValueError:
+                break
+    return max(0, int(Config.REPLY_CACHE_TTL_S))
+
+
+def _remember(key, entry, expires_at):
+    limit = max(0, int(Config.REPLY_CACHE_SIZE))
+    with _LOCK:
+        _ENTRIES[key] = (dict(entry), expires_at)
+        _ENTRIES.move_to_end(key)
+        while len(_ENTRIES) > limit:
+            _ENTRIES.popitem(last=False)
+            _STATS["evictions"] += 1
+
+
+def _entry(row, now):
+    return {"response": row["response"], "provider": row["provider"], "model": row["model"],
+            "age_s": max(0, int(now - float(row["created_at"])))}
+
+
+def get(key):
+    """Cached {"response", "provider", "model", "age_s"} for key, or None."""
+    now = time.time()
+    with _LOCK:
+        cached = _ENTRIES.get(key)
+        if cached is not None and now < cached[1]:
+            _ENTRIES.move_to_end(key)
+            _STATS["hits"] += 1
+            entry = dict(cached[0])
+            entry["age_s"] = max(0, int(now - entry.pop("created_at")))
+            return entry
+        if cached is not None:
+            del _ENTRIES[key]
+    try:
+        db = get_db()
+        try:
+            row = db.execute(
+                "SELECT response, provider, model, created_at, expires_at FROM reply_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE reply_cache SET hits = hits + 1, last_hit_at = ? WHERE key = ?", (now, key))
+                db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"reply_cache_error: {e}")
+        with _LOCK:
+            _STATS["errors"] += 1
+        row = None
+    if row is None:
+        with _LOCK:
+            _STATS["misses"] += 1
+        return None
+    _remember(key, {"response": row["response"], "provider": row["provider"], "model": row["model"],
+                    "created_at": float(row["created_at"])}, float(row["expires_at"]))
+    with _LOCK:
+        _STATS["db_hits"] += 1
+    return _entry(row, now)
+
+
+def put(key, agent_slug, ws_slug, response, provider, model):
+    """Store a reply under key for the agent's TTL; False when the agent's TTL is 0 or the write failed."""
+    ttl = ttl_for(agent_slug)
+    if ttl <= 0 or not str(response or "").strip():
+        with _LOCK:
+            _STATS["skipped"] += 1
+        return False
+    now = time.time()
+    try:
+        db = get_db()
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO reply_cache (key, agent_slug, ws_slug, response, provider, model, "
+                "created_at, expires_at, last_hit_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, agent_slug, ws_slug, response, provider, model, now, now + ttl, now),
+            )
+            pruned = db.execute("DELETE FROM reply_cache WHERE expires_at <= ?", (now,)).rowcount
+            excess = db.execute("SELECT COUNT(*) FROM reply_cache").fetchone()[0] - max(1, int(Config.REPLY_CACHE_DB_MAX_ROWS))
+            if excess > 0:
+                pruned += db.execute(
+                    "DELETE FROM reply_cache WHERE key IN (SELECT key FROM reply_cache ORDER BY last_hit_at LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"reply_cache_error: {e}")
+        with _LOCK:
+            _STATS["errors"] += 1
+        return False
+    _remember(key, {"response": response, "provider": provider, "model": model, "created_at": now}, now + ttl)
+    with _LOCK:
+        _STATS["stores"] += 1
+        _STATS["db_pruned"] += max(0, pruned)
+    return True
+
+
+def invalidate(agent_slug=None):
+    """Drop cached replies (all, or one agent's); returns the number of stored rows removed."""
+    db = get_db()
+    try:
+        if agent_slug is None:
+            removed = db.execute("DELETE FROM reply_cache").rowcount
+        else:
+            removed = db.execute("DELETE FROM reply_cache WHERE agent_slug = ?", (agent_slug,)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    with _LOCK:
+        # Memory entries are keyed by hash only; clearing them all is the safe choice.
+        _ENTRIES.clear()
+    return removed
+
+
+def reply_cache_stats():
+    with _LOCK:
+        stats = dict(_STATS)
+        stats["entries"] = len(_ENTRIES)
+    stats["enabled"] = bool(Config.REPLY_CACHE)
+    return stats
@@ -0,0 +1,93 @@
+"""
+Request deadlines: one time budget per request, set at the edge and spent by every step below it.
+
+A chat POST used to chain a 20 s run creation, a 60 s /llm call, docs enrichment and the DB writes
+without knowing how much of the caller's budget was left. A `Deadline` is started by a
+before_request hook (per-route default, `X-Request-Deadline-Ms` header override) and kept on `g`:
+  - `remaining()` is the time left minus REQUEST_DEADLINE_RESERVE_MS, which is kept back for
+    fallbacks and persistence so a timed-out gateway call still leaves room to answer;
+  - `cap(timeout)` shrinks a step's (connect, read) timeout to that, and raises DeadlineExceeded
+    (no I/O) once nothing is left;
+  - `allows(stage)` is asked before optional or expensive stages; a "no" is recorded and returned
+    to the caller in `snapshot()["skipped"]`.
+"""
+
+import threading
+import time
+
+from config import Config
+
+HEADER = "X-Request-Deadline-Ms"
+
+
+class DeadlineExceeded(RuntimeError):
+    def __init__(self, stage=""):
+        super().__init__(f"deadline_exceeded:{stage}" if stage else "deadline_exceeded")
+        self.stage = stage
+
+
+def parse_budget_ms(raw, default_ms=None):
+    """Header value -> budget in ms, clamped to REQUEST_DEADLINE_MAX_MS; default_ms when absent or invalid."""
+    try:
+        value = int(float(str(raw).strip()))
+    except (TypeError, ValueError):
+        return default_ms
+    if value <= 0:
+        return default_ms
+    return min(value, int(Config.REQUEST_DEADLINE_MAX_MS))
+
+
+class Deadline:
+    def __init__(self, budget_ms, reserve_ms=None):
+        self.budget_ms = int(budget_ms)
+        self.reserve = max(0.0, (Config.REQUEST_DEADLINE_RESERVE_MS if reserve_ms is None else reserve_ms) / 1000.0)
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget_ms / 1000.0
+        self._lock = threading.Lock()
+        self.skipped = []
+
+    def remaining(self):
+        """Seconds left for gateway / optional work (reserve excluded), never negative."""
+        return max(0.0, self.expires_at - self.reserve - time.monotonic())
+
+    def remaining_ms(self):
+        return int(self.remaining() * 1000)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, timeout, stage=""):
+        """Return (timeout, capped): timeout (seconds or (connect, read)) limited to the time left."""
+        left = self.remaining()
+        if left <= 0:
+            if stage:
+                self.skip(stage)
+            raise DeadlineExceeded(stage)
+        if isinstance(timeout, (tuple, list)):
+            capped = tuple(min(float(t), left) for t in timeout)
+            return capped, capped != tuple(float(t) for t in timeout)
+        value = float(timeout or 30)
+        return min(value, left), left < value
+
+    def allows(self, stage, need_ms=None):
+        """True when at least need_ms (default DEADLINE_MIN_STAGE_MS) is left; otherwise records stage as skipped."""
+        need = Config.DEADLINE_MIN_STAGE_MS if need_ms is None else need_ms
+        if self.remaining_ms() >= need:
+            return True
+        self.skip(stage)
+        return False
+
+    def skip(self, stage):
+        with self._lock:
+            if stage not in self.skipped:
+                self.skipped.append(stage)
+
+    def snapshot(self):
+        with self._lock:
+            skipped = list(self.skipped)
+        return {
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": int((time.monotonic() - self.started) * 1000),
+            "remaining_ms": self.remaining_ms(),
+            "skipped": skipped,
+        }
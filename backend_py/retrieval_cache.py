@@ -0,0 +1,203 @@
+"""
+Read side of the RAG corpora (knowledge_base/knowledge.db, connectors_api_docs.db).
+
+These files only change when an ingest/scrape job runs, so request threads keep them open:
+  - `read_connection()` leases a long-lived `mode=ro` connection (shared cache, large mmap) from a
+    process-wide pool keyed by corpus file (path + inode); close() hands it back, and at most
+    RETRIEVAL_POOL_SIZE idle connections are kept per file, so the count does not grow with the
+    server's request threads. The first use of a file runs the corpus' index check once on a
+    short-lived writable connection, because the read-only handle cannot create FTS tables.
+  - `cached_context()` memoizes formatted context blocks in a bounded LRU keyed by the query's
+    keyword set plus caller parts (connectors, top_k, mode) and the corpus version stamp.
+  - `bump_corpus_version()` is what ingest jobs call after committing; it rewrites `<db>.version`,
+    so every cached block for that corpus misses from then on and ages out of the LRU.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.request import pathname2url
+
+from config import Config
+from knowledge_index import query_terms
+
+_PREPARE_LOCK = threading.Lock()
+_PREPARED = set()  # (path, inode)
+_POOL_LOCK = threading.Lock()
+_POOL_IDLE = {}  # (path, inode) -> [sqlite3.Connection]
+_CACHE_LOCK = threading.Lock()
+_CACHE = OrderedDict()
+_STATS = {"hits": 0, "misses": 0, "evictions": 0, "connections": 0, "reused": 0, "discarded": 0}
+
+
+def _version_path(db_path):
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.name}.version")
+
+
+def corpus_version(db_path):
+    """Version stamp of a corpus: identity of `<db>.version` (a stat, no read), 0 until a job bumps it."""
+    try:
+        st = os.stat(_version_path(db_path))
+    except OSError:
+        return 0
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def bump_corpus_version(db_path):
+    path = _version_path(db_path)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp, path)  # new inode + mtime: the stamp moves even on coarse filesystem clocks
+
+
+def _open_read_only(path):
+    uri = f"file:{pathname2url(str(Path(path).resolve()))}?mode=ro&cache=shared"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    try:
+        if int(Config.RETRIEVAL_MMAP_SIZE) > 0:
+            conn.execute(f"PRAGMA mmap_size={int(Config.RETRIEVAL_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+    except sqlite3.Error:
+        pass
+    with _CACHE_LOCK:
+        _STATS["connections"] += 1
+    return conn
+
+
+class ReadConnection:
+    """Leased read-only connection; close() returns it to the pool. Use from one thread at a time."""
+
+    __slots__ = ("_conn", "_key")
+
+    def __init__(self, key, conn):
+        object.__setattr__(self, "_key", key)
+        object.__setattr__(self, "_conn", conn)
+
+    def _raw(self):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw(), name, value)
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, "_conn", None)
+        _release(self._key, conn)
+
+
+def _discard(conn):
+    with _CACHE_LOCK:
+        _STATS["discarded"] += 1
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _acquire(key):
+    stale = []
+    with _POOL_LOCK:
+        # A corpus file replaced on disk (new inode): its old connections are closed, not reused.
+        for other in [k for k in _POOL_IDLE if k[0] == key[0] and k != key]:
+            stale.extend(_POOL_IDLE.pop(other))
+        idle = _POOL_IDLE.get(key)
+        conn = idle.pop() if idle else None
+    for old in stale:
+        _discard(old)
+    if conn is not None:
+        with _CACHE_LOCK:
+            _STATS["reused"] += 1
+        return conn
+    return _open_read_only(key[0])
+
+
+def _release(key, conn):
+    try:
+        if conn.in_transaction:
+            # A write attempt on the read-only handle still opened a transaction; do not pool it open.
+            conn.rollback()
+        conn.row_factory = None
+    except sqlite3.Error:
+        _discard(conn)
+        return
+    with _POOL_LOCK:
+        idle = _POOL_IDLE.setdefault(key, [])
+        if len(idle) < max(0, int(Config.RETRIEVAL_POOL_SIZE)):
+            idle.append(conn)
+            return
+    _discard(conn)
+
+
+def read_connection(db_path, prepare=None):
+    """A leased read-only connection to db_path, or None when the file or its index is missing.
+
+    prepare(conn, path) -> bool runs once per file (path + inode) on a writable connection (index
+    creation). Callers close() the lease when done; a file replaced on disk is prepared and opened anew.
+    """
+    path = str(db_path)
+    try:
+        key = (path, os.stat(path).st_ino)
+    except OSError:
+        return None
+    if prepare is not None and key not in _PREPARED:
+        with _PREPARE_LOCK:
+            if key not in _PREPARED:
+                conn = sqlite3.connect(path)
+                try:
+                    ok = prepare(conn, db_path)
+                finally:
+                    conn.close()
+                if not ok:
+                    return None
+                _PREPARED.add(key)
+    return ReadConnection(key, _acquire(key))
+
+
+def cached_context(kind, db_path, query, parts, compute):
+    """LRU-memoized compute() for a context block; the key is kind + keyword set + parts + version."""
+    terms = query_terms(query)
+    if not terms:
+        return compute()
+    key = (kind, str(db_path), corpus_version(db_path), tuple(sorted(terms)), tuple(parts))
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            _STATS["hits"] += 1
+            return _CACHE[key]
+        _STATS["misses"] += 1
+    value = compute()
+    limit = max(0, int(Config.RETRIEVAL_CACHE_SIZE))
+    with _CACHE_LOCK:
+        _CACHE[key] = value
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > limit:
+            _CACHE.popitem(last=False)
+            _STATS["evictions"] += 1
+    return value
+
+
+def clear_context_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+def retrieval_cache_stats():
+    with _CACHE_LOCK:
+        stats = dict(_STATS)
+        stats["entries"] = len(_CACHE)
+    with _POOL_LOCK:
+        stats["idle"] = sum(len(v) for v in _POOL_IDLE.values())
+    return stats
@@ -9,6 +9,10 @@ from tqdm import tqdm
 import re
 from urllib.parse import urljoin, urlparse
 
+from api_docs_index import ensure_api_docs_index, index_api_docs, store_doc_passages
+from retrieval_cache import bump_corpus_version
+from vector_index import build_vector_index
+
 DB_PATH = Path("connectors_api_docs.db")
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
@@ -25,6 +29,7 @@ cursor.execute("""
         depth INTEGER DEFAULT 0
     )
 """)
+ensure_api_docs_index(conn)  # pasaje + index FTS folosite de get_api_docs_context / /api/rag/api-docs
 conn.commit()
 
 HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
@@ -115,12 +120,18 @@ def scrape_page(url, connector, depth=0, max_depth=4):
 
         title = soup.title.string if soup.title else url.split('/')[-1]
         content_parts = []
+        sections = [(None, [])]  # (heading, texte) - o secțiune nouă la fiecare h1/h2/h3
 
         for tag in soup.find_all(['h1', 'h2', 'h3', 'p', 'pre', 'code', 'li', 'table']):
             if tag.name == 'table':
-                content_parts.append(tag.get_text(separator=' ', strip=True))
+                text = tag.get_text(separator=' ', strip=True)
+            else:
+                text = tag.get_text(strip=True)
+            content_parts.append(text)
+            if tag.name in ('h1', 'h2', 'h3'):
+                sections.append((text, []))
             else:
-                content_parts.append(tag.get_text(strip=True))
+                sections[-1][1].append(text)
 
         content = clean_text(' '.join(content_parts))
         if len(content) < 400:
@@ -143,7 +154,13 @@ def scrape_page(url, connector, depth=0, max_depth=4):
             (connector, url, title, content, section_type, fetched_at, depth)
             VALUES (?, ?, ?, ?, ?, datetime('now'), ?)
         """, (connector, url, title, content, section_type, depth))
+        if cursor.rowcount:
+            doc_id = cursor.lastrowid
+            store_doc_passages(conn, doc_id, [(h, ' '.join(parts)) for h, parts in sections])
+            index_api_docs(conn, [doc_id])  # update incremental al indexului FTS
         conn.commit()
+        if cursor.rowcount:
+            bump_corpus_version(DB_PATH)  # contextele API docs din cache devin invalide
 
         print(f"  Saved: {title[:100]}... ({len(content):,} chars)")
 
@@ -173,6 +190,11 @@ def main():
         scrape_page(start_url, connector)
         time.sleep(30)  # pauză mare între conectori
 
+    # Index vectorial peste pasaje (incremental; reluat de unde a rămas dacă e întrerupt)
+    vectors = build_vector_index(conn, DB_PATH, "api_docs")
+    if vectors:
+        print(f"Vector index: +{vectors['added']} / -{vectors['removed']} ({vectors['rows']} passages)")
+        bump_corpus_version(DB_PATH)
     conn.close()
     print("\nFinished scraping!")
     print("Database saved:", DB_PATH.resolve())
@@ -0,0 +1,149 @@
+"""
+Background writer for telemetry rows that do not have to land before the response.
+
+Chat turns used to write their usage-ledger row on the request thread: an INSERT (preflight), then a
+SELECT, a settings load, pricing lookups and an UPDATE (finalize), committed separately from the
+messages. `TelemetryWriter`:
+  - `submit(item)` puts the item on a bounded queue (USAGE_WRITER_QUEUE_MAX) and returns at once;
+    when the queue is full (or USAGE_WRITER_ASYNC is off) the caller writes the item itself, so
+    back-pressure slows requests down instead of dropping rows;
+  - one daemon thread takes up to USAGE_WRITER_BATCH_MAX items, waiting at most USAGE_WRITER_FLUSH_MS
+    for a batch to fill, and hands them to `write_batch(items)`, which writes them in one transaction;
+    a failed batch is retried item by item so one bad row does not lose the others;
+  - `flush()` waits until everything queued so far is written; `close()` (registered with atexit by
+    the app) drains the queue and stops the thread.
+`snapshot()` (queue depth, high-water mark, batches, rows, inline writes, errors) is shown in /readyz.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from config import Config
+
+_STOP = object()
+
+
+class TelemetryWriter:
+    def __init__(self, name, write_batch, max_queue=None, batch_max=None, flush_ms=None):
+        """write_batch(items): persist a list of queued items in one transaction (raises on failure)."""
+        self.name = name
+        self._write_batch = write_batch
+        self._queue = queue.Queue(maxsize=max(1, int(Config.USAGE_WRITER_QUEUE_MAX if max_queue is None else max_queue)))
+        self.batch_max = max(1, int(Config.USAGE_WRITER_BATCH_MAX if batch_max is None else batch_max))
+        self.flush_ms = max(0, int(Config.USAGE_WRITER_FLUSH_MS if flush_ms is None else flush_ms))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "inline": 0, "errors": 0, "max_depth": 0}
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        if self._closed or not Config.USAGE_WRITER_ASYNC:
+            self._write([item], inline=True)
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._write([item], inline=True)
+            return
+        depth = self._queue.qsize()
+        with self._lock:
+            self.stats["queued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], depth)
+
+    def _write(self, items, inline=False):
+        try:
+            self._write_batch(items)
+            written = len(items)
+        except Exception as e:
+            print(f"{self.name}_writer_error: {e}")
+            written = 0
+            for item in items if len(items) > 1 else ():
+                try:
+                    self._write_batch([item])
+                    written += 1
+                except Exception as item_err:
+                    print(f"{self.name}_writer_error: {item_err}")
+        with self._lock:
+            self.stats["inline" if inline else "batches"] += 1
+            self.stats["written"] += written
+            self.stats["errors"] += len(items) - written
+
+    def _next_batch(self):
+        """Block for one item, then gather more until batch_max or flush_ms; (items, stop)."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        fill_until = time.monotonic() + self.flush_ms / 1000.0
+        while len(batch) < self.batch_max:
+            wait_s = fill_until - time.monotonic()
+            try:
+                item = self._queue.get(timeout=wait_s) if wait_s > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self, timeout=10.0):
+        """Wait until every queued item is written; False on timeout."""
+        until = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = until - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop accepting queued work, write what is left, stop the thread."""
+        self._closed = True
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover, inline=True)
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["running"] = bool(self._thread is not None and self._thread.is_alive())
+        out["depth"] = self._queue.qsize()
+        out["capacity"] = self._queue.maxsize
+        return out
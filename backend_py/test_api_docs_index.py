@@ -0,0 +1,135 @@
+"""Passage-level, connector-aware FTS over the API docs corpus (temp connectors_api_docs.db + local test client)."""
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import api_docs_index as adi
+import app as m
+import migrations
+import models
+import retrieval_cache as rc
+
+
+API_DOCS_DDL = """
+    CREATE TABLE api_docs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        connector TEXT,
+        url TEXT UNIQUE,
+        title TEXT,
+        content TEXT,
+        section_type TEXT,
+        fetched_at TEXT,
+        depth INTEGER DEFAULT 0
+    )
+"""
+
+
+def _insert(conn, connector, url, title, content, section_type="endpoint"):
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO api_docs (connector, url, title, content, section_type, fetched_at) "
+        "VALUES (?, ?, ?, ?, ?, datetime('now'))",
+        (connector, url, title, content, section_type),
+    )
+    return cur.lastrowid
+
+
+def run():
+    db_path = Path(tempfile.mkdtemp(prefix="camarad-apidocs-")) / "connectors_api_docs.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(API_DOCS_DDL)
+    _insert(conn, "Stripe", "https://docs.stripe.com/api/refunds", "Refunds | Stripe API",
+            "Create a refund. Refunds return a charge that was previously created. " + ("Navigation. " * 300))
+    _insert(conn, "PayPal", "https://developer.paypal.com/refunds", "Refund captured payment",
+            "Refunds a captured payment by ID. Refund webhooks notify the merchant.")
+    _insert(conn, "Google Ads", "https://developers.google.com/google-ads/budgets", "Campaign budgets",
+            "Campaign budget resources control daily spend.")
+    for i, topic in enumerate(["Webhooks", "Pagination", "Rate limits", "Errors", "Authentication", "Versioning"]):
+        _insert(conn, "Meta Ads", f"https://developers.facebook.com/docs/{i}", topic, f"{topic} for the Marketing API.")
+    conn.commit()
+
+    conn.execute("CREATE VIRTUAL TABLE api_docs_fts USING fts5(title, content)")  # pre-passage index
+    conn.commit()
+    legacy_path = db_path.with_name("legacy_api_docs.db")
+    shutil.copy(db_path, legacy_path)
+
+    # The read path only creates the index; splitting old pages is the offline migration's job.
+    legacy = sqlite3.connect(legacy_path)
+    assert adi.ensure_api_docs_index_once(legacy, legacy_path)
+    assert legacy.execute("SELECT COUNT(*) FROM api_doc_passages").fetchone()[0] == 0
+    legacy.close()
+    version = rc.corpus_version(legacy_path)
+    migrations.build_api_docs_passages(legacy_path)  # what `python3 migrations.py` runs on deploy
+    legacy = sqlite3.connect(legacy_path)
+    assert legacy.execute("SELECT COUNT(DISTINCT doc_id) FROM api_doc_passages").fetchone()[0] == 9
+    assert legacy.execute("SELECT COUNT(*) FROM api_doc_passages_fts").fetchone()[0] > 0
+    legacy.close()
+    assert rc.corpus_version(legacy_path) != version  # cached context built without them misses
+    assert adi.split_pending_pages(legacy_path) == 0 and adi.split_pending_pages(db_path.with_name("missing.db")) == 0
+
+    # The full reconcile splits + indexes rows written before passages existed.
+    assert adi.ensure_api_docs_index(conn)
+    conn.commit()
+    assert not adi._table_exists(conn, "api_docs_fts")
+    per_doc = dict(conn.execute("SELECT doc_id, COUNT(*) FROM api_doc_passages GROUP BY doc_id").fetchall())
+    assert [per_doc[i] for i in (1, 2, 3)] == [3, 1, 1] and len(per_doc) == 9, per_doc
+    indexed = conn.execute("SELECT COUNT(*) FROM api_doc_passages_fts").fetchone()[0]
+    assert indexed == sum(per_doc.values())
+    title, preview, tokens, size = conn.execute(
+        "SELECT title, preview, token_count, LENGTH(content) FROM api_doc_passages WHERE doc_id = 1 AND position = 0"
+    ).fetchone()
+    assert title == "Refunds | Stripe API" and size <= adi.PASSAGE_MAX_CHARS
+    assert preview.endswith("...") and len(preview) <= adi.PASSAGE_PREVIEW_CHARS + 3
+    assert tokens == -(-size // 4)
+
+    # Without a boost the denser PayPal doc wins; boosting Stripe flips it in the same single query.
+    plain = adi.search_api_docs(conn, "how do refunds work", limit=2)
+    assert [r["connector"] for r in plain] == ["PayPal", "Stripe"], plain
+    boosted = adi.search_api_docs(conn, "how do refunds work", boost_connectors=["Stripe"], limit=2)
+    assert [r["connector"] for r in boosted] == ["Stripe", "PayPal"], boosted
+    assert "refund" in boosted[0]["snippet"].lower() and len(boosted[0]["snippet"]) < 600
+
+    # Hard connector filter.
+    only = adi.search_api_docs(conn, "refund", connector="PayPal", limit=5)
+    assert [r["connector"] for r in only] == ["PayPal"], only
+
+    # Incremental update from the scraper path: heading sections become passages.
+    sections = [
+        ("Disputes", "Overview of the dispute lifecycle. " * 8),
+        ("Upload evidence", "Dispute evidence uploads attach files to a dispute before the deadline. " * 4),
+        ("Close", "Closing concedes."),
+    ]
+    new_id = _insert(conn, "Stripe", "https://docs.stripe.com/api/disputes", "Disputes\xa0| Stripe",
+                     " ".join(f"{h} {t}" for h, t in sections))
+    assert len(adi.store_doc_passages(conn, new_id, sections)) == 2  # "Close" folds into the previous one
+    assert adi.index_api_docs(conn, [new_id]) == (2, 0)
+    conn.commit()
+    hit = adi.search_api_docs(conn, "evidence uploads")[0]
+    assert hit["url"].endswith("/disputes") and hit["heading"] == "Upload evidence", hit
+    assert hit["title"] == "Disputes | Stripe" and hit["token_count"] > 0
+    # Re-storing replaces the page's passages instead of duplicating them.
+    adi.store_doc_passages(conn, new_id, sections)
+    adi.index_api_docs(conn, [new_id])
+    conn.commit()
+    assert len(adi.search_api_docs(conn, "dispute", connector="Stripe", limit=5)) == 1
+    assert adi.index_api_docs(conn) == (0, 0)
+    conn.close()
+
+    original = models.API_DOCS_DB
+    models.API_DOCS_DB = db_path
+    try:
+        ctx = models.get_api_docs_context("refunds", ["Stripe"], top_k=2)
+        first = ctx.splitlines()[0]
+        assert first.startswith("📖 **[Refunds | Stripe API](https://docs.stripe.com/api/refunds)**"), ctx[:200]
+        assert "(Stripe – endpoint)" in first
+
+        r = m.app.test_client().get("/api/rag/api-docs?q=refund&connector=PayPal")
+        assert r.status_code == 200, r.get_data(as_text=True)[:240]
+        assert [x["connector"] for x in r.get_json()] == ["PayPal"], r.get_json()
+    finally:
+        models.API_DOCS_DB = original
+    print("API docs index tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,163 @@
+"""Async chat jobs: fair worker pool, long-poll, TTL, 202 + polling through the chat route (local test client)."""
+import json
+import threading
+import time
+
+import app as m
+import chat_jobs as cj
+
+RUN_ID = int(time.time())
+
+
+def _pool_units():
+    # One worker, round-robin between users: B's job is not stuck behind A's backlog.
+    gate = threading.Event()
+    order = []
+
+    def work(name):
+        def fn(job):
+            gate.wait(5)
+            order.append(name)
+            return name
+        return fn
+
+    pool = cj.JobPool(workers=1, max_per_user=3, ttl_s=60)
+    first = pool.submit("a", work("a1"))
+    time.sleep(0.05)
+    pool.submit("a", work("a2"))
+    pool.submit("a", work("a3"))
+    try:
+        pool.submit("a", work("a4"))
+        raise AssertionError("expected JobRejected")
+    except cj.JobRejected:
+        pass
+    last_b = pool.submit("b", work("b1"))
+    gate.set()
+    assert pool.wait(last_b.id, "b", since=10 ** 6, timeout=5)["done"]
+    while pool.snapshot()["completed"] < 4:
+        time.sleep(0.01)
+    assert order == ["a1", "b1", "a2", "a3"], order
+    assert pool.get(first.id, "a")["result"] == "a1" and pool.get(first.id, "b") is None
+    stats = pool.snapshot()
+    assert stats["rejected"] == 1 and stats["queued"] == 0 and stats["retained"] == 4
+
+    # Long-poll wakes on partial text; errors are reported on the job.
+    step = threading.Event()
+
+    def chatty(job):
+        pool.append(job, "Hel")
+        step.wait(5)
+        pool.append(job, "lo")
+        return {"response": "Hello"}
+
+    job = pool.submit("c", chatty)
+    snap = pool.wait(job.id, "c", since=0, timeout=2)
+    while snap["text"] != "Hel":
+        snap = pool.wait(job.id, "c", since=snap["version"], timeout=2)
+    started = time.monotonic()
+    threading.Timer(0.2, step.set).start()
+    snap = pool.wait(job.id, "c", since=snap["version"], timeout=5)
+    assert snap["text"] == "Hello" and time.monotonic() - started >= 0.15, snap
+    assert pool.wait(job.id, "c", since=snap["version"], timeout=5)["done"]
+    failing = pool.submit("c", lambda job: 1 / 0)
+    snap = pool.wait(failing.id, "c", since=10 ** 6, timeout=5)
+    assert snap["status"] == "error" and "division" in snap["error"], snap
+
+    # Finished jobs are swept after the TTL.
+    short = cj.JobPool(workers=1, ttl_s=0)
+    job = short.submit("d", lambda job: "x")
+    while short.snapshot()["completed"] < 1:
+        time.sleep(0.01)
+    assert short.get(job.id, "d") is None and short.snapshot()["expired"] == 1
+
+
+def _agent_messages(conv_id):
+    return [r["content"] for r in m.get_messages(conv_id) if r["role"] == "agent"]
+
+
+def run():
+    _pool_units()
+
+    m.init_db()
+    uid = RUN_ID * 10 + 3  # fresh user (and conversation) per run
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'jobs-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.commit()
+    conn.close()
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid)}
+
+    release = threading.Event()
+
+    def slow_stream(**kwargs):
+        yield "Budget "
+        release.wait(5)
+        yield "pacing "
+        yield "looks fine."
+
+    saved = (m._stream_real_agent_response, set(m.REAL_AGENT_SLUGS), m._chat_jobs.max_per_user)
+    m._stream_real_agent_response = slow_stream
+    m.REAL_AGENT_SLUGS.add("ppc-specialist")
+    try:
+        r = c.post("/chat/business/ppc-specialist", json={"message": "How is pacing?", "async": True,
+                                                          "request_id": f"job-{RUN_ID}"}, headers=headers)
+        assert r.status_code == 202, r.get_data(as_text=True)
+        body = r.get_json()
+        job_id, conv_id = body["job_id"], body["conv_id"]
+        assert r.headers["Location"] == body["poll_url"] == f"/api/chat/jobs/{job_id}"
+
+        # Partial text is visible while the reply is still being produced.
+        snap = c.get(f"/api/chat/jobs/{job_id}?wait=5&since=0", headers=headers).get_json()
+        while snap["text"] != "Budget ":
+            snap = c.get(f"/api/chat/jobs/{job_id}?wait=5&since={snap['version']}", headers=headers).get_json()
+        assert snap["status"] == "running" and not snap["done"] and snap["conv_id"] == conv_id
+        assert c.get(f"/api/chat/jobs/{job_id}", headers={"X-User-ID": str(uid + 1)}).status_code == 404
+
+        release.set()
+        while not snap["done"]:
+            snap = c.get(f"/api/chat/jobs/{job_id}?wait=5&since={snap['version']}", headers=headers).get_json()
+        assert snap["status"] == "done" and snap["result"]["response"] == "Budget pacing looks fine.", snap
+        assert snap["text"] == snap["result"]["response"] and snap["result"]["deadline"]["budget_ms"] == m.Config.CHAT_JOBS_DEADLINE_MS
+
+        # Persisted once, however often the job is polled.
+        for _ in range(3):
+            c.get(f"/api/chat/jobs/{job_id}", headers=headers)
+        assert _agent_messages(conv_id) == ["Budget pacing looks fine."]
+        assert m.get_messages(conv_id)[-2] == {"role": "user", "content": "How is pacing?"}
+        assert m._usage_writer.flush()
+        conn = m.get_db()
+        row = conn.execute("SELECT provider, meta_json FROM usage_ledger WHERE request_id = ?", (f"job-{RUN_ID}",)).fetchone()
+        conn.close()
+        assert row["provider"] == "vertex" and json.loads(row["meta_json"])["job_id"] == job_id
+
+        # A job nobody polls still saves its reply; Prefer: respond-async opts in too.
+        r = c.post("/chat/business/ppc-specialist", json={"message": "Quick check", "conv_id": conv_id},
+                   headers=dict(headers, Prefer="respond-async"))
+        assert r.status_code == 202
+        deadline = time.monotonic() + 5
+        while len(_agent_messages(conv_id)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert _agent_messages(conv_id) == ["Budget pacing looks fine."] * 2
+
+        # Per-user cap.
+        release.clear()
+        m._chat_jobs.max_per_user = 1
+        assert c.post("/chat/business/ppc-specialist", json={"message": "one", "async": True}, headers=headers).status_code == 202
+        r = c.post("/chat/business/ppc-specialist", json={"message": "two", "async": True}, headers=headers)
+        assert r.status_code == 429 and r.get_json()["error"] == "too_many_jobs"
+        release.set()
+
+        jobs = c.get("/readyz").get_json()["checks"]["chat_jobs"]
+        assert jobs["submitted"] >= 3 and jobs["rejected"] >= 1, jobs
+    finally:
+        release.set()
+        m._stream_real_agent_response = saved[0]
+        m.REAL_AGENT_SLUGS.clear()
+        m.REAL_AGENT_SLUGS.update(saved[1])
+        m._chat_jobs.max_per_user = saved[2]
+    print("Chat job tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,123 @@
+"""Chat turn persistence in one transaction + background usage-ledger writer (local test client)."""
+import json
+import threading
+import time
+
+import app as m
+import telemetry_writer as tw
+from database import CONVERSATION_PREVIEW_CHARS
+
+RUN_ID = int(time.time())
+
+
+def _writer_units():
+    # Items are grouped into batches of at most batch_max.
+    batches = []
+    w = tw.TelemetryWriter("t", lambda items: batches.append(list(items)), max_queue=100, batch_max=20, flush_ms=100)
+    for i in range(50):
+        w.submit(i)
+    assert w.flush()
+    assert sorted(x for b in batches for x in b) == list(range(50)) and max(len(b) for b in batches) <= 20, batches
+    stats = w.snapshot()
+    assert stats["queued"] == 50 and stats["written"] == 50 and stats["depth"] == 0 and stats["batches"] == len(batches)
+
+    # A bad row does not take the rest of its batch down.
+    def picky(items):
+        if "bad" in items:
+            raise ValueError("bad row")
+        batches.append(list(items))
+
+    batches.clear()
+    w = tw.TelemetryWriter("t", picky, batch_max=10, flush_ms=100)
+    for item in ("a", "bad", "b"):
+        w.submit(item)
+    assert w.flush()
+    assert sorted(x for b in batches for x in b) == ["a", "b"] and w.snapshot()["errors"] == 1
+
+    # A full queue pushes the write back onto the caller; close() drains what is queued.
+    gate = threading.Event()
+    written = []
+
+    def slow(items):
+        gate.wait(5)
+        written.extend(items)
+
+    w = tw.TelemetryWriter("t", slow, max_queue=2, batch_max=1, flush_ms=0)
+    w.submit(1)
+    time.sleep(0.1)  # the writer thread is now blocked on item 1
+    w.submit(2)
+    w.submit(3)
+    threading.Timer(0.2, gate.set).start()
+    w.submit(4)  # queue full: written inline once the gate opens
+    assert w.snapshot()["inline"] == 1 and w.snapshot()["max_depth"] == 2
+    w.close()
+    assert sorted(written) == [1, 2, 3, 4] and not w.snapshot()["running"]
+    w.submit(5)  # after close: inline
+    assert written[-1] == 5
+
+
+def run():
+    _writer_units()
+
+    m.init_db()
+    uid = RUN_ID * 10 + 2  # fresh user (and conversation) per run
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'persist-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.commit()
+    conn.close()
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid)}
+    original_generate = m._chat_generate_reply
+    try:
+        message = "How should I split next quarter's budget across search and social campaigns?"
+        body = c.post("/chat/business/ceo-strategy", json={"message": message, "request_id": f"persist-{RUN_ID}"},
+                      headers=headers).get_json()
+        conv_id = body["conv_id"]
+        conn = m.get_db()
+        conv = conn.execute("SELECT title, message_count, last_message_preview FROM conversations WHERE id = ?",
+                            (conv_id,)).fetchone()
+        rows = conn.execute("SELECT role, content, timestamp FROM messages WHERE conv_id = ? ORDER BY id",
+                            (conv_id,)).fetchall()
+        conn.close()
+        assert conv["title"] == message[:50] + "…" and conv["message_count"] == 2, dict(conv)
+        assert [(r["role"], r["content"]) for r in rows] == [("user", message), ("agent", body["response"])]
+        assert rows[0]["timestamp"] <= rows[1]["timestamp"]
+        assert conv["last_message_preview"] == body["response"][:CONVERSATION_PREVIEW_CHARS]
+
+        # Telemetry lands once the writer drains.
+        assert m._usage_writer.flush()
+        conn = m.get_db()
+        row = conn.execute("SELECT event_type, status, agent_id, output_tokens, meta_json FROM usage_ledger WHERE request_id = ?",
+                           (f"persist-{RUN_ID}",)).fetchone()
+        conn.close()
+        assert row["event_type"] == "chat_message" and row["status"] == "ok" and row["agent_id"] == "ceo-strategy"
+        assert row["output_tokens"] > 0 and json.loads(row["meta_json"])["source"] == "chat"
+
+        # A second turn keeps the title and adds two messages.
+        c.post("/chat/business/ceo-strategy", json={"message": "And for Q3?", "conv_id": conv_id}, headers=headers)
+        conn = m.get_db()
+        conv = conn.execute("SELECT title, message_count FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+        conn.close()
+        assert conv["title"] == message[:50] + "…" and conv["message_count"] == 4
+
+        # A crash while generating still keeps the user message.
+        def boom(turn, try_real=True):
+            raise RuntimeError("generation exploded")
+
+        m._chat_generate_reply = boom
+        r = c.post("/chat/business/ceo-strategy", json={"message": "will this survive?", "conv_id": conv_id}, headers=headers)
+        assert r.status_code == 500
+        last = m.get_messages(conv_id)[-1]
+        assert last == {"role": "user", "content": "will this survive?"}, last
+
+        assert m._usage_writer.flush()
+        writer = c.get("/readyz").get_json()["checks"]["usage_writer"]
+        assert writer["written"] >= 2 and writer["depth"] == 0 and writer["errors"] == 0, writer
+    finally:
+        m._chat_generate_reply = original_generate
+    print("Chat persistence tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,133 @@
+"""SSE chat streaming (local test client, gateway stubbed)."""
+import json
+
+import app as m
+
+
+def _events(body):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = block.split("\n")
+        event = lines[0][len("event: "):]
+        out.append((event, json.loads(lines[1][len("data: "):])))
+    return out
+
+
+def _ledger(request_id):
+    assert m._usage_writer.flush()
+    conn = m.get_db()
+    row = conn.execute(
+        "SELECT provider, status, meta_json FROM usage_ledger WHERE request_id = ? ORDER BY id DESC LIMIT 1",
+        (request_id,),
+    ).fetchone()
+    conn.close()
+    return row[0], row[1], json.loads(row[2] or "{}")
+
+
+def _agent_messages(conv_id):
+    return [r["content"] for r in m.get_messages(conv_id) if r["role"] == "agent"]
+
+
+class _FakeStream:
+    status_code = 200
+    headers = {"content-type": "text/event-stream"}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=True):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+def run():
+    m.init_db()
+    uid = 990301
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'sse-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.commit()
+    conn.close()
+
+    originals = {
+        name: getattr(m, name)
+        for name in ("_generate_real_agent_response", "_stream_real_agent_response", "_coolbits_request",
+                     "_coolbits_open_stream", "get_api_docs_context", "_should_attach_docs_context")
+    }
+    real_slugs = set(m.REAL_AGENT_SLUGS)
+    m._generate_real_agent_response = lambda **kwargs: None
+    m.REAL_AGENT_SLUGS.discard("ceo-strategy")  # mock path, no gateway
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid)}
+    sse = dict(headers, Accept="text/event-stream")
+    try:
+        # The JSON contract is unchanged without the Accept header.
+        r = c.post("/chat/business/ceo-strategy", json={"message": "hello", "request_id": "sse-json-1"}, headers=headers)
+        assert r.status_code == 200 and r.is_json and r.get_json()["response"], r.status_code
+
+        # Mock path: meta first, chunked tokens, done carries the full reply; persisted after the stream.
+        r = c.post("/chat/business/ceo-strategy", json={"message": "Plan my quarter", "request_id": "sse-mock-1"},
+                   headers=sse)
+        assert r.mimetype == "text/event-stream", r.mimetype
+        events = _events(r.get_data(as_text=True))
+        assert events[0][0] == "meta" and events[0][1]["request_id"] == "sse-mock-1"
+        conv_id = events[0][1]["conv_id"]
+        tokens = [d["text"] for e, d in events if e == "token"]
+        done = events[-1][1]
+        assert events[-1][0] == "done" and len(tokens) > 1 and "".join(tokens) == done["response"], events
+        assert done["response_html"] and _agent_messages(conv_id)[-1] == done["response"]
+        provider, status, meta = _ledger("sse-mock-1")
+        assert status == "ok" and meta.get("streamed") is True and "first_token_ms" in meta, meta
+
+        # Real agent: gateway deltas are relayed as they arrive, docs context follows as its own event.
+        m.REAL_AGENT_SLUGS.add("ppc-specialist")
+        m._stream_real_agent_response = lambda **kwargs: iter(["Budget ", "pacing ", "looks fine."])
+        m._should_attach_docs_context = lambda agent_slug, message: True
+        m.get_api_docs_context = lambda query, connectors, top_k=3, deadline=None: "📖 **[Budgets](https://x/budgets)**"
+        r = c.post("/api/chat/stream", json={"ws_slug": "business", "agent_slug": "ppc-specialist",
+                                             "message": "campaign budget api", "request_id": "sse-real-1"},
+                   headers=headers)
+        events = _events(r.get_data(as_text=True))
+        assert [e for e, _ in events] == ["meta", "token", "token", "token", "docs", "done"], events
+        assert events[-1][1]["response"].startswith("Budget pacing looks fine.\n\n---")
+        assert _ledger("sse-real-1")[0] == "vertex"
+
+        # Client disconnect mid-reply: the partial reply is still saved, marked client_closed.
+        r = c.post("/api/chat/stream", json={"ws_slug": "business", "agent_slug": "ppc-specialist",
+                                             "message": "status", "request_id": "sse-closed-1"},
+                   headers=headers, buffered=False)
+        chunks = iter(r.response)
+        first = next(chunks)
+        first = first.decode() if isinstance(first, bytes) else first
+        conv_closed = json.loads(first.split("data: ", 1)[1])["conv_id"]
+        next(chunks)
+        r.close()
+        assert _ledger("sse-closed-1")[1] == "client_closed"
+        assert _agent_messages(conv_closed)[-1] == "Budget "
+
+        # Gateway SSE parsing: data lines, [DONE], non-JSON payloads.
+        fake = _FakeStream(["", 'data: {"delta": "Hel"}', ": keepalive", 'data: {"delta": "lo"}', "data: [DONE]",
+                            'data: {"delta": "ignored"}'])
+        m._coolbits_request = lambda *a, **k: (200, {"runId": "run-1"}, "")
+        m._coolbits_open_stream = lambda *a, **k: fake
+        m._stream_real_agent_response = originals["_stream_real_agent_response"]
+        with m.app.test_request_context(headers=headers):
+            parts = list(m._stream_real_agent_response(agent_slug="ppc-specialist", ws_slug="business",
+                                                       user_message="hi", recent_history=[]))
+        assert parts == ["Hel", "lo"] and fake.closed, parts
+
+        r = c.post("/api/chat/stream", json={"agent_slug": "ppc-specialist", "message": "x"}, headers=headers)
+        assert r.status_code == 400
+    finally:
+        for name, fn in originals.items():
+            setattr(m, name, fn)
+        m.REAL_AGENT_SLUGS.clear()
+        m.REAL_AGENT_SLUGS.update(real_slugs)
+    print("Chat stream tests: OK")
+
+
+if __name__ == "__main__":
+    run()
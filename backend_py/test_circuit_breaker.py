@@ -0,0 +1,137 @@
+"""Gateway circuit breaker: open / half-open / close, fast fallback while open (local test client)."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import circuit_breaker as cb
+import gateway_cache
+import gateway_client as gc
+
+
+class _Failing(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = []
+
+    def do_GET(self):
+        _Failing.hits.append(self.path)
+        time.sleep(0.3)
+        self.send_response(503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def _coalesced_failures():
+    """Identical concurrent GETs share one upstream call, so the breaker records one outcome, not one per caller."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Failing)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = m.COOLBITS_URL
+    m.COOLBITS_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    cb.reset_breakers()
+    try:
+        barrier = threading.Barrier(m.Config.GATEWAY_BREAKER_MIN_CALLS)
+        statuses = []
+
+        def call():
+            barrier.wait()
+            statuses.append(m._coolbits_request("GET", "/api/connectors/googleads/report", params={"q": "same"})[0])
+
+        threads = [threading.Thread(target=call) for _ in range(m.Config.GATEWAY_BREAKER_MIN_CALLS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert statuses == [503] * len(threads) and len(_Failing.hits) == 1, (statuses, _Failing.hits)
+        snap = cb.breaker_stats()["googleads"]
+        assert snap["calls"] == 1 and snap["errors"] == 1 and snap["state"] == cb.CLOSED, snap
+    finally:
+        m.COOLBITS_URL = saved
+        server.shutdown()
+        cb.reset_breakers()
+
+
+def run():
+    # State machine.
+    b = cb.CircuitBreaker("ga4", window_s=30, min_calls=4, failure_pct=50, open_s=0.2)
+    for outcome in ("ok", "ok", "error"):
+        b.record(outcome)
+    assert b.state == cb.CLOSED and b.allow()
+    b.record("timeout")  # 2 of 4 failed
+    assert b.state == cb.OPEN and not b.allow()
+    time.sleep(0.25)
+    assert b.allow() and b.state == cb.HALF_OPEN
+    assert not b.allow()  # one probe at a time
+    b.record("error")
+    assert b.state == cb.OPEN and not b.allow()
+    time.sleep(0.25)
+    assert b.allow()
+    b.record("ok")
+    assert b.state == cb.CLOSED and b.allow()
+    snap = b.snapshot()
+    assert snap["opened"] == 2 and snap["probes"] == 2 and snap["short_circuited"] == 3, snap
+
+    assert cb.path_family("/api/runs/abc/llm") == "runs"
+    assert cb.path_family("api/connectors/googleads/report") == "googleads"
+    assert cb.path_family("/api/connectors/stripe/overview") == "billing"
+    assert cb.path_family("/api/connectors/ga4/report") == "ga4"
+
+    # App: a dead gateway trips the family breaker, then callers fall back without any I/O.
+    saved = (m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED, dict(m._coolbits_auth_cache), m.Config.GATEWAY_RETRY_MAX)
+    m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = "http://127.0.0.1:9", True
+    m._coolbits_auth_cache.update({"token": "stub-token", "fetched_at": time.time()})
+    m.Config.GATEWAY_RETRY_MAX = 0
+    gc.reset_gateway_client()
+    _coalesced_failures()
+    gc.reset_gateway_client()
+    cb.reset_breakers()
+    gateway_cache.clear()
+    try:
+        for i in range(m.Config.GATEWAY_BREAKER_MIN_CALLS):
+            payload, gw = m._ga4_gateway_fetch(["/api/connectors/ga4/report"], params={"n": i}, cache=False)
+            assert payload is None and "circuit_open" not in gw["error"], gw
+        assert cb.breaker_state("ga4") == cb.OPEN
+
+        started = time.perf_counter()
+        payload, gw = m._ga4_gateway_fetch(["/api/connectors/ga4/report"], params={"n": "x"})
+        assert time.perf_counter() - started < 0.005
+        assert payload is None and "circuit_open:ga4" in gw["error"] and gw["breaker"] == "open", gw
+
+        client = m.app.test_client()
+        started = time.perf_counter()
+        body = client.get("/api/connectors/ga4/overview?property_id=123").get_json()
+        assert body["source"] == "mock" and time.perf_counter() - started < 0.5, body
+
+        # Other families are independent: Google Ads still tries the network.
+        _payload, gw = m._google_ads_gateway_fetch(["/api/connectors/googleads/report"], cache=False)
+        assert "circuit_open" not in gw["error"] and gw["breaker"] == "closed", gw
+
+        # Real-agent replies fall back (None) immediately once the runs breaker is open.
+        with m.app.test_request_context(headers={"X-User-ID": "990701"}):
+            for _ in range(m.Config.GATEWAY_BREAKER_MIN_CALLS):
+                assert m._generate_real_agent_response("ceo-strategy", "business", "hello", []) is None
+            assert cb.breaker_state("runs") == cb.OPEN
+            started = time.perf_counter()
+            assert m._generate_real_agent_response("ceo-strategy", "business", "hello", []) is None
+            assert time.perf_counter() - started < 0.05
+
+        breakers = client.get("/readyz").get_json()["checks"]["gateway"]["breakers"]
+        assert breakers["ga4"]["state"] == "open" and breakers["ga4"]["short_circuited"] >= 2, breakers
+        assert breakers["runs"]["state"] == "open" and breakers["googleads"]["errors"] == 1, breakers
+    finally:
+        m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = saved[0], saved[1]
+        m._coolbits_auth_cache.clear()
+        m._coolbits_auth_cache.update(saved[2])
+        m.Config.GATEWAY_RETRY_MAX = saved[3]
+        gc.reset_gateway_client()
+        cb.reset_breakers()
+        gateway_cache.clear()
+    print("Circuit breaker tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,76 @@
+"""Denormalized conversation activity columns (local test client)."""
+import time
+
+import app as m
+from database import refresh_conversation_activity, save_message, CONVERSATION_PREVIEW_CHARS
+
+
+def run():
+    m.init_db()
+    uid = 990101
+
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'activity-user', 0)", (uid,))
+    conn.execute("DELETE FROM messages WHERE conv_id IN (SELECT id FROM conversations WHERE user_id = ?)", (uid,))
+    conn.execute("DELETE FROM conversations WHERE user_id = ?", (uid,))
+    conn.commit()
+    conn.close()
+
+    older = m.create_new_conversation(uid, "personal", "life-coach", "Older")
+    newer = m.create_new_conversation(uid, "business", "ceo-strategy", "Newer")
+    save_message(older, "user", "first question")
+    save_message(older, "agent", "x" * (CONVERSATION_PREVIEW_CHARS + 50))
+    time.sleep(1.1)  # CURRENT_TIMESTAMP has second resolution
+    save_message(newer, "user", "latest question")
+
+    conn = m.get_db()
+    row = conn.execute(
+        "SELECT message_count, last_message_preview, last_activity_at FROM conversations WHERE id = ?",
+        (older,),
+    ).fetchone()
+    assert row["message_count"] == 2, tuple(row)
+    assert row["last_message_preview"] == "x" * CONVERSATION_PREVIEW_CHARS
+    last_ts = conn.execute("SELECT MAX(timestamp) FROM messages WHERE conv_id = ?", (older,)).fetchone()[0]
+    assert row["last_activity_at"] == last_ts, (tuple(row), last_ts)
+
+    # The backfill is idempotent and agrees with the incremental updates.
+    snapshot = conn.execute(
+        "SELECT id, message_count, last_message_preview, last_activity_at FROM conversations WHERE user_id = ? ORDER BY id",
+        (uid,),
+    ).fetchall()
+    conn.execute("UPDATE conversations SET message_count = 0, last_message_preview = NULL WHERE user_id = ?", (uid,))
+    refresh_conversation_activity(conn)
+    conn.commit()
+    again = conn.execute(
+        "SELECT id, message_count, last_message_preview, last_activity_at FROM conversations WHERE user_id = ? ORDER BY id",
+        (uid,),
+    ).fetchall()
+    assert [tuple(r) for r in snapshot] == [tuple(r) for r in again]
+
+    plan = " ".join(
+        str(r[-1]) for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM conversations WHERE user_id = ? AND COALESCE(client_id, 0) = ? "
+            "ORDER BY last_activity_at DESC LIMIT 30",
+            (uid, 0),
+        ).fetchall()
+    )
+    assert "idx_conversations_user_client_activity" in plan and "TEMP B-TREE" not in plan, plan
+    conn.close()
+
+    c = m.app.test_client()
+    r = c.get("/api/conversations", headers={"X-User-ID": str(uid)})
+    assert r.status_code == 200, r.get_data(as_text=True)[:240]
+    items = r.get_json() or []
+    assert [i["id"] for i in items[:2]] == [newer, older], items
+    assert items[1]["msg_count"] == 2
+    assert items[1]["last_message"].endswith("…")
+
+    recent = m.get_recent_conversations(uid, "personal")
+    assert recent and recent[0]["title"] == "Older", recent
+    found = m.search_conversations(uid, "business", "latest")
+    assert found and found[0]["agent_slug"] == "ceo-strategy", found
+    print("Conversation activity tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,119 @@
+"""Bounded real-agent context: recent window + incremental rolling summary (local test client)."""
+import json
+
+import app as m
+import conversation_context as cc
+
+
+def _summary_units():
+    msgs = [{"role": "user", "content": "Budget is tight.  Second sentence is dropped."},
+            {"role": "agent", "content": "x" * 400}]
+    folded = cc.fold_summary("", msgs, max_chars=2000)
+    lines = folded.split("\n")
+    assert lines[0] == "User: Budget is tight." and lines[1].startswith("Assistant: x") and len(lines[1]) <= 172, lines
+    # Past the cap the oldest lines go first.
+    capped = cc.fold_summary(folded, [{"role": "user", "content": f"point {i}"} for i in range(40)], max_chars=200)
+    assert len(capped) <= 202 and capped.startswith("…\n") and capped.endswith("User: point 39"), capped
+
+
+def _conversation(uid, cid, turns):
+    conv_id = m.create_new_conversation(uid, "business", "ppc-specialist", client_id=cid)
+    for i in range(turns):
+        m.save_chat_turn(conv_id, f"Question {i} about campaign pacing and budgets.", f"Answer {i}: shift spend gradually.")
+    return conv_id
+
+
+def run():
+    _summary_units()
+
+    m.init_db()
+    uid = 990971
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'context-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    cid = conn.execute("INSERT INTO clients (user_id, type, name) VALUES (?, 'company', 'Context Client')", (uid,)).lastrowid
+    conn.commit()
+    conn.close()
+    headers = {"X-User-ID": str(uid), "X-Client-ID": str(cid)}
+
+    # The prompt window is the last K messages (pending one included); everything older is summarized.
+    k, every = m.Config.CHAT_CONTEXT_RECENT_K, m.Config.CHAT_CONTEXT_SUMMARY_EVERY
+    conv_id = _conversation(uid, cid, 2)
+    sizes = []
+    for i in range(2, 40):
+        history, summary, stats = cc.build_context(conv_id, "pending question")
+        assert len(history) == min(k, 2 * i + 1) and history[-1] == {"role": "user", "content": "pending question"}, history
+        assert history[-2]["content"] == f"Answer {i - 1}: shift spend gradually."
+        assert stats["summarized_messages"] + stats["window_messages"] - 1 == 2 * i, (i, stats)
+        sizes.append(stats["history_tokens"])
+        m.save_chat_turn(conv_id, f"Question {i} about campaign pacing and budgets.", f"Answer {i}: shift spend gradually.")
+    conn = m.get_db()
+    state = cc.load_summary(conn, conv_id)
+    total = conn.execute("SELECT COUNT(*) FROM messages WHERE conv_id = ?", (conv_id,)).fetchone()[0]
+    conn.close()
+    assert state["covered_count"] > 0 and total - state["covered_count"] < cc.window_limit(), state
+    assert "Question 0 about campaign pacing and budgets." in summary or summary.startswith("…")
+    assert stats["full_history_tokens"] > stats["history_tokens"] and stats["saved_tokens"] > 0, stats
+    # Prompt size plateaus: the late turns cost no more than the summary cap over the early ones.
+    assert max(sizes[-10:]) - max(sizes[:10]) <= cc.estimate_tokens("x" * m.Config.CHAT_CONTEXT_SUMMARY_MAX_CHARS) + 2, sizes
+
+    # A long conversation without a summary row is folded from its first message, in bounded chunks.
+    old_conv = _conversation(uid, cid, 150)
+    saved_chunk, cc._BACKLOG_CHUNK = cc._BACKLOG_CHUNK, 40
+    try:
+        _, _, stats = cc.build_context(old_conv, "pending question")
+    finally:
+        cc._BACKLOG_CHUNK = saved_chunk
+    conn = m.get_db()
+    backlog = cc.load_summary(conn, old_conv)
+    contents = [r[0] for r in conn.execute("SELECT content FROM messages WHERE conv_id = ? ORDER BY id", (old_conv,))]
+    conn.close()
+    assert backlog["covered_count"] == 300 - (k - 1) == stats["summarized_messages"], (backlog, stats)
+    assert backlog["covered_tokens"] == sum(cc.estimate_tokens(c) for c in contents[:300 - (k - 1)])
+    assert stats["full_history_tokens"] == sum(cc.estimate_tokens(c) for c in contents) + cc.estimate_tokens("pending question")
+
+    # The summary is part of the real-agent objective.
+    with m.app.test_request_context(headers=headers):
+        objective = m._build_real_agent_objective("ppc-specialist", "business", "pending", history, summary=summary)
+    assert "- Earlier in this conversation:\n" + summary in objective
+
+    # Through the chat route: the stream gets the bounded window + summary, the ledger gets the savings.
+    seen = {}
+
+    def capture(**kwargs):
+        seen.update(kwargs)
+        yield "Keep pacing steady."
+
+    saved = (m._stream_real_agent_response, m._generate_real_agent_response, set(m.REAL_AGENT_SLUGS))
+    m._stream_real_agent_response = capture
+    m._generate_real_agent_response = lambda **kwargs: (seen.update(kwargs), "Keep pacing steady.")[1]
+    m.REAL_AGENT_SLUGS.add("ppc-specialist")
+    try:
+        c = m.app.test_client()
+        r = c.post("/chat/business/ppc-specialist", json={"message": "And next week?", "conv_id": conv_id,
+                                                          "request_id": "context-1"}, headers=headers)
+        assert r.status_code == 200, r.get_data(as_text=True)
+        assert seen["summary"] and len(seen["recent_history"]) == k
+        assert seen["recent_history"][-1] == {"role": "user", "content": "And next week?"}
+        assert m._usage_writer.flush()
+        conn = m.get_db()
+        meta = json.loads(conn.execute("SELECT meta_json FROM usage_ledger WHERE request_id = 'context-1'").fetchone()[0])
+        conn.close()
+        ctx = meta["context"]
+        assert ctx["saved_tokens"] > 0 and ctx["summarized_messages"] >= 2 * every, ctx
+        assert ctx["full_history_tokens"] - ctx["saved_tokens"] == ctx["history_tokens"], ctx
+
+        # Deleting the conversation drops its summary.
+        assert c.delete(f"/api/conversations/{conv_id}", headers=headers).status_code == 200
+        conn = m.get_db()
+        assert cc.load_summary(conn, conv_id)["covered_message_id"] == 0
+        conn.close()
+    finally:
+        m._stream_real_agent_response, m._generate_real_agent_response = saved[0], saved[1]
+        m.REAL_AGENT_SLUGS.clear()
+        m.REAL_AGENT_SLUGS.update(saved[2])
+    print("Conversation context tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+"""Request-scoped / pooled SQLite connection tests (local test client)."""
+import database as dbm
+
+import app as m
+
+
+def run():
+    m.init_db()
+
+    # Outside a request: close() hands the connection back and the next lease reuses it.
+    conn = m.get_db()
+    raw = conn._conn
+    mode = str(conn.execute("PRAGMA journal_mode").fetchone()[0]).lower()
+    assert mode == "wal", mode
+    assert int(conn.execute("PRAGMA busy_timeout").fetchone()[0]) == int(m.Config.DB_BUSY_TIMEOUT_MS)
+    conn.close()
+    conn.close()  # double close stays harmless
+    conn2 = m.get_db()
+    assert conn2._conn is raw
+    conn2.close()
+
+    # Uncommitted work is rolled back on release, like sqlite3.Connection.close().
+    conn3 = m.get_db()
+    conn3.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (990001, 'pool-rollback', 0)")
+    conn3.close()
+    conn4 = m.get_db()
+    assert conn4.execute("SELECT 1 FROM users WHERE id = 990001").fetchone() is None
+    conn4.close()
+
+    # Inside a request: every get_db() returns the same handle until teardown.
+    with m.app.test_request_context("/"):
+        a = m.get_db()
+        b = m.get_db()
+        assert a is b
+        a.close()
+        assert b.execute("SELECT 1").fetchone()[0] == 1
+        # A caller that closes without committing does not leak its writes into a later commit,
+        # while a nested helper's close() leaves the outer caller's open transaction alone.
+        b.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (990003, 'pool-leak', 0)")
+        b.close()
+        outer = m.get_db()
+        outer.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (990004, 'pool-outer', 0)")
+        inner = m.get_db()
+        inner.close()
+        assert outer.in_transaction
+        outer.commit()
+        outer.close()
+        ids = {r[0] for r in a.execute("SELECT id FROM users WHERE id IN (990003, 990004)")}
+        assert ids == {990004}, ids
+        a.execute("DELETE FROM users WHERE id = 990004")
+        a.commit()
+    assert a._conn is None
+
+    uid = 990002
+    conn5 = m.get_db()
+    conn5.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'pool-chat', 0)", (uid,))
+    m._save_user_settings(conn5, uid, {"preferences": {"onboarding_completed": True}})
+    conn5.commit()
+    conn5.close()
+
+    original_real = m._generate_real_agent_response
+    m._generate_real_agent_response = lambda **kwargs: None
+    try:
+        before = dbm.pool_stats()
+        c = m.app.test_client()
+        r = c.post("/chat/personal/life-coach", json={"message": "pool smoke"}, headers={"X-User-ID": str(uid)})
+        assert r.status_code == 200, r.get_data(as_text=True)[:240]
+        after = dbm.pool_stats()
+        assert after["opened"] - before["opened"] <= 1, (before, after)
+    finally:
+        m._generate_real_agent_response = original_real
+
+    r = c.get("/readyz")
+    assert "pool" in ((r.get_json() or {}).get("checks") or {}).get("db", {}), r.get_data(as_text=True)
+    print("DB pool tests: OK")
+
+
+if __name__ == "__main__":
+    run()
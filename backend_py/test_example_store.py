@@ -0,0 +1,79 @@
+"""Few-shot example store: one-time JSONL load, per-call sampling by id, keyword relevance, reloads."""
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import example_store as es
+import models
+
+
+def _write(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for system, user, assistant in rows:
+            f.write(json.dumps({"messages": [{"role": "system", "content": system},
+                                             {"role": "user", "content": user},
+                                             {"role": "assistant", "content": assistant}]}) + "\n")
+        f.write("not json\n\n")
+
+
+def run():
+    tmp = Path(tempfile.mkdtemp(prefix="camarad-examples-"))
+    data = tmp / "data"
+    data.mkdir()
+    topics = ["budget pacing", "keyword research", "landing page", "bid strategy", "audience targeting"]
+    _write(data / "ppc-specialist_synthetic.jsonl",
+           [("You are PPC.", f"Help with {topics[i % 5]} case {i}", f"PPC answer {i}") for i in range(200)])
+    _write(data / "seo-content_synthetic.jsonl",
+           [("You are SEO.", f"Help with budget pacing for blog {i}", f"SEO answer {i}") for i in range(50)])
+    db = tmp / "examples.db"
+
+    conn = sqlite3.connect(str(db))
+    assert es.sync_examples(conn, data) == {"ppc-specialist": 200, "seo-content": 50}
+    assert es.sync_examples(conn, data) == {}  # unchanged files are not reloaded
+    sources = dict(conn.execute("SELECT agent, count FROM example_sources").fetchall())
+    conn.close()
+    assert sources == {"ppc-specialist": 200, "seo-content": 50}
+
+    # Fresh random samples per call, only from the agent's own rows.
+    seen = set()
+    for seed in range(10):
+        picked = es.sample_examples("ppc-specialist", 3, db_path=db, data_dir=data, rng=random.Random(seed))
+        assert len(picked) == 3 and all(ex["messages"][2]["content"].startswith("PPC answer") for ex in picked)
+        assert picked[0]["messages"][0]["content"] == "You are PPC."
+        seen.add(tuple(ex["messages"][2]["content"] for ex in picked))
+    assert len(seen) > 1, seen
+    assert es.sample_examples("missing-agent", 3, db_path=db, data_dir=data) == []
+    assert len(es.sample_examples("seo-content", 500, db_path=db, data_dir=data)) == 50
+
+    # Relevance mode: keyword matches first, scoped to the agent, topped up with random rows.
+    picked = es.sample_examples("ppc-specialist", 3, query="How do I fix budget pacing?", db_path=db, data_dir=data)
+    assert all("budget pacing" in ex["messages"][1]["content"] for ex in picked), picked
+    picked = es.sample_examples("ppc-specialist", 3, query="zzzz nothing matches", db_path=db, data_dir=data)
+    assert len(picked) == 3
+
+    # A changed file is reloaded; the other agent keeps its rows.
+    time.sleep(0.01)
+    _write(data / "seo-content_synthetic.jsonl", [("You are SEO.", "Only one now", "SEO answer x")])
+    conn = sqlite3.connect(str(db))
+    assert es.sync_examples(conn, data) == {"seo-content": 1}
+    counts = dict(conn.execute("SELECT agent, COUNT(*) FROM examples GROUP BY agent").fetchall())
+    fts_rows = conn.execute("SELECT COUNT(*) FROM examples_fts").fetchone()[0]
+    conn.close()
+    assert counts == {"ppc-specialist": 200, "seo-content": 1} and fts_rows == 201, (counts, fts_rows)
+
+    # models.enhance_context draws its few-shot block from the store (real datasets, temporary store file).
+    saved = es.Config.EXAMPLE_STORE_DB
+    es.Config.EXAMPLE_STORE_DB = str(tmp / "synthetic.db")
+    try:
+        prompt = models.enhance_context("How should I pace my budget?", "", "ppc-specialist")
+    finally:
+        es.Config.EXAMPLE_STORE_DB = saved
+    assert prompt.startswith("Examples of similar conversations:\nUser: ") and prompt.count("\nAssistant: ") == 3, prompt[:300]
+    print("Example store tests: OK")
+
+
+if __name__ == "__main__":
+    run()
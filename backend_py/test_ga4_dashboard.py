@@ -0,0 +1,122 @@
+"""Batched GA4 dashboard report shared by the per-section endpoints (local test client, gateway stubbed)."""
+import time
+
+import app as m
+import gateway_cache
+
+
+def _report(skip=()):
+    data = {
+        "overview": {"sessions": 500, "users": 250, "conversions": 20, "revenue": 1234.5},
+        "pages_screens": {"rows": [{"pagePath": "/", "pageTitle": "Home", "screenPageViews": 900, "sessions": 400}]},
+        "traffic_acquisition": {"rows": [{"sessionSource": "google", "sessionMedium": "organic", "sessions": 300}]},
+        "events": {"rows": [
+            {"eventName": "page_view", "eventCount": 900, "sessions": 400},
+            {"eventName": "purchase", "eventCount": 20, "sessions": 20},
+        ]},
+        "device": {"deviceCategory": [{"deviceCategory": "Mobile", "sessions": 300}, {"deviceCategory": "Desktop", "sessions": 200}]},
+        "geo": {"countries": [{"country": "Romania", "sessions": 500}]},
+        "series": {"daily": [{"date": "2026-01-01", "sessions": 70, "conversions": 3}]},
+    }
+    return {"data": {k: v for k, v in data.items() if k not in skip}}
+
+
+def run():
+    calls = []
+    state = {"skip": (), "connected": True, "section_delay": 0.0}
+
+    def fake_live(path_candidates, params=None, timeout=30):
+        calls.append(dict(params or {}))
+        if not state["connected"]:
+            return {"error": "not_connected"}, {"enabled": True, "status": 400, "error": "not_connected"}
+        if state["section_delay"] and len(calls) > 1:
+            # Per-section fallback read: slow, but it carries the section.
+            time.sleep(state["section_delay"])
+            return _report(), {"enabled": True, "path": path_candidates[0], "status": 200}
+        return _report(state["skip"]), {"enabled": True, "path": path_candidates[0], "status": 200}
+
+    saved = (m.COOLBITS_GATEWAY_ENABLED, m._ga4_gateway_fetch_live)
+    m.COOLBITS_GATEWAY_ENABLED = True
+    m._ga4_gateway_fetch_live = fake_live
+    gateway_cache.clear()
+    hdr = {"X-User-ID": "990501"}
+    query = "property_id=123&days=28"
+    try:
+        client = m.app.test_client()
+
+        # One upstream report feeds every section.
+        dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+        assert len(calls) == 1, calls
+        assert calls[0]["blocks"] == "overview,device,geo,series", calls[0]
+        assert calls[0]["preset"] == "pages_screens,traffic_acquisition,events", calls[0]
+        assert set(dash["sections"].values()) == {"batched"} and dash["source"] == "coolbits", dash["sections"]
+        assert dash["overview"]["sessions"] == 500 and dash["overview"]["source"] == "coolbits"
+        assert dash["pages"][0]["path"] == "/" and dash["countries"][0]["country"] == "Romania"
+        assert [d["category"] for d in dash["devices"]] == ["mobile", "desktop"]
+        assert dash["daily"][0]["sessions"] == 70 and dash["gateway"]["cache"] == "miss"
+
+        # The per-section endpoints (and the funnel) reuse the fresh batched report.
+        for path, field in (("overview", "sessions"), ("pages", "pages"), ("sources", "sources"), ("events", "events"),
+                            ("devices", "devices"), ("countries", "countries"), ("timeseries", "daily")):
+            body = client.get(f"/api/connectors/ga4/{path}?{query}", headers=hdr).get_json()
+            assert body["source"] == "coolbits" and body.get(field), (path, body)
+            assert body["gateway"]["batched"] is True, (path, body["gateway"])
+        funnel = client.get(f"/api/connectors/ga4/funnel?{query}", headers=hdr).get_json()
+        assert funnel.get("source") == "coolbits", funnel
+        assert len(calls) == 1, calls
+
+        # Other users / ranges do not see it.
+        client.get(f"/api/connectors/ga4/pages?{query}", headers={"X-User-ID": "990502"})
+        client.get(f"/api/connectors/ga4/pages?property_id=123&days=7", headers=hdr)
+        assert len(calls) == 3
+
+        # Sections missing from the batched answer are fetched on their own.
+        gateway_cache.clear()
+        calls.clear()
+        state["skip"] = ("geo",)
+        dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+        assert dash["sections"]["countries"] == "mock" and dash["sections"]["pages"] == "batched", dash["sections"]
+        assert calls[1] == {"propertyId": "123", "from": calls[0]["from"], "to": calls[0]["to"], "blocks": "geo"}, calls
+
+        # Those reads run in parallel, and the ones still running at the deadline fall back to mock data.
+        saved_deadline = m.Config.GA4_DASHBOARD_FALLBACK_DEADLINE_MS
+        try:
+            state["skip"], state["section_delay"] = ("geo", "device", "series"), 0.3
+            gateway_cache.clear()
+            calls.clear()
+            started = time.monotonic()
+            dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+            assert time.monotonic() - started < 0.8 and len(calls) == 4, calls
+            assert [dash["sections"][k] for k in ("countries", "devices", "daily")] == ["fallback"] * 3, dash["sections"]
+            m.Config.GA4_DASHBOARD_FALLBACK_DEADLINE_MS = 100
+            state["section_delay"] = 1.0
+            gateway_cache.clear()
+            calls.clear()
+            started = time.monotonic()
+            dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+            assert time.monotonic() - started < 0.6, time.monotonic() - started
+            assert [dash["sections"][k] for k in ("countries", "devices", "daily")] == ["mock"] * 3, dash["sections"]
+            assert dash["sections"]["pages"] == "batched" and dash["source"] == "coolbits"
+        finally:
+            m.Config.GA4_DASHBOARD_FALLBACK_DEADLINE_MS = saved_deadline
+            state["skip"], state["section_delay"] = (), 0.0
+            time.sleep(1.0)  # let the abandoned reads finish before the stub changes under them
+
+        # not_connected is passed through; gateway off serves the mock dashboard.
+        gateway_cache.clear()
+        state["connected"] = False
+        dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+        assert dash["error"] == "not_connected" and dash["overview"]["error"] == "not_connected"
+        m.COOLBITS_GATEWAY_ENABLED = False
+        dash = client.get(f"/api/connectors/ga4/dashboard?{query}", headers=hdr).get_json()
+        assert dash["source"] == "mock" and set(dash["sections"].values()) == {"mock"} and "gateway" not in dash
+        assert len(dash["daily"]) == 28 and dash["daily"] == client.get(
+            f"/api/connectors/ga4/timeseries?{query}", headers=hdr).get_json()["daily"]
+    finally:
+        m.COOLBITS_GATEWAY_ENABLED, m._ga4_gateway_fetch_live = saved
+        gateway_cache.clear()
+    print("GA4 dashboard tests: OK")
+
+
+if __name__ == "__main__":
+    run()
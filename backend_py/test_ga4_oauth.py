@@ -18,7 +18,7 @@ def run():
     m.COOLBITS_GATEWAY_ENABLED = True
     state_value = f"state-{uuid.uuid4().hex}"
 
-    def fake_coolbits_request(method, path, params=None, body=None, timeout=25, extra_headers=None):
+    def fake_coolbits_request(method, path, params=None, body=None, timeout=25, extra_headers=None, hedge=False):
         if path == "/api/connectors/ga4/auth/url":
             return 200, {
                 "url": (
@@ -0,0 +1,105 @@
+"""Gateway read cache: TTL, stale-while-revalidate, negative entries, LRU (local test client, gateway stubbed)."""
+import threading
+import time
+
+import app as m
+import gateway_cache as gcache
+
+
+def run():
+    gcache.clear()
+
+    # read_through: miss -> hit -> stale (old value served, one refresh) -> hit on the refreshed value.
+    calls = []
+    refreshed = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        return ({"n": len(calls)}, {"status": 200})
+
+    def spawn(fn):
+        def _run():
+            fn()
+            refreshed.set()
+        threading.Thread(target=_run).start()
+
+    key = gcache.cache_key("ga4", 1, 2, ["/api/connectors/ga4/report"], {"to": "b", "from": "a", "x": None})
+    assert key == gcache.cache_key("ga4", 1, 2, "/api/connectors/ga4/report", {"from": "a", "to": "b"})
+    assert gcache.read_through(key, fetch, 0.05, spawn=spawn) == (({"n": 1}, {"status": 200}), "miss")
+    value, state = gcache.read_through(key, fetch, 0.05, spawn=spawn)
+    assert state == "hit" and value[0]["n"] == 1 and len(calls) == 1
+    value[0]["n"] = 99  # callers get copies
+    time.sleep(0.08)
+    value, state = gcache.read_through(key, fetch, 0.05, spawn=spawn)
+    assert state == "stale" and value[0]["n"] == 1, (value, state)
+    assert refreshed.wait(2) and len(calls) == 2
+    value, state = gcache.read_through(key, fetch, 0.05, spawn=spawn)
+    assert state == "hit" and value[0]["n"] == 2
+
+    # Negative answers use their own TTL and are never served stale; failures are not cached.
+    neg_key = gcache.cache_key("ga4", 1, 2, "/neg")
+    neg = lambda: (None, {"error": "not_connected"})
+    classify = lambda v: "negative" if v[1].get("error") else ("ok" if v[0] is not None else None)
+    assert gcache.read_through(neg_key, neg, 60, negative_ttl=0.05, classify=classify)[1] == "miss"
+    assert gcache.read_through(neg_key, neg, 60, negative_ttl=0.05, classify=classify)[1] == "hit"
+    time.sleep(0.08)
+    assert gcache.read_through(neg_key, neg, 60, negative_ttl=0.05, classify=classify)[1] == "miss"
+    fail_key = gcache.cache_key("stripe", 1, None, "/down")
+    for _ in range(2):
+        assert gcache.read_through(fail_key, lambda: (None, {}), 60, classify=classify)[1] == "miss"
+
+    # Bounded LRU: the least recently used key is evicted first.
+    original_size = m.Config.GATEWAY_CACHE_SIZE
+    m.Config.GATEWAY_CACHE_SIZE = 2
+    try:
+        gcache.clear()
+        for i in range(3):
+            gcache.read_through(("lru", i), lambda i=i: i, 60)
+        assert gcache.read_through(("lru", 0), lambda: "again", 60) == ("again", "miss")
+        assert gcache.read_through(("lru", 2), lambda: "again", 60) == (2, "hit")
+    finally:
+        m.Config.GATEWAY_CACHE_SIZE = original_size
+    gcache.clear()
+
+    # App: GA4 dashboards answer from the cache per user, tagged in gateway.cache.
+    live_calls = []
+
+    def fake_live(path_candidates, params=None, timeout=30):
+        live_calls.append((tuple(path_candidates), dict(params or {})))
+        if params and params.get("propertyId") == "missing":
+            return {"error": "property_not_set"}, {"enabled": True, "status": 400, "error": "property_not_set"}
+        return {"data": {"overview": {"sessions": 120, "users": 60}}}, {"enabled": True, "path": path_candidates[0], "status": 200}
+
+    saved = (m.COOLBITS_GATEWAY_ENABLED, m._ga4_gateway_fetch_live)
+    m.COOLBITS_GATEWAY_ENABLED = True
+    m._ga4_gateway_fetch_live = fake_live
+    try:
+        client = m.app.test_client()
+        url = "/api/connectors/ga4/overview?property_id=123&days=7"
+        first = client.get(url, headers={"X-User-ID": "990401"}).get_json()
+        second = client.get(url, headers={"X-User-ID": "990401"}).get_json()
+        assert first["gateway"]["cache"] == "miss" and second["gateway"]["cache"] == "hit", (first, second)
+        assert second["sessions"] == 120 and len(live_calls) == 1
+        other = client.get(url, headers={"X-User-ID": "990402"}).get_json()
+        assert other["gateway"]["cache"] == "miss" and len(live_calls) == 2
+
+        missing = "/api/connectors/ga4/overview?property_id=missing"
+        client.get(missing, headers={"X-User-ID": "990401"})
+        client.get(missing, headers={"X-User-ID": "990401"})
+        assert len(live_calls) == 3  # negative entry served the repeat
+
+        assert gcache.invalidate("ga4", 990401) == 2
+        assert client.get(url, headers={"X-User-ID": "990401"}).get_json()["gateway"]["cache"] == "miss"
+
+        payload, gw = m._ga4_gateway_fetch(["/api/connectors/ga4/report"], params={"propertyId": "123"}, cache=False)
+        assert gw["cache"] == "bypass" and payload["data"]
+        stats = client.get("/readyz").get_json()["checks"]["gateway"]["cache"]
+        assert stats["hits"] >= 2 and stats["entries"] >= 2, stats
+    finally:
+        m.COOLBITS_GATEWAY_ENABLED, m._ga4_gateway_fetch_live = saved
+        gcache.clear()
+    print("Gateway cache tests: OK")
+
+
+if __name__ == "__main__":
+    run()
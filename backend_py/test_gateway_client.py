@@ -0,0 +1,115 @@
+"""Pooled gateway client: keep-alive reuse, retry/backoff budget (local stub HTTP server)."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import gateway_client as gc
+
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    hits = {}
+    flaky = {"/flaky": 2}
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        _Stub.hits[path] = _Stub.hits.get(path, 0) + 1
+        if path == "/api/auth/mock-login":
+            return self._reply(200, {"token": "stub-token"}, {"Set-Cookie": "sid=leak; Path=/"})
+        if path == "/cookie":
+            return self._reply(200, {"cookie": self.headers.get("Cookie")})
+        if path in _Stub.flaky and _Stub.hits[path] <= _Stub.flaky[path]:
+            return self._reply(503, {"error": "unavailable"})
+        if path == "/down":
+            return self._reply(503, {"error": "unavailable"})
+        return self._reply(200, {"ok": True, "path": path, "auth": self.headers.get("Authorization")})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def run():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        client = gc.GatewayClient(retry_max=3, retry_budget_ms=2000, backoff_base_ms=5, backoff_max_ms=20)
+
+        # Keep-alive: sequential calls share one pooled connection.
+        before = gc.gateway_stats()
+        for _ in range(5):
+            assert client.request("GET", f"{base}/ping", timeout=5).json()["ok"]
+        after = gc.gateway_stats()
+        assert after["connections_opened"] - before["connections_opened"] == 1, after
+        assert after["pool_hits"] - before["pool_hits"] == 4, after
+        assert client._timeout(25) == (client.connect_timeout, 25.0) and client._timeout(0.5) == (0.5, 0.5)
+
+        # Idempotent GETs retry transient 5xx within the budget; POSTs never do.
+        r = client.request("GET", f"{base}/flaky", timeout=5)
+        assert r.status_code == 200 and _Stub.hits["/flaky"] == 3
+        assert gc.gateway_stats()["retries"] - after["retries"] == 2
+        r = client.request("POST", f"{base}/down", json={}, timeout=5)
+        assert r.status_code == 503 and _Stub.hits["/down"] == 1
+        stats = gc.gateway_stats()
+        r = client.request("GET", f"{base}/down", timeout=5)
+        assert r.status_code == 503 and _Stub.hits["/down"] == 5  # 1 + retry_max
+        assert gc.gateway_stats()["retry_gave_up"] == stats["retry_gave_up"] + 1
+
+        # An exhausted time budget stops retrying even with retries left.
+        tight = gc.GatewayClient(retry_max=5, retry_budget_ms=0, backoff_base_ms=50)
+        assert tight.request("GET", f"{base}/down", timeout=5).status_code == 503 and _Stub.hits["/down"] == 6
+
+        # Transport errors are retried then re-raised.
+        try:
+            client.request("GET", "http://127.0.0.1:9/closed", timeout=1)
+            raise AssertionError("expected a connection error")
+        except gc.requests.ConnectionError:
+            pass
+
+        # The shared session never stores upstream cookies.
+        client.request("POST", f"{base}/api/auth/mock-login", json={}, timeout=5)
+        assert client.request("GET", f"{base}/cookie", timeout=5).json()["cookie"] is None
+
+        # App wiring: token + connector fetch go through the per-process client.
+        saved = (m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED, dict(m._coolbits_auth_cache))
+        m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = base, True
+        m._coolbits_auth_cache.clear()
+        gc.reset_gateway_client()
+        try:
+            payload, meta = m._google_ads_gateway_fetch(["/api/connectors/google-ads/campaigns"])
+            assert payload["auth"] == "Bearer stub-token" and meta["status"] == 200, (payload, meta)
+            payload, meta = m._stripe_gateway_fetch(["/down", "/api/billing/summary"])
+            assert meta["path"] == "/api/billing/summary" and payload["ok"], meta
+            assert gc.gateway_client() is gc.gateway_client()
+            ready = m.app.test_client().get("/readyz").get_json()
+            assert ready["checks"]["gateway"]["pool_hits"] >= 1, ready["checks"]["gateway"]
+        finally:
+            m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = saved[0], saved[1]
+            m._coolbits_auth_cache.clear()
+            m._coolbits_auth_cache.update(saved[2])
+            gc.reset_gateway_client()
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("Gateway client tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,156 @@
+"""Hedged gateway GETs: latency histograms, hedge after the tail quantile, rate cap (stub gateway on localhost)."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import gateway_cache
+import gateway_hedge as gh
+
+REPORT = "/api/connectors/ga4/report"
+
+
+class _TailGateway(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seen = []
+
+    def do_GET(self):
+        _TailGateway.seen.append(self.path)
+        if len(_TailGateway.seen) == 1:
+            time.sleep(2)  # the first attempt lands in the tail
+        raw = json.dumps({"data": {"overview": {"sessions": 42}}}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def _warm(path, seconds, n=20):
+    hist = gh.latency_histogram(path)
+    for _ in range(n):
+        hist.record(seconds)
+    return hist
+
+
+def run():
+    saved = (m.Config.GATEWAY_HEDGE, m.Config.GATEWAY_HEDGE_MAX_PCT)
+    m.Config.GATEWAY_HEDGE = True
+    gh.reset_hedging()
+    try:
+        # Histogram quantiles come from the log-spaced buckets.
+        hist = _warm("/h", 0.09, n=95)
+        for _ in range(5):
+            hist.record(4.0)
+        assert hist.quantile(50) == 0.1 and hist.quantile(95) == 0.1 and hist.quantile(99) == 5.0
+        assert gh.latency_histogram("/cold").hedge_delay() is None
+
+        # A slow first attempt is raced by a second one after ~p95; the fast one wins.
+        _warm("/x", 0.05)
+        calls = []
+
+        def slow_then_fast():
+            calls.append(1)
+            time.sleep(1.5 if len(calls) == 1 else 0.01)
+            return len(calls)
+
+        started = time.monotonic()
+        assert gh.hedged_call("/x", slow_then_fast) == 2
+        assert time.monotonic() - started < 0.5 and len(calls) == 2
+        stats = gh.hedge_stats()
+        assert stats["hedged"] == 1 and stats["hedge_wins"] == 1, stats
+
+        # Fast answers are never duplicated.
+        calls.clear()
+        assert gh.hedged_call("/x", lambda: calls.append(1) or "ok") == "ok" and len(calls) == 1
+
+        # The token bucket caps hedges: with no tokens left the slow primary is simply awaited.
+        calls.clear()
+        m.Config.GATEWAY_HEDGE_MAX_PCT = 0
+        started = time.monotonic()
+        assert gh.hedged_call("/x", lambda: calls.append(1) or time.sleep(0.3) or "slow") == "slow"
+        assert len(calls) == 1 and time.monotonic() - started >= 0.3
+        assert gh.hedge_stats()["rate_limited"] == 1
+        m.Config.GATEWAY_HEDGE_MAX_PCT = 5
+
+        # Errors from one attempt fall through to the other.
+        attempts = []
+
+        def fail_first():
+            attempts.append(1)
+            if len(attempts) == 1:
+                time.sleep(0.2)
+                raise RuntimeError("boom")
+            time.sleep(0.4)
+            return "second"
+
+        gh._TOKENS[0] = 1.0
+        assert gh.hedged_call("/x", fail_first) == "second"
+
+        # A fast rejected answer (429 / 5xx) does not end the race; with no accepted one, it is returned.
+        answers = []
+
+        def slow_ok_fast_503():
+            answers.append(1)
+            if len(answers) == 1:
+                time.sleep(0.4)
+                return (200, "ok")
+            return (503, "busy")
+
+        def ok(r):
+            return 200 <= r[0] < 500 and r[0] != 429
+
+        _warm("/r", 0.05)
+        gh._TOKENS[0] = 1.0
+        assert gh.hedged_call("/r", slow_ok_fast_503, accept=ok) == (200, "ok") and len(answers) == 2
+        gh._TOKENS[0] = 1.0
+        answers.clear()
+        busy = gh.hedged_call("/r", lambda: answers.append(1) or time.sleep(0.3) or (503, "busy"), accept=ok)
+        assert busy == (503, "busy") and len(answers) == 2
+
+        # Off by default: inline, but latency is still recorded.
+        m.Config.GATEWAY_HEDGE = False
+        before = gh.hedge_stats()["inline"]
+        assert gh.hedged_call("/y", lambda: "z") == "z"
+        assert gh.hedge_stats()["inline"] == before + 1 and gh.hedge_stats()["latency"]["/y"]["samples"] == 1
+        m.Config.GATEWAY_HEDGE = True
+
+        # App: the GA4 report read hedges through the real gateway client.
+        gh.reset_hedging()
+        _warm(REPORT, 0.05)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _TailGateway)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        app_saved = (m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED, dict(m._coolbits_auth_cache))
+        m.COOLBITS_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        m.COOLBITS_GATEWAY_ENABLED = True
+        m._coolbits_auth_cache.update({"token": "stub-token", "fetched_at": time.time()})
+        gateway_cache.clear()
+        try:
+            started = time.monotonic()
+            payload, gw = m._ga4_gateway_fetch([REPORT], params={"propertyId": "1"}, cache=False)
+            assert time.monotonic() - started < 1.0 and payload["data"]["overview"]["sessions"] == 42, gw
+            assert len(_TailGateway.seen) == 2 and _TailGateway.seen[0] == _TailGateway.seen[1]
+            hedging = m.app.test_client().get("/readyz").get_json()["checks"]["gateway"]["hedging"]
+            assert hedging["hedged"] == 1 and hedging["latency"][REPORT]["samples"] >= 21, hedging
+        finally:
+            m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = app_saved[0], app_saved[1]
+            m._coolbits_auth_cache.clear()
+            m._coolbits_auth_cache.update(app_saved[2])
+            gateway_cache.clear()
+            server.shutdown()
+            server.server_close()
+    finally:
+        m.Config.GATEWAY_HEDGE, m.Config.GATEWAY_HEDGE_MAX_PCT = saved
+        gh.reset_hedging()
+    print("Gateway hedge tests: OK")
+
+
+if __name__ == "__main__":
+    run()
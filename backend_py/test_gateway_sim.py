@@ -0,0 +1,113 @@
+"""Gateway simulator: mock-dataset answers, token revocation, slow-drip SSE, latency and error injection (app against the simulator)."""
+import random
+import time
+
+import requests
+
+import app as m
+import circuit_breaker as cb
+import gateway_cache
+import gateway_client as gc
+import gateway_sim as gs
+
+REPORT = "/api/connectors/ga4/report"
+
+
+def run():
+    m.init_db()
+
+    # Latency specs.
+    rng = random.Random(1)
+    assert gs.parse_latency("fixed:250")(rng) == 0.25
+    assert 0.1 <= gs.parse_latency("uniform:100:200")(rng) <= 0.2
+    tail = gs.parse_latency("tail:10:5000:10")
+    samples = [tail(rng) for _ in range(2000)]
+    assert set(samples) == {0.01, 5.0} and 100 < samples.count(5.0) < 300
+    for bad in ("lognormal:300", "gamma:1:2", "fixed:x"):
+        try:
+            gs.parse_latency(bad)
+            raise AssertionError(f"expected ValueError for {bad}")
+        except ValueError:
+            pass
+
+    server, url = gs.start_simulator(seed=7)
+    sim = server.sim
+    saved = (m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED, dict(m._coolbits_auth_cache), m.Config.GATEWAY_RETRY_MAX)
+    m.COOLBITS_URL = url
+    m.COOLBITS_GATEWAY_ENABLED = True
+    m.Config.GATEWAY_RETRY_MAX = 0
+    m._coolbits_auth_cache.clear()
+    gc.reset_gateway_client()
+    gateway_cache.clear()
+    cb.reset_breakers()
+    c = m.app.test_client()
+    headers = {"X-User-ID": "990901"}
+    try:
+        # Reports come back from the mock datasets through the real gateway path.
+        body = c.get("/api/connectors/ga4/dashboard?property_id=G-ABC123DEF4", headers=headers).get_json()
+        assert body["source"] == "coolbits" and set(body["sections"].values()) == {"batched"}, body.get("sections")
+        assert body["overview"]["sessions"] == m.GA4_MOCK_OVERVIEW["G-ABC123DEF4"]["sessions"]
+        body = c.get("/api/connectors/google-ads/campaigns?account_id=234-567-8901", headers=headers).get_json()
+        assert body["source"] == "coolbits" and [x["id"] for x in body["campaigns"]] == ["c-2001", "c-2002"], body
+        stats = sim.snapshot()["routes"]
+        assert stats["POST /api/auth/mock-login"]["calls"] == 1 and stats[f"GET {REPORT}"]["200"] == 1, stats
+        assert m._coolbits_tokens.expires_at() > time.time() + 3600
+
+        # Revoked service tokens get a 401; the app logs in again and the read still succeeds.
+        sim.revoke()
+        time.sleep(0.01)
+        payload, gw = m._ga4_gateway_fetch([REPORT], params={"propertyId": "G-MOB987XYZ1", "blocks": "overview"}, cache=False)
+        assert payload["data"]["overview"]["sessions"] == m.GA4_MOCK_OVERVIEW["G-MOB987XYZ1"]["sessions"], gw
+        stats = sim.snapshot()["routes"]
+        assert stats["POST /api/auth/mock-login"]["calls"] == 2 and stats[f"GET {REPORT}"]["401"] == 1, stats
+
+        # Streamed /llm answers drip a synthetic reply in small SSE events.
+        sim.configure({"drip_ms": 20, "drip_words": 2})
+        started = time.monotonic()
+        with m.app.test_request_context(headers=headers):
+            parts = list(m._stream_real_agent_response(agent_slug="ceo-strategy", ws_slug="business",
+                                                       user_message="Plan my quarter", recent_history=[]))
+        elapsed = time.monotonic() - started
+        assert len(parts) > 2 and "".join(parts).strip() in gs._agent_replies("ceo-strategy"), parts
+        assert elapsed >= 0.02 * len(parts), elapsed
+        sim.configure({"drip_ms": 0})
+
+        # Per-family latency.
+        sim.configure({"route_latency": {"ga4": "fixed:300"}})
+        started = time.monotonic()
+        m._ga4_gateway_fetch([REPORT], params={"propertyId": "G-ABC123DEF4", "blocks": "overview"}, cache=False)
+        assert time.monotonic() - started >= 0.3
+        started = time.monotonic()
+        status, payload, _ = m._coolbits_request("GET", "/api/billing/summary", timeout=5)
+        assert status == 200 and payload["stripe"]["status"] == "active" and time.monotonic() - started < 0.3
+        sim.configure({"route_latency": {}})
+
+        # Injected 503s open the family's breaker.
+        sim.configure({"error_rate": 1.0})
+        for _ in range(m.Config.GATEWAY_BREAKER_MIN_CALLS):
+            m._ga4_gateway_fetch([REPORT], params={"propertyId": "G-ABC123DEF4"}, cache=False)
+        assert cb.breaker_stats()["ga4"]["state"] == "open"
+        assert cb.breaker_stats()["ga4"]["short_circuited"] >= 1
+        assert sim.snapshot()["routes"][f"GET {REPORT}"]["503"] < m.Config.GATEWAY_BREAKER_MIN_CALLS
+        sim.configure({"error_rate": 0.0})
+
+        # Admin endpoints.
+        assert requests.post(f"{url}/__sim/config", json={"latency": "nope"}, timeout=5).status_code == 400
+        assert requests.post(f"{url}/__sim/config", json={"error_status": 429}, timeout=5).json()["config"]["error_status"] == 429
+        assert requests.post(f"{url}/__sim/reset", timeout=5).json()["ok"]
+        assert requests.get(f"{url}/__sim/stats", timeout=5).json()["routes"] == {}
+    finally:
+        m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = saved[0], saved[1]
+        m._coolbits_auth_cache.clear()
+        m._coolbits_auth_cache.update(saved[2])
+        m.Config.GATEWAY_RETRY_MAX = saved[3]
+        gc.reset_gateway_client()
+        gateway_cache.clear()
+        cb.reset_breakers()
+        server.shutdown()
+        server.server_close()
+    print("Gateway simulator tests: OK")
+
+
+if __name__ == "__main__":
+    run()
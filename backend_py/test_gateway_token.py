@@ -0,0 +1,144 @@
+"""Gateway token manager: JWT expiry, coalesced login, background refresh, cached /api/auth/me (stub gateway)."""
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import gateway_token as gt
+
+
+def _jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({"sub": "svc", "exp": exp}).encode()).decode().rstrip("=")
+    return f"eyJhbGciOiJIUzI1NiJ9.{claims}.sig"
+
+
+class _AuthGateway(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = {"login": 0, "me": 0}
+
+    def _send(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        _AuthGateway.hits["login"] += 1
+        time.sleep(0.2)
+        self._send(200, {"token": _jwt(time.time() + 30 * 86400)})
+
+    def do_GET(self):
+        _AuthGateway.hits["me"] += 1
+        if self.headers.get("Authorization") != "Bearer user-token":
+            self._send(401, {"error": "unauthorized"})
+            return
+        self._send(200, {"user": {"email": "u@example.com", "name": "U"}})
+
+    def log_message(self, *args):
+        pass
+
+
+def run():
+    assert abs(gt.jwt_expiry(_jwt(1234567890)) - 1234567890) < 1e-6
+    assert gt.jwt_expiry("stub-token") is None and gt.jwt_expiry("a.!!!.c") is None
+
+    logins = []
+
+    def login():
+        logins.append(1)
+        time.sleep(0.2)
+        return _jwt(time.time() + 7200) if len(logins) < 10 else None
+
+    # Concurrent callers without a token share one login.
+    tm = gt.TokenManager(login)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(tm.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(logins) == 1 and len(set(got)) == 1 and got[0], got
+    first = got[0]
+
+    # Inside the refresh margin the valid token is served at once and refreshed in the background.
+    tm.state["token"] = _jwt(time.time() + 60)
+    soon = tm.state["token"]
+    started = time.monotonic()
+    assert tm.get() == soon and tm.get() == soon
+    assert time.monotonic() - started < 0.1
+    time.sleep(0.4)
+    assert len(logins) == 2 and tm.state["token"] not in (soon, first)
+    assert tm.snapshot()["background_refreshes"] == 1 and tm.snapshot()["expires_in_s"] > 3600
+
+    # A 401 re-logs in only while the rejected token is still current.
+    current = tm.state["token"]
+    assert tm.get(rejected="some-older-token") == current and len(logins) == 2
+    assert tm.get(rejected=current) != current and len(logins) == 3
+
+    # Expired or missing: the caller waits for a login; a failed background refresh keeps the old token.
+    tm.state.update({"token": _jwt(time.time() - 5), "fetched_at": time.time()})
+    assert tm.get() and len(logins) == 4
+    logins.extend([1] * 5)  # next login returns no token
+    tm.state["token"] = _jwt(time.time() + 60)
+    kept = tm.state["token"]
+    assert tm.get() == kept
+    time.sleep(0.4)
+    assert tm.state["token"] == kept and tm.snapshot()["refresh_errors"] == 1
+    # Tokens without `exp` (e.g. opaque ones) live GATEWAY_TOKEN_FALLBACK_TTL_S from their fetch.
+    tm.state.update({"token": "opaque", "fetched_at": time.time()})
+    assert tm.get() == "opaque"
+
+    # App: service token and /api/auth/me validations against a stub gateway.
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AuthGateway)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = (m.COOLBITS_URL, dict(m._coolbits_auth_cache), m.Config.GATEWAY_AUTH_ME_TTL_S)
+    m.COOLBITS_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    m._coolbits_auth_cache.clear()
+    m._coolbits_auth_me_cache.clear()
+    try:
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(m._coolbits_get_token())) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert _AuthGateway.hits["login"] == 1 and len(set(tokens)) == 1, (_AuthGateway.hits, tokens)
+        assert m._coolbits_get_token() == tokens[0] and _AuthGateway.hits["login"] == 1
+        assert m._coolbits_get_token(force=True) != tokens[0] and _AuthGateway.hits["login"] == 2
+
+        assert m._coolbits_auth_me("user-token")["email"] == "u@example.com"
+        assert m._coolbits_auth_me("user-token")["email"] == "u@example.com"
+        assert _AuthGateway.hits["me"] == 1
+        for _ in range(2):  # failures are not cached
+            try:
+                m._coolbits_auth_me("bad-token")
+                raise AssertionError("expected auth failure")
+            except RuntimeError as e:
+                assert "401" in str(e)
+        assert _AuthGateway.hits["me"] == 3
+        m.Config.GATEWAY_AUTH_ME_TTL_S = 0
+        m._coolbits_auth_me_cache.clear()
+        m._coolbits_auth_me("user-token")
+        m._coolbits_auth_me("user-token")
+        assert _AuthGateway.hits["me"] == 5
+
+        token_stats = m.app.test_client().get("/readyz").get_json()["checks"]["gateway"]["token"]
+        assert token_stats["has_token"] and token_stats["logins"] >= 2 and token_stats["auth_me_cache"]["hits"] == 1
+    finally:
+        m.COOLBITS_URL = saved[0]
+        m._coolbits_auth_cache.clear()
+        m._coolbits_auth_cache.update(saved[1])
+        m.Config.GATEWAY_AUTH_ME_TTL_S = saved[2]
+        m._coolbits_auth_me_cache.clear()
+        server.shutdown()
+        server.server_close()
+    print("Gateway token tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,112 @@
+"""Bounded fan-out for Google Ads name enrichment and multi-account campaigns (local test client, gateway stubbed)."""
+import threading
+import time
+
+import app as m
+import gateway_cache
+import gateway_client as gc
+
+RUN_ID = int(time.time())
+UID = RUN_ID * 10 + 1  # fresh user per run: account names persist in google_ads_account_names
+
+def run():
+    m.init_db()
+
+    # fan_out: at most `limit` in flight, partial results at the deadline.
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def task(delay, value):
+        def _run():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(delay)
+            with lock:
+                active[0] -= 1
+            if value is None:
+                raise RuntimeError("boom")
+            return value
+        return _run
+
+    started = time.monotonic()
+    results, errors, pending = gc.fan_out({i: task(0.1, i) for i in range(6)}, limit=3)
+    assert results == {i: i for i in range(6)} and not errors and not pending
+    assert peak[0] == 3 and time.monotonic() - started < 0.5, peak
+    results, errors, pending = gc.fan_out({"ok": task(0.01, 1), "bad": task(0.01, None), "slow": task(1.0, 2)}, deadline=0.3)
+    assert results == {"ok": 1} and list(errors) == ["bad"] and pending == ["slow"], (results, errors, pending)
+
+    # Enrichment: placeholder names resolved in parallel, then served from google_ads_account_names.
+    ids = [f"{100 + i}-000-000{i}" for i in range(8)]
+    reports = []
+
+    def fake_live(path_candidates, params=None, timeout=25):
+        params = params or {}
+        if "keywords" in path_candidates[0]:
+            reports.append(params.get("account_id"))
+            return {"data": {"keywords": {"rows": []}}}, {"enabled": True, "status": 200}
+        if "report" not in path_candidates[0]:
+            return {"accounts": [{"id": aid, "name": f"Account {aid}"} for aid in ids]}, {"enabled": True, "status": 200}
+        aid = params.get("account_id")
+        reports.append(aid)
+        time.sleep(1.5 if aid == "slow-1" else 0.2)
+        if params.get("preset") == "campaigns":
+            rows = [{"id": f"c-{aid}", "name": f"Campaign {aid}", "clicks": 10, "impressions": 100, "cost": 5}]
+            return {"data": {"campaigns": {"rows": rows}}}, {"enabled": True, "status": 200}
+        return {"data": {"overview": {"accountName": f"Client {aid}"}}}, {"enabled": True, "status": 200}
+
+    saved = (m.COOLBITS_GATEWAY_ENABLED, m._google_ads_gateway_fetch_live, m.Config.GOOGLE_ADS_FANOUT_DEADLINE_MS,
+             m._google_ads_set_active_customer)
+    m.COOLBITS_GATEWAY_ENABLED = True
+    m._google_ads_set_active_customer = lambda account_id, mcc_id: {"enabled": True, "status": 200}
+    m._google_ads_gateway_fetch_live = fake_live
+    hdr = {"X-User-ID": str(UID)}
+    try:
+        client = m.app.test_client()
+        started = time.monotonic()
+        body = client.get("/api/connectors/google-ads/accounts", headers=hdr).get_json()
+        elapsed = time.monotonic() - started
+        assert sorted(a["name"] for a in body["accounts"]) == sorted(f"Client {aid}" for aid in ids), body
+        assert body["enrichment"] == {"stored": 0, "fetched": 8, "pending": 0}, body["enrichment"]
+        assert len(reports) == 8 and elapsed < 8 * 0.2, elapsed
+        conn = m.get_db()
+        stored = conn.execute("SELECT COUNT(*) FROM google_ads_account_names WHERE user_id = ?", (UID,)).fetchone()[0]
+        conn.close()
+        assert stored == 8
+
+        gateway_cache.clear()
+        reports.clear()
+        body = client.get("/api/connectors/google-ads/accounts", headers=hdr).get_json()
+        assert body["enrichment"]["stored"] == 8 and reports == [], body["enrichment"]
+        assert body["accounts"][0]["name"].startswith("Client ")
+
+        # Multi-account campaigns: parallel reads, slow accounts reported as pending.
+        m.Config.GOOGLE_ADS_FANOUT_DEADLINE_MS = 700
+        reports.clear()
+        body = client.get("/api/connectors/google-ads/campaigns/multi?account_ids=1110000001,222-000-0002,slow-1",
+                          headers=hdr).get_json()
+        assert body["account_ids"] == ["111-000-0001", "222-000-0002", "slow-1"], body
+        assert set(body["accounts"]) == {"111-000-0001", "222-000-0002"} and body["pending"] == ["slow-1"]
+        assert body["partial"] is True and body["source"] == "coolbits"
+        assert body["summary"]["total_clicks"] == 20 and body["summary"]["total_campaigns"] == 2, body["summary"]
+        assert body["accounts"]["111-000-0001"]["campaigns"][0]["id"] == "c-111-000-0001"
+        assert client.get("/api/connectors/google-ads/campaigns/multi", headers=hdr).status_code == 400
+
+        # Keywords for the same campaign under two accounts are cached separately.
+        reports.clear()
+        for aid in ("111-000-0001", "222-000-0002", "111-000-0001"):
+            client.get(f"/api/connectors/google-ads/keywords?campaign_id=c-1&account_id={aid}", headers=hdr)
+        assert reports == ["111-000-0001", "222-000-0002"], reports
+
+        m.COOLBITS_GATEWAY_ENABLED = False
+        body = client.get("/api/connectors/google-ads/campaigns/multi?account_ids=123-456-7890", headers=hdr).get_json()
+        assert body["source"] == "mock" and body["accounts"]["123-456-7890"]["campaigns"], body
+    finally:
+        (m.COOLBITS_GATEWAY_ENABLED, m._google_ads_gateway_fetch_live, m.Config.GOOGLE_ADS_FANOUT_DEADLINE_MS,
+         m._google_ads_set_active_customer) = saved
+        gateway_cache.clear()
+    print("Google Ads fan-out tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,97 @@
+"""BM25 knowledge-base retrieval (temp knowledge.db + local test client)."""
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import app as m
+import knowledge_index as ki
+import models
+
+
+CHUNKS_DDL = """
+    CREATE TABLE chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chunk_id TEXT UNIQUE,
+        title TEXT,
+        summary TEXT,
+        content TEXT,
+        source TEXT,
+        timestamp TEXT
+    )
+"""
+
+
+def _insert(conn, chunk_id, title, summary, content, verb="INSERT OR IGNORE"):
+    conn.execute(
+        f"{verb} INTO chunks (chunk_id, title, summary, content, source) VALUES (?, ?, ?, ?, 'test.pdf')",
+        (chunk_id, title, summary, content),
+    )
+
+
+def run():
+    kb_path = Path(tempfile.mkdtemp(prefix="camarad-kb-")) / "knowledge.db"
+    conn = sqlite3.connect(kb_path)
+    conn.execute(CHUNKS_DDL)
+    # Long filler chunk: the old LENGTH(content) ordering always put this first.
+    _insert(conn, "c1", "Company history", "Background.", "marketing " + ("lorem ipsum " * 400))
+    _insert(conn, "c2", "Generative AI in marketing personalization", "Personalization at scale.",
+            "Generative AI lets marketing teams personalize campaigns for every segment.")
+    _insert(conn, "c3", "Sales productivity", "Sales teams.", "Personalization helps sales follow-ups.")
+    conn.commit()
+
+    # Rows written before the index existed are picked up by the hook.
+    added, removed = ki.sync_chunk_index(conn)
+    conn.commit()
+    assert (added, removed) == (3, 0), (added, removed)
+
+    rows = ki.search_chunks(conn, "How does generative AI personalization help marketing?", top_k=3)
+    assert rows[0]["title"].startswith("Generative AI"), [r["title"] for r in rows]
+    assert rows[0]["score"] < rows[-1]["score"]  # bm25: lower is better
+
+    # Title weight: a title hit outranks the same term buried in content.
+    rows = ki.search_chunks(conn, "sales", top_k=2)
+    assert rows[0]["title"] == "Sales productivity", rows
+
+    # INSERT OR REPLACE skips delete triggers; the sync hook removes the stale entry.
+    _insert(conn, "c3", "Sales enablement", "Sales teams.", "Enablement playbooks.", verb="INSERT OR REPLACE")
+    added, removed = ki.sync_chunk_index(conn)
+    conn.commit()
+    assert removed == 1, (added, removed)
+    assert conn.execute("SELECT COUNT(*) FROM chunks_fts").fetchone()[0] == 3
+    assert [r["title"] for r in ki.search_chunks(conn, "enablement")] == ["Sales enablement"]
+    assert ki.search_chunks(conn, "follow") == []
+
+    # Triggers cover ordinary writes without a sync.
+    _insert(conn, "c4", "Pricing", "Pricing.", "Dynamic pricing experiments.")
+    conn.commit()
+    assert ki.search_chunks(conn, "pricing")[0]["title"] == "Pricing"
+    conn.close()
+
+    original_path = models.DB_PATH
+    models.DB_PATH = kb_path
+    try:
+        ctx = models.get_rag_context("generative personalization", top_k=1)
+        assert ctx.startswith("Relevant knowledge from reports:") and "Generative AI in marketing" in ctx, ctx[:200]
+        assert models.get_rag_context("zzzz-nothing") == ""
+    finally:
+        models.DB_PATH = original_path
+
+    # /api/rag/search ranks camarad.db chunks the same way.
+    m.init_db()
+    db = m.get_db()
+    db.execute("DELETE FROM chunks WHERE chunk_id LIKE 'kbtest-%'")
+    _insert(db, "kbtest-1", "Retention cohorts", "Cohorts.", "retention " + ("filler " * 300))
+    _insert(db, "kbtest-2", "Churn and retention playbook", "Retention.", "Reduce churn with retention offers.")
+    db.commit()
+    db.close()
+    r = m.app.test_client().get("/api/rag/search?q=churn retention&limit=2")
+    assert r.status_code == 200, r.get_data(as_text=True)[:240]
+    titles = [x["title"] for x in r.get_json()]
+    assert titles[0] == "Churn and retention playbook", titles
+    os.remove(kb_path)
+    print("Knowledge index tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,83 @@
+"""Versioned schema migration tests (temp database, no server needed)."""
+import os
+import sqlite3
+import tempfile
+
+import database as dbm
+import migrations as mig
+from config import Config
+
+
+def _columns(conn, table_name):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table_name})").fetchall()}
+
+
+def run():
+    tmpdir = tempfile.mkdtemp(prefix="camarad-mig-")
+    legacy_path = os.path.join(tmpdir, "legacy.db")
+
+    # A pre-migration database: old agents_config uniqueness, no client_id, no ledger.
+    legacy = sqlite3.connect(legacy_path)
+    legacy.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, is_premium BOOLEAN DEFAULT FALSE);
+        CREATE TABLE agents_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER DEFAULT 1,
+            agent_slug TEXT NOT NULL,
+            custom_name TEXT,
+            UNIQUE(user_id, agent_slug)
+        );
+        INSERT INTO users (id, username) VALUES (42, 'legacy');
+        INSERT INTO agents_config (user_id, agent_slug, custom_name) VALUES (42, 'life-coach', NULL);
+    """)
+    legacy.commit()
+    legacy.close()
+
+    original_db = Config.DATABASE
+    Config.DATABASE = legacy_path
+    try:
+        conn = dbm.get_db()
+        assert not mig.schema_is_current(conn)
+        applied = mig.apply_migrations(conn)
+        assert applied == [v for v, _, _ in mig.MIGRATIONS], applied
+        assert mig.schema_version(conn) == mig.LATEST_VERSION
+        assert mig.apply_migrations(conn) == []  # idempotent
+
+        recorded = [r[0] for r in conn.execute("SELECT version FROM schema_migrations ORDER BY version").fetchall()]
+        assert recorded == [v for v, _, _ in mig.MIGRATIONS], recorded
+        assert "client_id" in _columns(conn, "agents_config")
+        assert {"email", "auth_provider", "last_login_at"} <= _columns(conn, "users")
+        assert {"billable_usd", "ct_actual_debit", "phase3_applied"} <= _columns(conn, "usage_ledger")
+        for table_name in ("oauth_states", "flow_executions", "executions", "meetings", "pricing_catalog", "ct_rates"):
+            assert dbm._table_exists(conn, table_name), table_name
+
+        # Legacy rows survive the per-client rebuild and pick up the branding step.
+        row = conn.execute("SELECT client_id, custom_name FROM agents_config WHERE user_id = 42").fetchone()
+        assert row["client_id"] == 0 and row["custom_name"] == "Personal Assistant", tuple(row)
+        conn.execute("INSERT INTO agents_config (user_id, client_id, agent_slug) VALUES (42, 7, 'life-coach')")
+        conn.rollback()
+
+        seeded = conn.execute("SELECT COUNT(*) FROM pricing_catalog").fetchone()[0]
+        assert seeded >= 5, seeded
+
+        # ensure_schema is a no-op once current (no writes, no new versions).
+        mig.ensure_schema(conn)
+        mig.ensure_schema(conn)
+        assert conn.execute("SELECT COUNT(*) FROM pricing_catalog").fetchone()[0] == seeded
+        conn.close()
+
+        # A fresh database goes from empty to latest via init_db().
+        Config.DATABASE = os.path.join(tmpdir, "fresh.db")
+        dbm.init_db()
+        conn = dbm.get_db()
+        assert mig.schema_version(conn) == mig.LATEST_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE id IN (1, 2, 3)").fetchone()[0] == 3
+        conn.close()
+    finally:
+        Config.DATABASE = original_db
+
+    print("Schema migration tests: OK")
+
+
+if __name__ == "__main__":
+    run()
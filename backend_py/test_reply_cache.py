@@ -0,0 +1,142 @@
+"""Opt-in per-agent reply cache: keys, skip rules, TTLs, LRU tiers, ledger tagging (local test client)."""
+import json
+
+import app as m
+import reply_cache as rc
+
+
+def _units():
+    assert rc.normalize("  What can you DO\n for me?! ") == "what can you do for me"
+    ctx = {"client_name": "Acme", "connected_connectors": ["Google Ads", "GA4"]}
+    key = rc.make_key("ppc-specialist", "business", "What can you do?", ctx)
+    assert key == rc.make_key("ppc-specialist", "business", "what can you do", {"client_name": "Acme", "connected_connectors": ["GA4", "Google Ads"]})
+    assert key != rc.make_key("ppc-specialist", "business", "what can you do", {"client_name": "Acme", "connected_connectors": ["GA4"]})
+    assert key != rc.make_key("seo-specialist", "business", "what can you do", ctx)
+    for personal in ("My name is Ana", "email me at ana@example.com", "How did we do today?", "Check order 12345",
+                     "see https://example.com", "x" * (m.Config.REPLY_CACHE_MAX_CHARS + 1)):
+        assert not rc.cacheable(personal), personal
+    assert rc.cacheable("What can you do for our campaigns?")
+
+    saved = m.Config.REPLY_CACHE_AGENT_TTLS
+    m.Config.REPLY_CACHE_AGENT_TTLS = "ppc-specialist=60, life-coach=0,bad=x"
+    try:
+        assert rc.ttl_for("ppc-specialist") == 60 and rc.ttl_for("life-coach") == 0
+        assert rc.ttl_for("ceo-strategy") == m.Config.REPLY_CACHE_TTL_S
+        assert not rc.put("k-off", "life-coach", "personal", "hello", "mock", "simulate_response")
+    finally:
+        m.Config.REPLY_CACHE_AGENT_TTLS = saved
+
+    # Memory tier misses fall through to SQLite; the table is pruned least-recently-hit first.
+    saved = m.Config.REPLY_CACHE_DB_MAX_ROWS
+    m.Config.REPLY_CACHE_DB_MAX_ROWS = 3
+    try:
+        rc.invalidate()
+        for i in range(5):
+            assert rc.put(f"k{i}", "ceo-strategy", "business", f"reply {i}", "mock", "simulate_response")
+        conn = m.get_db()
+        keys = [r[0] for r in conn.execute("SELECT key FROM reply_cache ORDER BY key")]
+        conn.close()
+        assert keys == ["k2", "k3", "k4"], keys
+        rc.invalidate("seo-specialist")  # clears the memory tier, keeps ceo-strategy rows
+        before = rc.reply_cache_stats()
+        assert rc.get("k4")["response"] == "reply 4" and rc.get("k4")["response"] == "reply 4"
+        after = rc.reply_cache_stats()
+        assert after["db_hits"] == before["db_hits"] + 1 and after["hits"] == before["hits"] + 1
+        assert rc.get("k0") is None
+    finally:
+        m.Config.REPLY_CACHE_DB_MAX_ROWS = saved
+        rc.invalidate()
+
+
+def _ledger(request_id):
+    assert m._usage_writer.flush()
+    conn = m.get_db()
+    row = conn.execute("SELECT provider, model, meta_json FROM usage_ledger WHERE request_id = ?", (request_id,)).fetchone()
+    conn.close()
+    return row["provider"], row["model"], json.loads(row["meta_json"])
+
+
+def run():
+    m.init_db()
+    _units()
+
+    uid = 990981
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'cache-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.commit()
+    conn.close()
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid)}
+
+    calls = []
+    original_simulate = m.simulate_response
+
+    def counting_simulate(agent_slug, message):
+        calls.append(message)
+        return original_simulate(agent_slug, message)
+
+    def post(message, request_id, headers=headers, **extra):
+        conv_id = m.create_new_conversation(uid, "business", "ceo-strategy")
+        body = {"message": message, "conv_id": conv_id, "request_id": request_id, **extra}
+        r = c.post("/chat/business/ceo-strategy", json=body, headers=headers)
+        assert r.status_code == 200, r.get_data(as_text=True)
+        return conv_id, r.get_json()
+
+    saved = (m.Config.REPLY_CACHE, m._stream_real_agent_response, set(m.REAL_AGENT_SLUGS))
+    m.Config.REPLY_CACHE = True
+    m.simulate_response = counting_simulate
+    m.REAL_AGENT_SLUGS.discard("ceo-strategy")  # mock replies for the first part
+    try:
+        # Same starter prompt, different wording: the second one is served from the cache.
+        _, first = post("What should our strategy focus on this quarter?", "cache-1")
+        conv_id, second = post("what should our STRATEGY focus on this quarter", "cache-2")
+        assert len(calls) == 1 and second["response"] == first["response"], calls
+        assert m.get_messages(conv_id)[-1] == {"role": "agent", "content": second["response"]}
+        provider, model, meta = _ledger("cache-2")
+        assert provider == "cache" and model == "simulate_response", (provider, model)
+        assert meta["reply_cache"]["hit"] and meta["reply_cache"]["source_provider"] == "mock", meta
+        assert _ledger("cache-1")[0] == "mock" and _ledger("cache-1")[2]["reply_cache"] == {"hit": False, "stored": True}
+
+        # Follow-ups in a conversation, explicit opt-outs and personal messages always generate.
+        c.post("/chat/business/ceo-strategy", json={"message": "What should our strategy focus on this quarter?",
+                                                   "conv_id": conv_id}, headers=headers)
+        post("What should our strategy focus on this quarter?", "cache-3", cache=False)
+        post("What should our strategy focus on this quarter?", "cache-4", headers=dict(headers, **{"Cache-Control": "no-cache"}))
+        post("My name is Ana, what should our strategy be?", "cache-5")
+        assert len(calls) == 5, calls
+        assert _ledger("cache-3")[0] == "mock"
+
+        # Streaming real agents: the cached reply is replayed as SSE tokens.
+        streamed = []
+
+        def real_stream(**kwargs):
+            streamed.append(kwargs["user_message"])
+            yield from ("Focus ", "on ", "retention.")
+
+        m._stream_real_agent_response = real_stream
+        m.REAL_AGENT_SLUGS.add("ppc-specialist")
+        for request_id in ("cache-s1", "cache-s2"):
+            conv = m.create_new_conversation(uid, "business", "ppc-specialist")
+            r = c.post("/chat/business/ppc-specialist", json={"message": "Where should we focus?", "conv_id": conv,
+                                                              "request_id": request_id},
+                       headers=dict(headers, Accept="text/event-stream"))
+            text = r.get_data(as_text=True)
+            assert "event: done" in text and "retention." in text, text
+        assert streamed == ["Where should we focus?"], streamed
+        assert _ledger("cache-s2")[0] == "cache" and _ledger("cache-s1")[0] == "vertex"
+
+        stats = c.get("/readyz").get_json()["checks"]["reply_cache"]
+        assert stats["enabled"] and stats["stores"] >= 2 and stats["hits"] >= 2, stats
+    finally:
+        m.Config.REPLY_CACHE = saved[0]
+        m.simulate_response = original_simulate
+        m._stream_real_agent_response = saved[1]
+        m.REAL_AGENT_SLUGS.clear()
+        m.REAL_AGENT_SLUGS.update(saved[2])
+        rc.invalidate()
+    print("Reply cache tests: OK")
+
+
+if __name__ == "__main__":
+    run()
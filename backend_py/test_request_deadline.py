@@ -0,0 +1,141 @@
+"""Request deadlines: per-route budget, header override, capped gateway timeouts, skipped stages (local test client)."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import circuit_breaker as cb
+import gateway_client as gc
+import request_deadline as rd
+
+
+class _SlowGateway(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.endswith("/llm"):
+            time.sleep(3)
+            body = {"text": "too late"}
+        else:
+            body = {"runId": "run-slow"}
+        raw = json.dumps(body).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def run():
+    m.init_db()
+
+    # Budget parsing and timeout capping.
+    assert rd.parse_budget_ms("2500", 100) == 2500 and rd.parse_budget_ms("junk", 100) == 100
+    assert rd.parse_budget_ms(None, None) is None and rd.parse_budget_ms("-5", 7) == 7
+    assert rd.parse_budget_ms(str(10 ** 9)) == m.Config.REQUEST_DEADLINE_MAX_MS
+    d = rd.Deadline(2000, reserve_ms=500)
+    timeout, capped = d.cap(60)
+    assert capped and 1.4 < timeout <= 1.5, timeout
+    (connect, read), capped = d.cap((0.5, 60))
+    assert capped and connect == 0.5 and read <= timeout
+    assert d.cap(1) == (1.0, False)
+    assert d.allows("fits", need_ms=1000) and not d.allows("docs_context", need_ms=1600)
+    spent = rd.Deadline(100, reserve_ms=500)
+    try:
+        spent.cap(20, stage="gateway:runs")
+        raise AssertionError("expected DeadlineExceeded")
+    except rd.DeadlineExceeded as e:
+        assert str(e) == "deadline_exceeded:gateway:runs"
+    assert spent.snapshot()["skipped"] == ["gateway:runs"] and d.snapshot()["skipped"] == ["docs_context"]
+    assert m.get_api_docs_context("google ads budget", ["google-ads"], deadline=spent) == ""
+
+    # A deadline already behind us stops gateway retries.
+    client = gc.GatewayClient(retry_max=5, backoff_base_ms=1, backoff_max_ms=1)
+    before = gc.gateway_stats()["retries"]
+    try:
+        client.request("GET", "http://127.0.0.1:9/x", timeout=1, deadline=time.monotonic())
+    except Exception:
+        pass
+    assert gc.gateway_stats()["retries"] == before
+    client.close()
+
+    uid = 990801
+    conn = m.get_db()
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, 'deadline-user', 0)", (uid,))
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.commit()
+    conn.close()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowGateway)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = (m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED, dict(m._coolbits_auth_cache), set(m.REAL_AGENT_SLUGS),
+             m.Config.DEADLINE_MIN_STAGE_MS)
+    m.COOLBITS_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    m.COOLBITS_GATEWAY_ENABLED = True
+    m._coolbits_auth_cache.update({"token": "stub-token", "fetched_at": time.time()})
+    m.REAL_AGENT_SLUGS.add("ceo-strategy")
+    m.Config.DEADLINE_MIN_STAGE_MS = 300
+    cb.reset_breakers()
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid)}
+    try:
+        # Too little budget for a real-agent call: straight to the fallback reply.
+        body = c.post("/chat/business/ceo-strategy", json={"message": "hi"},
+                      headers=dict(headers, **{rd.HEADER: "700"})).get_json()
+        assert body["response"] and body["deadline"]["budget_ms"] == 700, body
+        assert body["deadline"]["skipped"] == ["real_agent"], body["deadline"]
+
+        # The /llm call is cut at the budget, the reply falls back, the timeout is not blamed on the gateway.
+        started = time.monotonic()
+        body = c.post("/chat/business/ceo-strategy", json={"message": "Plan my quarter"},
+                      headers=dict(headers, **{rd.HEADER: "1500"})).get_json()
+        elapsed = time.monotonic() - started
+        assert elapsed < 2.0 and body["response"] and "too late" not in body["response"], (elapsed, body)
+        assert body["deadline"]["budget_ms"] == 1500 and body["deadline"]["remaining_ms"] < 400, body["deadline"]
+        runs = cb.breaker_stats()["runs"]
+        assert runs["state"] == "closed" and runs["timeouts"] == 0 and runs["calls"] == 1, runs
+
+        # Orchestrator: live connector snapshots are skipped once the budget is gone.
+        flow = {
+            "nodes": [
+                {"id": "t", "type": "trigger", "label": "Start", "config": {}},
+                {"id": "g", "type": "connector", "label": "GA4", "slug": "ga4", "config": {}},
+            ],
+            "connections": [{"from": "t", "to": "g"}],
+        }
+        created = c.post("/api/clients", json={"type": "company", "company_name": "deadline-co",
+                                               "email": "deadline-co@example.com"}, headers=headers).get_json()
+        scoped = dict(headers, **{"X-Client-ID": str(created["client"]["id"]), rd.HEADER: "50"})
+        body = c.post("/api/orchestrator/execute", json={"flow": flow}, headers=scoped).get_json()
+        ga4_step = [s for s in body["steps"] if s["type"] == "connector"][0]
+        assert ga4_step["status"] == "warning" and ga4_step["fail_reason"] == "deadline_skipped", ga4_step
+        assert body["deadline"]["skipped"] == ["connector_snapshot:ga4"], body["deadline"]
+        assert "deadline" not in c.get("/api/connectors/ga4/overview", headers=headers).get_json()
+
+        # Without the header the route default applies.
+        m.REAL_AGENT_SLUGS.discard("ceo-strategy")
+        body = c.post("/chat/business/ceo-strategy", json={"message": "hello"}, headers=headers).get_json()
+        assert body["deadline"]["budget_ms"] == m.Config.CHAT_DEADLINE_MS and body["deadline"]["skipped"] == []
+    finally:
+        m.COOLBITS_URL, m.COOLBITS_GATEWAY_ENABLED = saved[0], saved[1]
+        m._coolbits_auth_cache.clear()
+        m._coolbits_auth_cache.update(saved[2])
+        m.REAL_AGENT_SLUGS.clear()
+        m.REAL_AGENT_SLUGS.update(saved[3])
+        m.Config.DEADLINE_MIN_STAGE_MS = saved[4]
+        cb.reset_breakers()
+        server.shutdown()
+        server.server_close()
+    print("Request deadline tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,120 @@
+"""Read-only corpus connections + context LRU with version-stamp invalidation (temp knowledge.db)."""
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import app as m
+import models
+import retrieval_cache as rc
+from config import Config
+from knowledge_index import sync_chunk_index
+from test_knowledge_index import CHUNKS_DDL, _insert
+
+
+def run():
+    tmp = Path(tempfile.mkdtemp(prefix="camarad-rc-"))
+    kb_path = tmp / "knowledge.db"
+    conn = sqlite3.connect(kb_path)
+    conn.execute(CHUNKS_DDL)
+    _insert(conn, "k1", "Campaign metrics", "Reporting.", "Pull campaign metrics with the reporting API.")
+    conn.commit()
+
+    original = models.DB_PATH
+    models.DB_PATH = kb_path
+    rc.clear_context_cache()
+    try:
+        before = rc.retrieval_cache_stats()
+        first = models.get_rag_context("how do I pull campaign metrics", mode="keyword")
+        assert "Campaign metrics" in first, first
+        # Same keyword set, different phrasing: served from memory.
+        started = time.perf_counter()
+        again = models.get_rag_context("campaign metrics: pull", mode="keyword")
+        elapsed = time.perf_counter() - started
+        stats = rc.retrieval_cache_stats()
+        assert again == first and stats["hits"] == before["hits"] + 1, stats
+        assert elapsed < 0.005, elapsed
+
+        # Leased read-only handles from a process-wide pool; the index was created once on a writable
+        # connection. A connection released by one thread is reused by the next lease, in any thread.
+        ro = rc.read_connection(kb_path)
+        raw = ro._conn
+        try:
+            ro.execute("DELETE FROM chunks")
+            raise AssertionError("read-only connection accepted a write")
+        except sqlite3.OperationalError:
+            pass
+        other = []
+
+        def lease():
+            held = rc.read_connection(kb_path)
+            other.append(held._conn)
+            held.execute("SELECT COUNT(*) FROM chunks").fetchone()
+            held.close()
+
+        t = threading.Thread(target=lease)
+        t.start()
+        t.join()
+        assert other[0] is not None and other[0] is not raw
+        ro.close()
+        ro.close()  # double close stays harmless
+        opened = rc.retrieval_cache_stats()["connections"]
+        for _ in range(3):
+            t = threading.Thread(target=lease)
+            t.start()
+            t.join()
+        assert rc.retrieval_cache_stats()["connections"] == opened and set(other[1:]) <= {raw, other[0]}
+
+        # The idle pool is bounded; a corpus file replaced on disk (new inode) gets fresh connections.
+        size = Config.RETRIEVAL_POOL_SIZE
+        Config.RETRIEVAL_POOL_SIZE = 1
+        try:
+            held = [rc.read_connection(kb_path) for _ in range(3)]
+            for h in held:
+                h.close()
+            assert rc.retrieval_cache_stats()["idle"] == 1
+        finally:
+            Config.RETRIEVAL_POOL_SIZE = size
+        replaced = tmp / "replaced.db"
+        shutil.copy(kb_path, replaced)
+        old = rc.read_connection(replaced)
+        old_raw = old._conn
+        old.close()
+        shutil.copy(kb_path, tmp / "swap.db")
+        (tmp / "swap.db").replace(replaced)
+        fresh = rc.read_connection(replaced)
+        assert fresh._conn is not old_raw and fresh.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 1
+        fresh.close()
+
+        # New content stays invisible to cached blocks until the ingest job bumps the version.
+        _insert(conn, "k2", "Campaign metrics export", "Exports.", "Pull campaign metrics into sheets.")
+        sync_chunk_index(conn)
+        conn.commit()
+        assert models.get_rag_context("pull campaign metrics", top_k=3, mode="keyword") == first
+        rc.bump_corpus_version(kb_path)
+        fresh = models.get_rag_context("pull campaign metrics", top_k=3, mode="keyword")
+        assert "Campaign metrics export" in fresh, fresh
+
+        # Bounded LRU.
+        size = Config.RETRIEVAL_CACHE_SIZE
+        Config.RETRIEVAL_CACHE_SIZE = 2
+        try:
+            for q in ("reporting api", "sheets export", "campaign exports"):
+                models.get_rag_context(q, mode="keyword")
+            assert rc.retrieval_cache_stats()["entries"] == 2
+        finally:
+            Config.RETRIEVAL_CACHE_SIZE = size
+    finally:
+        models.DB_PATH = original
+        conn.close()
+
+    r = m.app.test_client().get("/readyz")
+    assert "retrieval" in r.get_json()["checks"], r.get_json()
+    shutil.rmtree(tmp, ignore_errors=True)
+    print("Retrieval cache tests: OK")
+
+
+if __name__ == "__main__":
+    run()
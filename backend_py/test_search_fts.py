@@ -0,0 +1,84 @@
+"""FTS5 conversation/message search (local test client)."""
+import app as m
+from database import build_fts_query, rebuild_search_index, save_message, update_conversation_title
+
+
+def _reset_user(conn, uid, username):
+    conn.execute("INSERT OR IGNORE INTO users (id, username, is_premium) VALUES (?, ?, 0)", (uid, username))
+    conn.execute("DELETE FROM messages WHERE conv_id IN (SELECT id FROM conversations WHERE user_id = ?)", (uid,))
+    conn.execute("DELETE FROM conversations WHERE user_id = ?", (uid,))
+
+
+def run():
+    m.init_db()
+    uid, other = 990201, 990202
+
+    conn = m.get_db()
+    _reset_user(conn, uid, "fts-user")
+    _reset_user(conn, other, "fts-other")
+    m._save_user_settings(conn, uid, {"preferences": {"onboarding_completed": True}})
+    conn.execute("DELETE FROM clients WHERE user_id = ?", (uid,))
+    cid = conn.execute("INSERT INTO clients (user_id, type, name) VALUES (?, 'company', 'FTS Client')", (uid,)).lastrowid
+    conn.commit()
+    conn.close()
+
+    scoped = m.create_new_conversation(uid, "business", "ppc-specialist", "Client budget", client_id=cid)
+    save_message(scoped, "user", "client budget only")
+    budget = m.create_new_conversation(uid, "business", "ppc-specialist", "Budget pacing review")
+    save_message(budget, "user", "Is our <b>campaign</b> pacing ahead of budget?")
+    body_only = m.create_new_conversation(uid, "business", "ceo-strategy", "Weekly notes")
+    save_message(body_only, "agent", "Budget is fine; focus on retention this quarter.")
+    personal = m.create_new_conversation(uid, "personal", "life-coach", "Morning routine")
+    save_message(personal, "user", "budget my time better, împreună cu sportul")
+    foreign = m.create_new_conversation(other, "business", "ppc-specialist", "Budget secrets")
+    save_message(foreign, "user", "budget budget budget")
+
+    # Ranking: title + body hit beats a body-only hit; scoping drops the other user, workspace and client.
+    res = m.search_conversations(uid, "business", "budget", client_id=0)
+    assert [r["conv_id"] for r in res] == [budget, body_only], res
+    assert "<mark>" in res[0]["snippet"]
+
+    # Snippets are HTML-escaped around the highlight markers.
+    res = m.search_conversations(uid, "business", "campaign")
+    assert res and "&lt;b&gt;<mark>campaign</mark>&lt;/b&gt;" in res[0]["snippet"], res
+
+    # Prefix match on the last token, diacritics folded, FTS syntax neutralised.
+    assert m.search_conversations(uid, "business", "reten")[0]["conv_id"] == body_only
+    assert m.search_conversations(uid, "personal", "impreuna")[0]["conv_id"] == personal
+    assert m.search_conversations(uid, "business", 'budget" OR NEAR(') == []
+    assert build_fts_query('a "b" -c') == '"a" "b" "c"*'
+    assert build_fts_query("  ") == ""
+
+    # Pagination.
+    page1 = m.search_conversations(uid, None, "budget", limit=2, client_id=0)
+    page2 = m.search_conversations(uid, None, "budget", limit=2, offset=2, client_id=0)
+    assert len(page1) == 2 and len(page2) == 1
+    assert {r["conv_id"] for r in page1 + page2} == {budget, body_only, personal}
+
+    # Triggers keep the index in sync with title updates and deletes; rebuild is idempotent.
+    update_conversation_title(personal, "Sleep schedule")
+    assert m.search_conversations(uid, "personal", "sleep")[0]["conv_id"] == personal
+    conn = m.get_db()
+    conn.execute("DELETE FROM messages WHERE conv_id = ?", (body_only,))
+    rebuild_search_index(conn)
+    conn.commit()
+    conn.close()
+    assert [r["conv_id"] for r in m.search_conversations(uid, "business", "retention")] == []
+
+    c = m.app.test_client()
+    headers = {"X-User-ID": str(uid), "X-Client-ID": str(cid)}
+    r = c.get("/api/conversations/search?q=budget&per_page=1", headers=headers)
+    assert r.status_code == 200, r.get_data(as_text=True)[:240]
+    body = r.get_json()
+    assert body["has_more"] is False and [x["conv_id"] for x in body["results"]] == [scoped], body
+    assert body["results"][0]["url"] == f"/chat/business/ppc-specialist?conv_id={scoped}"
+    r = c.get("/api/conversations/search?q=budget", headers={"X-User-ID": str(other), "X-Client-ID": str(cid)})
+    assert r.status_code == 404, r.status_code
+
+    r = c.get("/search/business?q=budget", headers=headers)
+    assert r.status_code == 200 and "<mark>" in r.get_data(as_text=True), r.status_code
+    print("Search FTS tests: OK")
+
+
+if __name__ == "__main__":
+    run()
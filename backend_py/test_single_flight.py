@@ -0,0 +1,124 @@
+"""Single-flight coalescing of identical concurrent gateway GETs (local stub HTTP server)."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app as m
+import gateway_client as gc
+
+
+class _Slow(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with _Slow.lock:
+            _Slow.hits.append(self.path)
+        time.sleep(0.3)
+        body = json.dumps({"rows": [{"path": self.path}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _burst(n, fn):
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run():
+    # Unit: waiters share the leader's exception; a waiter past its timeout goes upstream itself.
+    sf = gc.SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def boom():
+        calls.append(1)
+        gate.wait(1)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call(_i):
+        try:
+            sf.do("k", boom, timeout=2)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and errors == ["upstream down"] * 3, (calls, errors)
+    assert sf.in_flight() == 0
+
+    slow = threading.Event()
+    leader = threading.Thread(target=lambda: sf.do("t", lambda: slow.wait(1) and "leader"))
+    leader.start()
+    time.sleep(0.05)
+    before = gc.gateway_stats()["coalesce_timeouts"]
+    assert sf.do("t", lambda: "own", timeout=0.05) == ("own", False)
+    assert gc.gateway_stats()["coalesce_timeouts"] == before + 1
+    slow.set()
+    leader.join()
+
+    # App: a fan-out burst of identical _coolbits_request GETs sends one upstream request.
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Slow)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = (m.COOLBITS_URL, dict(m._coolbits_auth_cache))
+    m.COOLBITS_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    m._coolbits_auth_cache.update({"token": "stub-token", "fetched_at": time.time()})
+    try:
+        stats = gc.gateway_stats()
+        params = {"propertyId": "123", "from": "2026-01-01"}
+        results = _burst(6, lambda i: m._coolbits_request("GET", "/api/connectors/ga4/report", params=dict(params), timeout=5))
+        assert len(_Slow.hits) == 1, _Slow.hits
+        assert all(r[0] == 200 and r[1]["rows"] for r in results)
+        assert len({id(r[1]) for r in results}) == 6  # every caller parsed its own payload
+        after = gc.gateway_stats()
+        assert after["coalesced"] - stats["coalesced"] == 5 and after["flights"] - stats["flights"] == 1, after
+
+        # Different params, or a different caller token, are different flights.
+        _Slow.hits.clear()
+        _burst(4, lambda i: m._coolbits_request("GET", "/api/connectors/ga4/report", params={"propertyId": str(i % 2)}, timeout=5))
+        assert len(_Slow.hits) == 2, _Slow.hits
+        _Slow.hits.clear()
+        with m.app.test_request_context(headers={"Authorization": "Bearer other-user"}):
+            m._coolbits_request("GET", "/api/connectors/ga4/report", params=params, timeout=5)
+        assert len(_Slow.hits) == 1
+
+        ready = m.app.test_client().get("/readyz").get_json()["checks"]["gateway"]
+        assert ready["coalesced"] >= 7 and ready["in_flight"] == 0, ready
+    finally:
+        m.COOLBITS_URL = saved[0]
+        m._coolbits_auth_cache.clear()
+        m._coolbits_auth_cache.update(saved[1])
+        gc.reset_gateway_client()
+        server.shutdown()
+        server.server_close()
+    print("Single-flight tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,131 @@
+"""Offline vector retrieval + hybrid RRF (temp knowledge.db / connectors_api_docs.db)."""
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import models
+import vector_index as vi
+from test_api_docs_index import API_DOCS_DDL
+from test_knowledge_index import CHUNKS_DDL
+
+TOPICS = {
+    "billing": "invoice refund chargeback payment customer card dispute",
+    "ads": "campaign budget bidding keyword impressions clicks conversion",
+    "crm": "contact lead pipeline deal stage owner followup",
+    "infra": "deploy server container latency uptime incident rollback",
+}
+
+
+def _corpus(conn, n, width=12):
+    words = {k: v.split() for k, v in TOPICS.items()}
+    for i in range(n):
+        topic = list(TOPICS)[i % len(TOPICS)]
+        w = words[topic]
+        text = " ".join(w[(i // len(TOPICS) + j) % len(w)] for j in range(width))
+        conn.execute(
+            "INSERT INTO chunks (chunk_id, title, summary, content, source) VALUES (?, ?, ?, ?, ?)",
+            (f"v{i}", f"{topic} note {i}", "", text, topic),
+        )
+
+
+def run():
+    tmp = Path(tempfile.mkdtemp(prefix="camarad-vec-"))
+    kb_path = tmp / "knowledge.db"
+    conn = sqlite3.connect(kb_path)
+    conn.execute(CHUNKS_DDL)
+    _corpus(conn, 40)
+    conn.commit()
+
+    # Resumable: a build interrupted after the first flushed batch picks up where it stopped.
+    def stop(done, total):
+        raise KeyboardInterrupt
+
+    try:
+        vi.build_vector_index(conn, kb_path, "chunks", batch_size=16, progress=stop)
+    except KeyboardInterrupt:
+        pass
+    partial = vi._read_meta(vi.index_dir(kb_path, "chunks").with_name("chunks.tmp"))
+    assert partial["rows"] == 16, partial
+    stats = vi.build_vector_index(conn, kb_path, "chunks", batch_size=16)
+    assert stats["refit"] and stats["added"] == 24 and stats["rows"] == 40, stats
+    assert stats["dim"] == vi.VECTOR_HASH_DIM  # too few docs for SVD
+
+    index = vi.open_vector_index(kb_path, "chunks")
+    hits = index.search("customer disputes a card payment", top_k=5)
+    topics = [conn.execute("SELECT source FROM chunks WHERE id = ?", (i,)).fetchone()[0] for i, _ in hits]
+    assert topics and set(topics) == {"billing"}, topics
+    batch = index.search_many(["deploy rollback", "lead pipeline"], top_k=3)
+    assert [len(b) for b in batch] == [3, 3] and batch[0][0][1] >= batch[0][-1][1]
+
+    # Incremental: new rows are appended, deleted rows tombstoned, nothing is refit.
+    deleted = {r[0] for r in conn.execute("SELECT id FROM chunks WHERE chunk_id IN ('v0', 'v4')")}
+    conn.execute("DELETE FROM chunks WHERE chunk_id IN ('v0', 'v4')")
+    conn.execute("INSERT INTO chunks (chunk_id, title, content, source) VALUES ('x1', 'Quarterly churn', "
+                 "'churn retention cohort renewal', 'crm')")
+    conn.commit()
+    stats = vi.build_vector_index(conn, kb_path, "chunks")
+    assert (stats["added"], stats["removed"], stats["rows"], stats["refit"]) == (1, 2, 39, False), stats
+    assert vi.build_vector_index(conn, kb_path, "chunks")["added"] == 0
+    index = vi.open_vector_index(kb_path, "chunks")  # reopened: meta.json changed
+    assert index.search("renewal cohort")[0][0] == conn.execute("SELECT id FROM chunks WHERE chunk_id = 'x1'").fetchone()[0]
+    assert not deleted & {i for i, _ in index.search("invoice refund", top_k=50)}
+
+    # Larger corpora get SVD-reduced vectors, which also reach docs that never use the query term.
+    big = tmp / "big.db"
+    bconn = sqlite3.connect(big)
+    bconn.execute(CHUNKS_DDL)
+    _corpus(bconn, 200, width=3)
+    bconn.commit()
+    stats = vi.build_vector_index(bconn, big, "chunks", svd_dim=16)
+    assert stats["dim"] == 16 and stats["rows"] == 200, stats
+    hits = vi.open_vector_index(big, "chunks").search("chargeback", top_k=40)
+    rows = [bconn.execute("SELECT source, content FROM chunks WHERE id = ?", (i,)).fetchone() for i, _ in hits]
+    assert {r[0] for r in rows} == {"billing"}, rows
+    assert any("chargeback" not in r[1] for r in rows), rows
+    bconn.close()
+
+    # RRF: agreement between rankings beats a single first place.
+    fused = vi.rrf_fuse([["a", "b", "c"], ["b", "c", "a"]])
+    assert [k for k, _ in fused] == ["b", "a", "c"], fused
+    assert vi.rrf_fuse([["a"], []]) == [("a", 1.0 / (vi.RRF_K + 1))]
+
+    # Hybrid get_rag_context: vector-only hits are fetched, keyword mode ignores the vectors.
+    conn.close()
+    original = models.DB_PATH
+    models.DB_PATH = kb_path
+    try:
+        hybrid = models.get_rag_context("customer card dispute", top_k=2, mode="hybrid")
+        assert hybrid.count("**billing note") == 2, hybrid[:300]
+        for mode in ("vector", "keyword"):
+            ctx = models.get_rag_context("renewal of the cohort", top_k=1, mode=mode)
+            assert "Quarterly churn" in ctx, (mode, ctx[:200])
+    finally:
+        models.DB_PATH = original
+
+    # API docs passages: connector filter applies to vector hits too; best passage per page.
+    docs_path = tmp / "connectors_api_docs.db"
+    dconn = sqlite3.connect(docs_path)
+    dconn.execute(API_DOCS_DDL)
+    dconn.execute("INSERT INTO api_docs (connector, url, title, content, section_type) VALUES "
+                  "('Stripe', 'https://s/refunds', 'Refunds', 'Refunds return a charge to the customer card.', 'endpoint')")
+    dconn.execute("INSERT INTO api_docs (connector, url, title, content, section_type) VALUES "
+                  "('PayPal', 'https://p/refunds', 'Refund payment', 'Refunds a captured payment to the buyer.', 'endpoint')")
+    dconn.commit()
+    vi.main([str(docs_path), "api_docs"])
+    dconn.close()
+    original = models.API_DOCS_DB
+    models.API_DOCS_DB = docs_path
+    try:
+        rows = models.search_api_docs_corpus("refunds to the customer card", connector="PayPal", limit=3, mode="hybrid")
+        assert [r["connector"] for r in rows] == ["PayPal"], rows
+        rows = models.search_api_docs_corpus("refunds", limit=5, mode="hybrid")
+        assert sorted(r["url"] for r in rows) == ["https://p/refunds", "https://s/refunds"], rows
+    finally:
+        models.API_DOCS_DB = original
+    shutil.rmtree(tmp, ignore_errors=True)
+    print("Vector index tests: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,421 @@
+"""
+Offline vector retrieval for the RAG corpora (hashed TF-IDF, optionally reduced with truncated SVD).
+
+No embedding API is involved: text is hashed into VECTOR_HASH_DIM buckets (unigrams + bigrams),
+weighted with an IDF fitted on a sample of the corpus and, once the corpus is large enough, projected
+to VECTOR_SVD_DIM dimensions (LSA) so paraphrases that share related terms land close together.
+
+Vectors live next to the SQLite file, in `<db>.vectors/<source>/`:
+    meta.json          dims, row count, fit info
+    vectors.f32        float32 [capacity x dim], L2-normalized rows (memory-mapped)
+    ids.i64            int64 [capacity] source rowid per vector row, -1 once the row is deleted
+    idf.npy            float32 [hash_dim]
+    components.npy     float32 [hash_dim x dim] (only when SVD is used)
+
+`build_vector_index()` is incremental (embeds rowids it has not seen, tombstones deleted ones) and
+resumable (meta.json is advanced after every flushed batch; a refit builds in `<source>.tmp/` and is
+swapped in when complete). Queries stream the memmap in blocks, so the corpus is never materialized
+as Python objects. NumPy is optional: without it `open_vector_index()` returns None and callers stay
+keyword-only.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # keyword-only retrieval
+    np = None
+
+from api_docs_index import ensure_api_docs_index
+from knowledge_index import STOP_WORDS
+from retrieval_cache import bump_corpus_version
+
+VECTOR_FORMAT_VERSION = 1
+VECTOR_HASH_DIM = 1 << 12
+VECTOR_SVD_DIM = 256
+# Docs sampled to fit IDF/SVD; a refit is triggered once the corpus outgrows the fit 4x.
+VECTOR_FIT_SAMPLE = 6000
+VECTOR_BATCH_SIZE = 256
+VECTOR_SCAN_BLOCK = 32768
+VECTOR_MIN_SCORE = 0.05
+# Reciprocal rank fusion constant (Cormack et al. use 60).
+RRF_K = 60
+
+# source -> (table, text expression); rowid is the table's INTEGER PRIMARY KEY.
+SOURCES = {
+    "chunks": ("chunks", "COALESCE(title, '') || ' ' || COALESCE(summary, '') || ' ' || COALESCE(content, '')"),
+    "api_docs": ("api_doc_passages", "COALESCE(title, '') || ' ' || COALESCE(heading, '') || ' ' || content"),
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_LOCK = threading.Lock()
+_OPEN = {}  # directory -> (meta mtime_ns, VectorIndex)
+
+
+def index_dir(db_path, source):
+    db_path = Path(db_path)
+    return db_path.parent / f"{db_path.name}.vectors" / source
+
+
+def _features(text):
+    tokens = [t for t in _TOKEN_RE.findall(str(text or "").lower()) if len(t) > 1 and t not in STOP_WORDS]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _hashed_counts(texts, hash_dim):
+    counts = np.zeros((len(texts), hash_dim), dtype=np.float32)
+    buckets = {}
+    mask = hash_dim - 1
+    for i, text in enumerate(texts):
+        cols = []
+        for feat in _features(text):
+            col = buckets.get(feat)
+            if col is None:
+                col = buckets[feat] = zlib.crc32(feat.encode("utf-8")) & mask
+            cols.append(col)
+        if cols:
+            np.add.at(counts[i], np.asarray(cols, dtype=np.int64), 1.0)
+    return counts
+
+
+def _normalize(mat):
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _embed(texts, idf, components):
+    mat = _normalize(np.log1p(_hashed_counts(texts, idf.shape[0])) * idf)
+    if components is not None:
+        mat = _normalize(mat @ components)
+    return mat.astype(np.float32, copy=False)
+
+
+def _fit(texts, hash_dim, svd_dim, seed=0):
+    """IDF over the sample, plus randomized truncated SVD components when the sample supports them."""
+    counts = _hashed_counts(texts, hash_dim)
+    df = (counts > 0).sum(axis=0)
+    idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+    if not svd_dim or len(texts) < 2 * svd_dim:
+        return idf, None
+    x = _normalize(np.log1p(counts) * idf)
+    rng = np.random.default_rng(seed)
+    y = x @ rng.standard_normal((hash_dim, svd_dim + 10)).astype(np.float32)
+    for _ in range(4):  # power iterations sharpen the leading subspace
+        y, _ = np.linalg.qr(x @ np.linalg.qr(x.T @ y)[0])
+    q, _ = np.linalg.qr(y)
+    _, _, vt = np.linalg.svd(q.T @ x, full_matrices=False)
+    return idf, np.ascontiguousarray(vt[:svd_dim].T, dtype=np.float32)
+
+
+def _read_meta(directory):
+    try:
+        with open(Path(directory) / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(directory, meta):
+    path = Path(directory) / "meta.json"
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def _grow(path, nbytes):
+    with open(path, "ab") as f:
+        if f.tell() < nbytes:
+            f.truncate(nbytes)
+
+
+class _Writer:
+    """Append-only writer over one index directory."""
+
+    def __init__(self, directory, meta):
+        self.directory = Path(directory)
+        self.meta = meta
+        self.idf = np.load(self.directory / "idf.npy")
+        comp = self.directory / "components.npy"
+        self.components = np.load(comp) if comp.exists() else None
+
+    def _map(self, capacity):
+        dim = self.meta["dim"]
+        _grow(self.directory / "vectors.f32", capacity * dim * 4)
+        _grow(self.directory / "ids.i64", capacity * 8)
+        self.meta["capacity"] = capacity
+        vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r+", shape=(capacity, dim))
+        ids = np.memmap(self.directory / "ids.i64", dtype=np.int64, mode="r+", shape=(capacity,))
+        return vectors, ids
+
+    def indexed_ids(self):
+        rows = self.meta["rows"]
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.array(np.memmap(self.directory / "ids.i64", dtype=np.int64, mode="r", shape=(rows,)))
+
+    def tombstone(self, dead_ids):
+        if not len(dead_ids):
+            return 0
+        _, ids = self._map(max(self.meta["capacity"], 1))
+        mask = np.isin(ids[: self.meta["rows"]], dead_ids)
+        ids[: self.meta["rows"]][mask] = -1
+        ids.flush()
+        self.meta["dead"] = int(self.meta.get("dead", 0) + mask.sum())
+        _write_meta(self.directory, self.meta)
+        return int(mask.sum())
+
+    def append(self, conn, table, expr, new_ids, batch_size, progress=None):
+        added = 0
+        for start in range(0, len(new_ids), batch_size):
+            batch = [int(v) for v in new_ids[start:start + batch_size]]
+            marks = ",".join("?" for _ in batch)
+            rows = conn.execute(f"SELECT id, {expr} FROM {table} WHERE id IN ({marks}) ORDER BY id", batch).fetchall()
+            if not rows:
+                continue
+            mat = _embed([r[1] for r in rows], self.idf, self.components)
+            begin = self.meta["rows"]
+            end = begin + len(rows)
+            capacity = self.meta["capacity"]
+            if end > capacity:
+                capacity = max(end, capacity * 2, 1024)
+            vectors, ids = self._map(capacity)
+            vectors[begin:end] = mat
+            ids[begin:end] = [r[0] for r in rows]
+            vectors.flush()
+            ids.flush()
+            # Advance the row count only after the batch is on disk: an interrupted build resumes here.
+            self.meta["rows"] = end
+            self.meta["updated_at"] = int(time.time())
+            _write_meta(self.directory, self.meta)
+            added += len(rows)
+            if progress:
+                progress(added, len(new_ids))
+        return added
+
+
+def _needs_refit(meta, live_count, hash_dim, svd_dim):
+    if not meta or meta.get("version") != VECTOR_FORMAT_VERSION:
+        return True
+    if meta.get("hash_dim") != hash_dim or meta.get("svd_dim") != svd_dim:
+        return True
+    rows = meta.get("rows", 0)
+    if rows and meta.get("dead", 0) * 2 > rows:
+        return True
+    fitted = meta.get("fitted_docs", 0)
+    return fitted < VECTOR_FIT_SAMPLE and live_count > 4 * max(fitted, 1)
+
+
+def _start_fit(conn, table, expr, directory, live_ids, hash_dim, svd_dim):
+    if len(live_ids) > VECTOR_FIT_SAMPLE:
+        sample = live_ids[np.linspace(0, len(live_ids) - 1, VECTOR_FIT_SAMPLE).astype(np.int64)]
+    else:
+        sample = live_ids
+    texts = []
+    for start in range(0, len(sample), 500):
+        batch = [int(v) for v in sample[start:start + 500]]
+        marks = ",".join("?" for _ in batch)
+        texts.extend(r[0] for r in conn.execute(f"SELECT {expr} FROM {table} WHERE id IN ({marks})", batch))
+    idf, components = _fit(texts, hash_dim, svd_dim)
+    directory.mkdir(parents=True, exist_ok=True)
+    np.save(directory / "idf.npy", idf)
+    if components is not None:
+        np.save(directory / "components.npy", components)
+    meta = {
+        "version": VECTOR_FORMAT_VERSION,
+        "hash_dim": hash_dim,
+        "svd_dim": svd_dim,
+        "dim": int(components.shape[1]) if components is not None else hash_dim,
+        "fitted_docs": len(texts),
+        "rows": 0,
+        "dead": 0,
+        "capacity": 0,
+        "created_at": int(time.time()),
+    }
+    _write_meta(directory, meta)
+    return meta
+
+
+def build_vector_index(conn, db_path, source, rebuild=False, hash_dim=VECTOR_HASH_DIM, svd_dim=VECTOR_SVD_DIM,
+                       batch_size=VECTOR_BATCH_SIZE, progress=None):
+    """Bring `<db>.vectors/<source>` in line with the source table.
+
+    Returns {"added", "removed", "rows", "dim", "refit"} or None when NumPy or the table is missing.
+    """
+    if np is None or source not in SOURCES:
+        return None
+    table, expr = SOURCES[source]
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+        return None
+    live_ids = np.fromiter((r[0] for r in conn.execute(f"SELECT id FROM {table} ORDER BY id")), dtype=np.int64)
+    directory = index_dir(db_path, source)
+    meta = None if rebuild else _read_meta(directory)
+    refit = _needs_refit(meta, len(live_ids), hash_dim, svd_dim)
+    target = directory
+    if refit:
+        target = directory.with_name(f"{source}.tmp")
+        meta = _read_meta(target)  # resume an interrupted refit with the same parameters
+        if rebuild or meta is None or _needs_refit(meta, len(live_ids), hash_dim, svd_dim):
+            shutil.rmtree(target, ignore_errors=True)
+            meta = _start_fit(conn, table, expr, target, live_ids, hash_dim, svd_dim)
+
+    writer = _Writer(target, meta)
+    indexed = writer.indexed_ids()
+    removed = writer.tombstone(np.setdiff1d(indexed[indexed >= 0], live_ids, assume_unique=True))
+    added = writer.append(conn, table, expr, np.setdiff1d(live_ids, indexed), batch_size, progress=progress)
+
+    if refit:
+        old = directory.with_name(f"{source}.old")
+        shutil.rmtree(old, ignore_errors=True)
+        if directory.exists():
+            os.replace(directory, old)
+        os.replace(target, directory)
+        shutil.rmtree(old, ignore_errors=True)
+    return {
+        "added": added,
+        "removed": removed,
+        "rows": writer.meta["rows"] - writer.meta.get("dead", 0),
+        "dim": writer.meta["dim"],
+        "refit": refit,
+    }
+
+
+class VectorIndex:
+    """Read-only view over one built index directory."""
+
+    def __init__(self, directory, meta):
+        directory = Path(directory)
+        self.meta = meta
+        self.rows = int(meta["rows"])
+        self.dim = int(meta["dim"])
+        self.idf = np.load(directory / "idf.npy")
+        comp = directory / "components.npy"
+        self.components = np.load(comp) if comp.exists() else None
+        self.vectors = np.memmap(directory / "vectors.f32", dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        self.ids = np.memmap(directory / "ids.i64", dtype=np.int64, mode="r", shape=(self.rows,))
+
+    def embed(self, texts):
+        return _embed(list(texts), self.idf, self.components)
+
+    def search_many(self, queries, top_k=10, min_score=VECTOR_MIN_SCORE):
+        """Cosine top-k for a batch of queries: one matmul per block of rows. -> [[(rowid, score)]]"""
+        q = self.embed(queries)
+        k = max(1, int(top_k))
+        best_scores = np.full((len(q), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(q), 0), dtype=np.int64)
+        for start in range(0, self.rows, VECTOR_SCAN_BLOCK):
+            block = np.asarray(self.vectors[start:start + VECTOR_SCAN_BLOCK])
+            scores = q @ block.T
+            scores[:, np.asarray(self.ids[start:start + VECTOR_SCAN_BLOCK]) < 0] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores, best_rows = scores, rows
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([
+                (int(self.ids[rows[i]]), round(float(scores[i]), 4))
+                for i in order
+                if scores[i] > min_score
+            ])
+        return results
+
+    def search(self, query, top_k=10, min_score=VECTOR_MIN_SCORE):
+        return self.search_many([query], top_k=top_k, min_score=min_score)[0]
+
+
+def open_vector_index(db_path, source):
+    """Cached VectorIndex for `<db>.vectors/<source>`, reopened when meta.json changes; None if unavailable."""
+    if np is None:
+        return None
+    directory = index_dir(db_path, source)
+    try:
+        mtime = os.stat(directory / "meta.json").st_mtime_ns
+    except OSError:
+        return None
+    key = str(directory)
+    cached = _OPEN.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _LOCK:
+        cached = _OPEN.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        meta = _read_meta(directory)
+        if not meta or not meta.get("rows"):
+            return None
+        try:
+            index = VectorIndex(directory, meta)
+        except Exception as e:
+            print(f"vector_index_error: {e}")
+            return None
+        _OPEN[key] = (mtime, index)
+        return index
+
+
+def rrf_fuse(rankings, k=RRF_K):
+    """Reciprocal rank fusion of ranked key lists -> [(key, fused score)], best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    rebuild = "--rebuild" in args
+    args = [a for a in args if a != "--rebuild"]
+    if np is None:
+        print("numpy is not installed: pip install numpy")
+        return 1
+    base = Path(__file__).parent
+    targets = {
+        "chunks": base / "knowledge_base" / "knowledge.db",
+        "api_docs": base / "connectors_api_docs.db",
+    }
+    sources = [a for a in args if a in SOURCES] or list(SOURCES)
+    paths = [Path(a) for a in args if a not in SOURCES]
+    for source in sources:
+        db_path = paths[0] if paths else targets[source]
+        if not db_path.exists():
+            print(f"{source}: {db_path} not found")
+            continue
+        conn = sqlite3.connect(db_path)
+        try:
+            started = time.time()
+            if source == "api_docs":
+                ensure_api_docs_index(conn)  # splits pages stored before passages existed
+                conn.commit()
+            stats = build_vector_index(conn, db_path, source, rebuild=rebuild)
+        finally:
+            conn.close()
+        if stats is None:
+            print(f"{source}: no source table in {db_path}")
+            continue
+        if stats["added"] or stats["removed"]:
+            bump_corpus_version(db_path)
+        print(
+            f"{source}: +{stats['added']} / -{stats['removed']} -> {stats['rows']} vectors x {stats['dim']}"
+            f"{' (refit)' if stats['refit'] else ''} in {time.time() - started:.1f}s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())